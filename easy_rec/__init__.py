@@ -47,12 +47,33 @@ if 'PROCESSOR_TEST' not in os.environ:
     logging.warning('ops_dir[%s] does not exist' % ops_dir)
     ops_dir = None
 
-  from easy_rec.python.inference.predictor import Predictor  # isort:skip  # noqa: E402
-  from easy_rec.python.main import evaluate  # isort:skip  # noqa: E402
-  from easy_rec.python.main import distribute_evaluate  # isort:skip  # noqa: E402
-  from easy_rec.python.main import export  # isort:skip  # noqa: E402
-  from easy_rec.python.main import train_and_evaluate  # isort:skip  # noqa: E402
-  from easy_rec.python.main import export_checkpoint  # isort:skip  # noqa: E402
+  # the predictor and main functions are imported on first access,
+  # so that importing easy_rec does not import all the models and inputs.
+  _LAZY_ATTRS = {
+      'Predictor': 'easy_rec.python.inference.predictor',
+      'evaluate': 'easy_rec.python.main',
+      'distribute_evaluate': 'easy_rec.python.main',
+      'export': 'easy_rec.python.main',
+      'train_and_evaluate': 'easy_rec.python.main',
+      'export_checkpoint': 'easy_rec.python.main',
+  }
+
+  if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+      if name in _LAZY_ATTRS:
+        import importlib
+        module = importlib.import_module(_LAZY_ATTRS[name])
+        return getattr(module, name)
+      raise AttributeError('module %s has no attribute %s' % (__name__, name))
+  else:
+    # module level __getattr__ is not supported before python 3.7
+    from easy_rec.python.inference.predictor import Predictor  # isort:skip  # noqa: E402
+    from easy_rec.python.main import evaluate  # isort:skip  # noqa: E402
+    from easy_rec.python.main import distribute_evaluate  # isort:skip  # noqa: E402
+    from easy_rec.python.main import export  # isort:skip  # noqa: E402
+    from easy_rec.python.main import train_and_evaluate  # isort:skip  # noqa: E402
+    from easy_rec.python.main import export_checkpoint  # isort:skip  # noqa: E402
 
   try:
     import tensorflow_io.oss
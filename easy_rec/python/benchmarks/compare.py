@@ -0,0 +1,68 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Compare benchmark results with a baseline, fail on regressions.
+
+Usage:
+  python -m easy_rec.python.benchmarks.compare \
+    --baseline baseline.json --current benchmark.json --max_regression 0.1
+
+Exit with code 1 if any metric is more than max_regression worse than
+the baseline, or is missing from the current results.
+"""
+import argparse
+import logging
+import sys
+
+from easy_rec.python.benchmarks import results
+
+
+def main(args):
+  baseline = results.load_results(args.baseline)
+  current = results.load_results(args.current)
+  for key in ['cpu_count', 'tf_version', 'processor']:
+    if baseline['env'].get(key) != current['env'].get(key):
+      logging.warning('%s differs: baseline=%s current=%s' %
+                      (key, baseline['env'].get(key), current['env'].get(key)))
+  rows = results.compare_results(baseline, current, args.max_regression,
+                                 args.metrics)
+  logging.info('benchmark comparison:\n%s' % results.format_comparison(rows))
+  missing = [row['name'] for row in rows if row['current'] is None]
+  if missing:
+    logging.error('%d baseline metrics are missing from the current results: '
+                  '%s' % (len(missing), ','.join(missing)))
+  regressed = [
+      row['name']
+      for row in rows
+      if row['regressed'] and row['current'] is not None
+  ]
+  if regressed:
+    logging.error(
+        '%d metrics regressed by more than %.1f%%: %s' %
+        (len(regressed), args.max_regression * 100, ','.join(regressed)))
+  if missing or regressed:
+    return 1
+  logging.info('no regressions')
+  return 0
+
+
+def get_parser():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--baseline', type=str, required=True, help='baseline results json')
+  parser.add_argument(
+      '--current', type=str, required=True, help='current results json')
+  parser.add_argument(
+      '--max_regression',
+      type=float,
+      default=0.1,
+      help='max allowed relative regression of each metric')
+  parser.add_argument(
+      '--metrics',
+      type=str,
+      default=None,
+      help='regex of the metrics to compare, default all')
+  return parser
+
+
+if __name__ == '__main__':
+  sys.exit(main(get_parser().parse_args()))
@@ -0,0 +1,127 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Benchmark results saved as json baselines and their comparison.
+
+A result file looks like:
+  {
+    "env": {"tf_version": "2.12.0", "cpu_count": 16, ...},
+    "options": {"batch_size": 256, ...},
+    "metrics": {
+      "input/samples_per_sec": {"value": 81234.5, "unit": "samples/s",
+                                "higher_is_better": true},
+      "predict/p99_ms": {"value": 3.2, "unit": "ms",
+                         "higher_is_better": false},
+      ...
+    }
+  }
+"""
+import json
+import logging
+import multiprocessing
+import platform
+import re
+import sys
+import time
+
+import tensorflow as tf
+from tensorflow.python.platform import gfile
+
+import easy_rec
+
+
+def make_metric(value, unit, higher_is_better):
+  return {
+      'value': float(value),
+      'unit': unit,
+      'higher_is_better': higher_is_better
+  }
+
+
+def get_env():
+  """Environment of the benchmark run, results are only comparable on the same env."""
+  return {
+      'easy_rec_version': easy_rec.__version__,
+      'tf_version': tf.__version__,
+      'python_version': sys.version.split()[0],
+      'platform': platform.platform(),
+      'processor': platform.processor(),
+      'cpu_count': multiprocessing.cpu_count(),
+      'time': time.strftime('%Y-%m-%d %H:%M:%S')
+  }
+
+
+def save_results(output_path, metrics, options=None):
+  results = {'env': get_env(), 'options': options or {}, 'metrics': metrics}
+  with gfile.GFile(output_path, 'w') as fout:
+    json.dump(results, fout, indent=2, sort_keys=True)
+  logging.info('save benchmark results to %s' % output_path)
+  return results
+
+
+def load_results(result_path):
+  with gfile.GFile(result_path, 'r') as fin:
+    return json.load(fin)
+
+
+def compare_results(baseline, current, max_regression=0.1, metric_pattern=None):
+  """Compare the metrics of current results with the baseline.
+
+  Args:
+    baseline: baseline results loaded by load_results
+    current: current results loaded by load_results
+    max_regression: max allowed relative regression, 0.1 means a metric
+      is regressed if it gets 10% worse than the baseline
+    metric_pattern: if set, only metrics matching the regex are compared
+
+  Return:
+    a list of dict with keys: name, unit, baseline, current, change
+      (relative change, positive is better), regressed; metrics only in
+      one of the results have None as baseline or current, metrics missing
+      from the current results are regressed.
+  """
+  base_metrics = baseline['metrics']
+  cur_metrics = current['metrics']
+  names = sorted(set(base_metrics.keys()) | set(cur_metrics.keys()))
+  if metric_pattern:
+    names = [x for x in names if re.search(metric_pattern, x)]
+  rows = []
+  for name in names:
+    base = base_metrics.get(name)
+    cur = cur_metrics.get(name)
+    row = {
+        'name': name,
+        'unit': (base or cur)['unit'],
+        'baseline': base['value'] if base else None,
+        'current': cur['value'] if cur else None,
+        'change': None,
+        'regressed': base is not None and cur is None
+    }
+    if base is not None and cur is not None and base['value'] > 0:
+      if base['higher_is_better']:
+        change = (cur['value'] - base['value']) / base['value']
+      else:
+        change = (base['value'] - cur['value']) / base['value']
+      row['change'] = change
+      row['regressed'] = change < -max_regression
+    rows.append(row)
+  return rows
+
+
+def format_comparison(rows):
+  lines = [
+      '%-48s %14s %14s %9s  %s' %
+      ('metric', 'baseline', 'current', 'change', 'unit')
+  ]
+
+  def _fmt(value):
+    return '%14s' % '-' if value is None else '%14.4f' % value
+
+  for row in rows:
+    change = '%+8.2f%%' % (row['change'] * 100) \
+        if row['change'] is not None else '%9s' % '-'
+    status = ''
+    if row['regressed']:
+      status = '  MISSING' if row['current'] is None else '  REGRESSED'
+    lines.append('%-48s %s %s %s  %s%s' % (row['name'], _fmt(
+        row['baseline']), _fmt(row['current']), change, row['unit'], status))
+  return '\n'.join(lines)
@@ -0,0 +1,169 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Run the benchmark stages on synthetic data, cpu only and offline.
+
+Synthetic data is generated according to the data_config and feature
+configs of the pipeline config, and read by CSVInput whatever the
+input_type of the pipeline config is.
+
+Usage:
+  python -m easy_rec.python.benchmarks.run \
+    --pipeline_config_path samples/model_config/multi_tower_on_taobao.config \
+    --output_path benchmark.json
+  python -m easy_rec.python.benchmarks.compare \
+    --baseline baseline.json --current benchmark.json
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+from easy_rec.python.benchmarks import results
+from easy_rec.python.benchmarks import stages
+from easy_rec.python.benchmarks.synthetic_data import SyntheticDataGenerator
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.utils import config_util
+from easy_rec.python.utils import fg_util
+
+ALL_STAGES = ['input', 'embedding', 'layers', 'train', 'predict']
+
+
+def _get_pipeline_config(args, data_path, model_dir):
+  pipeline_config = config_util.get_configs_from_pipeline_file(
+      args.pipeline_config_path)
+  if pipeline_config.fg_json_path:
+    fg_util.load_fg_json_to_config(pipeline_config)
+  data_config = pipeline_config.data_config
+  data_config.input_type = DatasetConfig.CSVInput
+  data_config.num_epochs = 0
+  data_config.ClearField('cache_dir')
+  if args.batch_size > 0:
+    data_config.batch_size = args.batch_size
+  pipeline_config.train_input_path = data_path
+  pipeline_config.eval_input_path = data_path
+  pipeline_config.model_dir = model_dir
+  pipeline_config.train_config.ClearField('fine_tune_checkpoint')
+  return pipeline_config
+
+
+def run(args):
+  """Run the benchmark stages, return the metrics."""
+  # benchmarks are cpu only
+  os.environ['CUDA_VISIBLE_DEVICES'] = ''
+  run_stages = [x.strip() for x in args.stages.split(',') if x.strip()]
+  for stage in run_stages:
+    assert stage in ALL_STAGES, 'invalid stage: %s, should be one of %s' % (
+        stage, ','.join(ALL_STAGES))
+  if set(run_stages) - set(['layers']):
+    assert args.pipeline_config_path, \
+        'pipeline_config_path is required by stages: %s' % args.stages
+  if 'predict' in run_stages:
+    assert 'train' in run_stages, 'predict stage exports the trained model'
+
+  work_dir = args.work_dir if args.work_dir else tempfile.mkdtemp(
+      prefix='easy_rec_benchmark_')
+  if not os.path.exists(work_dir):
+    os.makedirs(work_dir)
+  data_path = os.path.join(work_dir, 'data.csv')
+  model_dir = os.path.join(work_dir, 'model')
+  if os.path.exists(model_dir):
+    shutil.rmtree(model_dir)
+
+  metrics = {}
+  if args.pipeline_config_path:
+    pipeline_config = _get_pipeline_config(args, data_path, model_dir)
+    SyntheticDataGenerator(
+        pipeline_config, seed=args.seed).write(data_path, args.num_samples)
+  if 'input' in run_stages:
+    metrics.update(
+        stages.benchmark_input(pipeline_config, data_path, args.num_warmup,
+                               args.num_runs))
+  if 'embedding' in run_stages:
+    metrics.update(
+        stages.benchmark_embedding(pipeline_config, data_path, args.num_warmup,
+                                   args.num_runs))
+  if 'layers' in run_stages:
+    layer_names = [x.strip() for x in args.layers.split(',') if x.strip()]
+    metrics.update(
+        stages.benchmark_layers(args.layer_batch_size, args.num_warmup,
+                                args.num_runs, layer_names))
+  if 'train' in run_stages:
+    metrics.update(
+        stages.benchmark_train(pipeline_config, data_path, args.num_warmup,
+                               args.num_runs))
+  if 'predict' in run_stages:
+    metrics.update(
+        stages.benchmark_predict(pipeline_config,
+                                 os.path.join(work_dir, 'export'),
+                                 args.predict_batch_size, args.num_warmup,
+                                 args.num_runs))
+
+  for name in sorted(metrics.keys()):
+    logging.info('%-48s %14.4f %s' %
+                 (name, metrics[name]['value'], metrics[name]['unit']))
+  if args.output_path:
+    options = {k: v for k, v in vars(args).items() if k not in ['output_path']}
+    results.save_results(args.output_path, metrics, options)
+  if not args.work_dir:
+    shutil.rmtree(work_dir)
+  return metrics
+
+
+def get_parser():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--pipeline_config_path',
+      type=str,
+      default=None,
+      help='pipeline config, required by stages other than layers')
+  parser.add_argument(
+      '--stages',
+      type=str,
+      default=','.join(ALL_STAGES),
+      help='stages to run, separated by ,')
+  parser.add_argument(
+      '--layers',
+      type=str,
+      default='',
+      help='layers to benchmark, separated by ,; default all of: %s' %
+      ','.join(sorted(stages.LAYER_BENCHMARKS.keys())))
+  parser.add_argument(
+      '--batch_size',
+      type=int,
+      default=0,
+      help='overwrite data_config.batch_size if > 0')
+  parser.add_argument(
+      '--layer_batch_size',
+      type=int,
+      default=256,
+      help='batch size of the layer benchmarks')
+  parser.add_argument(
+      '--predict_batch_size',
+      type=int,
+      default=32,
+      help='batch size of each predict request')
+  parser.add_argument(
+      '--num_samples',
+      type=int,
+      default=10000,
+      help='number of synthetic samples')
+  parser.add_argument(
+      '--num_warmup', type=int, default=10, help='number of warmup runs')
+  parser.add_argument(
+      '--num_runs', type=int, default=50, help='number of timed runs')
+  parser.add_argument(
+      '--seed', type=int, default=0, help='seed of the synthetic data')
+  parser.add_argument(
+      '--work_dir',
+      type=str,
+      default=None,
+      help='directory of the synthetic data, model and exported model, '
+      'a temporary directory is used and removed if not set')
+  parser.add_argument(
+      '--output_path', type=str, default=None, help='save results as json')
+  return parser
+
+
+if __name__ == '__main__':
+  run(get_parser().parse_args())
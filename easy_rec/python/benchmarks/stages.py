@@ -0,0 +1,365 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Benchmark stages, each stage is timed in isolation.
+
+  input: samples/sec of the input pipeline(parsing and preprocessing)
+  embedding: time of the embedding lookups of all feature groups, on a
+    cached batch so that the input pipeline is excluded
+  layers: forward and forward+backward time of keras layers on random inputs
+  train: steps/sec of the estimator train loop, on a cached batch
+  predict: qps and latency of the exported saved_model
+
+Each stage returns a dict of metric name to results.make_metric.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from google.protobuf import text_format
+
+from easy_rec.python.benchmarks import results
+from easy_rec.python.benchmarks.synthetic_data import SyntheticDataGenerator
+from easy_rec.python.inference.predictor import PredictorImpl
+from easy_rec.python.layers.utils import Parameter
+from easy_rec.python.main import _create_estimator
+from easy_rec.python.main import _get_input_fn
+from easy_rec.python.main import export
+from easy_rec.python.model.easy_rec_model import EasyRecModel
+from easy_rec.python.protos import keras_layer_pb2
+from easy_rec.python.utils import config_util
+from easy_rec.python.utils.load_class import load_keras_layer
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+# sizes of the random inputs of the layer benchmarks
+_NUM_FEATURES = 16
+_EMBED_DIM = 16
+_SEQ_LEN = 50
+
+# name => (KerasLayer config, input type)
+#   input types: dense: [B, F * D], fields: [B, F, D], list: F x [B, D],
+#   seq: ([B, L, D], seq_len), seq_query: ([B, L, D], seq_len, [B, D])
+LAYER_BENCHMARKS = {
+    'mlp': ("""
+        class_name: 'MLP'
+        mlp {
+          hidden_units: [512, 256, 128]
+        }
+        """, 'dense'),
+    'masknet': ("""
+        class_name: 'MaskNet'
+        masknet {
+          mask_blocks {
+            aggregation_size: 512
+            output_size: 256
+          }
+          mask_blocks {
+            aggregation_size: 512
+            output_size: 256
+          }
+          mlp {
+            hidden_units: [256, 128]
+          }
+        }
+        """, 'dense'),
+    'cin': ("""
+        class_name: 'CIN'
+        cin {
+          hidden_feature_sizes: [16, 16, 16]
+        }
+        """, 'fields'),
+    'fibinet': ("""
+        class_name: 'FiBiNet'
+        fibinet {
+          senet {
+            reduction_ratio: 4
+          }
+          bilinear {
+            type: 'each'
+            num_output_units: 512
+          }
+          mlp {
+            hidden_units: [256]
+          }
+        }
+        """, 'list'),
+    'din': ("""
+        class_name: 'DIN'
+        din {
+          attention_dnn {
+            hidden_units: [64, 32, 1]
+          }
+        }
+        """, 'seq_query'),
+    'bst': ("""
+        class_name: 'BST'
+        bst {
+          hidden_size: 64
+          num_hidden_layers: 2
+          num_attention_heads: 2
+          intermediate_size: 128
+          max_position_embeddings: %d
+        }
+        """ % _SEQ_LEN, 'seq_query'),
+}
+
+
+def time_runs(run_fn, num_warmup, num_runs):
+  """Call run_fn num_warmup times, then return the seconds of num_runs calls."""
+  for _ in range(num_warmup):
+    run_fn()
+  elapsed = []
+  for _ in range(num_runs):
+    start = time.time()
+    run_fn()
+    elapsed.append(time.time() - start)
+  return np.array(elapsed)
+
+
+def _session_config():
+  return tf.ConfigProto(device_count={'GPU': 0}, allow_soft_placement=True)
+
+
+def _sum_op(tensors):
+  """Sum of all the tensors, fetched instead of tf.group(tensors).
+
+  A NoOp grouping the tensors is cheap to fetch but the tensors are pruned by
+  grappler, so the timed op must depend on the values of the tensors.
+  """
+  tensors = [
+      x.values if isinstance(x, tf.IndexedSlices) else x
+      for x in tensors
+      if x is not None
+  ]
+  return tf.add_n([tf.reduce_sum(tf.cast(x, tf.float32)) for x in tensors])
+
+
+def _cached_input_fn(input_fn):
+  """Repeat the first batch so that the input pipeline is not timed."""
+
+  def _input_fn(mode=None, params=None, config=None):
+    return input_fn(mode, params, config).take(1).cache().repeat()
+
+  return _input_fn
+
+
+def _train_input_fn(pipeline_config, data_path):
+  return _get_input_fn(
+      pipeline_config.data_config,
+      config_util.get_compatible_feature_configs(pipeline_config), data_path)
+
+
+def benchmark_input(pipeline_config, data_path, num_warmup, num_runs):
+  """Samples/sec of the train input pipeline."""
+  with tf.Graph().as_default():
+    dataset = _train_input_fn(pipeline_config, data_path)(
+        mode=tf.estimator.ModeKeys.TRAIN, params={})
+    next_batch = tf.data.make_one_shot_iterator(dataset).get_next()
+    run_op = tf.group(tf.nest.flatten(next_batch))
+    with tf.Session(config=_session_config()) as sess:
+      elapsed = time_runs(lambda: sess.run(run_op), num_warmup, num_runs)
+  batch_size = pipeline_config.data_config.batch_size
+  return {
+      'input/samples_per_sec':
+          results.make_metric(batch_size * num_runs / np.sum(elapsed),
+                              'samples/s', True),
+      'input/batch_ms':
+          results.make_metric(np.median(elapsed) * 1000, 'ms', False)
+  }
+
+
+def benchmark_embedding(pipeline_config, data_path, num_warmup, num_runs):
+  """Forward and forward+backward time of the embedding lookups."""
+  model_config = pipeline_config.model_config
+  with tf.Graph().as_default():
+    dataset = _cached_input_fn(_train_input_fn(pipeline_config, data_path))(
+        mode=tf.estimator.ModeKeys.TRAIN, params={})
+    features, labels = tf.data.make_one_shot_iterator(dataset).get_next()
+    model_cls = EasyRecModel.create_class(model_config.model_class)
+    model = model_cls(
+        model_config,
+        config_util.get_compatible_feature_configs(pipeline_config),
+        features,
+        labels,
+        is_training=True)
+    # sequence features without sequence_combiner are not combined
+    uncombined_features = set([
+        fc.feature_name if fc.HasField('feature_name') else fc.input_names[0]
+        for fc in config_util.get_compatible_feature_configs(pipeline_config)
+        if fc.feature_type == fc.SequenceFeature and
+        not fc.HasField('sequence_combiner')
+    ])
+    outputs = []
+    # the layers of the sequence groups are shared by the feature groups
+    with tf.variable_scope(tf.get_variable_scope(), reuse=tf.AUTO_REUSE):
+      for group in model_config.feature_groups:
+        is_combine = not uncombined_features & set(group.feature_names)
+        outputs.extend(
+            tf.nest.flatten(
+                model._input_layer(features, group.group_name, is_combine)))
+    forward_op = _sum_op([x for x in outputs if x.dtype.is_floating])
+    backward_op = _sum_op(tf.gradients(forward_op, tf.trainable_variables()))
+    with tf.Session(config=_session_config()) as sess:
+      sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+      forward = time_runs(lambda: sess.run(forward_op), num_warmup, num_runs)
+      backward = time_runs(lambda: sess.run(backward_op), num_warmup, num_runs)
+  return {
+      'embedding/forward_ms':
+          results.make_metric(np.median(forward) * 1000, 'ms', False),
+      'embedding/forward_backward_ms':
+          results.make_metric(np.median(backward) * 1000, 'ms', False)
+  }
+
+
+def _layer_inputs(input_type, batch_size, rng):
+
+  def _random(*shape):
+    return tf.constant(rng.normal(size=shape).astype(np.float32))
+
+  if input_type == 'dense':
+    return _random(batch_size, _NUM_FEATURES * _EMBED_DIM)
+  if input_type == 'fields':
+    return _random(batch_size, _NUM_FEATURES, _EMBED_DIM)
+  if input_type == 'list':
+    return [_random(batch_size, _EMBED_DIM) for _ in range(_NUM_FEATURES)]
+  seq_len = tf.constant(rng.randint(1, _SEQ_LEN + 1, size=batch_size))
+  inputs = [_random(batch_size, _SEQ_LEN, _EMBED_DIM), seq_len]
+  if input_type == 'seq_query':
+    inputs.append(_random(batch_size, _EMBED_DIM))
+  return inputs
+
+
+def _load_layer(name, layer_config):
+  layer_cls, _ = load_keras_layer(layer_config.class_name)
+  params = Parameter(
+      getattr(layer_config, layer_config.WhichOneof('params')), False)
+  return layer_cls(params, name=name)
+
+
+def benchmark_layers(batch_size, num_warmup, num_runs, layer_names=None):
+  """Forward and forward+backward time of the keras layers."""
+  metrics = {}
+  rng = np.random.RandomState(0)
+  for name in sorted(LAYER_BENCHMARKS.keys()):
+    if layer_names and name not in layer_names:
+      continue
+    config_str, input_type = LAYER_BENCHMARKS[name]
+    layer_config = keras_layer_pb2.KerasLayer()
+    text_format.Merge(config_str, layer_config)
+    with tf.Graph().as_default():
+      inputs = _layer_inputs(input_type, batch_size, rng)
+      layer = _load_layer(name, layer_config)
+      forward_op = _sum_op(tf.nest.flatten(layer(inputs, training=True)))
+      float_inputs = [x for x in tf.nest.flatten(inputs) if x.dtype.is_floating]
+      backward_op = _sum_op(
+          tf.gradients(forward_op,
+                       tf.trainable_variables() + float_inputs))
+      with tf.Session(config=_session_config()) as sess:
+        sess.run(tf.global_variables_initializer())
+        forward = time_runs(lambda: sess.run(forward_op), num_warmup, num_runs)
+        backward = time_runs(lambda: sess.run(backward_op), num_warmup,
+                             num_runs)
+    metrics['layers/%s/forward_ms' % name] = results.make_metric(
+        np.median(forward) * 1000, 'ms', False)
+    metrics['layers/%s/forward_backward_ms' % name] = results.make_metric(
+        np.median(backward) * 1000, 'ms', False)
+    logging.info('layer %s: forward %.3fms, forward+backward %.3fms' %
+                 (name, np.median(forward) * 1000, np.median(backward) * 1000))
+  return metrics
+
+
+class _StepTimerHook(tf.train.SessionRunHook):
+  """Record the time of each train step."""
+
+  def __init__(self):
+    self.elapsed = []
+    self._start = None
+
+  def before_run(self, run_context):
+    self._start = time.time()
+
+  def after_run(self, run_context, run_values):
+    self.elapsed.append(time.time() - self._start)
+
+
+def benchmark_train(pipeline_config, data_path, num_warmup, num_runs):
+  """Steps/sec of the estimator train loop.
+
+  The checkpoint saved at the end of training is in pipeline_config.model_dir.
+  """
+  train_config = pipeline_config.train_config
+  train_config.num_steps = num_warmup + num_runs
+  # no checkpoints and summaries during the timed steps
+  train_config.save_checkpoints_steps = train_config.num_steps
+  train_config.ClearField('save_checkpoints_secs')
+  train_config.save_summary_steps = train_config.num_steps
+  train_config.log_step_count_steps = train_config.num_steps
+  estimator, _ = _create_estimator(pipeline_config)
+  timer = _StepTimerHook()
+  estimator.train(
+      _cached_input_fn(_train_input_fn(pipeline_config, data_path)),
+      max_steps=train_config.num_steps,
+      hooks=[timer])
+  elapsed = np.array(timer.elapsed[num_warmup:])
+  return {
+      'train/steps_per_sec':
+          results.make_metric(len(elapsed) / np.sum(elapsed), 'steps/s', True),
+      'train/samples_per_sec':
+          results.make_metric(
+              pipeline_config.data_config.batch_size * len(elapsed) /
+              np.sum(elapsed), 'samples/s', True)
+  }
+
+
+def _predict_inputs(predictor, pipeline_config, batch_size, seed):
+  generator = SyntheticDataGenerator(pipeline_config, seed=seed)
+  rows = generator.generate(batch_size)
+  columns = {
+      field.input_name: [row[fid] for row in rows
+                         ] for fid, field in enumerate(generator.input_fields)
+  }
+  inputs = {}
+  for name in predictor.input_names:
+    dtype = predictor._inputs_map[name].dtype
+    if dtype == tf.string:
+      inputs[name] = np.array(columns[name], dtype=np.object_)
+    else:
+      inputs[name] = np.array(columns[name]).astype(dtype.as_numpy_dtype)
+  return inputs
+
+
+def benchmark_predict(pipeline_config, export_dir, batch_size, num_warmup,
+                      num_runs):
+  """Export the latest checkpoint in model_dir, then time the predictions."""
+  export_config = pipeline_config.export_config
+  # feed each input field by its name
+  export_config.multi_placeholder = True
+  export_config.placeholder_named_by_input = True
+  start = time.time()
+  final_export_dir = export(export_dir, pipeline_config)
+  export_secs = time.time() - start
+  if not isinstance(final_export_dir, str):
+    final_export_dir = final_export_dir.decode('utf-8')
+  predictor = PredictorImpl(final_export_dir)
+  inputs = [
+      _predict_inputs(predictor, pipeline_config, batch_size, seed)
+      for seed in range(num_runs)
+  ]
+  input_iter = iter(inputs * (num_warmup // num_runs + 2))
+  elapsed = time_runs(lambda: predictor.predict(next(input_iter)), num_warmup,
+                      num_runs)
+  logging.info('exported model: %s' % os.path.basename(final_export_dir))
+  return {
+      'predict/export_secs':
+          results.make_metric(export_secs, 's', False),
+      'predict/qps':
+          results.make_metric(batch_size * num_runs / np.sum(elapsed),
+                              'samples/s', True),
+      'predict/p50_ms':
+          results.make_metric(np.percentile(elapsed, 50) * 1000, 'ms', False),
+      'predict/p99_ms':
+          results.make_metric(np.percentile(elapsed, 99) * 1000, 'ms', False)
+  }
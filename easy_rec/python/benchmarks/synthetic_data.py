@@ -0,0 +1,183 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Generate synthetic csv data matching the feature configs of a pipeline.
+
+The value of each input field is generated according to the features built
+on it: ids are drawn from a zipf distribution over the hash buckets or the
+vocab, tag and sequence features get a random number of ids joined by the
+feature separator, raw features get floats in the range of the boundaries
+or [min_val, max_val]. Fields not used by any feature are filled according
+to their input_type, labels are 0/1.
+"""
+import logging
+
+import numpy as np
+from tensorflow.python.platform import gfile
+
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
+from easy_rec.python.utils import config_util
+
+# skewness of the ids, real ids are mostly long tailed
+_ZIPF_A = 1.2
+_MAX_TAG_LEN = 5
+_DEFAULT_MAX_SEQ_LEN = 20
+
+_CATEGORICAL_TYPES = [
+    FeatureConfig.IdFeature, FeatureConfig.TagFeature,
+    FeatureConfig.ComboFeature, FeatureConfig.LookupFeature
+]
+_INT_TYPES = [DatasetConfig.INT32, DatasetConfig.INT64, DatasetConfig.BOOL]
+_FLOAT_TYPES = [DatasetConfig.FLOAT, DatasetConfig.DOUBLE]
+
+
+def _expand_input_fields(data_config):
+  input_fields = []
+  for field in data_config.input_fields:
+    if data_config.auto_expand_input_fields:
+      names = config_util.auto_expand_names(field.input_name)
+    else:
+      names = [field.input_name]
+    for name in names:
+      one_field = DatasetConfig.Field()
+      one_field.CopyFrom(field)
+      one_field.input_name = name
+      input_fields.append(one_field)
+  return input_fields
+
+
+class SyntheticDataGenerator(object):
+  """Generate csv rows in the order of data_config.input_fields.
+
+  Args:
+    pipeline_config: EasyRecConfig, only data_config and feature configs
+      are used
+    seed: random seed, the same seed generates the same data
+    max_vocab_size: max number of distinct ids of a hashed feature
+  """
+
+  def __init__(self, pipeline_config, seed=0, max_vocab_size=100000):
+    self._data_config = pipeline_config.data_config
+    self._input_fields = _expand_input_fields(self._data_config)
+    self._max_vocab_size = max_vocab_size
+    self._rng = np.random.RandomState(seed)
+    self._seq_len_ratio = 1.0
+
+    # the first feature built on each input field decides its values
+    self._field_features = {}
+    for fc in config_util.get_compatible_feature_configs(pipeline_config):
+      for input_id, input_name in enumerate(fc.input_names):
+        if input_name not in self._field_features:
+          self._field_features[input_name] = (fc, input_id)
+
+  @property
+  def input_fields(self):
+    return self._input_fields
+
+  def _vocab_size(self, fc):
+    if len(fc.vocab_list) > 0:
+      return len(fc.vocab_list)
+    if fc.num_buckets > 0:
+      return fc.num_buckets
+    if fc.hash_bucket_size > 0:
+      return min(fc.hash_bucket_size, self._max_vocab_size)
+    return self._max_vocab_size
+
+  def _ids(self, fc, num):
+    ids = (self._rng.zipf(_ZIPF_A, num) - 1) % self._vocab_size(fc)
+    if len(fc.vocab_list) > 0:
+      return [fc.vocab_list[x] for x in ids]
+    return [str(x) for x in ids]
+
+  def _floats(self, fc, num, is_int=False):
+    if len(fc.boundaries) > 0:
+      low, high = fc.boundaries[0], fc.boundaries[-1]
+      margin = (high - low) * 0.1 + 1e-6
+      values = self._rng.uniform(low - margin, high + margin, num)
+    elif fc.max_val > fc.min_val:
+      values = self._rng.uniform(fc.min_val, fc.max_val, num)
+    else:
+      values = self._rng.normal(size=num)
+    if is_int:
+      return ['%d' % x for x in np.round(values)]
+    return ['%.6g' % x for x in values]
+
+  def _sub_values(self, fc, sub_type, num, is_int):
+    if sub_type == FeatureConfig.RawFeature:
+      return self._floats(fc, num, is_int)
+    return self._ids(fc, num)
+
+  def _feature_value(self, fc, input_id, is_int):
+    feature_type = fc.feature_type
+    if feature_type == FeatureConfig.SequenceFeature:
+      max_seq_len = fc.max_seq_len if fc.max_seq_len > 0 else \
+          _DEFAULT_MAX_SEQ_LEN
+      seq_len = int(np.ceil(self._seq_len_ratio * max_seq_len))
+      if fc.seq_multi_sep:
+        steps = [
+            fc.seq_multi_sep.join(
+                self._sub_values(fc, fc.sub_feature_type,
+                                 self._rng.randint(1, _MAX_TAG_LEN + 1),
+                                 is_int)) for _ in range(seq_len)
+        ]
+      else:
+        steps = self._sub_values(fc, fc.sub_feature_type, seq_len, is_int)
+      return fc.separator.join(steps)
+    if feature_type == FeatureConfig.LookupFeature and input_id == 0:
+      num = self._rng.randint(1, _MAX_TAG_LEN + 1)
+      kv_separator = fc.kv_separator if fc.kv_separator else ':'
+      return fc.separator.join([
+          k + kv_separator + v
+          for k, v in zip(self._ids(fc, num), self._floats(fc, num))
+      ])
+    if feature_type == FeatureConfig.TagFeature:
+      num = self._rng.randint(1, _MAX_TAG_LEN + 1)
+      ids = self._ids(fc, num)
+      if fc.kv_separator:
+        ids = [
+            k + fc.kv_separator + v
+            for k, v in zip(ids, self._floats(FeatureConfig(), num))
+        ]
+      return fc.separator.join(ids)
+    if feature_type in _CATEGORICAL_TYPES:
+      if len(fc.boundaries) > 0:
+        return self._floats(fc, 1, is_int)[0]
+      return self._ids(fc, 1)[0]
+    # RawFeature, ExprFeature, PassThroughFeature
+    raw_input_dim = fc.raw_input_dim if fc.raw_input_dim > 1 else 1
+    return fc.separator.join(self._floats(fc, raw_input_dim, is_int))
+
+  def _field_value(self, field):
+    if field.input_name in self._data_config.label_fields:
+      return str(self._rng.randint(0, 2))
+    if field.input_name in self._field_features:
+      fc, input_id = self._field_features[field.input_name]
+      # numeric values of int fields are rounded
+      return self._feature_value(fc, input_id, field.input_type in _INT_TYPES)
+    if field.input_type in _INT_TYPES:
+      return str(self._rng.randint(0, 100))
+    if field.input_type in _FLOAT_TYPES:
+      return '%.6g' % self._rng.uniform()
+    return str(self._rng.randint(0, 100))
+
+  def _row(self):
+    # sequences of one sample have the same length, as required by
+    # the sequence features in the same feature group
+    self._seq_len_ratio = 1.0 - self._rng.uniform()
+    return [self._field_value(field) for field in self._input_fields]
+
+  def generate(self, num_samples):
+    """Generate num_samples rows, each row is a list of field values."""
+    return [self._row() for _ in range(num_samples)]
+
+  def write(self, output_path, num_samples):
+    """Write num_samples rows to output_path in csv format."""
+    separator = self._data_config.separator
+    with gfile.GFile(output_path, 'w') as fout:
+      if self._data_config.with_header:
+        fout.write(
+            separator.join([x.input_name for x in self._input_fields]) + '\n')
+      for row in self.generate(num_samples):
+        fout.write(separator.join(row) + '\n')
+    logging.info('write %d synthetic samples to %s' %
+                 (num_samples, output_path))
@@ -14,7 +14,6 @@
 # ==============================================================================
 """Utilities for early stopping."""
 
-import collections
 import datetime
 import logging
 import operator
@@ -31,12 +30,12 @@ from tensorflow.python.ops import state_ops
 from tensorflow.python.ops import variable_scope
 from tensorflow.python.platform import gfile
 from tensorflow.python.platform import tf_logging
-from tensorflow.python.summary import summary_iterator
 from tensorflow.python.training import basic_session_run_hooks
 from tensorflow.python.training import session_run_hook
 from tensorflow.python.training import training_util
 
 from easy_rec.python.utils.config_util import parse_time
+from easy_rec.python.utils.eval_metrics_index import get_eval_metrics_index
 from easy_rec.python.utils.load_class import load_by_path
 
 if LooseVersion(tf.__version__) >= LooseVersion('2.12.0'):
@@ -386,24 +385,18 @@ def stop_if_no_decrease_hook(estimator,
 def read_eval_metrics(eval_dir):
   """Helper to read eval metrics from eval summary files.
 
+  The event files are read incrementally by EvalMetricsIndex, which is
+  shared by the hooks in the same process.
+
   Args:
     eval_dir: Directory containing summary files with eval metrics.
 
   Returns:
     A `dict` with global steps mapping to `dict` of metric names and values.
   """
-  eval_metrics_dict = collections.defaultdict(dict)
-  for event in _summaries(eval_dir):
-    if not event.HasField('summary'):
-      continue
-    metrics = {}
-    for value in event.summary.value:
-      if value.HasField('simple_value'):
-        metrics[value.tag] = value.simple_value
-    if metrics:
-      eval_metrics_dict[event.step].update(metrics)
-  return collections.OrderedDict(
-      sorted(eval_metrics_dict.items(), key=lambda t: t[0]))
+  index = get_eval_metrics_index(eval_dir, _EVENT_FILE_GLOB_PATTERN)
+  index.update()
+  return index.eval_metrics()
 
 
 def _stop_if_threshold_crossed_hook(estimator, metric_name, threshold,
@@ -479,22 +472,6 @@ def _stop_if_no_metric_improvement_hook(estimator, metric_name,
       run_every_steps=run_every_steps)
 
 
-def _summaries(eval_dir):
-  """Yields `tensorflow.Event` protos from event files in the eval dir.
-
-  Args:
-    eval_dir: Directory containing summary files with eval metrics.
-
-  Yields:
-    `tensorflow.Event` object read from the event files.
-  """
-  if gfile.Exists(eval_dir):
-    for event_file in gfile.Glob(
-        os.path.join(eval_dir, _EVENT_FILE_GLOB_PATTERN)):
-      for event in summary_iterator.summary_iterator(event_file):
-        yield event
-
-
 def _get_or_create_stop_var():
   with variable_scope.variable_scope(
       name_or_scope=EARLY_STOP_SIG_SCOPE,
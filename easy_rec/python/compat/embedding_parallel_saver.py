@@ -1,5 +1,6 @@
 # -*- encoding:utf-8 -*-
 
+import json
 import logging
 import os
 
@@ -35,6 +36,15 @@ except Exception as ex:
   logging.warning('load libload_embed.so failed: %s' % str(ex))
   load_embed_lib = None
 
+# kv embedding keys are grouped by key % _KV_NUM_BUCKETS when saving,
+# so that if the number of workers divides it, each worker only reads
+# the rows of its own buckets when restoring.
+_KV_NUM_BUCKETS = 8192
+# for remote files, rows closer than this are fetched by one ranged read
+_MAX_READ_GAP_BYTES = 64 * 1024
+# max bytes fetched by one ranged read
+_MAX_READ_SPAN_BYTES = 64 * 1024 * 1024
+
 
 def _get_embed_part_id(embed_file):
   embed_file = embed_file.split('/')[-1]
@@ -43,6 +53,183 @@ def _get_embed_part_id(embed_file):
   return int(embed_id)
 
 
+def _get_embed_index_path(filename, var_name):
+  return filename + '-embedding/embed-' + var_name + '.index'
+
+
+def _write_embed_index(filename, var_name, embed_index):
+  """Write the header of an embedding table, which describes the parts."""
+  with gfile.GFile(_get_embed_index_path(filename, var_name), 'w') as fout:
+    json.dump(embed_index, fout)
+
+
+def _has_embed_index(filename, var_name):
+  filename = filename.decode('utf-8')
+  var_name = var_name.decode('utf-8').replace('/', '__')
+  return gfile.Exists(_get_embed_index_path(filename, var_name))
+
+
+def _read_embed_index(filename, var_name):
+  with gfile.GFile(_get_embed_index_path(filename, var_name), 'r') as fin:
+    return json.load(fin)
+
+
+def _read_rows(file_path, dtype, row_size, row_ids):
+  """Read the rows of row_ids from a binary file of fixed size rows.
+
+  Local files are memory mapped, so only the pages of the selected rows
+  are loaded, remote files are fetched by ranged reads, close rows are
+  merged into one read.
+
+  Args:
+    file_path: binary file path.
+    dtype: numpy dtype of the elements.
+    row_size: number of elements of each row.
+    row_ids: sorted ids of the rows to read.
+
+  Return:
+    numpy array of shape [len(row_ids), row_size].
+  """
+  row_ids = np.asarray(row_ids, dtype=np.int64)
+  if len(row_ids) == 0:
+    return np.zeros([0, row_size], dtype=dtype)
+  if '://' not in file_path:
+    embed_vals = np.memmap(file_path, dtype=dtype, mode='r')
+    embed_vals = embed_vals.reshape([-1, row_size])
+    return np.array(embed_vals[row_ids])
+
+  row_bytes = np.dtype(dtype).itemsize * row_size
+  max_gap = max(1, _MAX_READ_GAP_BYTES // row_bytes)
+  max_span = max(1, _MAX_READ_SPAN_BYTES // row_bytes)
+  breaks = list(np.where(np.diff(row_ids) > max_gap)[0] + 1)
+  rows = np.zeros([len(row_ids), row_size], dtype=dtype)
+  with gfile.GFile(file_path, 'rb') as fin:
+    for seg_start, seg_end in zip([0] + breaks, breaks + [len(row_ids)]):
+      pos = seg_start
+      while pos < seg_end:
+        span_start = row_ids[pos]
+        end = np.searchsorted(row_ids, span_start + max_span, side='left')
+        end = min(end, seg_end)
+        span_stop = row_ids[end - 1] + 1
+        fin.seek(span_start * row_bytes)
+        span_vals = np.frombuffer(
+            fin.read((span_stop - span_start) * row_bytes), dtype=dtype)
+        span_vals = span_vals.reshape([-1, row_size])
+        rows[pos:end] = span_vals[row_ids[pos:end] - span_start]
+        pos = end
+  return rows
+
+
+def _group_by_bucket(keys, vals, num_buckets=_KV_NUM_BUCKETS):
+  """Sort the keys and vals by key % num_buckets.
+
+  Return:
+    sorted keys, sorted vals and the row offsets of the buckets.
+  """
+  bucket_ids = keys % num_buckets
+  sort_ids = np.argsort(bucket_ids, kind='stable')
+  bucket_offsets = np.searchsorted(
+      bucket_ids.take(sort_ids), np.arange(num_buckets + 1))
+  return (keys.take(sort_ids,
+                    axis=0), vals.take(sort_ids,
+                                       axis=0), bucket_offsets.astype(np.int64))
+
+
+def _load_indexed_dense_embed(filename, var_name, embed_dim, embed_part_size,
+                              part_id, part_num):
+  """Load the rows of part_id from an indexed dense embedding checkpoint.
+
+  The rows are striped over the parts: row i of saved part p is global row
+  p + i * saved_part_num, global row g is row g // part_num of part
+  g % part_num. So only the saved parts with
+  (part_id - p) % gcd(saved_part_num, part_num) == 0 have rows of part_id,
+  and the rows in them are evenly strided.
+  """
+  filename = filename.decode('utf-8')
+  var_name = var_name.decode('utf-8').replace('/', '__')
+  embed_index = _read_embed_index(filename, var_name)
+  assert embed_index['embed_dim'] == embed_dim, \
+      'embed_dim of %s does not match: %d vs %d' % (
+          var_name, embed_index['embed_dim'], embed_dim)
+  saved_part_num = embed_index['part_num']
+  total_rows = embed_part_size * part_num
+  part_gcd = np.gcd(saved_part_num, part_num)
+  saved_step = part_num // part_gcd
+  part_step = saved_part_num // part_gcd
+
+  part_embed_vals = np.zeros([embed_part_size, embed_dim], dtype=np.float32)
+  part_update_cnt = 0
+  for saved_part_id in range(saved_part_num):
+    if (part_id - saved_part_id) % part_gcd != 0:
+      continue
+    row_start = [
+        x for x in range(saved_step)
+        if (saved_part_id + x * saved_part_num) % part_num == part_id
+    ][0]
+    row_stop = min(embed_index['part_rows'][saved_part_id],
+                   (total_rows - saved_part_id + saved_part_num - 1) //
+                   saved_part_num)
+    if row_start >= row_stop:
+      continue
+    embed_file = filename + '-embedding/embed-' + var_name + \
+        '-part-%d.bin' % saved_part_id
+    embed_val = _read_rows(embed_file, np.float32, embed_dim,
+                           np.arange(row_start, row_stop, saved_step))
+    part_start = (saved_part_id + row_start * saved_part_num) // part_num
+    part_embed_vals[part_start::part_step][:len(embed_val)] = embed_val
+    part_update_cnt += len(embed_val)
+  logging.info('task[%d] load_part_cnt=%d from %d indexed parts' %
+               (part_id, part_update_cnt, saved_part_num))
+  return part_embed_vals
+
+
+def _load_indexed_kv_embed(filename, var_name, embed_dim, part_id, part_num):
+  """Load the keys of part_id from an indexed kv embedding checkpoint.
+
+  Each saved part is grouped by key % num_buckets, with the row offsets of
+  the buckets saved in the .bucket file. If part_num divides num_buckets,
+  the keys of part_id are exactly those in buckets part_id,
+  part_id + part_num, ..., otherwise all the keys are read and filtered.
+  """
+  filename = filename.decode('utf-8')
+  var_name = var_name.decode('utf-8').replace('/', '__')
+  embed_index = _read_embed_index(filename, var_name)
+  num_buckets = embed_index['num_buckets']
+  key_dtype = np.dtype(embed_index['key_dtype'])
+  all_keys = []
+  all_vals = []
+  for saved_part_id in range(embed_index['part_num']):
+    part_prefix = filename + '-embedding/embed-' + var_name + \
+        '-part-%d' % saved_part_id
+    with gfile.GFile(part_prefix + '.bucket', 'rb') as fin:
+      bucket_offsets = np.frombuffer(fin.read(), dtype=np.int64)
+    if num_buckets % part_num == 0:
+      row_ids = np.concatenate([
+          np.arange(bucket_offsets[x], bucket_offsets[x + 1])
+          for x in range(part_id, num_buckets, part_num)
+      ])
+      part_keys = _read_rows(part_prefix + '.key', key_dtype, 1, row_ids)
+      part_keys = part_keys.reshape([-1])
+    else:
+      part_keys = _read_rows(part_prefix + '.key', key_dtype, 1,
+                             np.arange(bucket_offsets[-1])).reshape([-1])
+      row_ids = np.where(part_keys % part_num == part_id)[0]
+      part_keys = part_keys[row_ids]
+    all_keys.append(part_keys.astype(np.int64))
+    all_vals.append(
+        _read_rows(part_prefix + '.val', np.float32, embed_dim, row_ids))
+  all_keys = np.concatenate(all_keys, axis=0)
+  all_vals = np.concatenate(all_vals, axis=0)
+  logging.info('task[%d] load %d keys from %d indexed parts' %
+               (part_id, len(all_keys), embed_index['part_num']))
+
+  shuffle_ids = np.array(range(len(all_keys)))
+  np.random.shuffle(shuffle_ids)
+  all_keys = all_keys.take(shuffle_ids, axis=0)
+  all_vals = all_vals.take(shuffle_ids, axis=0)
+  return all_keys, all_vals
+
+
 class EmbeddingParallelSaver(saver.Saver):
 
   def __init__(self,
@@ -113,6 +300,12 @@ class EmbeddingParallelSaver(saver.Saver):
         fout.write(embed.tobytes())
 
       if task_id == 0:
+        _write_embed_index(
+            filename, var_name, {
+                'part_num': hvd.size(),
+                'embed_dim': embed.shape[1],
+                'part_rows': [embed.shape[0]] * hvd.size()
+            })
         # clear old embedding tables
         embed_pattern = filename + '-embedding/embed-' + var_name + '-part-*.bin'
         embed_files = gfile.Glob(embed_pattern)
@@ -166,9 +359,9 @@ class EmbeddingParallelSaver(saver.Saver):
       logging.info('task[%d] load_part_cnt=%d' % (part_id, part_update_cnt))
       return part_embed_vals
 
-    with ops.control_dependencies([embed_var._initializer_op]):
+    def _load_embed_all_parts():
       if load_embed_lib is not None:
-        embed_val = load_embed_lib.load_embed(
+        return load_embed_lib.load_embed(
             task_index=hvd.rank(),
             task_num=hvd.size(),
             embed_dim=embed_dim,
@@ -176,11 +369,26 @@ class EmbeddingParallelSaver(saver.Saver):
             var_name='embed-' + embed_var.name.replace('/', '__'),
             ckpt_path=file_name)
       else:
-        embed_val = script_ops.py_func(_load_embed, [
+        return script_ops.py_func(_load_embed, [
             embed_var, embed_dim, embed_part_size,
             hvd.rank(),
             hvd.size(), file_name, embed_var.name
         ], dtypes.float32)
+
+    def _load_embed_indexed():
+      # only read the rows of the current worker
+      return script_ops.py_func(_load_indexed_dense_embed, [
+          file_name, embed_var.name, embed_dim, embed_part_size,
+          hvd.rank(),
+          hvd.size()
+      ], dtypes.float32)
+
+    with ops.control_dependencies([embed_var._initializer_op]):
+      has_index = script_ops.py_func(_has_embed_index,
+                                     [file_name, embed_var.name], dtypes.bool)
+      has_index.set_shape([])
+      embed_val = control_flow_ops.cond(has_index, _load_embed_indexed,
+                                        _load_embed_all_parts)
       embed_val.set_shape(embed_var.get_shape())
       return state_ops.assign(embed_var, embed_val)
 
@@ -197,14 +405,25 @@ class EmbeddingParallelSaver(saver.Saver):
       if not gfile.Exists(sok_dir):
         gfile.MakeDirs(sok_dir)
       task_id = hvd.rank()
+      indices, values, bucket_offsets = _group_by_bucket(indices, values)
       key_file = filename + '-embedding/embed-' + var_name + '-part-%d.key' % task_id
       with gfile.GFile(key_file, 'wb') as fout:
         fout.write(indices.tobytes())
       val_file = filename + '-embedding/embed-' + var_name + '-part-%d.val' % task_id
       with gfile.GFile(val_file, 'wb') as fout:
         fout.write(values.tobytes())
+      bucket_file = filename + '-embedding/embed-' + var_name + '-part-%d.bucket' % task_id
+      with gfile.GFile(bucket_file, 'wb') as fout:
+        fout.write(bucket_offsets.tobytes())
 
       if task_id == 0:
+        _write_embed_index(
+            filename, var_name, {
+                'part_num': hvd.size(),
+                'embed_dim': values.shape[1],
+                'key_dtype': indices.dtype.name,
+                'num_buckets': _KV_NUM_BUCKETS
+            })
         key_file_pattern = filename + '-embedding/embed-' + var_name + '-part-*.key'
         key_files = gfile.Glob(key_file_pattern)
         for key_file in key_files:
@@ -214,6 +433,9 @@ class EmbeddingParallelSaver(saver.Saver):
             val_file = key_file[:-4] + '.val'
             if gfile.Exists(val_file):
               gfile.DeleteRecursively(val_file)
+            old_bucket_file = key_file[:-4] + '.bucket'
+            if gfile.Exists(old_bucket_file):
+              gfile.DeleteRecursively(old_bucket_file)
 
       return np.asarray([key_file, val_file], order='C', dtype=np.object)
 
@@ -241,12 +463,12 @@ class EmbeddingParallelSaver(saver.Saver):
           tmp_ids = tmp_keys % hvd.size()
           tmp_ids = np.where(tmp_ids == hvd.rank())[0]
           if len(tmp_ids) == 0:
-            break
+            continue
           all_keys.append(tmp_keys.take(tmp_ids, axis=0))
           logging.info('part_keys.shape=%s %s %s' % (str(
               tmp_keys.shape), str(tmp_ids.shape), str(all_keys[-1].shape)))
 
-        val_file = key_file[:-4] + 'vals'
+        val_file = key_file[:-4] + '.val'
         with gfile.GFile(val_file, 'rb') as fin:
           tmp_vals = np.frombuffer(
               fin.read(), dtype=np.float32).reshape([-1, sok_var._dimension])
@@ -265,17 +487,37 @@ class EmbeddingParallelSaver(saver.Saver):
 
     file_name = ops.get_default_graph().get_tensor_by_name(
         self.saver_def.filename_tensor_name)
-    if load_embed_lib is not None:
-      keys, vals = load_embed_lib.load_kv_embed(
-          task_index=hvd.rank(),
-          task_num=hvd.size(),
-          embed_dim=sok_var._dimension,
-          var_name='embed-' + sok_var.name.replace('/', '__'),
-          ckpt_path=file_name)
-    else:
-      logging.warning('libload_embed.so not loaded, will use python script_ops')
-      keys, vals = script_ops.py_func(_load_key_vals, [file_name, sok_var.name],
-                                      (dtypes.int64, dtypes.float32))
+
+    def _load_key_vals_all_parts():
+      if load_embed_lib is not None:
+        keys, vals = load_embed_lib.load_kv_embed(
+            task_index=hvd.rank(),
+            task_num=hvd.size(),
+            embed_dim=sok_var._dimension,
+            var_name='embed-' + sok_var.name.replace('/', '__'),
+            ckpt_path=file_name)
+      else:
+        logging.warning(
+            'libload_embed.so not loaded, will use python script_ops')
+        keys, vals = script_ops.py_func(_load_key_vals,
+                                        [file_name, sok_var.name],
+                                        (dtypes.int64, dtypes.float32))
+      return keys, vals
+
+    def _load_key_vals_indexed():
+      # only read the buckets of the current worker
+      keys, vals = script_ops.py_func(
+          _load_indexed_kv_embed,
+          [file_name, sok_var.name, sok_var._dimension,
+           hvd.rank(),
+           hvd.size()], (dtypes.int64, dtypes.float32))
+      return keys, vals
+
+    has_index = script_ops.py_func(_has_embed_index, [file_name, sok_var.name],
+                                   dtypes.bool)
+    has_index.set_shape([])
+    keys, vals = control_flow_ops.cond(has_index, _load_key_vals_indexed,
+                                       _load_key_vals_all_parts)
     with ops.control_dependencies([sok_var._initializer_op]):
       return dynamic_variable_ops.dummy_var_assign(sok_var.handle, keys, vals)
 
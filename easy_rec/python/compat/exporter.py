@@ -29,9 +29,9 @@ from tensorflow.python.estimator.exporter import _SavedModelExporter
 from tensorflow.python.framework import errors_impl
 from tensorflow.python.platform import gfile
 from tensorflow.python.platform import tf_logging
-from tensorflow.python.summary import summary_iterator
 
 from easy_rec.python.utils import io_util
+from easy_rec.python.utils.eval_metrics_index import get_eval_metrics_index
 
 
 def _loss_smaller(best_eval_result, current_eval_result):
@@ -99,7 +99,8 @@ class BestExporter(Exporter):
                compare_fn=_loss_smaller,
                assets_extra=None,
                as_text=False,
-               exports_to_keep=5):
+               exports_to_keep=5,
+               post_export_fn=None):
     """Create an `Exporter` to use with `tf.estimator.EvalSpec`.
 
     Example of creating a BestExporter for training and evaluation:
@@ -171,6 +172,8 @@ class BestExporter(Exporter):
       exports_to_keep: Number of exports to keep.  Older exports will be
         garbage-collected.  Defaults to 5.  Set to `None` to disable garbage
         collection.
+      post_export_fn: An optional function called with the export directory
+        after each export, such as optimizing the exported serving graph.
 
     Raises:
       ValueError: if any argument is invalid.
@@ -184,6 +187,7 @@ class BestExporter(Exporter):
                                                      serving_input_receiver_fn,
                                                      assets_extra, as_text)
 
+    self._post_export_fn = post_export_fn
     self._event_file_pattern = event_file_pattern
     self._model_dir = None
     self._best_eval_result = None
@@ -221,6 +225,8 @@ class BestExporter(Exporter):
                                                         checkpoint_path,
                                                         eval_result,
                                                         is_the_final_export)
+      if self._post_export_fn is not None:
+        self._post_export_fn(export_result)
       self._garbage_collect_exports(export_path)
       # cp best checkpoints to best folder
       model_dir, _ = os.path.split(checkpoint_path)
@@ -315,21 +321,18 @@ class BestExporter(Exporter):
     if not event_files:
       return None
 
+    eval_dir, event_file_pattern = os.path.split(event_files)
+    index = get_eval_metrics_index(eval_dir, event_file_pattern)
+    index.update()
     best_eval_result = None
-    for event_file in gfile.Glob(os.path.join(event_files)):
-      for event in summary_iterator.summary_iterator(event_file):
-        if event.HasField('summary'):
-          event_eval_result = {}
-          event_eval_result['global_step'] = event.step
-          if event.step >= curr_eval_result['global_step']:
-            continue
-          for value in event.summary.value:
-            if value.HasField('simple_value'):
-              event_eval_result[value.tag] = value.simple_value
-          if len(event_eval_result) >= 2:
-            if best_eval_result is None or self._compare_fn(
-                best_eval_result, event_eval_result):
-              best_eval_result = event_eval_result
+    for step, metrics in index.eval_metrics().items():
+      if step >= curr_eval_result['global_step']:
+        continue
+      event_eval_result = dict(metrics)
+      event_eval_result['global_step'] = step
+      if best_eval_result is None or self._compare_fn(best_eval_result,
+                                                      event_eval_result):
+        best_eval_result = event_eval_result
     return best_eval_result
 
 
@@ -343,7 +346,8 @@ class FinalExporter(Exporter):
                name,
                serving_input_receiver_fn,
                assets_extra=None,
-               as_text=False):
+               as_text=False,
+               post_export_fn=None):
     """Create an `Exporter` to use with `tf.estimator.EvalSpec`.
 
     Args:
@@ -360,6 +364,8 @@ class FinalExporter(Exporter):
         `{'my_asset_file.txt': '/path/to/my_asset_file.txt'}`.
       as_text: whether to write the SavedModel proto in text format. Defaults to
         `False`.
+      post_export_fn: An optional function called with the export directory
+        after the export, such as optimizing the exported serving graph.
 
     Raises:
       ValueError: if any arguments is invalid.
@@ -367,6 +373,7 @@ class FinalExporter(Exporter):
     self._saved_model_exporter = _SavedModelExporter(name,
                                                      serving_input_receiver_fn,
                                                      assets_extra, as_text)
+    self._post_export_fn = post_export_fn
 
   @property
   def name(self):
@@ -379,9 +386,13 @@ class FinalExporter(Exporter):
 
     tf_logging.info('Performing the final export in the end of training.')
 
-    return self._saved_model_exporter.export(estimator, export_path,
-                                             checkpoint_path, eval_result,
-                                             is_the_final_export)
+    export_result = self._saved_model_exporter.export(estimator, export_path,
+                                                      checkpoint_path,
+                                                      eval_result,
+                                                      is_the_final_export)
+    if self._post_export_fn is not None:
+      self._post_export_fn(export_result)
+    return export_result
 
 
 class LatestExporter(Exporter):
@@ -174,6 +174,8 @@ from easy_rec.python.compat.feature_column import utils as fc_utils
 from easy_rec.python.utils import conditional
 from easy_rec.python.utils import constant
 from easy_rec.python.utils import embedding_utils
+from easy_rec.python.utils import ev_budget
+from easy_rec.python.utils import user_side_util
 
 try:
   from easy_rec.python.compat import dynamic_variable
@@ -396,6 +398,8 @@ def _internal_input_layer(features,
             builder,
             weight_collections=weight_collections,
             trainable=trainable)
+        # user side features are looked up once per request on serving
+        tensor = user_side_util.maybe_broadcast(column.raw_name, tensor)
         num_elements = column._variable_shape.num_elements()  # pylint: disable=protected-access
         batch_size = array_ops.shape(tensor)[0]
         output_tensor = array_ops.reshape(
@@ -3041,6 +3045,12 @@ class _SharedEmbeddingColumn(
 
         ops.add_to_collection(self.shared_embedding_collection_name,
                               embedding_weights)
+      if self.ev_params is not None and self.ev_params.key_budget is not None \
+          and os.environ.get('tf.estimator.mode', '') == \
+          os.environ.get('tf.estimator.ModeKeys.TRAIN', 'train'):
+        sparse_ids, sparse_weights = ev_budget.filter_sparse_ids(
+            self.ev_params.key_budget, embedding_weights, self.dimension,
+            sparse_ids, sparse_weights)
       if self.ckpt_to_load_from is not None:
         to_restore = embedding_weights
         if isinstance(to_restore, variables.PartitionedVariable):
@@ -171,6 +171,7 @@ from easy_rec.python.compat import ops as compat_ops
 from easy_rec.python.compat.feature_column import feature_column as fc_old
 from easy_rec.python.compat.feature_column import utils as fc_utils
 from easy_rec.python.layers import utils as layer_utils
+from easy_rec.python.utils import ev_budget
 
 from easy_rec.python.compat.feature_column.feature_column import embedding_lookup_ragged  # NOQA
 
@@ -3435,6 +3436,12 @@ class EmbeddingColumn(
                                         embedding_weights):
     sparse_ids = sparse_tensors.id_tensor
     sparse_weights = sparse_tensors.weight_tensor
+    if self.ev_params is not None and self.ev_params.key_budget is not None \
+        and os.environ.get('tf.estimator.mode', '') == \
+        os.environ.get('tf.estimator.ModeKeys.TRAIN', 'train'):
+      sparse_ids, sparse_weights = ev_budget.filter_sparse_ids(
+          self.ev_params.key_budget, embedding_weights, self.dimension,
+          sparse_ids, sparse_weights)
 
     if self.ckpt_to_load_from is not None:
       to_restore = embedding_weights
@@ -0,0 +1,125 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Streaming item frequency estimation for sampling bias correction.
+
+Reference:
+  Sampling-Bias-Corrected Neural Modeling for Large Corpus
+  Item Recommendations, RecSys 2019.
+
+For each hash bucket, the estimator keeps the global_step an item is last
+seen(last_step), and a moving average of the number of steps between two
+consecutive occurrences(interval). The probability of an item occurs in
+a batch is estimated as 1 / interval. With multiple hash functions, the
+largest interval, i.e. the least colliding bucket, is used. Items not seen
+yet are estimated to occur once in global_step + 1 steps.
+"""
+import tensorflow as tf
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class FrequencyEstimator(object):
+
+  def __init__(self, num_buckets, num_hashes=2, alpha=0.01, name='item_freq'):
+    """Create the state variables, which are saved in checkpoints.
+
+    Args:
+      num_buckets: number of hash buckets of each hash array.
+      num_hashes: number of hash functions.
+      alpha: learning rate of the moving average of intervals.
+      name: variable scope name.
+    """
+    self._num_buckets = num_buckets
+    self._num_hashes = num_hashes
+    self._alpha = alpha
+    self._read_vals = []
+    with tf.variable_scope(name):
+      self._last_step = tf.get_variable(
+          'last_step',
+          shape=[num_hashes, num_buckets],
+          dtype=tf.int64,
+          initializer=tf.zeros_initializer(),
+          trainable=False,
+          use_resource=True)
+      self._interval = tf.get_variable(
+          'interval',
+          shape=[num_hashes, num_buckets],
+          dtype=tf.float32,
+          initializer=tf.zeros_initializer(),
+          trainable=False,
+          use_resource=True)
+
+  def _bucket_indices(self, item_ids):
+    """Get the [num_ids, num_hashes, 2] indices into the state arrays."""
+    item_ids = tf.reshape(item_ids, [-1])
+    if item_ids.dtype != tf.string:
+      item_ids = tf.as_string(item_ids)
+    indices = []
+    for hash_id in range(self._num_hashes):
+      buckets = tf.strings.to_hash_bucket_strong(
+          item_ids, self._num_buckets, key=[hash_id, 2019])
+      indices.append(
+          tf.stack([tf.fill(tf.shape(buckets), tf.to_int64(hash_id)), buckets],
+                   axis=1))
+    return tf.stack(indices, axis=1)
+
+  def log_prob(self, item_ids, global_step=None):
+    """Estimated log probability of the items occur in a batch.
+
+    Items not seen before are estimated to occur once since training
+    starts, i.e. the interval is global_step + 1, which is also the initial
+    interval of an item first seen at global_step. So rare items still
+    get the logQ correction when they first occur, instead of being
+    treated as the most popular items.
+
+    Args:
+      item_ids: [num_ids] int or string tensor.
+      global_step: int64 scalar tensor, default is the global step.
+
+    Return:
+      [num_ids] float tensor.
+    """
+    if global_step is None:
+      global_step = tf.train.get_or_create_global_step()
+    indices = self._bucket_indices(item_ids)
+    interval = tf.gather_nd(self._interval.read_value(), indices)
+    self._read_vals.append(interval)
+    # each occurrence updates all the hash buckets of the item,
+    # so the item is not seen if any of its buckets is not updated
+    not_seen = tf.reduce_min(interval, axis=1) <= 0
+    interval = tf.reduce_max(interval, axis=1)
+    interval = tf.where(
+        not_seen, tf.fill(tf.shape(interval), tf.to_float(global_step + 1)),
+        interval)
+    return -tf.log(tf.maximum(interval, 1.0))
+
+  def update(self, item_ids, global_step):
+    """Update the estimates with the items of current batch.
+
+    The update is run after the values read by log_prob.
+
+    Args:
+      item_ids: [num_ids] int or string tensor.
+      global_step: int64 scalar tensor.
+
+    Return:
+      the update op.
+    """
+    indices = tf.reshape(self._bucket_indices(item_ids), [-1, 2])
+    with tf.control_dependencies(self._read_vals):
+      last_step = tf.gather_nd(self._last_step.read_value(), indices)
+      interval = tf.gather_nd(self._interval.read_value(), indices)
+      # for items first seen, the interval is initialized
+      # as the number of steps since training starts
+      new_interval = tf.where(
+          interval > 0, (1 - self._alpha) * interval +
+          self._alpha * tf.to_float(global_step - last_step),
+          tf.to_float(global_step - last_step + 1))
+    with tf.control_dependencies([new_interval]):
+      update_interval = tf.scatter_nd_update(self._interval, indices,
+                                             new_interval)
+      update_step = tf.scatter_nd_update(
+          self._last_step, indices,
+          tf.fill(tf.shape(last_step), tf.to_int64(global_step)))
+    return tf.group(update_interval, update_step)
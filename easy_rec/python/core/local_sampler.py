@@ -0,0 +1,518 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""In-process samplers which do not depend on a graph-learn cluster.
+
+The item attributes, node weights and the user->item adjacency(CSR) are
+kept in numpy arrays. The arrays are saved to shm_dir(local_graph_dir of
+the sampler configs, /dev/shm by default) by the first process and memory
+mapped by the other processes on the same host, so that they are shared
+instead of being loaded by each worker.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import six
+import tensorflow as tf
+
+from easy_rec.python.core.sampler import BaseSampler
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+# max rounds of rejection sampling, the remaining samples
+# are accepted without checking
+MAX_REJECT_ROUNDS = 10
+
+
+def _default_shm_dir():
+  if os.path.isdir('/dev/shm'):
+    return '/dev/shm'
+  return tempfile.gettempdir()
+
+
+def _split_paths(data_path):
+  return [x for x in data_path.split(',') if x]
+
+
+def _read_rows(data_path):
+  """Read tab separated rows of graph-learn format files.
+
+  The optional schema header, such as id:int64 weight:float, is skipped.
+  """
+  for path in _split_paths(data_path):
+    with tf.gfile.GFile(path, 'r') as fin:
+      for line_id, line_str in enumerate(fin):
+        line_str = line_str.rstrip('\r\n')
+        if not line_str:
+          continue
+        cols = line_str.split('\t')
+        if line_id == 0:
+          try:
+            int(cols[0])
+          except ValueError:
+            continue
+        yield cols
+
+
+class LocalGraph(object):
+  """Item nodes and user->item edges stored in numpy arrays.
+
+  Args:
+    item_data_path: item data path. id:int64 | weight:float | attrs:string.
+    attr_np_types: numpy types of the item attrs.
+    attr_delimiter: delimiter of item attrs.
+    edge_data_paths: dict of edge name to edge data path,
+      userid:int64 | itemid:int64 | weight:float.
+    shm_dir: directory to share the arrays between processes.
+  """
+
+  def __init__(self,
+               item_data_path,
+               attr_np_types,
+               attr_delimiter=':',
+               edge_data_paths=None,
+               shm_dir=None):
+    self._attr_np_types = attr_np_types
+    self._attr_delimiter = attr_delimiter
+    self._edge_data_paths = edge_data_paths if edge_data_paths else {}
+    graph_dir = os.path.join(shm_dir if shm_dir else _default_shm_dir(),
+                             'easy_rec_local_graph',
+                             self._graph_key(item_data_path))
+    if not os.path.exists(os.path.join(graph_dir, 'item_ids.npy')):
+      self._build(item_data_path, graph_dir)
+    self._load(graph_dir)
+
+  def _graph_key(self, item_data_path):
+    key_strs = [self._attr_delimiter]
+    key_strs.extend([str(x) for x in self._attr_np_types])
+    all_paths = [('item', item_data_path)]
+    all_paths.extend(sorted(self._edge_data_paths.items()))
+    for name, data_path in all_paths:
+      key_strs.append(name)
+      for path in _split_paths(data_path):
+        key_strs.append(path)
+        try:
+          file_stat = tf.gfile.Stat(path)
+          key_strs.append('%d:%d' % (file_stat.length, file_stat.mtime_nsec))
+        except Exception as ex:
+          logging.warning('could not stat %s: %s' % (path, str(ex)))
+    return hashlib.md5('\n'.join(key_strs).encode('utf-8')).hexdigest()
+
+  def _build(self, item_data_path, graph_dir):
+    logging.info('build local graph from %s' % item_data_path)
+    item_ids = []
+    item_weights = []
+    attr_cols = [[] for _ in self._attr_np_types]
+    for cols in _read_rows(item_data_path):
+      item_ids.append(int(cols[0]))
+      item_weights.append(float(cols[1]))
+      attr_vals = cols[2].split(self._attr_delimiter) if len(cols) > 2 else []
+      assert len(attr_vals) == len(attr_cols), \
+          'invalid item[%s], expect %d attrs: %s' % (
+              cols[0], len(attr_cols), cols[2] if len(cols) > 2 else '')
+      for col_id, attr_val in enumerate(attr_vals):
+        attr_cols[col_id].append(attr_val)
+    assert len(item_ids) > 0, 'no items in %s' % item_data_path
+
+    arrays = {}
+    item_ids = np.array(item_ids, dtype=np.int64)
+    # items are sorted by id, so that ids are mapped to indices
+    # by binary search
+    order = np.argsort(item_ids, kind='mergesort')
+    arrays['item_ids'] = item_ids[order]
+    item_weights = np.array(item_weights, dtype=np.float64)[order]
+    arrays['item_cum_weights'] = np.cumsum(item_weights)
+    for col_id, np_type in enumerate(self._attr_np_types):
+      if np_type == str:
+        col = np.array([six.ensure_binary(x) for x in attr_cols[col_id]])
+      else:
+        col = np.array(attr_cols[col_id]).astype(np_type)
+      arrays['attr_%d' % col_id] = col[order]
+
+    for edge_name, edge_data_path in self._edge_data_paths.items():
+      user_ids = []
+      dst_ids = []
+      for cols in _read_rows(edge_data_path):
+        user_ids.append(int(cols[0]))
+        dst_ids.append(int(cols[1]))
+      user_ids = np.array(user_ids, dtype=np.int64)
+      dst_ids = np.array(dst_ids, dtype=np.int64)
+      dst_idx = np.searchsorted(arrays['item_ids'], dst_ids)
+      dst_idx = np.minimum(dst_idx, len(arrays['item_ids']) - 1)
+      valid = arrays['item_ids'][dst_idx] == dst_ids
+      if not np.all(valid):
+        logging.warning('%d edges of %s have unknown items' %
+                        (np.sum(~valid), edge_name))
+      user_ids = user_ids[valid]
+      dst_idx = dst_idx[valid]
+      # CSR: rows are sorted user ids, columns are sorted item indices
+      order = np.lexsort((dst_idx, user_ids))
+      user_ids = user_ids[order]
+      dst_idx = dst_idx[order]
+      uniq_users, user_starts = np.unique(user_ids, return_index=True)
+      arrays[edge_name + '_users'] = uniq_users
+      arrays[edge_name + '_indptr'] = np.append(user_starts,
+                                                len(dst_idx)).astype(np.int64)
+      arrays[edge_name + '_indices'] = dst_idx.astype(np.int64)
+      # row * num_items + col of each edge, which is sorted, used to
+      # search (user, item) pairs in the neighbor lists in one pass
+      user_rows = np.repeat(
+          np.arange(len(uniq_users), dtype=np.int64),
+          np.diff(arrays[edge_name + '_indptr']))
+      arrays[edge_name +
+             '_keys'] = user_rows * len(arrays['item_ids']) + arrays[edge_name +
+                                                                     '_indices']
+
+    parent_dir = os.path.dirname(graph_dir)
+    if not os.path.exists(parent_dir):
+      os.makedirs(parent_dir)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    for name, arr in arrays.items():
+      np.save(os.path.join(tmp_dir, name + '.npy'), arr)
+    try:
+      os.rename(tmp_dir, graph_dir)
+      logging.info('local graph is saved to %s' % graph_dir)
+    except OSError:
+      # built by another process on the same host
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+
+  def _load(self, graph_dir):
+
+    def _load_arr(name):
+      return np.load(os.path.join(graph_dir, name + '.npy'), mmap_mode='r')
+
+    self._item_ids = _load_arr('item_ids')
+    self._item_cum_weights = _load_arr('item_cum_weights')
+    self._attrs = [
+        _load_arr('attr_%d' % col_id)
+        for col_id in range(len(self._attr_np_types))
+    ]
+    self._edges = {}
+    for edge_name in self._edge_data_paths:
+      self._edges[edge_name] = (_load_arr(edge_name + '_users'),
+                                _load_arr(edge_name + '_indptr'),
+                                _load_arr(edge_name + '_indices'),
+                                _load_arr(edge_name + '_keys'))
+
+  @property
+  def num_items(self):
+    return len(self._item_ids)
+
+  def item_index(self, ids):
+    """Map item ids to indices, -1 for unknown items."""
+    ids = np.asarray(ids, dtype=np.int64)
+    idx = np.minimum(np.searchsorted(self._item_ids, ids), self.num_items - 1)
+    return np.where(self._item_ids[idx] == ids, idx, -1)
+
+  def _user_rows(self, edge_name, user_ids):
+    users = self._edges[edge_name][0]
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    if len(users) == 0:
+      return np.full(user_ids.shape, -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(users, user_ids), len(users) - 1)
+    return np.where(users[rows] == user_ids, rows, -1)
+
+  def has_edges(self, edge_name, user_ids, item_idx):
+    """Check whether (user_ids[i], item_idx[i]) are edges.
+
+    The neighbor list of each user is sorted, so it is a binary search
+    in the neighbor lists.
+    """
+    keys = self._edges[edge_name][3]
+    if len(keys) == 0:
+      return np.zeros(len(item_idx), dtype=bool)
+    rows = self._user_rows(edge_name, user_ids)
+    query_keys = rows * self.num_items + item_idx
+    pos = np.minimum(np.searchsorted(keys, query_keys), len(keys) - 1)
+    return np.logical_and(rows >= 0, keys[pos] == query_keys)
+
+  def neighbors(self, edge_name, user_ids, max_num):
+    """Get at most max_num neighbors of each user.
+
+    Return:
+      item_idx: item indices of all the neighbors.
+      indices: [num_neighbors, 2], the user position in user_ids
+        and the neighbor position of the user.
+    """
+    _, indptr, all_indices, _ = self._edges[edge_name]
+    rows = self._user_rows(edge_name, user_ids)
+    item_idx = []
+    indices = []
+    for i, row in enumerate(rows):
+      if row < 0:
+        continue
+      neighbors = all_indices[indptr[row]:indptr[row + 1]][:max_num]
+      item_idx.append(neighbors)
+      user_pos = np.full(len(neighbors), i, dtype=np.int64)
+      neighbor_pos = np.arange(len(neighbors), dtype=np.int64)
+      indices.append(np.stack([user_pos, neighbor_pos], axis=1))
+    if len(item_idx) == 0:
+      return np.zeros([0], dtype=np.int64), np.zeros([0, 2], dtype=np.int64)
+    return np.concatenate(item_idx), np.concatenate(indices, axis=0)
+
+  def sample_items(self, num, weighted=True):
+    if weighted:
+      rand_vals = np.random.uniform(0, self._item_cum_weights[-1], size=num)
+      idx = np.searchsorted(self._item_cum_weights, rand_vals, side='right')
+      return np.minimum(idx, self.num_items - 1)
+    return np.random.randint(0, self.num_items, size=num)
+
+  def item_attrs(self, item_idx):
+    features = []
+    for np_type, attr in zip(self._attr_np_types, self._attrs):
+      feature = attr[item_idx]
+      if np_type == str:
+        feature = feature.astype(object)
+      features.append(feature)
+    return features
+
+
+class LocalSampler(BaseSampler):
+  """Base class of in-process samplers."""
+
+  def __init__(self,
+               item_data_path,
+               fields,
+               num_sample,
+               batch_size,
+               attr_delimiter=':',
+               num_eval_sample=None,
+               edge_data_paths=None,
+               shm_dir=None):
+    super(LocalSampler, self).__init__(fields, num_sample, num_eval_sample)
+    self._batch_size = batch_size
+    self._graph = LocalGraph(
+        item_data_path,
+        self._attr_np_types,
+        attr_delimiter=attr_delimiter,
+        edge_data_paths=edge_data_paths,
+        shm_dir=shm_dir)
+
+  def _reject_sample(self, reject_fn, num, weighted):
+    """Sample items, and resample the rejected ones.
+
+    Args:
+      reject_fn: function that takes sample positions and item indices,
+        return a bool array indicating which samples are rejected.
+      num: number of samples.
+      weighted: sample by item weight or uniformly.
+    """
+    item_idx = self._graph.sample_items(num, weighted)
+    pos = np.arange(num)
+    for _ in range(MAX_REJECT_ROUNDS):
+      rejected = reject_fn(pos, item_idx[pos])
+      pos = pos[rejected]
+      if len(pos) == 0:
+        break
+      item_idx[pos] = self._graph.sample_items(len(pos), weighted)
+    return item_idx
+
+  def _negative_sample(self, dst_ids):
+    """Weighted sampling items not in batch."""
+    batch_idx = np.sort(self._graph.item_index(dst_ids))
+    if len(batch_idx) == 0:
+      return self._graph.sample_items(self._num_sample, weighted=True)
+
+    def _reject_fn(pos, item_idx):
+      found = np.minimum(
+          np.searchsorted(batch_idx, item_idx),
+          len(batch_idx) - 1)
+      return batch_idx[found] == item_idx
+
+    return self._reject_sample(_reject_fn, self._num_sample, weighted=True)
+
+  def _conditional_negative_sample(self, src_ids):
+    """Random sampling items which do not have edges with the users."""
+    src_ids = np.array(src_ids, dtype=np.int64)
+    if len(src_ids) == 0:
+      # no users to condition on, the items are sampled uniformly
+      return self._graph.sample_items(self._num_sample, weighted=False)
+    src_ids = np.pad(src_ids, (0, self._batch_size - len(src_ids)), 'edge')
+    expand_factor = int(math.ceil(self._num_sample / self._batch_size))
+    user_ids = np.repeat(src_ids, expand_factor)[:self._num_sample]
+
+    def _reject_fn(pos, item_idx):
+      return self._graph.has_edges('edge', user_ids[pos], item_idx)
+
+    return self._reject_sample(_reject_fn, self._num_sample, weighted=False)
+
+  def _with_hard_negatives(self, neg_item_idx, src_ids):
+    hard_item_idx, hard_neg_indices = self._graph.neighbors(
+        'hard_neg_edge', src_ids, self._num_hard_sample)
+    item_idx = np.concatenate([neg_item_idx, hard_item_idx])
+    results = self._graph.item_attrs(item_idx)
+    results.append(hard_neg_indices)
+    return results
+
+  def _hard_neg_result_dict(self, output_values):
+    result_dict = {}
+    for k, v in zip(self._attr_names, output_values[:-1]):
+      v.set_shape([None])
+      result_dict[k] = v
+    hard_neg_indices = output_values[-1]
+    hard_neg_indices.set_shape([None, 2])
+    result_dict['hard_neg_indices'] = hard_neg_indices
+    return result_dict
+
+  def _result_dict(self, output_values):
+    result_dict = {}
+    for k, v in zip(self._attr_names, output_values):
+      v.set_shape([self._num_sample])
+      result_dict[k] = v
+    return result_dict
+
+
+class LocalNegativeSampler(LocalSampler):
+  """In-process version of NegativeSampler.
+
+  Weighted random sampling items not in batch.
+  """
+
+  def __init__(self,
+               data_path,
+               fields,
+               num_sample,
+               batch_size,
+               attr_delimiter=':',
+               num_eval_sample=None,
+               shm_dir=None):
+    super(LocalNegativeSampler, self).__init__(
+        data_path,
+        fields,
+        num_sample,
+        batch_size,
+        attr_delimiter,
+        num_eval_sample,
+        shm_dir=shm_dir)
+
+  def _get_impl(self, ids):
+    return self._graph.item_attrs(self._negative_sample(ids))
+
+  def get(self, ids):
+    sampled_values = tf.py_func(self._get_impl, [ids], self._attr_tf_types)
+    return self._result_dict(sampled_values)
+
+
+class LocalNegativeSamplerV2(LocalSampler):
+  """In-process version of NegativeSamplerV2.
+
+  Random sampling items which do not have positive edge with the user.
+  """
+
+  def __init__(self,
+               user_data_path,
+               item_data_path,
+               edge_data_path,
+               fields,
+               num_sample,
+               batch_size,
+               attr_delimiter=':',
+               num_eval_sample=None,
+               shm_dir=None):
+    super(LocalNegativeSamplerV2, self).__init__(
+        item_data_path,
+        fields,
+        num_sample,
+        batch_size,
+        attr_delimiter,
+        num_eval_sample,
+        edge_data_paths={'edge': edge_data_path},
+        shm_dir=shm_dir)
+
+  def _get_impl(self, src_ids, dst_ids):
+    return self._graph.item_attrs(self._conditional_negative_sample(src_ids))
+
+  def get(self, src_ids, dst_ids):
+    sampled_values = tf.py_func(self._get_impl, [src_ids, dst_ids],
+                                self._attr_tf_types)
+    return self._result_dict(sampled_values)
+
+
+class LocalHardNegativeSampler(LocalSampler):
+  """In-process version of HardNegativeSampler.
+
+  Weighted random sampling items not in batch as negative samples, and
+  the neighbors in hard_neg_edge as hard negative samples.
+  """
+
+  def __init__(self,
+               user_data_path,
+               item_data_path,
+               hard_neg_edge_data_path,
+               fields,
+               num_sample,
+               num_hard_sample,
+               batch_size,
+               attr_delimiter=':',
+               num_eval_sample=None,
+               shm_dir=None):
+    super(LocalHardNegativeSampler, self).__init__(
+        item_data_path,
+        fields,
+        num_sample,
+        batch_size,
+        attr_delimiter,
+        num_eval_sample,
+        edge_data_paths={'hard_neg_edge': hard_neg_edge_data_path},
+        shm_dir=shm_dir)
+    self._num_hard_sample = num_hard_sample
+
+  def _get_impl(self, src_ids, dst_ids):
+    return self._with_hard_negatives(self._negative_sample(dst_ids), src_ids)
+
+  def get(self, src_ids, dst_ids):
+    output_values = tf.py_func(self._get_impl, [src_ids, dst_ids],
+                               self._attr_tf_types + [tf.int64])
+    return self._hard_neg_result_dict(output_values)
+
+
+class LocalHardNegativeSamplerV2(LocalSampler):
+  """In-process version of HardNegativeSamplerV2.
+
+  Random sampling items which do not have positive edge with the user
+  as negative samples, and the neighbors in hard_neg_edge as hard
+  negative samples.
+  """
+
+  def __init__(self,
+               user_data_path,
+               item_data_path,
+               edge_data_path,
+               hard_neg_edge_data_path,
+               fields,
+               num_sample,
+               num_hard_sample,
+               batch_size,
+               attr_delimiter=':',
+               num_eval_sample=None,
+               shm_dir=None):
+    super(LocalHardNegativeSamplerV2, self).__init__(
+        item_data_path,
+        fields,
+        num_sample,
+        batch_size,
+        attr_delimiter,
+        num_eval_sample,
+        edge_data_paths={
+            'edge': edge_data_path,
+            'hard_neg_edge': hard_neg_edge_data_path
+        },
+        shm_dir=shm_dir)
+    self._num_hard_sample = num_hard_sample
+
+  def _get_impl(self, src_ids, dst_ids):
+    return self._with_hard_negatives(
+        self._conditional_negative_sample(src_ids), src_ids)
+
+  def get(self, src_ids, dst_ids):
+    output_values = tf.py_func(self._get_impl, [src_ids, dst_ids],
+                               self._attr_tf_types + [tf.int64])
+    return self._hard_neg_result_dict(output_values)
@@ -21,6 +21,10 @@ from easy_rec.python.utils.shape_utils import get_shape_list
 if tf.__version__ >= '2.0':
   tf = tf.compat.v1
 
+# graph collection of the states of the metrics computed in python, such as
+# gauc and session_auc, which have get_state and merge_state methods
+PYTHON_METRIC_STATES = 'python_metric_states'
+
 
 def max_f1(label, predictions):
   """Calculate the largest F1 metric under different thresholds.
@@ -56,6 +60,95 @@ def max_f1(label, predictions):
   return f1, f1_update_op
 
 
+class SeparatedAucState(object):
+  """Labels, predictions and weights of each key of the separated auc."""
+
+  def __init__(self, reduction):
+    self.reduction = reduction
+    self.separated_label = defaultdict(list)
+    self.separated_prediction = defaultdict(list)
+    self.separated_weights = defaultdict(int)
+
+  def get_state(self):
+    return {
+        'separated_label': dict(self.separated_label),
+        'separated_prediction': dict(self.separated_prediction),
+        'separated_weights': dict(self.separated_weights)
+    }
+
+  def reset(self):
+    self.separated_label.clear()
+    self.separated_prediction.clear()
+    self.separated_weights.clear()
+
+  def merge_state(self, state):
+    for key, labels in state['separated_label'].items():
+      self.separated_label[key].extend(labels)
+    for key, predictions in state['separated_prediction'].items():
+      self.separated_prediction[key].extend(predictions)
+    for key, weight in state['separated_weights'].items():
+      if self.reduction == 'mean':
+        self.separated_weights[key] = 1
+      else:
+        self.separated_weights[key] += weight
+
+
+def get_metric_states(sess):
+  """Get the states of the metrics, which could be merged by merge_metric_states.
+
+  Args:
+    sess: session which has run the metric update ops
+
+  Return:
+    a dict of metric variable names to values and the states of the
+    metrics computed in python
+  """
+  metric_vars = tf.get_collection(tf.GraphKeys.METRIC_VARIABLES)
+  var_values = sess.run(metric_vars)
+  return {
+      'variables': {x.op.name: y for x, y in zip(metric_vars, var_values)},
+      'python_states': [
+          x.get_state() for x in tf.get_collection(PYTHON_METRIC_STATES)
+      ]
+  }
+
+
+def merge_metric_states(states):
+  """Merge the states of the metrics on different data shards.
+
+  The metric variables of the streaming metrics are sums and counts,
+  such as the confusion matrix at each threshold of tf.metrics.auc,
+  the histograms of fast_auc and the totals of tf.metrics.mean, so they
+  are summed up. The states of the metrics computed in python are merged
+  by load_metric_states.
+  """
+  variables = {}
+  for state in states:
+    for name, value in state['variables'].items():
+      if name in variables:
+        variables[name] = variables[name] + value
+      else:
+        variables[name] = value
+  return {
+      'variables': variables,
+      'python_states': [x['python_states'] for x in states]
+  }
+
+
+def load_metric_states(sess, merged_states):
+  """Replace the states of the metrics of the default graph by merged_states."""
+  for var in tf.get_collection(tf.GraphKeys.METRIC_VARIABLES):
+    var.load(merged_states['variables'][var.op.name], sess)
+  python_states = tf.get_collection(PYTHON_METRIC_STATES)
+  for python_state in python_states:
+    python_state.reset()
+  for shard_states in merged_states['python_states']:
+    assert len(shard_states) == len(python_states), \
+        'the python metric states of the shards do not match'
+    for python_state, shard_state in zip(python_states, shard_states):
+      python_state.merge_state(shard_state)
+
+
 def _separated_auc_impl(labels, predictions, keys, reduction='mean'):
   """Computes the AUC group by the key separately.
 
@@ -72,9 +165,11 @@ def _separated_auc_impl(labels, predictions, keys, reduction='mean'):
   """
   assert reduction in ['mean', 'mean_by_sample_num', 'mean_by_positive_num'], \
       'reduction method must in mean | mean_by_sample_num | mean_by_positive_num'
-  separated_label = defaultdict(list)
-  separated_prediction = defaultdict(list)
-  separated_weights = defaultdict(int)
+  state = SeparatedAucState(reduction)
+  tf.add_to_collection(PYTHON_METRIC_STATES, state)
+  separated_label = state.separated_label
+  separated_prediction = state.separated_prediction
+  separated_weights = state.separated_weights
 
   def update_pyfunc(labels, predictions, keys):
     for label, prediction, key in zip(labels, predictions, keys):
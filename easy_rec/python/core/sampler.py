@@ -726,7 +726,8 @@ def build(data_config):
   print('sampler_type = %s' % sampler_type)
   sampler_config = getattr(data_config, sampler_type)
 
-  if ds_util.is_on_ds():
+  if ds_util.is_on_ds() and not getattr(sampler_config, 'use_local_graph',
+                                        False):
     gl.set_field_delimiter(sampler_config.field_delimiter)
 
   if sampler_type == 'negative_sampler':
@@ -734,13 +735,20 @@ def build(data_config):
     attr_fields = [input_fields[name] for name in sampler_config.attr_fields]
 
     input_path = process_multi_file_input_path(sampler_config.input_path)
-    return NegativeSampler.instance(
+    sampler_cls = NegativeSampler
+    local_kwargs = {}
+    if sampler_config.use_local_graph:
+      from easy_rec.python.core.local_sampler import LocalNegativeSampler
+      sampler_cls = LocalNegativeSampler
+      local_kwargs['shm_dir'] = sampler_config.local_graph_dir
+    return sampler_cls.instance(
         data_path=input_path,
         fields=attr_fields,
         num_sample=sampler_config.num_sample,
         batch_size=data_config.batch_size,
         attr_delimiter=sampler_config.attr_delimiter,
-        num_eval_sample=sampler_config.num_eval_sample)
+        num_eval_sample=sampler_config.num_eval_sample,
+        **local_kwargs)
   elif sampler_type == 'negative_sampler_in_memory':
     input_fields = {f.input_name: f for f in data_config.input_fields}
     attr_fields = [input_fields[name] for name in sampler_config.attr_fields]
@@ -763,7 +771,13 @@ def build(data_config):
         sampler_config.item_input_path)
     pos_edge_input_path = process_multi_file_input_path(
         sampler_config.pos_edge_input_path)
-    return NegativeSamplerV2.instance(
+    sampler_cls = NegativeSamplerV2
+    local_kwargs = {}
+    if sampler_config.use_local_graph:
+      from easy_rec.python.core.local_sampler import LocalNegativeSamplerV2
+      sampler_cls = LocalNegativeSamplerV2
+      local_kwargs['shm_dir'] = sampler_config.local_graph_dir
+    return sampler_cls.instance(
         user_data_path=user_input_path,
         item_data_path=item_input_path,
         edge_data_path=pos_edge_input_path,
@@ -771,7 +785,8 @@ def build(data_config):
         num_sample=sampler_config.num_sample,
         batch_size=data_config.batch_size,
         attr_delimiter=sampler_config.attr_delimiter,
-        num_eval_sample=sampler_config.num_eval_sample)
+        num_eval_sample=sampler_config.num_eval_sample,
+        **local_kwargs)
   elif sampler_type == 'hard_negative_sampler':
     input_fields = {f.input_name: f for f in data_config.input_fields}
     attr_fields = [input_fields[name] for name in sampler_config.attr_fields]
@@ -782,7 +797,13 @@ def build(data_config):
         sampler_config.item_input_path)
     hard_neg_edge_input_path = process_multi_file_input_path(
         sampler_config.hard_neg_edge_input_path)
-    return HardNegativeSampler.instance(
+    sampler_cls = HardNegativeSampler
+    local_kwargs = {}
+    if sampler_config.use_local_graph:
+      from easy_rec.python.core.local_sampler import LocalHardNegativeSampler
+      sampler_cls = LocalHardNegativeSampler
+      local_kwargs['shm_dir'] = sampler_config.local_graph_dir
+    return sampler_cls.instance(
         user_data_path=user_input_path,
         item_data_path=item_input_path,
         hard_neg_edge_data_path=hard_neg_edge_input_path,
@@ -791,7 +812,8 @@ def build(data_config):
         num_hard_sample=sampler_config.num_hard_sample,
         batch_size=data_config.batch_size,
         attr_delimiter=sampler_config.attr_delimiter,
-        num_eval_sample=sampler_config.num_eval_sample)
+        num_eval_sample=sampler_config.num_eval_sample,
+        **local_kwargs)
   elif sampler_type == 'hard_negative_sampler_v2':
     input_fields = {f.input_name: f for f in data_config.input_fields}
     attr_fields = [input_fields[name] for name in sampler_config.attr_fields]
@@ -804,7 +826,13 @@ def build(data_config):
         sampler_config.pos_edge_input_path)
     hard_neg_edge_input_path = process_multi_file_input_path(
         sampler_config.hard_neg_edge_input_path)
-    return HardNegativeSamplerV2.instance(
+    sampler_cls = HardNegativeSamplerV2
+    local_kwargs = {}
+    if sampler_config.use_local_graph:
+      from easy_rec.python.core.local_sampler import LocalHardNegativeSamplerV2  # NOQA
+      sampler_cls = LocalHardNegativeSamplerV2
+      local_kwargs['shm_dir'] = sampler_config.local_graph_dir
+    return sampler_cls.instance(
         user_data_path=user_input_path,
         item_data_path=item_input_path,
         edge_data_path=pos_edge_input_path,
@@ -814,6 +842,7 @@ def build(data_config):
         num_hard_sample=sampler_config.num_hard_sample,
         batch_size=data_config.batch_size,
         attr_delimiter=sampler_config.attr_delimiter,
-        num_eval_sample=sampler_config.num_eval_sample)
+        num_eval_sample=sampler_config.num_eval_sample,
+        **local_kwargs)
   else:
     raise ValueError('Unknown sampler %s' % sampler_type)
@@ -10,6 +10,7 @@ from tensorflow.python.lib.io import file_io
 
 from easy_rec.python.main import distribute_evaluate
 from easy_rec.python.main import evaluate
+from easy_rec.python.main import local_sharded_evaluate
 from easy_rec.python.protos.train_pb2 import DistributionStrategy
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import ds_util
@@ -40,6 +41,9 @@ tf.app.flags.DEFINE_string('eval_result_path', 'eval_result.txt',
 tf.app.flags.DEFINE_bool('distribute_eval', False,
                          'use distribute parameter server for train and eval.')
 tf.app.flags.DEFINE_bool('is_on_ds', False, help='is on ds')
+tf.app.flags.DEFINE_integer(
+    'local_eval_workers', 0, 'number of local worker processes to evaluate '
+    'the shards of the eval files, 0 to disable, -1 for the number of cpus')
 FLAGS = tf.app.flags.FLAGS
 
 
@@ -83,6 +87,15 @@ def main(argv):
     eval_result = distribute_evaluate(pipeline_config, FLAGS.checkpoint_path,
                                       FLAGS.eval_input_path,
                                       FLAGS.eval_result_path)
+  elif FLAGS.local_eval_workers != 0:
+    os.environ['distribute_eval'] = 'False'
+    num_workers = FLAGS.local_eval_workers
+    eval_result = local_sharded_evaluate(
+        pipeline_config,
+        FLAGS.checkpoint_path,
+        FLAGS.eval_input_path,
+        FLAGS.eval_result_path,
+        num_workers=num_workers if num_workers > 0 else None)
   else:
     os.environ['distribute_eval'] = 'False'
     eval_result = evaluate(pipeline_config, FLAGS.checkpoint_path,
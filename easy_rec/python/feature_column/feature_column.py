@@ -12,6 +12,7 @@ from easy_rec.python.builders import hyperparams_builder
 from easy_rec.python.compat.feature_column import sequence_feature_column
 from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
 from easy_rec.python.protos.feature_config_pb2 import WideOrDeep
+from easy_rec.python.utils.ev_budget import KeyBudget
 from easy_rec.python.utils.proto_util import copy_obj
 
 from easy_rec.python.compat.feature_column import feature_column_v2 as feature_column  # NOQA
@@ -34,7 +35,8 @@ class SharedEmbedding(object):
 
 
 EVParams = collections.namedtuple('EVParams', [
-    'filter_freq', 'steps_to_live', 'use_cache', 'init_capacity', 'max_capacity'
+    'filter_freq', 'steps_to_live', 'use_cache', 'init_capacity',
+    'max_capacity', 'key_budget'
 ])
 
 
@@ -657,8 +659,30 @@ class FeatureColumnParser(object):
 
   def _build_ev_params(self, ev_params):
     """Build embedding_variables params."""
-    ev_params = EVParams(
-        ev_params.filter_freq,
-        ev_params.steps_to_live if ev_params.steps_to_live > 0 else None,
-        ev_params.use_cache, ev_params.init_capacity, ev_params.max_capacity)
+    filter_freq = ev_params.filter_freq
+    steps_to_live = ev_params.steps_to_live if ev_params.steps_to_live > 0 else None
+    key_budget = None
+    sketch_admit = ev_params.admit_strategy == ev_params.COUNT_MIN_SKETCH
+    has_budget = ev_params.max_rows > 0 or ev_params.max_bytes > 0
+    if has_budget or (sketch_admit and filter_freq > 1):
+      # shared by all the embedding variables built from the same ev_params
+      key_budget = KeyBudget(
+          max_rows=ev_params.max_rows,
+          max_bytes=ev_params.max_bytes,
+          filter_freq=filter_freq,
+          admit_strategy=ev_params.AdmitStrategy.Name(ev_params.admit_strategy),
+          evict_strategy=ev_params.EvictStrategy.Name(ev_params.evict_strategy),
+          evict_ratio=ev_params.evict_ratio,
+          sketch_width=ev_params.sketch_width,
+          sketch_depth=ev_params.sketch_depth)
+      if sketch_admit:
+        # keys are filtered by the sketch before embedding lookup
+        filter_freq = 0
+      if has_budget and steps_to_live is None:
+        logging.warning(
+            'steps_to_live is not set, the evicted rows are not looked up or '
+            'updated any more, but are kept in the embedding variables.')
+    ev_params = EVParams(filter_freq, steps_to_live, ev_params.use_cache,
+                         ev_params.init_capacity, ev_params.max_capacity,
+                         key_budget)
     return ev_params
@@ -0,0 +1,457 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Local hyperparameter search for easy_rec with asynchronous successive halving.
+
+Trials are launched as subprocesses of easy_rec.python.train_eval on a
+local worker pool. The eval metrics are read from the eval event files
+of each trial, and trials whose metrics are not in the top 1/reduction_factor
+of the trials reaching the same rung(global_step) are killed early.
+The states of the trials are saved in exp_dir/trials.json, so that the
+experiment could be resumed by running the same command again.
+
+Reference:
+  A System for Massively Parallel Hyperparameter Tuning, MLSys 2020.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+
+import numpy as np
+import psutil
+
+from easy_rec.python.utils import config_util
+from easy_rec.python.utils.eval_metrics_index import get_eval_metrics_index
+
+logging.basicConfig(
+    level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
+
+TRIAL_PENDING = 'PENDING'
+TRIAL_RUNNING = 'RUNNING'
+TRIAL_COMPLETED = 'COMPLETED'
+TRIAL_STOPPED = 'STOPPED'
+TRIAL_FAILED = 'FAILED'
+
+
+def sample_hyperparams(hyperparams, rng):
+  """Sample a group of hyperparameters.
+
+  Args:
+    hyperparams: the search space, in either of the two formats:
+      the hyperparams of emr_hpo, a list of dict, such as:
+        [{"type": "Categorical", "name": "x", "candidates": ["16", "32"]},
+         {"type": "Real", "name": "y", "min_value": 0.0001, "max_value": 0.1}]
+      the search space of pai_nni_hpo, a dict, such as:
+        {"x": {"_type": "choice", "_value": [16, 32]},
+         "y": {"_type": "loguniform", "_value": [0.0001, 0.1]}}
+    rng: random.Random object
+
+  Return:
+    a dict of param name => param value, which could be passed to
+    config_util.edit_config.
+  """
+  params = {}
+  if isinstance(hyperparams, dict):
+    for name in sorted(hyperparams.keys()):
+      param_type = hyperparams[name]['_type']
+      param_vals = hyperparams[name]['_value']
+      if param_type == 'choice':
+        params[name] = rng.choice(param_vals)
+      elif param_type == 'randint':
+        params[name] = rng.randint(param_vals[0], param_vals[1] - 1)
+      elif param_type in ['uniform', 'quniform']:
+        params[name] = rng.uniform(param_vals[0], param_vals[1])
+      elif param_type in ['loguniform', 'qloguniform']:
+        params[name] = math.exp(
+            rng.uniform(math.log(param_vals[0]), math.log(param_vals[1])))
+      else:
+        raise ValueError('unsupported param type: %s' % param_type)
+      if param_type.startswith('q'):
+        params[name] = round(params[name] / param_vals[2]) * param_vals[2]
+  else:
+    for param in hyperparams:
+      name = param['name']
+      if param['type'] == 'Categorical':
+        params[name] = rng.choice(param['candidates'])
+      elif param['type'] == 'Integer':
+        params[name] = rng.randint(param['min_value'], param['max_value'])
+      elif param['type'] == 'Real':
+        params[name] = rng.uniform(param['min_value'], param['max_value'])
+      else:
+        raise ValueError('unsupported param type: %s' % param['type'])
+  return params
+
+
+class AshaScheduler(object):
+  """Asynchronous successive halving, the early stopping variant.
+
+  The rungs are at global_step min_steps * reduction_factor^k. When a trial
+  reaches a rung, its metric is recorded for the rung, and the trial is
+  stopped if its metric is not in the top 1/reduction_factor of the metrics
+  recorded for the rung.
+  """
+
+  def __init__(self, min_steps, max_steps, reduction_factor=3, mode='max'):
+    assert mode in ['max', 'min'], 'invalid mode: %s' % mode
+    assert reduction_factor > 1, 'reduction_factor must be greater than 1'
+    self._mode = mode
+    self._reduction_factor = reduction_factor
+    self._milestones = []
+    milestone = min_steps
+    while milestone < max_steps:
+      self._milestones.append(int(milestone))
+      milestone *= reduction_factor
+    # rung id => {trial id => metric}
+    self._rungs = [{} for _ in self._milestones]
+
+  @property
+  def milestones(self):
+    return self._milestones
+
+  def _cutoff(self, rung):
+    metrics = list(rung.values())
+    if self._mode == 'max':
+      return np.percentile(metrics, (1 - 1.0 / self._reduction_factor) * 100)
+    else:
+      return np.percentile(metrics, 100.0 / self._reduction_factor)
+
+  def on_result(self, trial_id, global_step, metric):
+    """Record the metric of the trial, return whether to stop the trial.
+
+    Args:
+      trial_id: trial id
+      global_step: global_step of the metric
+      metric: the metric value
+
+    Return:
+      True if the trial should be stopped.
+    """
+    should_stop = False
+    for milestone, rung in zip(self._milestones, self._rungs):
+      if global_step < milestone or trial_id in rung:
+        continue
+      rung[trial_id] = metric
+      cutoff = self._cutoff(rung)
+      if self._mode == 'max':
+        should_stop = should_stop or metric < cutoff
+      else:
+        should_stop = should_stop or metric > cutoff
+    return should_stop
+
+
+class Trial(object):
+
+  def __init__(self, trial_id, params, model_dir, status=TRIAL_PENDING):
+    self.trial_id = trial_id
+    self.params = params
+    self.model_dir = model_dir
+    self.status = status
+    # list of (global_step, metric)
+    self.results = []
+    self.proc = None
+
+  @property
+  def last_result(self):
+    return self.results[-1] if len(self.results) > 0 else (None, None)
+
+  def to_dict(self):
+    return {
+        'trial_id': self.trial_id,
+        'params': self.params,
+        'model_dir': self.model_dir,
+        'status': self.status,
+        'results': self.results
+    }
+
+  @staticmethod
+  def from_dict(trial_dict):
+    trial = Trial(trial_dict['trial_id'], trial_dict['params'],
+                  trial_dict['model_dir'], trial_dict['status'])
+    trial.results = [tuple(x) for x in trial_dict['results']]
+    return trial
+
+
+class LocalHPO(object):
+
+  def __init__(self,
+               config_path,
+               hyperparams,
+               exp_dir,
+               metric_name='auc',
+               mode='max',
+               max_parallel=4,
+               total_trial_num=6,
+               min_steps=1000,
+               max_steps=None,
+               reduction_factor=3,
+               gpus=None,
+               extra_args='',
+               poll_interval=10,
+               seed=2020):
+    self._config_path = config_path
+    self._hyperparams = hyperparams
+    self._exp_dir = exp_dir
+    self._metric_name = metric_name
+    self._mode = mode
+    self._max_parallel = max_parallel
+    self._total_trial_num = total_trial_num
+    self._max_steps = max_steps
+    self._gpus = gpus if gpus else []
+    self._extra_args = shlex.split(extra_args) if extra_args else []
+    self._poll_interval = poll_interval
+    self._seed = seed
+    self._db_path = os.path.join(exp_dir, 'trials.json')
+
+    if max_steps is None:
+      pipeline_config = config_util.get_configs_from_pipeline_file(config_path)
+      max_steps = pipeline_config.train_config.num_steps
+    self._scheduler = AshaScheduler(min_steps, max_steps, reduction_factor,
+                                    mode)
+    logging.info('rungs of successive halving: %s' %
+                 str(self._scheduler.milestones))
+
+    self._trials = []
+    if os.path.exists(self._db_path):
+      self._load_trials()
+    elif not os.path.exists(exp_dir):
+      os.makedirs(exp_dir)
+
+  def _load_trials(self):
+    with open(self._db_path, 'r') as fin:
+      self._trials = [Trial.from_dict(x) for x in json.load(fin)['trials']]
+    for trial in self._trials:
+      # trials interrupted are resumed from the latest checkpoints
+      if trial.status == TRIAL_RUNNING:
+        trial.status = TRIAL_PENDING
+      for global_step, metric in trial.results:
+        self._scheduler.on_result(trial.trial_id, global_step, metric)
+    logging.info('resume %d trials from %s' %
+                 (len(self._trials), self._db_path))
+
+  def _save_trials(self):
+    tmp_path = self._db_path + '.tmp'
+    with open(tmp_path, 'w') as fout:
+      json.dump({'trials': [x.to_dict() for x in self._trials]}, fout, indent=2)
+    os.rename(tmp_path, self._db_path)
+
+  def _new_trial(self):
+    trial_id = len(self._trials)
+    # seeded by trial_id, so that resumed experiments sample the same params
+    rng = random.Random(self._seed + trial_id)
+    params = sample_hyperparams(self._hyperparams, rng)
+    model_dir = os.path.join(self._exp_dir, 'trial_%d' % trial_id)
+    trial = Trial(trial_id, params, model_dir)
+    self._trials.append(trial)
+    return trial
+
+  def _trial_cmd(self, trial, worker_id):
+    edit_config_json = dict(trial.params)
+    if self._max_steps is not None:
+      edit_config_json['train_config.num_steps'] = self._max_steps
+    cmd = [
+        sys.executable, '-m', 'easy_rec.python.train_eval',
+        '--pipeline_config_path', self._config_path, '--model_dir',
+        trial.model_dir, '--edit_config_json',
+        json.dumps(edit_config_json), '--continue_train'
+    ] + self._extra_args
+    if len(self._gpus) > 0:
+      cmd += ['--gpu', self._gpus[worker_id % len(self._gpus)]]
+    return cmd
+
+  def _launch(self, trial, worker_id):
+    cmd = self._trial_cmd(trial, worker_id)
+    log_path = os.path.join(self._exp_dir, 'trial_%d.log' % trial.trial_id)
+    logging.info('launch trial %d: %s, log to %s' %
+                 (trial.trial_id, json.dumps(trial.params), log_path))
+    with open(log_path, 'a') as log_file:
+      trial.proc = subprocess.Popen(
+          cmd, stdout=log_file, stderr=subprocess.STDOUT)
+    trial.status = TRIAL_RUNNING
+
+  def _kill(self, trial):
+    try:
+      proc = psutil.Process(trial.proc.pid)
+      procs = proc.children(recursive=True) + [proc]
+      for p in procs:
+        p.terminate()
+      _, alive = psutil.wait_procs(procs, timeout=30)
+      for p in alive:
+        p.kill()
+    except psutil.NoSuchProcess:
+      pass
+
+  def _update_results(self, trial):
+    index = get_eval_metrics_index(
+        os.path.join(trial.model_dir, 'eval_val'), '*.tfevents.*')
+    index.update()
+    num_old_results = len(trial.results)
+    trial.results = [(step, metrics[self._metric_name])
+                     for step, metrics in index.eval_metrics().items()
+                     if self._metric_name in metrics]
+    should_stop = False
+    for global_step, metric in trial.results[num_old_results:]:
+      logging.info('trial %d global_step %d %s = %.6f' %
+                   (trial.trial_id, global_step, self._metric_name, metric))
+      if self._scheduler.on_result(trial.trial_id, global_step, metric):
+        should_stop = True
+    return should_stop
+
+  def _poll(self, trial):
+    ret_code = trial.proc.poll()
+    should_stop = self._update_results(trial)
+    if ret_code is not None:
+      trial.status = TRIAL_COMPLETED if ret_code == 0 else TRIAL_FAILED
+      logging.info('trial %d exit with %d' % (trial.trial_id, ret_code))
+    elif should_stop:
+      logging.info('early stop trial %d at global_step %d' %
+                   (trial.trial_id, trial.last_result[0]))
+      self._kill(trial)
+      trial.status = TRIAL_STOPPED
+
+  def best_trial(self):
+    finished_trials = [
+        x for x in self._trials
+        if x.status in [TRIAL_COMPLETED, TRIAL_STOPPED] and len(x.results) > 0
+    ]
+    if len(finished_trials) == 0:
+      return None
+    sign = 1 if self._mode == 'max' else -1
+    # stopped trials have fewer steps, compare the final metrics of trials
+    # with the most steps first
+    return max(
+        finished_trials,
+        key=lambda x: (x.last_result[0], sign * x.last_result[1]))
+
+  def run(self):
+    # worker_id => trial
+    workers = {}
+    try:
+      while True:
+        for worker_id in list(workers.keys()):
+          self._poll(workers[worker_id])
+          if workers[worker_id].status != TRIAL_RUNNING:
+            del workers[worker_id]
+
+        pending_trials = [x for x in self._trials if x.status == TRIAL_PENDING]
+        for worker_id in range(self._max_parallel):
+          if worker_id in workers:
+            continue
+          if len(pending_trials) > 0:
+            trial = pending_trials.pop(0)
+          elif len(self._trials) < self._total_trial_num:
+            trial = self._new_trial()
+          else:
+            break
+          self._launch(trial, worker_id)
+          workers[worker_id] = trial
+        self._save_trials()
+
+        if len(workers) == 0:
+          break
+        time.sleep(self._poll_interval)
+    finally:
+      for trial in workers.values():
+        self._kill(trial)
+
+    for trial in self._trials:
+      logging.info(
+          'trial %d %s %s: global_step=%s %s=%s' %
+          (trial.trial_id, trial.status, json.dumps(trial.params),
+           trial.last_result[0], self._metric_name, trial.last_result[1]))
+    best_trial = self.best_trial()
+    if best_trial is not None:
+      logging.info('best trial %d: %s, model_dir=%s' %
+                   (best_trial.trial_id, json.dumps(
+                       best_trial.params), best_trial.model_dir))
+    return best_trial
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--hyperparams', type=str, help='hyper parameters', default=None)
+  parser.add_argument(
+      '--config_path', type=str, help='pipeline config', default=None)
+  parser.add_argument(
+      '--exp_dir', type=str, help='hpo experiment directory', default=None)
+  parser.add_argument(
+      '--metric_name', type=str, help='metric_name', default='auc')
+  parser.add_argument(
+      '--mode',
+      type=str,
+      choices=['max', 'min'],
+      help='whether the metric is to be maximized or minimized',
+      default='max')
+  parser.add_argument(
+      '--max_parallel',
+      type=int,
+      help='max number of trials run at the same time',
+      default=4)
+  parser.add_argument(
+      '--total_trial_num',
+      type=int,
+      help='total number of trials will run',
+      default=6)
+  parser.add_argument(
+      '--min_steps',
+      type=int,
+      help='global_step of the first rung of successive halving',
+      default=1000)
+  parser.add_argument(
+      '--max_steps',
+      type=int,
+      help='train steps of each trial, default to train_config.num_steps',
+      default=None)
+  parser.add_argument(
+      '--reduction_factor',
+      type=int,
+      help='only the top 1/reduction_factor trials continue at each rung',
+      default=3)
+  parser.add_argument(
+      '--gpus',
+      type=str,
+      help='gpus assigned to the trials in round robin, such as 0,1,2,3',
+      default=None)
+  parser.add_argument(
+      '--extra_args',
+      type=str,
+      help='extra arguments passed to easy_rec.python.train_eval',
+      default='')
+  parser.add_argument(
+      '--poll_interval',
+      type=int,
+      help='interval in seconds to check the trials',
+      default=10)
+  parser.add_argument('--seed', type=int, help='random seed', default=2020)
+
+  args = parser.parse_args()
+
+  assert args.hyperparams is not None
+  assert args.config_path is not None
+  assert args.exp_dir is not None
+
+  with open(args.hyperparams, 'r') as fin:
+    hyperparams = json.load(fin)
+
+  local_hpo = LocalHPO(
+      args.config_path,
+      hyperparams,
+      args.exp_dir,
+      metric_name=args.metric_name,
+      mode=args.mode,
+      max_parallel=args.max_parallel,
+      total_trial_num=args.total_trial_num,
+      min_steps=args.min_steps,
+      max_steps=args.max_steps,
+      reduction_factor=args.reduction_factor,
+      gpus=args.gpus.split(',') if args.gpus else None,
+      extra_args=args.extra_args,
+      poll_interval=args.poll_interval,
+      seed=args.seed)
+  local_hpo.run()
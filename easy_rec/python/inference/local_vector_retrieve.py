@@ -0,0 +1,293 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Retrieve top n neighbours of query vectors on a single machine.
+
+Unlike VectorRetrieve, which relies on graph-learn and odps tables, the
+inputs and outputs are files(csv or parquet). The doc vectors are indexed
+once and saved to a local directory, then the query batches are searched
+on a process pool, each process loads the index with mmap, so that the
+doc vectors are shared between processes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from tensorflow.python.platform import gfile
+
+from easy_rec.python.utils import vector_index
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = None
+  pq = None
+
+# index loaded in each search process
+_worker_index = None
+_worker_ids = None
+
+
+def _init_search_worker(index_dir, num_threads):
+  global _worker_index
+  global _worker_ids
+  if vector_index.faiss is not None and num_threads > 0:
+    vector_index.faiss.omp_set_num_threads(num_threads)
+  _worker_index, _worker_ids = vector_index.load_index(index_dir, mmap=True)
+
+
+def _search_batch(args):
+  query_ids, queries, top_n = args
+  positions, scores = _worker_index.search(queries, top_n)
+  valid = positions >= 0
+  num_valid = np.sum(valid, axis=1)
+  doc_ids = np.asarray(_worker_ids[positions[valid]])
+  return (np.repeat(query_ids,
+                    num_valid), doc_ids, scores[valid], len(query_ids))
+
+
+def _is_parquet(path):
+  return path.endswith('.parquet')
+
+
+def read_vectors(path, ndim, delimiter=',', field_sep='\t', batch_size=1024):
+  """Read (id, vector) records from csv or parquet files in batches.
+
+  Args:
+    path: file path, could be a pattern or multiple paths separated by ','.
+    ndim: dimension of the vectors.
+    delimiter: delimiter of the vector elements.
+    field_sep: field separator of csv files.
+    batch_size: number of records of each batch.
+
+  Return:
+    a generator of (ids, vectors), vectors are float32 arrays of
+    shape [batch_size, ndim].
+  """
+  input_files = []
+  for x in path.split(','):
+    input_files.extend(sorted(gfile.Glob(x)))
+  assert len(input_files) > 0, 'no files match: %s' % path
+  for input_file in input_files:
+    if _is_parquet(input_file):
+      assert pq is not None, 'pyarrow is required to read parquet files'
+      parquet_file = pq.ParquetFile(input_file)
+      for batch in parquet_file.iter_batches(batch_size=batch_size):
+        ids = batch.column(0).to_numpy(zero_copy_only=False)
+        vectors = batch.column(1)
+        if pa.types.is_string(vectors.type):
+          vectors = vector_index.parse_vectors(
+              vectors.to_numpy(zero_copy_only=False), ndim, delimiter)
+        else:
+          vectors = vectors.flatten().to_numpy(zero_copy_only=False)
+          vectors = vectors.astype(np.float32).reshape([-1, ndim])
+        yield ids, vectors
+    else:
+      with gfile.GFile(input_file, 'r') as fin:
+        reader = pd.read_csv(
+            fin,
+            sep=field_sep,
+            header=None,
+            names=['id', 'vector'],
+            dtype={'vector': str},
+            quoting=csv.QUOTE_NONE,
+            chunksize=batch_size)
+        for chunk in reader:
+          yield (chunk['id'].values,
+                 vector_index.parse_vectors(chunk['vector'].values, ndim,
+                                            delimiter))
+
+
+class ResultWriter(object):
+  """Write (query_id, doc_id, distance) columns in bulk."""
+
+  def __init__(self, output_path, field_sep='\t'):
+    self._output_path = output_path
+    self._field_sep = field_sep
+    self._parquet_writer = None
+    self._fout = None
+    if not _is_parquet(output_path):
+      self._fout = gfile.GFile(output_path, 'w')
+
+  def write(self, query_ids, doc_ids, distances):
+    if self._fout is not None:
+      pd.DataFrame({
+          'query_id': query_ids,
+          'doc_id': doc_ids,
+          'distance': distances
+      }).to_csv(
+          self._fout, sep=self._field_sep, header=False, index=False)
+      return
+    table = pa.Table.from_arrays(
+        [pa.array(query_ids),
+         pa.array(doc_ids),
+         pa.array(distances)],
+        names=['query_id', 'doc_id', 'distance'])
+    if self._parquet_writer is None:
+      self._parquet_writer = pq.ParquetWriter(self._output_path, table.schema)
+    self._parquet_writer.write_table(table)
+
+  def close(self):
+    if self._fout is not None:
+      self._fout.close()
+    if self._parquet_writer is not None:
+      self._parquet_writer.close()
+
+
+class LocalVectorRetrieve(object):
+
+  def __init__(self,
+               query_path,
+               doc_path,
+               output_path,
+               ndim,
+               delimiter=',',
+               field_sep='\t',
+               batch_size=1024,
+               index_type='ivfflat',
+               nlist=10,
+               nprobe=2,
+               distance=1,
+               m=8,
+               hnsw_m=32,
+               ef_search=64,
+               num_workers=None,
+               index_dir=None):
+    """Retrieve top n neighbours by query vector.
+
+    Args:
+      query_path: query vector files, csv or parquet, (id, vector)
+      doc_path: document vector files, csv or parquet, (id, vector)
+      output_path: output file, csv or parquet if ends with .parquet,
+        (query_id, doc_id, distance)
+      ndim: int, number of feature dimensions
+      delimiter: delimiter for feature vectors
+      field_sep: field separator of csv files
+      batch_size: query batch size
+      index_type: search model `flat`, `ivfflat`, `ivfpq`, `hnsw`
+      nlist: number of clusters of ivf indexes
+      nprobe: number of clusters to probe when searching
+      distance: type of distance, 0 is l2 distance, 1 is inner product.
+      m: number of dimensions for each node after compress(ivfpq)
+      hnsw_m: number of neighbours of each node(hnsw)
+      ef_search: size of the search queue(hnsw)
+      num_workers: number of search processes, default to cpu count
+      index_dir: directory to save the index, default to a temp dir
+    """
+    self.query_path = query_path
+    self.doc_path = doc_path
+    self.output_path = output_path
+    self.ndim = ndim
+    self.delimiter = delimiter
+    self.field_sep = field_sep
+    self.batch_size = batch_size
+    self.index_type = index_type
+    self.nlist = nlist
+    self.nprobe = nprobe
+    self.distance = distance
+    self.m = m
+    self.hnsw_m = hnsw_m
+    self.ef_search = ef_search
+    self.num_workers = num_workers or multiprocessing.cpu_count()
+    self.index_dir = index_dir
+
+  def build_index(self, index_dir):
+    start_ts = time.time()
+    doc_ids = []
+    doc_vectors = []
+    for ids, vectors in read_vectors(self.doc_path, self.ndim, self.delimiter,
+                                     self.field_sep, self.batch_size * 64):
+      doc_ids.append(ids)
+      doc_vectors.append(vectors)
+    doc_ids = np.concatenate(doc_ids, axis=0)
+    if doc_ids.dtype == object:
+      # saved as fixed length strings, so that it could be mmaped
+      doc_ids = doc_ids.astype(str)
+    doc_vectors = np.concatenate(doc_vectors, axis=0)
+    logging.info('read %d doc vectors, takes %.3fs' %
+                 (len(doc_ids), time.time() - start_ts))
+
+    index = vector_index.create_index(
+        self.ndim,
+        index_type=self.index_type,
+        distance=self.distance,
+        nlist=self.nlist,
+        nprobe=self.nprobe,
+        m=self.m,
+        hnsw_m=self.hnsw_m,
+        ef_search=self.ef_search)
+    index.train(doc_vectors)
+    index.add(doc_vectors)
+    vector_index.save_index(index, doc_ids, index_dir)
+    logging.info('build %s index takes %.3fs' %
+                 (self.index_type, time.time() - start_ts))
+
+  def __call__(self, top_n, task_index=0, task_count=1):
+    """Search the queries and write the results.
+
+    Args:
+      top_n: number of neighbours of each query.
+      task_index: index of the task, the query batches are split between
+        tasks.
+      task_count: number of tasks.
+    """
+    tmp_index_dir = None
+    index_dir = self.index_dir
+    if not index_dir:
+      tmp_index_dir = tempfile.mkdtemp(prefix='vector_index_')
+      index_dir = tmp_index_dir
+    if not gfile.Exists(os.path.join(index_dir, 'ids.npy')):
+      self.build_index(index_dir)
+
+    def _query_batches():
+      for batch_id, (ids, vectors) in enumerate(
+          read_vectors(self.query_path, self.ndim, self.delimiter,
+                       self.field_sep, self.batch_size)):
+        if batch_id % task_count == task_index:
+          yield ids, vectors, top_n
+
+    # each process uses a single thread when there are multiple processes
+    num_threads = 1 if self.num_workers > 1 else 0
+    writer = ResultWriter(self.output_path, self.field_sep)
+    start_ts = time.time()
+    num_queries = 0
+    pool = None
+    try:
+      if self.num_workers > 1:
+        pool = multiprocessing.get_context('spawn').Pool(
+            self.num_workers,
+            initializer=_init_search_worker,
+            initargs=(index_dir, num_threads))
+        results = pool.imap(_search_batch, _query_batches())
+      else:
+        _init_search_worker(index_dir, num_threads)
+        results = (_search_batch(x) for x in _query_batches())
+      for batch_id, (query_ids, doc_ids, distances,
+                     batch_size) in enumerate(results):
+        writer.write(query_ids, doc_ids, distances)
+        num_queries += batch_size
+        if batch_id % 100 == 0:
+          logging.info('searched %d queries, %.1f queries/s' %
+                       (num_queries, num_queries / (time.time() - start_ts)))
+      if pool is not None:
+        pool.close()
+        pool.join()
+        pool = None
+    finally:
+      if pool is not None:
+        pool.terminate()
+      writer.close()
+      if tmp_index_dir is not None:
+        shutil.rmtree(tmp_index_dir, ignore_errors=True)
+    logging.info('searched %d queries, takes %.3fs, output: %s' %
+                 (num_queries, time.time() - start_ts, self.output_path))
@@ -0,0 +1,171 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Columnar output sinks for batch predictors.
+
+The row based writers of the predictors format every cell as a python
+string. The sinks here take the fetched numpy arrays of each batch and
+convert them into arrow columns directly:
+  - numeric columns keep their native dtypes;
+  - bytes columns are decoded as utf-8 strings;
+  - outputs of shape [batch_size, 1] are flattened;
+  - other multi-dimensional outputs(such as embeddings) are written as
+    fixed size list columns.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import os
+import tempfile
+
+import numpy as np
+from tensorflow.python.platform import gfile
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = None
+  pq = None
+
+OUTPUT_FORMATS = ['csv', 'parquet']
+
+
+def _decode_strings(values):
+  try:
+    return pa.array(values, type=pa.binary()).cast(pa.string())
+  except pa.ArrowInvalid:
+    # invalid utf-8 bytes are dropped, the same as the row based writers
+    return pa.array([x.decode('utf-8', errors='ignore') for x in values],
+                    type=pa.string())
+
+
+def to_arrow_array(values):
+  """Convert a column of a batch to an arrow array.
+
+  Args:
+    values: numpy array or list of length batch_size.
+
+  Return:
+    pyarrow.Array
+  """
+  values = np.asarray(values)
+  if values.ndim > 1:
+    values = values.reshape([len(values), -1])
+    if values.shape[1] == 1:
+      values = values[:, 0]
+  if values.ndim > 1:
+    flat_values = to_arrow_array(values.reshape([-1]))
+    return pa.FixedSizeListArray.from_arrays(flat_values, values.shape[1])
+  if values.dtype == object:
+    if len(values) > 0 and isinstance(values[0], bytes):
+      return _decode_strings(values)
+    return pa.array(values)
+  if values.dtype.kind == 'S':
+    return _decode_strings(values.astype(object))
+  return pa.array(values)
+
+
+class OutputSink(object):
+  """Write batches of named numpy columns."""
+
+  def write(self, columns):
+    """Write a batch.
+
+    Args:
+      columns: list of (column_name, values), values are numpy arrays
+        whose first dimension is the batch_size.
+    """
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+
+class ParquetSink(OutputSink):
+  """Write batches as arrow record batches into a parquet file.
+
+  The record batches are buffered until there are row_group_size rows, so
+  that the row groups are not as small as the predict batches. Remote
+  files(oss, hdfs) are written to a local temp file and copied on close.
+  """
+
+  def __init__(self, output_path, row_group_size=65536, compression='snappy'):
+    assert pq is not None, 'pyarrow is required to write parquet files'
+    self._output_path = output_path
+    self._row_group_size = row_group_size
+    self._compression = compression
+    self._writer = None
+    self._local_path = output_path
+    if '://' in output_path:
+      fd, self._local_path = tempfile.mkstemp(suffix='.parquet')
+      os.close(fd)
+    self._batches = []
+    self._num_buffered = 0
+    self._num_rows = 0
+
+  def write(self, columns):
+    names = [name for name, _ in columns]
+    arrays = [to_arrow_array(values) for _, values in columns]
+    batch = pa.RecordBatch.from_arrays(arrays, names=names)
+    self._batches.append(batch)
+    self._num_buffered += batch.num_rows
+    if self._num_buffered >= self._row_group_size:
+      self._flush()
+
+  def _flush(self, final=False):
+    if not self._batches:
+      return
+    table = pa.Table.from_batches(self._batches)
+    num_rows = table.num_rows
+    if not final:
+      # write full row groups only, the rest rows are kept in the buffer
+      num_rows -= num_rows % self._row_group_size
+    if self._writer is None:
+      self._writer = pq.ParquetWriter(
+          self._local_path, table.schema, compression=self._compression)
+    self._writer.write_table(
+        table.slice(0, num_rows), row_group_size=self._row_group_size)
+    self._num_rows += num_rows
+    self._batches = table.slice(num_rows).to_batches()
+    self._num_buffered = table.num_rows - num_rows
+
+  def close(self):
+    self._flush(final=True)
+    if self._writer is not None:
+      self._writer.close()
+      if self._local_path != self._output_path:
+        gfile.Copy(self._local_path, self._output_path, overwrite=True)
+        os.remove(self._local_path)
+    logging.info('write %d rows to %s' % (self._num_rows, self._output_path))
+
+
+def create_output_sink(output_format,
+                       output_path,
+                       slice_id,
+                       row_group_size=65536,
+                       compression='snappy'):
+  """Create the sink that writes part-{slice_id} under output_path.
+
+  Args:
+    output_format: parquet, or csv for the row based writer of predictors.
+    output_path: output directory.
+    slice_id: id of the worker.
+    row_group_size: max number of rows of parquet row groups.
+    compression: parquet compression codec, such as snappy, zstd, none.
+
+  Return:
+    an OutputSink, or None if output_format is csv.
+  """
+  if output_format == 'csv':
+    return None
+  assert output_format in OUTPUT_FORMATS, \
+      'invalid output_format: %s, must be one of %s' % (
+          output_format, ','.join(OUTPUT_FORMATS))
+  if not gfile.Exists(output_path):
+    gfile.MakeDirs(output_path)
+  return ParquetSink(
+      os.path.join(output_path, 'part-%d.parquet' % slice_id),
+      row_group_size=row_group_size,
+      compression=compression)
@@ -142,6 +142,9 @@ class ParquetPredictor(Predictor):
       reserve_vals.append(tmp_val)
     return reserve_vals
 
+  def _get_reserve_columns(self, reserved_cols, all_vals):
+    return [all_vals['reserve'][k] for k in reserved_cols]
+
   @property
   def out_of_range_exception(self):
     return (tf.errors.OutOfRangeError)
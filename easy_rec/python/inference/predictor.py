@@ -21,6 +21,7 @@ from tensorflow.python.saved_model import signature_constants
 
 import easy_rec
 from easy_rec.python.utils import numpy_utils
+from easy_rec.python.utils import user_side_util
 from easy_rec.python.utils.config_util import get_configs_from_pipeline_file
 from easy_rec.python.utils.config_util import get_input_name_from_fg_json
 from easy_rec.python.utils.config_util import search_fg_json
@@ -39,7 +40,9 @@ SINGLE_PLACEHOLDER_FEATURE_KEY = 'features'
 
 _PREDICTOR_CLASS_MAP = {}
 _register_abc_meta = get_register_class_meta(
-    _PREDICTOR_CLASS_MAP, have_abstract_class=True)
+    _PREDICTOR_CLASS_MAP,
+    have_abstract_class=True,
+    registry='PredictorInterface')
 
 
 class PredictorInterface(six.with_metaclass(_register_abc_meta, object)):
@@ -117,6 +120,7 @@ class PredictorImpl(object):
     self._profiling_file = profiling_file
     self._model_path = model_path
     self._input_names = []
+    self._user_input_names = []
     self._is_multi_placeholder = True
     self._use_latest = use_latest
 
@@ -130,6 +134,11 @@ class PredictorImpl(object):
   def output_names(self):
     return list(self._outputs_map.keys())
 
+  @property
+  def user_input_names(self):
+    """Inputs fed once per request, shared by all the candidate items."""
+    return self._user_input_names
+
   def __del__(self):
     """Destroy predictor resources."""
     self._session.close()
@@ -171,7 +180,7 @@ class PredictorImpl(object):
       logging.warning(
           '%s not exists, default values maybe inconsistent with the values used in training.'
           % pipeline_path)
-      return {}
+      return {}, []
     pipeline_config = get_configs_from_pipeline_file(pipeline_path)
     input_fields = pipeline_config.data_config.input_fields
     input_fields_info = {
@@ -268,6 +277,15 @@ class PredictorImpl(object):
             self._assets[type_name] = asset_path
           logging.info(self._assets)
 
+          # get user side inputs, which are shared by candidate items
+          user_inputs = user_side_util.get_user_side_inputs_from_graph()
+          if user_inputs:
+            self._user_input_names = [
+                x for x in self._input_names if x in user_inputs
+            ]
+            logging.info('user side inputs: %s' %
+                         ','.join(self._user_input_names))
+
           # get export config
           self._export_config = {}
           # export_config_collection = tf.get_collection(fields.EVGraphKeys.export_config)
@@ -431,16 +449,42 @@ class Predictor(PredictorInterface):
   def _get_reserve_vals(self, reserved_cols, output_cols, all_vals, outputs):
     pass
 
-  def predict_impl(
-      self,
-      input_path,
-      output_path,
-      reserved_cols='',
-      output_cols=None,
-      batch_size=1024,
-      slice_id=0,
-      slice_num=1,
-  ):
+  def _get_reserve_columns(self, reserved_cols, all_vals):
+    """Reserved columns as numpy arrays, used by output sinks."""
+    return [all_vals[k] for k in reserved_cols]
+
+  def _write_rows(self, table_writer, all_vals, outputs):
+    """Format the outputs and reserved columns as rows and write them."""
+    for x in self._output_cols:
+      if outputs[x].dtype == np.object:
+        outputs[x] = [val.decode('utf-8') for val in outputs[x]]
+      elif len(outputs[x].shape) == 2 and outputs[x].shape[1] == 1:
+        # automatic flatten only one element array
+        outputs[x] = [val[0] for val in outputs[x]]
+      elif len(outputs[x].shape) > 1:
+        outputs[x] = [
+            json.dumps(val, cls=numpy_utils.NumpyEncoder) for val in outputs[x]
+        ]
+    for k in self._reserved_cols:
+      if k in all_vals and all_vals[k].dtype == np.object:
+        all_vals[k] = [
+            val.decode('utf-8', errors='ignore') for val in all_vals[k]
+        ]
+    reserve_vals = self._get_reserve_vals(self._reserved_cols,
+                                          self._output_cols, all_vals, outputs)
+    outputs = [x for x in zip(*reserve_vals)]
+    logging.info('predict size: %s' % len(outputs))
+    self._write_lines(table_writer, outputs)
+
+  def predict_impl(self,
+                   input_path,
+                   output_path,
+                   reserved_cols='',
+                   output_cols=None,
+                   batch_size=1024,
+                   slice_id=0,
+                   slice_num=1,
+                   output_sink=None):
     """Predict table input with loaded model.
 
     Args:
@@ -453,6 +497,9 @@ class Predictor(PredictorInterface):
       slice_id: when multiple workers write the same table, each worker should
                 be assigned different slice_id, which is usually slice_id
       slice_num: table slice number
+      output_sink: an OutputSink(see output_sink.py), if set, the outputs and
+                reserved columns are written to it as numpy arrays instead of
+                by the row based writer of the predictor
     """
     if output_cols is None or output_cols == 'ALL_COLUMNS':
       self._output_cols = sorted(self._predictor_impl.output_names)
@@ -481,7 +528,9 @@ class Predictor(PredictorInterface):
       all_dict = iterator.get_next()
       self._reserved_cols = self._get_reserved_cols(reserved_cols)
       input_names = self._predictor_impl.input_names
-      table_writer = self._get_writer(output_path, slice_id)
+      table_writer = None
+      if output_sink is None:
+        table_writer = self._get_writer(output_path, slice_id)
 
       def _parse_value(all_vals):
         if self._is_multi_placeholder:
@@ -521,30 +570,15 @@ class Predictor(PredictorInterface):
           ts1 = time.time()
           input_vals = _parse_value(all_vals)
           outputs = self._predictor_impl.predict(input_vals, self._output_cols)
-          for x in self._output_cols:
-            if outputs[x].dtype == np.object:
-              outputs[x] = [val.decode('utf-8') for val in outputs[x]]
-            elif len(outputs[x].shape) == 2 and outputs[x].shape[1] == 1:
-              # automatic flatten only one element array
-              outputs[x] = [val[0] for val in outputs[x]]
-            elif len(outputs[x].shape) > 1:
-              outputs[x] = [
-                  json.dumps(val, cls=numpy_utils.NumpyEncoder)
-                  for val in outputs[x]
-              ]
-          for k in self._reserved_cols:
-            if k in all_vals and all_vals[k].dtype == np.object:
-              all_vals[k] = [
-                  val.decode('utf-8', errors='ignore') for val in all_vals[k]
-              ]
-
           ts2 = time.time()
-          reserve_vals = self._get_reserve_vals(self._reserved_cols,
-                                                self._output_cols, all_vals,
-                                                outputs)
-          outputs = [x for x in zip(*reserve_vals)]
-          logging.info('predict size: %s' % len(outputs))
-          self._write_lines(table_writer, outputs)
+          if output_sink is not None:
+            columns = [(x, outputs[x]) for x in self._output_cols]
+            columns.extend(
+                zip(self._reserved_cols,
+                    self._get_reserve_columns(self._reserved_cols, all_vals)))
+            output_sink.write(columns)
+          else:
+            self._write_rows(table_writer, all_vals, outputs)
 
           ts3 = time.time()
           progress += 1
@@ -560,8 +594,11 @@ class Predictor(PredictorInterface):
                        (sum_t0, sum_t1, sum_t2))
       logging.info('Final_time_stats: read: %.2f predict: %.2f write: %.2f' %
                    (sum_t0, sum_t1, sum_t2))
-      table_writer.close()
-      self.load_to_table(output_path, slice_num, slice_id)
+      if output_sink is not None:
+        output_sink.close()
+      else:
+        table_writer.close()
+        self.load_to_table(output_path, slice_num, slice_id)
       logging.info('Predict %s done.' % input_path)
 
   def predict(self, input_data_dict_list, output_names=None, batch_size=1):
@@ -600,6 +637,57 @@ class Predictor(PredictorInterface):
         outputs_list.append(single_result)
     return outputs_list
 
+  def predict_user_items(self,
+                         user_data,
+                         item_data_list,
+                         output_names=None,
+                         batch_size=1024):
+    """Score candidate items of one user.
+
+    If the model is exported with user_input_names or user_feature_groups
+    set in export_config, user features are fed only once per batch and
+    the user side computation is shared by all the candidate items,
+    otherwise user features are repeated for each item.
+
+    Args:
+      user_data: dict of user side input name to value
+      item_data_list: list of dict, each dict contains the item side inputs
+        of one candidate item
+      output_names:  if not None, will fetch certain outputs
+      batch_size: number of candidate items predicted in one session run,
+        -1 indicates to predict all the items in one batch
+
+    Return:
+      a list of dict, each dict contain a key-value pair for output_name, output_value
+    """
+    num_example = len(item_data_list)
+    assert num_example > 0, 'item_data_list should not be an empty list'
+    assert isinstance(user_data, dict), 'user_data should be a dict'
+    if batch_size <= 0:
+      batch_size = num_example
+    num_batches = int(math.ceil(float(num_example) / batch_size))
+    user_input_names = self._predictor_impl.user_input_names
+
+    outputs_list = []
+    for batch_idx in range(num_batches):
+      batch_data_list = item_data_list[batch_idx * batch_size:(batch_idx + 1) *
+                                       batch_size]
+      feed_dict = self.batch(batch_data_list)
+      for key in user_data:
+        if key not in feed_dict:
+          continue
+        if key in user_input_names:
+          feed_dict[key] = np.array([user_data[key]])
+        else:
+          feed_dict[key] = np.array([user_data[key]] * len(batch_data_list))
+      outputs = self._predictor_impl.predict(feed_dict, output_names)
+      for idx in range(len(batch_data_list)):
+        single_result = {}
+        for key, batch_value in six.iteritems(outputs):
+          single_result[key] = batch_value[idx]
+        outputs_list.append(single_result)
+    return outputs_list
+
   def batch(self, data_list):
     """Batching the data."""
     batch_input = {key: [] for key in self._predictor_impl.input_names}
@@ -7,10 +7,11 @@ from __future__ import print_function
 import logging
 from datetime import datetime
 
-import common_io
 import numpy as np
 import tensorflow as tf
 
+from easy_rec.python.utils.vector_index import parse_vectors
+
 try:
   import graphlearn as gl
 except:  # noqa: E722
@@ -69,6 +70,7 @@ class VectorRetrieve(object):
     self.knn_option = knn_option
 
   def __call__(self, top_n, task_index, task_count, *args, **kwargs):
+    import common_io
     g = gl.Graph()
     g.node(
         self.doc_table,
@@ -97,17 +99,19 @@ class VectorRetrieve(object):
         batch_num += 1.0
         print('{} process: {:.2f}'.format(datetime.now().time(),
                                           batch_num / total_batch_num))
-        feats = to_np_array(batch_query_feats, self.delimiter)
+        feats = to_np_array(batch_query_feats, self.delimiter, self.ndim)
         rt_ids, rt_dists = g.search('doc', feats, gl.KnnOption(k=top_n))
 
-        for query_node, nodes, dists in zip(batch_query_nodes, rt_ids,
-                                            rt_dists):
-          query = np.array([query_node] * len(nodes), dtype='int64')
-          output_table_writer.write(
-              zip(query, nodes, dists), (0, 1, 2), allow_type_cast=False)
-          count += 1
-          if np.mod(count, 100) == 0:
-            print('write ', count, ' query nodes totally')
+        # write the results of the whole batch at once
+        query = np.repeat(
+            np.array(batch_query_nodes, dtype='int64'),
+            [len(nodes) for nodes in rt_ids])
+        output_table_writer.write(
+            zip(query, np.concatenate(rt_ids), np.concatenate(rt_dists)),
+            (0, 1, 2),
+            allow_type_cast=False)
+        count += len(batch_query_nodes)
+        print('write ', count, ' query nodes totally')
       except Exception as e:
         print(e)
         break
@@ -118,7 +122,13 @@ class VectorRetrieve(object):
     g.close()
 
 
-def to_np_array(batch_query_feats, attr_delimiter):
-  return np.array(
-      [map(float, feat.split(attr_delimiter)) for feat in batch_query_feats],
-      dtype='float32')
+def to_np_array(batch_query_feats, attr_delimiter, ndim=None):
+  """Parse the query vectors, ndim is inferred from the first one if None."""
+  if ndim is None:
+    if len(batch_query_feats) == 0:
+      return np.zeros([0, 0], dtype=np.float32)
+    feat = batch_query_feats[0]
+    if isinstance(feat, bytes):
+      feat = feat.decode('utf-8')
+    ndim = len(feat.split(attr_delimiter))
+  return parse_vectors(batch_query_feats, ndim, attr_delimiter)
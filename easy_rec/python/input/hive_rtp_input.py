@@ -5,6 +5,7 @@ import os
 import tensorflow as tf
 
 from easy_rec.python.input.input import Input
+from easy_rec.python.ops import gen_parse_rtp_op
 from easy_rec.python.utils.check_utils import check_split
 from easy_rec.python.utils.hive_utils import HiveUtils
 from easy_rec.python.utils.input_utils import string_to_number
@@ -40,6 +41,11 @@ class HiveRTPInput(Input):
     self._selected_cols = [c.strip() for c in self._data_config.selected_cols.split(',')] \
         if self._data_config.selected_cols else None
     logging.info('select cols: %s' % self._selected_cols)
+    self._fused_rtp_parse = self._data_config.fused_rtp_parse
+    if self._fused_rtp_parse and gen_parse_rtp_op.parse_rtp_op is None:
+      logging.warning('parse_rtp op is not available, fused_rtp_parse '
+                      'is disabled')
+      self._fused_rtp_parse = False
     hive_util = HiveUtils(
         data_config=self._data_config, hive_config=self._hive_config)
     self._input_hdfs_path = hive_util.get_table_location(
@@ -83,29 +89,37 @@ class HiveRTPInput(Input):
     ]
     feature_num = len(record_types)
 
-    check_list = [
-        tf.py_func(
-            check_split,
-            [fields[-1], self._data_config.separator,
-             len(record_types)],
-            Tout=tf.bool)
-    ] if self._check_mode else []
-    with tf.control_dependencies(check_list):
-      fields = tf.string_split(
-          fields[-1], self._data_config.separator, skip_empty=False)
-    tmp_fields = tf.reshape(fields.values, [-1, feature_num])
-
     rtp_record_defaults = [
         str(self.get_type_defaults(t, v))
         for x, t, v in zip(self._input_fields, self._input_field_types,
                            self._input_field_defaults)
         if x not in non_feature_cols
     ]
-    fields = labels[len(self._label_fields):]
-    for i in range(feature_num):
-      field = string_to_number(tmp_fields[:, i], record_types[i],
-                               rtp_record_defaults[i], i)
-      fields.append(field)
+    if self._fused_rtp_parse:
+      fields = labels[len(self._label_fields):] + gen_parse_rtp_op.parse_rtp(
+          fields[-1],
+          record_types,
+          rtp_record_defaults,
+          self._data_config.separator,
+          check_mode=self._check_mode)
+    else:
+      check_list = [
+          tf.py_func(
+              check_split,
+              [fields[-1], self._data_config.separator,
+               len(record_types)],
+              Tout=tf.bool)
+      ] if self._check_mode else []
+      with tf.control_dependencies(check_list):
+        fields = tf.string_split(
+            fields[-1], self._data_config.separator, skip_empty=False)
+      tmp_fields = tf.reshape(fields.values, [-1, feature_num])
+
+      fields = labels[len(self._label_fields):]
+      for i in range(feature_num):
+        field = string_to_number(tmp_fields[:, i], record_types[i],
+                                 rtp_record_defaults[i], i)
+        fields.append(field)
 
     field_keys = [x for x in self._input_fields if x not in self._label_fields]
     effective_fids = [field_keys.index(x) for x in self._effective_fields]
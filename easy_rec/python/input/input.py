@@ -1,12 +1,16 @@
 # -*- encoding:utf-8 -*-
 # Copyright (c) Alibaba, Inc. and its affiliates.
+import hashlib
 import logging
 import os
+import uuid
 from abc import abstractmethod
 from collections import OrderedDict
 
+import numpy as np
 import six
 import tensorflow as tf
+from google.protobuf import text_format
 from tensorflow.python.framework import ops
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import sparse_ops
@@ -18,6 +22,9 @@ from easy_rec.python.protos.dataset_pb2 import DatasetConfig
 from easy_rec.python.utils import conditional
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import input_autotune
+from easy_rec.python.utils import input_profiler
+from easy_rec.python.utils import user_side_util
 from easy_rec.python.utils.check_utils import check_split
 from easy_rec.python.utils.check_utils import check_string_to_number
 from easy_rec.python.utils.expr_util import get_expression
@@ -30,7 +37,29 @@ if tf.__version__ >= '2.0':
   tf = tf.compat.v1
 
 _INPUT_CLASS_MAP = {}
-_meta_type = get_register_class_meta(_INPUT_CLASS_MAP, have_abstract_class=True)
+_meta_type = get_register_class_meta(
+    _INPUT_CLASS_MAP, have_abstract_class=True, registry='Input')
+
+# prefix of the cached batches in the cache path
+_CACHE_NAME = 'cache'
+
+
+def _commit_cache(tmp_path, cache_path):
+  """Rename the completed cache in tmp_path to cache_path.
+
+  The rename fails if another job has committed cache_path first,
+  then the cache in tmp_path, which is written by this job, is removed.
+  """
+  if not gfile.Exists(os.path.join(cache_path, _CACHE_NAME + '.index')):
+    try:
+      gfile.Rename(tmp_path, cache_path)
+      logging.info('cache is committed to %s' % cache_path)
+      return
+    except (tf.errors.OpError, OSError):
+      if not gfile.Exists(os.path.join(cache_path, _CACHE_NAME + '.index')):
+        raise
+  logging.info('cache %s is committed by another job' % cache_path)
+  gfile.DeleteRecursively(tmp_path)
 
 
 class Input(six.with_metaclass(_meta_type, object)):
@@ -92,6 +121,10 @@ class Input(six.with_metaclass(_meta_type, object)):
 
     self._batch_size = data_config.batch_size
     self._prefetch_size = data_config.prefetch_size
+    # set when building the first pass which is written to cache_dir
+    self._is_cache_pass = False
+    # num_parallel_calls and prefetch_size are tuned only once
+    self._is_auto_tuned = False
     self._feature_configs = list(feature_configs)
     self._task_index = task_index
     self._task_num = task_num
@@ -225,6 +258,8 @@ class Input(six.with_metaclass(_meta_type, object)):
 
   @property
   def num_epochs(self):
+    if self._is_cache_pass:
+      return 1
     if self._data_config.num_epochs > 0:
       return self._data_config.num_epochs
     else:
@@ -294,10 +329,33 @@ class Input(six.with_metaclass(_meta_type, object)):
         logging.info('input_name: %s, dtype: %s' % (input_name, tf_type))
         finput = array_ops.placeholder(tf_type, [None], name=placeholder_name)
       inputs[input_name] = finput
+    if user_side_util.is_enabled(export_config):
+      self._set_user_side_info(export_config, inputs)
     features = {x: inputs[x] for x in inputs}
     features = self._preprocess(features)
     return inputs, features['feature']
 
+  def _set_user_side_info(self, export_config, inputs):
+    """User side inputs are fed once per request, and shared by all items.
+
+    Args:
+      export_config: ExportConfig instance.
+      inputs: dict of input_name to placeholder.
+    """
+    assert self._pipeline_config is not None, \
+        'pipeline_config is required to share user side inputs'
+    user_side_inputs = user_side_util.get_user_side_inputs(
+        export_config, self._feature_configs,
+        self._pipeline_config.model_config.feature_groups)
+    user_inputs = [x for x in inputs if x in user_side_inputs]
+    item_inputs = [x for x in inputs if x not in user_inputs]
+    assert len(item_inputs) > 0, 'at least one item side input is required'
+    user_features = user_side_util.get_user_side_features(
+        set(user_inputs), self._feature_configs)
+    candidate_batch_size = tf.shape(inputs[item_inputs[0]])[0]
+    user_side_util.set_user_side_info(user_inputs, user_features,
+                                      candidate_batch_size)
+
   def create_placeholders(self, export_config):
     self._mode = tf.estimator.ModeKeys.PREDICT
     inputs_placeholder = array_ops.placeholder(
@@ -1012,6 +1070,144 @@ class Input(six.with_metaclass(_meta_type, object)):
   def restore(self, checkpoint_path):
     pass
 
+  def _get_cache_path(self, mode):
+    """Cache path keyed by the hash of input_path and configs.
+
+    Any change of the input data(files, sizes, modify times), data_config
+    or feature_configs results in a new cache path. Inputs which could not
+    be listed, such as odps tables, are not fingerprinted, and could be
+    rewritten in place, so they are cached only if data_config.cache_version
+    is set.
+
+    Return:
+      the directory of the completed cache, the cached batches are saved
+      with the prefix os.path.join(cache_path, 'cache'); or None if the
+      input could not be cached.
+    """
+    data_config = DatasetConfig()
+    data_config.CopyFrom(self._data_config)
+    # fields which do not affect the preprocessed batches
+    for field in [
+        'num_epochs', 'shuffle', 'shuffle_buffer_size', 'prefetch_size',
+        'num_parallel_calls', 'cache_dir', 'cache_shuffle_buffer_size',
+        'profile_input', 'auto_tune'
+    ]:
+      data_config.ClearField(field)
+    input_path = self._input_path
+    if not isinstance(input_path, list):
+      input_path = input_path.split(',')
+    key_strs = [
+        str(mode),
+        str(self._task_index),
+        str(self._task_num),
+        text_format.MessageToString(data_config, as_one_line=True)
+    ]
+    for fc in self._feature_configs:
+      key_strs.append(text_format.MessageToString(fc, as_one_line=True))
+    for path in input_path:
+      key_strs.append(path)
+      try:
+        file_paths = sorted(gfile.Glob(path))
+        for file_path in file_paths:
+          file_stat = gfile.Stat(file_path)
+          key_strs.append('%s:%d:%d' %
+                          (file_path, file_stat.length, file_stat.mtime_nsec))
+        if len(file_paths) > 0:
+          continue
+        ex = 'no files matched'
+      except Exception as stat_ex:
+        ex = str(stat_ex)
+      # not file inputs, such as odps tables
+      if not self._data_config.cache_version:
+        logging.warning(
+            'could not fingerprint %s: %s, the batches are not cached, set '
+            'data_config.cache_version to cache them' % (path, ex))
+        return None
+      logging.warning(
+          'could not fingerprint %s: %s, the cache is keyed by cache_version'
+          '(%s), update it when the data changes' %
+          (path, ex, self._data_config.cache_version))
+    cache_key = hashlib.md5('\n'.join(key_strs).encode('utf-8')).hexdigest()
+    cache_dir = os.path.join(self._data_config.cache_dir, cache_key)
+    if not gfile.Exists(cache_dir):
+      gfile.MakeDirs(cache_dir)
+    return os.path.join(
+        cache_dir, '%s_%d_of_%d' % (mode, self._task_index, self._task_num))
+
+  def _build_with_cache(self, mode, params):
+    """Build dataset which caches the preprocessed batches.
+
+    The first pass parses and preprocesses the data, and writes
+    the batches to cache_dir, later epochs or jobs read from the cache
+    and shuffle the batches. The shuffle reorders whole batches, the
+    records within each batch are not reshuffled.
+
+    Jobs with the same configs, such as hpo trials, may write the same
+    cache concurrently, so each job writes to its own tmp dir, which is
+    renamed to the cache path after the first pass. Only completed caches
+    are read, and the cache files of other jobs are never touched.
+    """
+    assert self._sampler is None, 'cache_dir is not supported with samplers'
+    assert self._data_config.input_type not in [
+        DatasetConfig.KafkaInput, DatasetConfig.DataHubInput
+    ], 'cache_dir is not supported with streaming inputs'
+    cache_path = self._get_cache_path(mode)
+    if cache_path is None:
+      return self._build(mode, params)
+    self._is_cache_pass = True
+    try:
+      dataset = self._build(mode, params)
+    finally:
+      self._is_cache_pass = False
+    num_epochs = self.num_epochs if mode == tf.estimator.ModeKeys.TRAIN else 1
+
+    def _shuffle(cached_dataset):
+      if mode == tf.estimator.ModeKeys.TRAIN and self._data_config.shuffle:
+        cached_dataset = cached_dataset.shuffle(
+            self._data_config.cache_shuffle_buffer_size,
+            seed=2020,
+            reshuffle_each_iteration=True)
+      return cached_dataset
+
+    cache_prefix = os.path.join(cache_path, _CACHE_NAME)
+    if gfile.Exists(cache_prefix + '.index'):
+      logging.info('read preprocessed batches from cache %s' % cache_path)
+      cached_dataset = _shuffle(dataset.cache(cache_prefix)).repeat(num_epochs)
+      return cached_dataset.prefetch(buffer_size=self._prefetch_size)
+
+    tmp_path = '%s.tmp_%d_%s' % (cache_path, os.getpid(), uuid.uuid4().hex)
+    gfile.MakeDirs(tmp_path)
+    logging.info('preprocessed batches will be cached to %s' % cache_path)
+
+    def _commit(_):
+      _commit_cache(tmp_path, cache_path)
+      return np.int64(0)
+
+    # the tmp cache is completed when the first pass is exhausted, then
+    # the commit dataset renames it to cache_path and yields no batches
+    commit_dataset = tf.data.Dataset.from_tensors(
+        np.int64(0)).map(lambda x: tf.py_func(_commit, [x], tf.int64)).flat_map(
+            lambda _: dataset.take(0))
+    cached_dataset = _shuffle(
+        dataset.cache(os.path.join(tmp_path,
+                                   _CACHE_NAME))).concatenate(commit_dataset)
+    if num_epochs != 1:
+      # the iterators of later epochs are created after the commit,
+      # so they read from the completed cache
+      later_epochs = None if num_epochs is None else num_epochs - 1
+      cached_dataset = cached_dataset.concatenate(
+          _shuffle(dataset.cache(cache_prefix)).repeat(later_epochs))
+    return cached_dataset.prefetch(buffer_size=self._prefetch_size)
+
+  def _auto_tune(self, params):
+    """Tune num_parallel_calls and prefetch_size on the train data."""
+    self._data_config = input_autotune.auto_tune(self, params)
+    self._prefetch_size = self._data_config.prefetch_size
+    if self._data_config.auto_tune.adaptive:
+      # prefetch buffers are sized by tf.data autotune during training
+      self._prefetch_size = input_autotune.AUTOTUNE
+    self._is_auto_tuned = True
+
   def stop(self):
     pass
 
@@ -1044,7 +1240,21 @@ class Input(six.with_metaclass(_meta_type, object)):
                   tf.estimator.ModeKeys.PREDICT):
         # build dataset from self._config.input_path
         self._mode = mode
-        dataset = self._build(mode, params)
+        is_auto_tune = self._data_config.HasField('auto_tune') and \
+            mode == tf.estimator.ModeKeys.TRAIN
+        if is_auto_tune and not self._is_auto_tuned:
+          self._auto_tune(params)
+        if self._data_config.profile_input and \
+            mode == tf.estimator.ModeKeys.TRAIN:
+          input_profiler.get_profiler().instrument(self)
+        if self._data_config.cache_dir and \
+            mode != tf.estimator.ModeKeys.PREDICT:
+          dataset = self._build_with_cache(mode, params)
+        else:
+          dataset = self._build(mode, params)
+        if is_auto_tune and self._data_config.auto_tune.adaptive:
+          dataset = input_autotune.set_ram_budget(dataset,
+                                                  self._data_config.auto_tune)
         return dataset
       elif mode is None:  # serving_input_receiver_fn for export SavedModel
         place_on_cpu = os.getenv(constant.EmbeddingOnCPU)
@@ -1054,6 +1264,8 @@ class Input(six.with_metaclass(_meta_type, object)):
             inputs, features = self.create_multi_placeholders(export_config)
           return tf.estimator.export.ServingInputReceiver(features, inputs)
         else:
+          assert not user_side_util.is_enabled(export_config), \
+              'user side sharing is only supported when multi_placeholder is true'
           with conditional(place_on_cpu, ops.device('/CPU:0')):
             inputs, features = self.create_placeholders(export_config)
           print('built feature placeholders. features: {}'.format(
@@ -10,6 +10,7 @@ from tensorflow.python.platform import gfile
 
 from easy_rec.python.input.input import Input
 from easy_rec.python.input.kafka_dataset import KafkaDataset
+from easy_rec.python.input.kafka_reader import KafkaParallelReader
 from easy_rec.python.utils.config_util import parse_time
 
 try:
@@ -44,10 +45,7 @@ class KafkaInput(Input):
     self._kafka = kafka_config
     self._offset_dict = {}
     if self._kafka is not None:
-      consumer = KafkaConsumer(
-          group_id='kafka_dataset_consumer',
-          bootstrap_servers=[self._kafka.server],
-          api_version_auto_timeout_ms=60000)  # in miliseconds
+      consumer = self._create_consumer()
       partitions = consumer.partitions_for_topic(self._kafka.topic)
       self._num_partition = len(partitions)
       logging.info('all partitions[%d]: %s' % (self._num_partition, partitions))
@@ -80,8 +78,16 @@ class KafkaInput(Input):
             self._offset_dict[part_id] = offset_dict[part]
         else:
           assert 'invalid offset_type: %s' % offset_type
+      consumer.close()
     self._task_offset_dict = {}
 
+  def _create_consumer(self, group_id='kafka_dataset_consumer', **kwargs):
+    return KafkaConsumer(
+        group_id=group_id,
+        bootstrap_servers=[self._kafka.server],
+        api_version_auto_timeout_ms=60000,  # in miliseconds
+        **kwargs)
+
   def _preprocess(self, field_dict):
     output_dict = super(KafkaInput, self)._preprocess(field_dict)
 
@@ -129,6 +135,33 @@ class KafkaInput(Input):
                                            tf.string)
     return inputs
 
+  def _parse_csv_batch(self, lines, high_water_marks):
+    """Parse the batches from KafkaParallelReader, no py_func is used."""
+    record_defaults = [
+        self.get_type_defaults(t, v)
+        for t, v in zip(self._input_field_types, self._input_field_defaults)
+    ]
+
+    fields = tf.decode_csv(
+        lines,
+        use_quote_delim=False,
+        field_delim=self._data_config.separator,
+        record_defaults=record_defaults,
+        name='decode_csv')
+
+    inputs = {self._input_fields[x]: fields[x] for x in self._effective_fids}
+
+    for x in self._label_fids:
+      inputs[self._input_fields[x]] = fields[x]
+
+    # offsets in json format: {"0": 10, "1": 20}
+    part_keys = tf.constant(['"%d": ' % x for x in self._task_partitions])
+    offsets = tf.reduce_join(
+        tf.string_join([part_keys, tf.as_string(high_water_marks)]),
+        separator=', ')
+    inputs[Input.DATA_OFFSET] = tf.string_join(['{', offsets, '}'])
+    return inputs
+
   def restore(self, checkpoint_path):
     if checkpoint_path is None:
       return
@@ -147,28 +180,72 @@ class KafkaInput(Input):
         if k not in self._offset_dict or v > self._offset_dict[k]:
           self._offset_dict[k] = v
 
-  def _get_topics(self):
+  def _get_task_partitions(self):
     task_num = self._task_num
     task_index = self._task_index
     if self._data_config.chief_redundant and self._mode == tf.estimator.ModeKeys.TRAIN:
       task_index = max(task_index - 1, 0)
       task_num = max(task_num - 1, 1)
 
-    topics = []
     self._task_offset_dict = {}
     for part_id in range(self._num_partition):
       if (part_id % task_num) == task_index:
-        offset = self._offset_dict.get(part_id, 0)
-        topics.append('%s:%d:%d' % (self._kafka.topic, part_id, offset))
-        self._task_offset_dict[part_id] = offset
+        self._task_offset_dict[part_id] = self._offset_dict.get(part_id, 0)
+    assert len(self._task_offset_dict
+               ) > 0, 'no partitions are assigned for this task(%d/%d)' % (
+                   self._task_index, self._task_num)
+    self._task_partitions = sorted(self._task_offset_dict.keys())
+    return dict(self._task_offset_dict)
+
+  def _get_topics(self):
+    topics = [
+        '%s:%d:%d' % (self._kafka.topic, part_id, offset)
+        for part_id, offset in sorted(self._get_task_partitions().items())
+    ]
     logging.info('assigned topic partitions: %s' % (','.join(topics)))
-    assert len(
-        topics) > 0, 'no partitions are assigned for this task(%d/%d)' % (
-            self._task_index, self._task_num)
     return topics
 
+  def _build_parallel_reader(self, mode):
+    partition_offsets = self._get_task_partitions()
+    logging.info('%s kafka server: %s topic: %s task_num: %d task_index: %d '
+                 'partition offsets: %s reader threads: %d' %
+                 ('train' if mode == tf.estimator.ModeKeys.TRAIN else 'eval',
+                  self._kafka.server, self._kafka.topic, self._task_num,
+                  self._task_index, json.dumps(partition_offsets),
+                  self._kafka.num_reader_threads))
+    if len(self._kafka.config_global) > 0 or len(self._kafka.config_topic) > 0:
+      logging.warning('config_global and config_topic are ignored '
+                      'when num_reader_threads > 0')
+
+    def _consumer_fn():
+      return self._create_consumer(
+          group_id=self._kafka.group, enable_auto_commit=False)
+
+    reader = KafkaParallelReader(
+        self._kafka.topic,
+        partition_offsets,
+        _consumer_fn,
+        self._data_config.batch_size,
+        num_threads=self._kafka.num_reader_threads,
+        max_poll_records=self._kafka.max_poll_records,
+        eof=self._kafka.eof)
+    dataset = tf.data.Dataset.from_generator(
+        reader.batches,
+        output_types=(tf.string, tf.int64),
+        output_shapes=(tf.TensorShape([None]),
+                       tf.TensorShape([len(reader.partitions)])))
+    if mode == tf.estimator.ModeKeys.TRAIN and self._data_config.shuffle:
+      logging.warning('shuffle is not supported when num_reader_threads > 0')
+    return dataset.map(
+        self._parse_csv_batch,
+        num_parallel_calls=self._data_config.num_parallel_calls)
+
   def _build(self, mode, params):
     num_parallel_calls = self._data_config.num_parallel_calls
+    if self._kafka is not None and self._kafka.num_reader_threads > 0:
+      dataset = self._build_parallel_reader(mode)
+      return self._build_from_parsed(dataset, mode)
+
     task_topics = self._get_topics()
     if mode == tf.estimator.ModeKeys.TRAIN:
       assert self._kafka is not None, 'kafka_train_input is not set.'
@@ -215,6 +292,10 @@ class KafkaInput(Input):
     dataset = dataset.batch(self._data_config.batch_size)
     dataset = dataset.map(
         self._parse_csv, num_parallel_calls=num_parallel_calls)
+    return self._build_from_parsed(dataset, mode)
+
+  def _build_from_parsed(self, dataset, mode):
+    num_parallel_calls = self._data_config.num_parallel_calls
     if self._data_config.ignore_error:
       dataset = dataset.apply(ignore_errors)
     dataset = dataset.prefetch(buffer_size=self._prefetch_size)
@@ -0,0 +1,176 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Consume kafka partitions in parallel and group the messages into batches.
+
+Each reader thread owns a subset of the assigned partitions and polls them
+with its own consumer, the messages are grouped into batches together with
+the high-water marks(the max offsets read) of all assigned partitions, so
+that the offsets could be saved along with the checkpoints without tracking
+them in py_funcs per batch.
+"""
+import collections
+import logging
+import threading
+
+import numpy as np
+from six.moves import queue
+
+try:
+  from kafka import TopicPartition
+except ImportError:
+  TopicPartition = collections.namedtuple('TopicPartition',
+                                          ['topic', 'partition'])
+
+# put by reader threads when they finish
+_READER_END = 'READER_END'
+
+
+class KafkaParallelReader(object):
+
+  def __init__(self,
+               topic,
+               partition_offsets,
+               consumer_fn,
+               batch_size,
+               num_threads=1,
+               max_poll_records=500,
+               poll_timeout_ms=1000,
+               queue_size=64,
+               eof=False):
+    """Create the reader.
+
+    Args:
+      topic: kafka topic.
+      partition_offsets: dict of assigned partition => offset to start from.
+      consumer_fn: function returning a new consumer(KafkaConsumer or objects
+        with the same assign, seek, poll and close methods).
+      batch_size: number of messages in each batch.
+      num_threads: number of reader threads.
+      max_poll_records: max number of messages returned by one poll.
+      poll_timeout_ms: timeout of each poll in milliseconds.
+      queue_size: max number of polled message chunks waiting to be batched.
+      eof: if True, stop when all the partitions are read to the end.
+    """
+    assert len(partition_offsets) > 0, 'no partitions are assigned'
+    self._topic = topic
+    self._partitions = sorted(partition_offsets.keys())
+    self._start_offsets = [partition_offsets[x] for x in self._partitions]
+    self._consumer_fn = consumer_fn
+    self._batch_size = batch_size
+    self._num_threads = max(1, min(num_threads, len(self._partitions)))
+    self._max_poll_records = max_poll_records
+    self._poll_timeout_ms = poll_timeout_ms
+    self._queue_size = queue_size
+    self._eof = eof
+
+  @property
+  def partitions(self):
+    return self._partitions
+
+  def _read_partitions(self, partitions, chunk_queue, stop_event):
+    consumer = None
+    try:
+      consumer = self._consumer_fn()
+      topic_parts = [TopicPartition(self._topic, x) for x in partitions]
+      consumer.assign(topic_parts)
+      for topic_part in topic_parts:
+        part_id = self._partitions.index(topic_part.partition)
+        consumer.seek(topic_part, self._start_offsets[part_id])
+      while not stop_event.is_set():
+        records = consumer.poll(
+            timeout_ms=self._poll_timeout_ms,
+            max_records=self._max_poll_records)
+        if not records:
+          if self._eof:
+            break
+          continue
+        for topic_part, messages in records.items():
+          if not messages:
+            continue
+          chunk = (self._partitions.index(topic_part.partition),
+                   [x.value for x in messages],
+                   np.array([x.offset for x in messages], dtype=np.int64))
+          self._put(chunk_queue, chunk, stop_event)
+    except Exception as ex:
+      logging.error('kafka reader of partitions %s failed: %s' %
+                    (partitions, str(ex)))
+      # raised in batches
+      self._put(chunk_queue, ex, stop_event)
+    finally:
+      if consumer is not None:
+        consumer.close()
+      self._put(chunk_queue, _READER_END, stop_event)
+
+  @staticmethod
+  def _put(chunk_queue, item, stop_event):
+    while not stop_event.is_set():
+      try:
+        chunk_queue.put(item, timeout=1)
+        return
+      except queue.Full:
+        pass
+
+  def batches(self):
+    """Generate batches of messages.
+
+    Return:
+      a generator of (messages, high_water_marks), messages is an array of
+      batch_size messages(the last batch may be smaller if eof is True),
+      high_water_marks is an int64 array of the max offsets read of
+      the partitions, in the order of self.partitions, the start offsets
+      are used for the partitions not read yet.
+    """
+    chunk_queue = queue.Queue(self._queue_size)
+    stop_event = threading.Event()
+    threads = []
+    for thread_id in range(self._num_threads):
+      partitions = self._partitions[thread_id::self._num_threads]
+      thread = threading.Thread(
+          target=self._read_partitions,
+          args=(partitions, chunk_queue, stop_event),
+          name='kafka_reader_%d' % thread_id)
+      thread.daemon = True
+      thread.start()
+      threads.append(thread)
+    logging.info('start %d kafka reader threads for partitions: %s' %
+                 (len(threads), self._partitions))
+
+    high_water_marks = np.array(self._start_offsets, dtype=np.int64)
+    # buffered chunks of (part_id, messages, offsets)
+    chunks = collections.deque()
+    num_buffered = 0
+    num_running = len(threads)
+    try:
+      while num_running > 0:
+        chunk = chunk_queue.get()
+        if chunk is _READER_END:
+          num_running -= 1
+          continue
+        if isinstance(chunk, Exception):
+          raise chunk
+        chunks.append(chunk)
+        num_buffered += len(chunk[1])
+        while num_buffered >= self._batch_size:
+          yield self._make_batch(chunks, self._batch_size, high_water_marks)
+          num_buffered -= self._batch_size
+      if num_buffered > 0:
+        yield self._make_batch(chunks, num_buffered, high_water_marks)
+    finally:
+      stop_event.set()
+      for thread in threads:
+        thread.join(timeout=10)
+
+  @staticmethod
+  def _make_batch(chunks, batch_size, high_water_marks):
+    messages = []
+    while len(messages) < batch_size:
+      part_id, part_messages, offsets = chunks.popleft()
+      num_left = batch_size - len(messages)
+      if len(part_messages) > num_left:
+        chunks.appendleft(
+            (part_id, part_messages[num_left:], offsets[num_left:]))
+        part_messages = part_messages[:num_left]
+        offsets = offsets[:num_left]
+      messages.extend(part_messages)
+      high_water_marks[part_id] = max(high_water_marks[part_id], offsets[-1])
+    return np.array(messages, dtype=object), high_water_marks.copy()
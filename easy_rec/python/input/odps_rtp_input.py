@@ -5,6 +5,7 @@ import logging
 import tensorflow as tf
 
 from easy_rec.python.input.input import Input
+from easy_rec.python.ops import gen_parse_rtp_op
 from easy_rec.python.ops.gen_str_avx_op import str_split_by_chr
 from easy_rec.python.utils.check_utils import check_split
 from easy_rec.python.utils.input_utils import string_to_number
@@ -42,6 +43,11 @@ class OdpsRTPInput(Input):
                          task_num, check_mode, pipeline_config)
     logging.info('input_fields: %s label_fields: %s' %
                  (','.join(self._input_fields), ','.join(self._label_fields)))
+    self._fused_rtp_parse = self._data_config.fused_rtp_parse
+    if self._fused_rtp_parse and gen_parse_rtp_op.parse_rtp_op is None:
+      logging.warning('parse_rtp op is not available, fused_rtp_parse '
+                      'is disabled')
+      self._fused_rtp_parse = False
 
   def _parse_table(self, *fields):
     fields = list(fields)
@@ -72,22 +78,30 @@ class OdpsRTPInput(Input):
     logging.info('field_delim = %s, input_field_name = %d' %
                  (self._data_config.separator, len(record_types)))
 
-    check_list = [
-        tf.py_func(
-            check_split,
-            [fields[-1], self._data_config.separator,
-             len(record_types)],
-            Tout=tf.bool)
-    ] if self._check_mode else []
-    with tf.control_dependencies(check_list):
-      fields = str_split_by_chr(
-          fields[-1], self._data_config.separator, skip_empty=False)
-    tmp_fields = tf.reshape(fields.values, [-1, feature_num])
-    fields = labels[len(self._label_fields):]
-    for i in range(feature_num):
-      field = string_to_number(tmp_fields[:, i], record_types[i],
-                               record_defaults[i], i)
-      fields.append(field)
+    if self._fused_rtp_parse:
+      fields = labels[len(self._label_fields):] + gen_parse_rtp_op.parse_rtp(
+          fields[-1],
+          record_types,
+          record_defaults,
+          self._data_config.separator,
+          check_mode=self._check_mode)
+    else:
+      check_list = [
+          tf.py_func(
+              check_split,
+              [fields[-1], self._data_config.separator,
+               len(record_types)],
+              Tout=tf.bool)
+      ] if self._check_mode else []
+      with tf.control_dependencies(check_list):
+        fields = str_split_by_chr(
+            fields[-1], self._data_config.separator, skip_empty=False)
+      tmp_fields = tf.reshape(fields.values, [-1, feature_num])
+      fields = labels[len(self._label_fields):]
+      for i in range(feature_num):
+        field = string_to_number(tmp_fields[:, i], record_types[i],
+                                 record_defaults[i], i)
+        fields.append(field)
 
     field_keys = [x for x in self._input_fields if x not in self._label_fields]
     effective_fids = [field_keys.index(x) for x in self._effective_fields]
@@ -62,8 +62,16 @@ class ParquetInput(Input):
     self._file_que = queues.Queue(name='file_que', ctx=mp_ctxt)
 
     self._num_proc = 8
+    auto_tune_config = self._data_config.auto_tune
+    if self._data_config.HasField('auto_tune') and \
+        auto_tune_config.max_parallel_calls > 0:
+      # the readers are not tuned, each process buffers its own batches,
+      # so max_parallel_calls only caps the number of processes
+      self._num_proc = min(self._num_proc, auto_tune_config.max_parallel_calls)
     if file_num < self._num_proc:
       self._num_proc = file_num
+    logging.info('[task_index=%d] parquet reader num_proc=%d' %
+                 (task_index, self._num_proc))
 
     self._proc_start = False
     self._proc_start_que = queues.Queue(name='proc_start_que', ctx=mp_ctxt)
@@ -256,10 +264,10 @@ class ParquetInput(Input):
           [None, self._total_dense_fea_dim])
 
   def _build(self, mode, params):
-    if mode == tf.estimator.ModeKeys.TRAIN and self._data_config.num_epochs > 1:
-      logging.info('will repeat train data for %d epochs' %
-                   self._data_config.num_epochs)
-      my_files = self._my_files * self._data_config.num_epochs
+    if mode == tf.estimator.ModeKeys.TRAIN and self.num_epochs is not None \
+        and self.num_epochs > 1:
+      logging.info('will repeat train data for %d epochs' % self.num_epochs)
+      my_files = self._my_files * self.num_epochs
     else:
       my_files = self._my_files
 
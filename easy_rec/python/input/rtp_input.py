@@ -5,6 +5,7 @@ import logging
 import tensorflow as tf
 
 from easy_rec.python.input.input import Input
+from easy_rec.python.ops import gen_parse_rtp_op
 from easy_rec.python.ops.gen_str_avx_op import str_split_by_chr
 from easy_rec.python.utils.check_utils import check_split
 from easy_rec.python.utils.check_utils import check_string_to_number
@@ -52,8 +53,46 @@ class RTPInput(Input):
     self._num_cols = -1
     self._feature_col_id = self._selected_cols[-1]
     logging.info('rtp separator = %s' % self._rtp_separator)
+    self._fused_rtp_parse = self._data_config.fused_rtp_parse
+    if self._fused_rtp_parse and gen_parse_rtp_op.parse_rtp_op is None:
+      logging.warning('parse_rtp op is not available, fused_rtp_parse '
+                      'is disabled')
+      self._fused_rtp_parse = False
+
+  def _parse_csv_fused(self, line):
+    """Parse labels and features with the fused parse_rtp op."""
+    num_labels = len(self._selected_cols) - 1
+    feature_ids = [
+        i for i, x in enumerate(self._input_fields)
+        if x not in self._label_fields
+    ]
+    field_ids = list(range(num_labels)) + feature_ids
+    fields = gen_parse_rtp_op.parse_rtp(
+        line, [self._input_field_types[i] for i in field_ids], [
+            self.get_type_defaults(self._input_field_types[i],
+                                   self._input_field_defaults[i])
+            for i in field_ids
+        ],
+        self._data_config.separator,
+        rtp_separator=self._rtp_separator,
+        num_cols=self._num_cols,
+        label_cols=self._selected_cols[:-1],
+        feature_col=self._feature_col_id,
+        check_mode=self._check_mode)
+    labels = fields[:num_labels]
+    field_keys = [self._input_fields[i] for i in feature_ids]
+    inputs = {
+        x: fields[num_labels + field_keys.index(x)]
+        for x in self._effective_fields
+    }
+    for x in range(len(self._label_fields)):
+      inputs[self._label_fields[x]] = labels[x]
+    return inputs
 
   def _parse_csv(self, line):
+    if self._fused_rtp_parse:
+      return self._parse_csv_fused(line)
+
     record_defaults = ['' for i in range(self._num_cols)]
 
     # the actual features are in one single column
@@ -29,6 +29,14 @@ class CapsuleLayer:
     # scale ratio
     self._scale_ratio = capsule_config.scale_ratio
     self._const_caps_num = capsule_config.const_caps_num
+    self._ragged_routing = capsule_config.ragged_routing
+    # upper bounds of the sequence length buckets of ragged routing
+    self._length_buckets = list(capsule_config.routing_length_buckets)
+    if self._ragged_routing and not self._length_buckets:
+      bound = 8
+      while bound < self._max_seq_len:
+        self._length_buckets.append(bound)
+        bound *= 2
     self._is_training = is_training
 
   def squash(self, inputs):
@@ -57,31 +65,11 @@ class CapsuleLayer:
         (2.0 * tf.reduce_sum(is_multi))
     return avg_simi
 
-  def __call__(self, seq_feas, seq_lens):
-    """Capsule layer implementation.
-
-    Args:
-      seq_feas: tensor of shape batch_size x self._max_seq_len x low_fea_dim(bsd)
-      seq_lens: tensor of shape batch_size
-
-    Return:
-      high_capsules: tensor of shape batch_size x max_k x high_dim
-    """
-    # pad or clip to max_seq_len
-    seq_feas = tf.cond(
-        tf.greater(tf.shape(seq_feas)[1], self._max_seq_len),
-        lambda: seq_feas[:, :self._max_seq_len, :], lambda: tf.cond(
-            tf.less(tf.shape(seq_feas)[1], self._max_seq_len), lambda: tf.pad(
-                seq_feas, [[0, 0], [
-                    0, self._max_seq_len - tf.shape(seq_feas)[1]
-                ], [0, 0]]), lambda: seq_feas))
-    seq_lens = tf.minimum(seq_lens, self._max_seq_len)
-
-    batch_size = tf.shape(seq_lens)[0]
-    # max_seq_len x max_num_high_capsule(sh)
+  def _init_routing_logits(self, batch_size, max_seq_len):
+    # batch_size x max_seq_len x max_k(bsh)
     if self._is_training:
       routing_logits = tf.truncated_normal(
-          [batch_size, self._max_seq_len, self._max_k],
+          [batch_size, max_seq_len, self._max_k],
           stddev=self._routing_logits_stddev)
     else:
       np.random.seed(28)
@@ -90,32 +78,38 @@ class CapsuleLayer:
               high=self._routing_logits_stddev,
               size=[self._max_seq_len, self._max_k]),
           dtype=tf.float32)
+      routing_logits = routing_logits[:max_seq_len]
       routing_logits = tf.tile(routing_logits[None, :, :], [batch_size, 1, 1])
-    routing_logits = tf.stop_gradient(routing_logits)
-    # batch_size x max_seq_len x max_k(bsh)
-    low_fea_dim = seq_feas.get_shape()[-1]
-    # map low capsule features to high capsule features:
-    #    low_fea_dim x high_dim(de)
-    bilinear_matrix = tf.get_variable(
-        dtype=tf.float32, shape=[low_fea_dim, self._high_dim], name='capsule/S')
+    return tf.stop_gradient(routing_logits)
+
+  def _routing(self,
+               seq_feas,
+               seq_lens,
+               num_high_capsules,
+               bilinear_matrix,
+               add_summary=True):
+    """Dynamic routing over the sequence dimension of seq_feas.
+
+    Args:
+      seq_feas: tensor of shape batch_size x seq_len x low_fea_dim(bsd)
+      seq_lens: tensor of shape batch_size, not larger than seq_len
+      num_high_capsules: tensor of shape batch_size
+      bilinear_matrix: low_fea_dim x high_dim(de)
+      add_summary: whether to add summaries of the capsule similarities
+
+    Return:
+      high_capsules: tensor of shape batch_size x max_k x high_dim
+    """
+    batch_size = tf.shape(seq_lens)[0]
+    max_seq_len = tf.shape(seq_feas)[1]
+    routing_logits = self._init_routing_logits(batch_size, max_seq_len)
     # map sequence feature to high dimensional space
     seq_feas_high = tf.tensordot(seq_feas, bilinear_matrix, axes=1)
     seq_feas_high_stop = tf.stop_gradient(seq_feas_high)
     seq_feas_high_norm = tf.nn.l2_normalize(seq_feas_high_stop, -1)
 
-    if self._const_caps_num:
-      logging.info('will use constant number of capsules: %d' % self._max_k)
-      num_high_capsules = tf.zeros_like(seq_lens, dtype=tf.int32) + self._max_k
-    else:
-      logging.info(
-          'will use log(seq_len) number of capsules, max_capsules: %d' %
-          self._max_k)
-      num_high_capsules = tf.maximum(
-          1, tf.minimum(self._max_k,
-                        tf.to_int32(tf.log(tf.to_float(seq_lens)))))
-
     # batch_size x max_seq_len(bs)
-    mask = tf.sequence_mask(seq_lens, self._max_seq_len)
+    mask = tf.sequence_mask(seq_lens, max_seq_len)
     mask = tf.cast(mask, tf.float32)
     # batch_size x max_k(bh)
     mask_cap = tf.sequence_mask(num_high_capsules, self._max_k)
@@ -131,34 +125,39 @@ class CapsuleLayer:
 
       routing_logits = routing_logits * mask[:, :, None]
 
-      logits_simi = self._build_capsule_simi(routing_logits, seq_lens)
-      tf.summary.scalar('capsule/rlogits_simi_%d' % iter_id, logits_simi)
+      if add_summary:
+        logits_simi = self._build_capsule_simi(routing_logits, seq_lens)
+        tf.summary.scalar('capsule/rlogits_simi_%d' % iter_id, logits_simi)
 
-      seq_fea_simi = self._build_capsule_simi(seq_feas_high_stop, seq_lens)
-      tf.summary.scalar('capsule/seq_fea_simi_%d' % iter_id, seq_fea_simi)
+        seq_fea_simi = self._build_capsule_simi(seq_feas_high_stop, seq_lens)
+        tf.summary.scalar('capsule/seq_fea_simi_%d' % iter_id, seq_fea_simi)
 
       # batch_size x max_k x high_dim(bse,bsh->bhe)
       high_capsules = tf.einsum(
           'bse, bsh->bhe', seq_feas_high_stop
           if iter_id + 1 < self._num_iters else seq_feas_high, routing_logits)
       if iter_id + 1 == self._num_iters:
-        capsule_simi = self._build_capsule_simi(high_capsules,
-                                                num_high_capsules)
-        tf.summary.scalar('caspule/simi_%d' % iter_id, capsule_simi)
-        tf.summary.scalar('capsule/before_squash',
-                          tf.reduce_mean(tf.norm(high_capsules, axis=-1)))
+        if add_summary:
+          capsule_simi = self._build_capsule_simi(high_capsules,
+                                                  num_high_capsules)
+          tf.summary.scalar('caspule/simi_%d' % iter_id, capsule_simi)
+          tf.summary.scalar('capsule/before_squash',
+                            tf.reduce_mean(tf.norm(high_capsules, axis=-1)))
         high_capsules = self.squash(high_capsules)
-        tf.summary.scalar('capsule/after_squash',
-                          tf.reduce_mean(tf.norm(high_capsules, axis=-1)))
-        capsule_simi_final = self._build_capsule_simi(high_capsules,
-                                                      num_high_capsules)
-        tf.summary.scalar('caspule/simi_final', capsule_simi_final)
+        if add_summary:
+          tf.summary.scalar('capsule/after_squash',
+                            tf.reduce_mean(tf.norm(high_capsules, axis=-1)))
+          capsule_simi_final = self._build_capsule_simi(high_capsules,
+                                                        num_high_capsules)
+          tf.summary.scalar('caspule/simi_final', capsule_simi_final)
         break
 
       # batch_size x max_k x high_dim(bhe)
       high_capsules = tf.nn.l2_normalize(high_capsules, -1)
-      capsule_simi = self._build_capsule_simi(high_capsules, num_high_capsules)
-      tf.summary.scalar('caspule/simi_%d' % iter_id, capsule_simi)
+      if add_summary:
+        capsule_simi = self._build_capsule_simi(high_capsules,
+                                                num_high_capsules)
+        tf.summary.scalar('caspule/simi_%d' % iter_id, capsule_simi)
       # batch_size x max_seq_len x max_k(bse, bhe->bsh)
       if self._routing_logits_scale > 0:
         if iter_id == 0:
@@ -169,6 +168,81 @@ class CapsuleLayer:
       else:
         routing_logits = tf.einsum('bse, bhe->bsh', seq_feas_high_stop,
                                    high_capsules)
+    return high_capsules
+
+  def _bucket_routing(self, seq_feas, seq_lens, num_high_capsules,
+                      bilinear_matrix):
+    """Route the sequences in length buckets, to skip most of the paddings.
+
+    The rows of each bucket are gathered and clipped to the bucket upper
+    bound, routed as in _routing, and stitched back in the original order.
+    """
+    bucket_bounds = sorted(
+        set([min(x, self._max_seq_len) for x in self._length_buckets] +
+            [self._max_seq_len]))
+    logging.info('capsule routing length buckets: %s' % str(bucket_bounds))
+    bucket_ids = tf.zeros_like(seq_lens, dtype=tf.int32)
+    for bound in bucket_bounds[:-1]:
+      bucket_ids += tf.to_int32(seq_lens > bound)
+    row_ids = tf.range(tf.shape(seq_lens)[0])
+    bucket_rows = tf.dynamic_partition(row_ids, bucket_ids, len(bucket_bounds))
+    seq_width = tf.shape(seq_feas)[1]
+    bucket_capsules = []
+    for rows, bound in zip(bucket_rows, bucket_bounds):
+      bucket_feas = tf.gather(seq_feas, rows)[:, :tf.minimum(bound, seq_width)]
+      bucket_capsules.append(
+          self._routing(
+              bucket_feas,
+              tf.gather(seq_lens, rows),
+              tf.gather(num_high_capsules, rows),
+              bilinear_matrix,
+              add_summary=False))
+    high_capsules = tf.dynamic_stitch(bucket_rows, bucket_capsules)
+    high_capsules.set_shape([None, self._max_k, self._high_dim])
+    return high_capsules
+
+  def __call__(self, seq_feas, seq_lens):
+    """Capsule layer implementation.
+
+    Args:
+      seq_feas: tensor of shape batch_size x self._max_seq_len x low_fea_dim(bsd)
+      seq_lens: tensor of shape batch_size
+
+    Return:
+      high_capsules: tensor of shape batch_size x max_k x high_dim
+    """
+    seq_lens = tf.minimum(seq_lens, self._max_seq_len)
+    low_fea_dim = seq_feas.get_shape()[-1]
+    # map low capsule features to high capsule features:
+    #    low_fea_dim x high_dim(de)
+    bilinear_matrix = tf.get_variable(
+        dtype=tf.float32, shape=[low_fea_dim, self._high_dim], name='capsule/S')
+
+    if self._const_caps_num:
+      logging.info('will use constant number of capsules: %d' % self._max_k)
+      num_high_capsules = tf.zeros_like(seq_lens, dtype=tf.int32) + self._max_k
+    else:
+      logging.info(
+          'will use log(seq_len) number of capsules, max_capsules: %d' %
+          self._max_k)
+      num_high_capsules = tf.maximum(
+          1, tf.minimum(self._max_k,
+                        tf.to_int32(tf.log(tf.to_float(seq_lens)))))
+
+    if self._ragged_routing:
+      high_capsules = self._bucket_routing(seq_feas, seq_lens,
+                                           num_high_capsules, bilinear_matrix)
+    else:
+      # pad or clip to max_seq_len
+      seq_feas = tf.cond(
+          tf.greater(tf.shape(seq_feas)[1], self._max_seq_len),
+          lambda: seq_feas[:, :self._max_seq_len, :], lambda: tf.cond(
+              tf.less(tf.shape(seq_feas)[1], self._max_seq_len), lambda: tf.pad(
+                  seq_feas, [[0, 0],
+                             [0, self._max_seq_len - tf.shape(seq_feas)[1]],
+                             [0, 0]]), lambda: seq_feas))
+      high_capsules = self._routing(seq_feas, seq_lens, num_high_capsules,
+                                    bilinear_matrix)
 
     # zero paddings
     high_capsule_mask = tf.sequence_mask(num_high_capsules, self._max_k)
@@ -20,6 +20,7 @@ from easy_rec.python.layers.utils import Parameter
 from easy_rec.python.protos.feature_config_pb2 import WideOrDeep
 from easy_rec.python.utils import conditional
 from easy_rec.python.utils import shape_utils
+from easy_rec.python.utils import user_side_util
 
 from easy_rec.python.compat.feature_column.feature_column_v2 import is_embedding_column  # NOQA
 
@@ -180,6 +181,9 @@ class InputLayer(object):
       with variable_scope.variable_scope('input_layer/' +
                                          fc.categorical_column.name):
         tmp_embedding, tmp_seq_len = fc._get_sequence_dense_tensor(builder)
+        if user_side_util.is_user_side_feature(fc.raw_name):
+          tmp_embedding = user_side_util.broadcast(tmp_embedding)
+          tmp_seq_len = user_side_util.broadcast(tmp_seq_len)
         if fc.max_seq_length > 0:
           tmp_embedding, tmp_seq_len = shape_utils.truncate_sequence(
               tmp_embedding, tmp_seq_len, fc.max_seq_length)
@@ -204,6 +208,8 @@ class InputLayer(object):
     assert group_name in self._feature_groups, 'invalid group_name[%s], list: %s' % (
         group_name, ','.join([x for x in self._feature_groups]))
     feature_group = self._feature_groups[group_name]
+    features = user_side_util.maybe_broadcast_features(
+        features, feature_group.feature_names)
     return [features[x] for x in feature_group.feature_names]
 
   def get_bucketized_features(self, features, group_name):
@@ -219,6 +225,8 @@ class InputLayer(object):
     assert group_name in self._feature_groups, 'invalid group_name[%s], list: %s' % (
         group_name, ','.join([x for x in self._feature_groups]))
     feature_group = self._feature_groups[group_name]
+    features = user_side_util.maybe_broadcast_features(
+        features, feature_group.feature_names)
     offset = 0
     values = []
     weights = []
@@ -345,6 +353,10 @@ class InputLayer(object):
           cols_to_output_tensors[column] = cnn_feature
         else:
           raise NotImplementedError
+        # pooling of user side sequence is computed once per request
+        if user_side_util.is_user_side_feature(column.raw_name):
+          seq_features[-1] = user_side_util.broadcast(seq_features[-1])
+          cols_to_output_tensors[column] = seq_features[-1]
     if self._variational_dropout_config is not None:
       features_dimension = OrderedDict([
           (k.raw_name, int(v.shape[-1]))
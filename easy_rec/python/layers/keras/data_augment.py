@@ -9,103 +9,114 @@ if tf.__version__ >= '2.0':
   tf = tf.compat.v1
 
 
-def item_mask(aug_data, length, mask_emb, mask_rate):
-  length1 = tf.cast(length, dtype=tf.float32)
-  num_mask = tf.cast(tf.math.floor(length1 * mask_rate), dtype=tf.int32)
-  max_len = tf.shape(aug_data)[0]
-  seq_mask = tf.sequence_mask(num_mask, length)
-  seq_mask = tf.random.shuffle(seq_mask)
-  padding = tf.sequence_mask(0, max_len - length)
-  seq_mask = tf.concat([seq_mask, padding], axis=0)
+def _random_offsets(max_offsets):
+  """Uniform random ints in [0, max_offsets) of each row, 0 if max_offsets <= 0."""
+  rand = tf.random.uniform(tf.shape(max_offsets), dtype=tf.float32)
+  offsets = tf.cast(
+      tf.floor(rand * tf.cast(max_offsets, tf.float32)), dtype=tf.int32)
+  return tf.clip_by_value(offsets, 0, tf.maximum(max_offsets - 1, 0))
+
+
+def _argsort(keys):
+  """Ascending argsort of each row, ties are kept in the original order."""
+  return tf.nn.top_k(-keys, k=tf.shape(keys)[1], sorted=True).indices
+
+
+def _batch_gather(seq, index):
+  """Gather seq[b, index[b, i]] of [batch_size, max_len, dim] seq."""
+  batch_size, max_len = get_shape_list(index, 2)
+  batch_index = tf.tile(tf.expand_dims(tf.range(batch_size), 1), [1, max_len])
+  return tf.gather_nd(seq, tf.stack([batch_index, index], axis=2))
 
-  mask_emb = tf.tile(mask_emb, [max_len, 1])
 
+def item_mask(aug_data, length, mask_emb, mask_rate):
+  """Replace floor(length * mask_rate) random items of each row by mask_emb.
+
+  The masked positions are the ones with the smallest random sort keys among
+  the valid positions, which are uniformly sampled without replacement.
+  """
+  batch_size, max_len, emb_dim = get_shape_list(aug_data, 3)
+  num_mask = tf.cast(
+      tf.floor(tf.cast(length, tf.float32) * mask_rate), dtype=tf.int32)
+  valid = tf.sequence_mask(length, max_len)
+  sort_keys = tf.where(valid, tf.random.uniform([batch_size, max_len]),
+                       tf.ones([batch_size, max_len]) * 2.0)
+  ranks = _argsort(tf.cast(_argsort(sort_keys), tf.float32))
+  seq_mask = tf.less(ranks, tf.expand_dims(num_mask, 1))
+  seq_mask = tf.tile(tf.expand_dims(seq_mask, 2), [1, 1, emb_dim])
+  mask_emb = tf.tile(
+      tf.reshape(mask_emb, [1, 1, emb_dim]), [batch_size, max_len, 1])
   masked_item_seq = tf.where(seq_mask, mask_emb, aug_data)
   return masked_item_seq, length
 
 
 def item_crop(aug_data, length, crop_rate):
-  length1 = tf.cast(length, dtype=tf.float32)
-  max_len, _ = get_shape_list(aug_data)
-  max_length = tf.cast(max_len, dtype=tf.int32)
-
-  num_left = tf.cast(tf.math.floor(length1 * crop_rate), dtype=tf.int32)
-  crop_begin = tf.random.uniform([],
-                                 minval=0,
-                                 maxval=length - num_left,
-                                 dtype=tf.int32)
-  zeros = tf.zeros_like(aug_data)
-  x = aug_data[crop_begin:crop_begin + num_left]
-  y = zeros[:max_length - num_left]
-  cropped = tf.concat([x, y], axis=0)
-  cropped_item_seq = tf.where(
-      crop_begin + num_left < max_length, cropped,
-      tf.concat([aug_data[crop_begin:], zeros[:crop_begin]], axis=0))
+  """Keep floor(length * crop_rate) successive items from a random offset."""
+  _, max_len, emb_dim = get_shape_list(aug_data, 3)
+  num_left = tf.cast(
+      tf.floor(tf.cast(length, tf.float32) * crop_rate), dtype=tf.int32)
+  crop_begin = _random_offsets(length - num_left)
+  positions = tf.expand_dims(tf.range(max_len), 0)
+  index = tf.minimum(tf.expand_dims(crop_begin, 1) + positions, max_len - 1)
+  cropped = _batch_gather(aug_data, index)
+  keep = tf.less(positions, tf.expand_dims(num_left, 1))
+  keep = tf.tile(tf.expand_dims(keep, 2), [1, 1, emb_dim])
+  cropped_item_seq = tf.where(keep, cropped, tf.zeros_like(cropped))
   return cropped_item_seq, num_left
 
 
 def item_reorder(aug_data, length, reorder_rate):
-  length1 = tf.cast(length, dtype=tf.float32)
-  num_reorder = tf.cast(tf.math.floor(length1 * reorder_rate), dtype=tf.int32)
-  reorder_begin = tf.random.uniform([],
-                                    minval=0,
-                                    maxval=length - num_reorder,
-                                    dtype=tf.int32)
-  shuffle_index = tf.range(reorder_begin, reorder_begin + num_reorder)
-  shuffle_index = tf.random.shuffle(shuffle_index)
-  x = tf.range(get_shape_list(aug_data)[0])
-  left = tf.slice(x, [0], [reorder_begin])
-  right = tf.slice(x, [reorder_begin + num_reorder], [-1])
-  reordered_item_index = tf.concat([left, shuffle_index, right], axis=0)
-  reordered_item_seq = tf.scatter_nd(
-      tf.expand_dims(reordered_item_index, axis=1), aug_data,
-      tf.shape(aug_data))
+  """Shuffle floor(length * reorder_rate) successive items from a random offset.
+
+  Items in the segment get random sort keys within the segment, and the other
+  items keep their positions as sort keys, so that sorting the keys shuffles
+  the segment only.
+  """
+  batch_size, max_len, _ = get_shape_list(aug_data, 3)
+  num_reorder = tf.cast(
+      tf.floor(tf.cast(length, tf.float32) * reorder_rate), dtype=tf.int32)
+  reorder_begin = tf.expand_dims(_random_offsets(length - num_reorder), 1)
+  reorder_end = reorder_begin + tf.expand_dims(num_reorder, 1)
+  positions = tf.tile(tf.expand_dims(tf.range(max_len), 0), [batch_size, 1])
+  in_segment = tf.logical_and(positions >= reorder_begin,
+                              positions < reorder_end)
+  shuffle_keys = tf.cast(reorder_begin, tf.float32) + tf.random.uniform(
+      [batch_size, max_len]) * tf.cast(reorder_end - reorder_begin, tf.float32)
+  sort_keys = tf.where(in_segment, shuffle_keys, tf.cast(positions, tf.float32))
+  index = _argsort(sort_keys)
+  reordered_item_seq = _batch_gather(aug_data, index)
   return reordered_item_seq, length
 
 
-def augment_fn(x, aug_param, mask):
-  seq, length = x
-
-  def crop_fn():
-    return item_crop(seq, length, aug_param.crop_rate)
-
-  def mask_fn():
-    return item_mask(seq, length, mask, aug_param.mask_rate)
-
-  def reorder_fn():
-    return item_reorder(seq, length, aug_param.reorder_rate)
+def sequence_augment(seq_input, seq_len, mask, aug_param):
+  """Augment each sequence by one of crop, mask and reorder at random.
 
+  All the enabled augmentations are computed for the whole batch, and the
+  result of each row is selected by its randomly chosen method.
+  """
+  lengths = tf.cast(seq_len, dtype=tf.int32)
   trans_fn = []
   if aug_param.crop_rate < 1.0:
-    trans_fn.append(crop_fn)
+    trans_fn.append(lambda: item_crop(seq_input, lengths, aug_param.crop_rate))
   if aug_param.mask_rate > 0:
-    trans_fn.append(mask_fn)
+    trans_fn.append(
+        lambda: item_mask(seq_input, lengths, mask, aug_param.mask_rate))
   if aug_param.reorder_rate > 0:
-    trans_fn.append(reorder_fn)
-
-  num_trans = len(trans_fn)
-  if num_trans == 0:
-    return seq, length
-
-  if num_trans == 1:
-    return trans_fn[0]()
-
-  method = tf.random.uniform([], minval=0, maxval=num_trans, dtype=tf.int32)
-  if num_trans == 2:
-    return tf.cond(tf.equal(method, 0), trans_fn[0], trans_fn[1])
-
-  aug_seq, aug_len = tf.cond(
-      tf.equal(method, 0), crop_fn,
-      lambda: tf.cond(tf.equal(method, 1), mask_fn, reorder_fn))
-  return aug_seq, aug_len
-
-
-def sequence_augment(seq_input, seq_len, mask, aug_param):
-  lengths = tf.cast(seq_len, dtype=tf.int32)
-  aug_seq, aug_len = tf.map_fn(
-      lambda elems: augment_fn(elems, aug_param, mask),
-      elems=(seq_input, lengths),
-      dtype=(tf.float32, tf.int32))
+    trans_fn.append(
+        lambda: item_reorder(seq_input, lengths, aug_param.reorder_rate))
+
+  if len(trans_fn) == 0:
+    return seq_input, lengths
+
+  aug_seq, aug_len = trans_fn[0]()
+  if len(trans_fn) > 1:
+    method = tf.random.uniform(
+        tf.shape(lengths), minval=0, maxval=len(trans_fn), dtype=tf.int32)
+    for i, fn in enumerate(trans_fn[1:], 1):
+      trans_seq, trans_len = fn()
+      selected = tf.equal(method, i)
+      aug_seq = tf.where(selected, trans_seq, aug_seq)
+      aug_len = tf.where(selected, trans_len, aug_len)
 
   aug_seq = tf.reshape(aug_seq, tf.shape(seq_input))
   return aug_seq, aug_len
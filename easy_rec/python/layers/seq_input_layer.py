@@ -11,6 +11,7 @@ from easy_rec.python.compat import regularizers
 from easy_rec.python.compat.feature_column import feature_column
 from easy_rec.python.feature_column.feature_column import FeatureColumnParser
 from easy_rec.python.protos.feature_config_pb2 import WideOrDeep
+from easy_rec.python.utils import user_side_util
 
 if tf.__version__ >= '2.0':
   tf = tf.compat.v1
@@ -69,6 +70,8 @@ class SeqInputLayer(object):
             with variable_scope.variable_scope(qfc._var_scope_name):
               tmp_key_tensor = feature_column_dict[key]._get_dense_tensor(
                   builder)
+              tmp_key_tensor = user_side_util.maybe_broadcast(
+                  key, tmp_key_tensor)
               regularizers.apply_regularization(
                   self._embedding_regularizer, weights_list=[tmp_key_tensor])
               key_tensors.append(tmp_key_tensor)
@@ -86,9 +89,13 @@ class SeqInputLayer(object):
         for hist_seq in x.hist_seq:
           seq_fc = feature_column_dict[hist_seq]
           with variable_scope.variable_scope(seq_fc._var_scope_name):
-            cur_hist_seqs.append(
-                feature_column_dict[hist_seq]._get_sequence_dense_tensor(
-                    builder))
+            hist_embed, hist_seq_len = feature_column_dict[
+                hist_seq]._get_sequence_dense_tensor(builder)
+          # user behavior sequences are looked up once per request
+          if user_side_util.is_user_side_feature(hist_seq):
+            hist_embed = user_side_util.broadcast(hist_embed)
+            hist_seq_len = user_side_util.broadcast(hist_seq_len)
+          cur_hist_seqs.append((hist_embed, hist_seq_len))
         hist_tensors.extend(cur_hist_seqs)
 
         aux_hist_emb_list = []
@@ -97,6 +104,8 @@ class SeqInputLayer(object):
           with variable_scope.variable_scope(seq_fc._var_scope_name):
             aux_hist_embedding, _ = feature_column_dict[
                 aux_hist_seq]._get_sequence_dense_tensor(builder)
+          aux_hist_embedding = user_side_util.maybe_broadcast(
+              aux_hist_seq, aux_hist_embedding)
           aux_hist_emb_list.append(aux_hist_embedding)
 
         if tf_summary:
@@ -160,11 +160,6 @@ class Uniter(object):
 
     if self._txt_seq_features is not None:
 
-      def dynamic_mask(x, max_len):
-        ones = tf.ones(shape=tf.stack([x]), dtype=tf.int32)
-        zeros = tf.zeros(shape=tf.stack([max_len - x]), dtype=tf.int32)
-        return tf.concat([ones, zeros], axis=0)
-
       token_type_id += len(all_txt_features)
       for i, (seq_fea, seq_len) in enumerate(self._txt_seq_features):
         batch_size, max_seq_len, emb_size = get_shape_list(seq_fea, 3)
@@ -188,9 +183,8 @@ class Uniter(object):
             dropout_prob=self._model_config.hidden_dropout_prob)
         all_txt_features.append(seq_fea)
 
-        input_mask = tf.map_fn(
-            fn=lambda t: dynamic_mask(t, max_seq_len),
-            elems=tf.to_int32(seq_len))
+        input_mask = tf.sequence_mask(
+            tf.to_int32(seq_len), max_seq_len, dtype=tf.int32)
         input_masks.append(input_mask)
 
     return all_txt_features, input_masks
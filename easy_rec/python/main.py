@@ -8,7 +8,9 @@ from __future__ import print_function
 import json
 import logging
 import math
+import multiprocessing
 import os
+import queue
 import time
 
 import six
@@ -26,9 +28,10 @@ from easy_rec.python.model.easy_rec_model import EasyRecModel
 from easy_rec.python.protos.train_pb2 import DistributionStrategy
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import embedding_quantization
 from easy_rec.python.utils import estimator_utils
+from easy_rec.python.utils import export_optimizer
 from easy_rec.python.utils import fg_util
-from easy_rec.python.utils import load_class
 from easy_rec.python.utils.config_util import get_eval_input_path
 from easy_rec.python.utils.config_util import get_model_dir_path
 from easy_rec.python.utils.config_util import get_train_input_path
@@ -52,8 +55,6 @@ else:
   GPUOptions = tf.GPUOptions
   ConfigProto = tf.ConfigProto
 
-load_class.auto_import()
-
 # when version of tensorflow > 1.8 strip_default_attrs set true will cause
 # saved_model inference core, such as:
 #   [libprotobuf FATAL external/protobuf_archive/src/google/protobuf/map.h:1058]
@@ -70,6 +71,8 @@ def _get_input_fn(data_config,
                   data_path=None,
                   export_config=None,
                   check_mode=False,
+                  task_index=None,
+                  task_num=None,
                   **kwargs):
   """Build estimator input function.
 
@@ -79,6 +82,8 @@ def _get_input_fn(data_config,
     data_path: input_data_path
     export_config: configuration for exporting models,
       only used to build input_fn when exporting models
+    task_index: index of the data shard, default from TF_CONFIG
+    task_num: number of the data shards, default from TF_CONFIG
 
   Returns:
     subclass of Input
@@ -87,7 +92,10 @@ def _get_input_fn(data_config,
   input_cls_name = input_class_map[data_config.input_type]
   input_class = Input.create_class(input_cls_name)
 
-  task_id, task_num = estimator_utils.get_task_index_and_num()
+  if task_index is None:
+    task_id, task_num = estimator_utils.get_task_index_and_num()
+  else:
+    task_id = task_index
   input_obj = input_class(
       data_config,
       feature_configs,
@@ -164,6 +172,17 @@ def _create_estimator(pipeline_config, distribution=None, params={}):
   return estimator, run_config
 
 
+def _post_export(export_config, separator, export_dir):
+  """Quantize the embeddings and optimize the graph of the exported model."""
+  if export_config.HasField('embedding_quantization'):
+    embedding_quantization.quantize_saved_model(
+        export_dir, export_config.embedding_quantization, separator)
+  if export_config.HasField('graph_optimization'):
+    export_optimizer.optimize_saved_model(export_dir,
+                                          export_config.graph_optimization,
+                                          separator)
+
+
 def _create_eval_export_spec(pipeline_config, eval_data, check_mode=False):
   data_config = pipeline_config.data_config
   # feature_configs = pipeline_config.feature_configs
@@ -187,9 +206,20 @@ def _create_eval_export_spec(pipeline_config, eval_data, check_mode=False):
       export_config,
       check_mode=check_mode,
       **input_fn_kwargs)
+
+  def _post_export_fn(export_dir):
+    _post_export(export_config, data_config.separator, export_dir)
+
+  post_export_fn = None
+  if export_config.HasField('graph_optimization') or export_config.HasField(
+      'embedding_quantization'):
+    post_export_fn = _post_export_fn
   if export_config.exporter_type == 'final':
     exporters = [
-        FinalExporter(name='final', serving_input_receiver_fn=export_input_fn)
+        FinalExporter(
+            name='final',
+            serving_input_receiver_fn=export_input_fn,
+            post_export_fn=post_export_fn)
     ]
   elif export_config.exporter_type == 'latest':
     exporters = [
@@ -218,7 +248,8 @@ def _create_eval_export_spec(pipeline_config, eval_data, check_mode=False):
             name='best',
             serving_input_receiver_fn=export_input_fn,
             compare_fn=_metric_cmp_fn,
-            exports_to_keep=export_config.exports_to_keep)
+            exports_to_keep=export_config.exports_to_keep,
+            post_export_fn=post_export_fn)
     ]
   elif export_config.exporter_type == 'none':
     exporters = []
@@ -692,6 +723,217 @@ def distribute_evaluate(pipeline_config,
   return eval_result
 
 
+def _get_local_eval_shards(eval_data, num_workers, shard_records=False):
+  """Split the eval files into shards, balanced by file sizes.
+
+  Args:
+    eval_data: eval data path, comma separated or a list, supports patterns
+    num_workers: max number of shards
+    shard_records: if there are fewer files than num_workers, each worker
+      reads all the files and evaluates 1 / num_workers of the records
+
+  Returns:
+    a list of (eval_data_path, task_index, task_num)
+  """
+  if not isinstance(eval_data, list):
+    eval_data = eval_data.split(',')
+  file_sizes = []
+  for path in eval_data:
+    file_paths = gfile.Glob(path)
+    assert len(file_paths) > 0, 'local sharded evaluation only supports ' \
+        'file inputs, no files match %s' % path
+    file_sizes.extend([(gfile.Stat(x).length, x) for x in file_paths])
+  if len(file_sizes) < num_workers and shard_records:
+    file_paths = ','.join([x for _, x in file_sizes])
+    return [(file_paths, i, num_workers) for i in range(num_workers)]
+
+  num_shards = min(num_workers, len(file_sizes))
+  shards = [[] for _ in range(num_shards)]
+  shard_sizes = [0] * num_shards
+  # assign the largest file to the smallest shard
+  for file_size, file_path in sorted(file_sizes, reverse=True):
+    shard_id = shard_sizes.index(min(shard_sizes))
+    shards[shard_id].append(file_path)
+    shard_sizes[shard_id] += file_size
+  return [(','.join(x), 0, 1) for x in shards]
+
+
+def _local_eval_shard(pipeline_config, ckpt_path, shard, shard_id, num_shards,
+                      max_steps, num_threads, state_queue, result_queue):
+  """Evaluate a shard of the eval data in a worker process.
+
+  Workers other than the first put the metric states to state_queue,
+  the first worker merges the states of all the workers, computes the
+  metrics and puts the eval result to result_queue.
+  """
+  from tensorflow.python.training.monitored_session import ChiefSessionCreator
+  from tensorflow.python.training.monitored_session import MonitoredSession
+  from easy_rec.python.core import metrics as metrics_lib
+
+  eval_data, task_index, task_num = shard
+  data_config = pipeline_config.data_config
+  feature_configs = config_util.get_compatible_feature_configs(pipeline_config)
+  input_fn_kwargs = {'pipeline_config': pipeline_config}
+  if data_config.input_type == data_config.InputType.OdpsRTPInputV2:
+    input_fn_kwargs['fg_json_path'] = pipeline_config.fg_json_path
+  eval_input_fn = _get_input_fn(
+      data_config,
+      feature_configs,
+      eval_data,
+      task_index=task_index,
+      task_num=task_num,
+      **input_fn_kwargs)
+  estimator, run_config = _create_estimator(pipeline_config)
+
+  global_step = tf.train.get_or_create_global_step()
+  dataset = eval_input_fn(mode=tf.estimator.ModeKeys.EVAL)
+  input_iter = tf.data.make_initializable_iterator(dataset)
+  tf.add_to_collection(tf.GraphKeys.TABLE_INITIALIZERS, input_iter.initializer)
+  input_feas, input_lbls = input_iter.get_next()
+  estimator_spec = estimator._eval_model_fn(input_feas, input_lbls, run_config)
+  eval_metric_ops = dict(estimator_spec.eval_metric_ops)
+  # the default loss metric added by tf.estimator.Estimator.evaluate
+  eval_metric_ops['loss'] = tf.metrics.mean(estimator_spec.loss)
+  update_op = tf.group([eval_metric_ops[x][1] for x in eval_metric_ops.keys()])
+  metric_ops = {x: eval_metric_ops[x][0] for x in eval_metric_ops.keys()}
+
+  session_config = ConfigProto(
+      allow_soft_placement=True,
+      intra_op_parallelism_threads=num_threads,
+      inter_op_parallelism_threads=num_threads)
+  chief_sess_creator = ChiefSessionCreator(
+      scaffold=estimator_spec.scaffold,
+      checkpoint_filename_with_path=ckpt_path,
+      config=session_config)
+  with MonitoredSession(session_creator=chief_sess_creator, hooks=None) as sess:
+    num_steps = 0
+    while max_steps is None or num_steps < max_steps:
+      try:
+        sess.run(update_op)
+        num_steps += 1
+      except tf.errors.OutOfRangeError:
+        break
+    logging.info('local eval shard[%d] finished %d steps: %s' %
+                 (shard_id, num_steps, eval_data))
+    metric_states = metrics_lib.get_metric_states(sess)
+    if shard_id > 0:
+      state_queue.put(metric_states)
+      return
+    all_states = [metric_states]
+    for _ in range(num_shards - 1):
+      all_states.append(state_queue.get())
+    merged_states = metrics_lib.merge_metric_states(all_states)
+    metrics_lib.load_metric_states(sess, merged_states)
+    eval_result = sess.run(metric_ops)
+    eval_result[tf.GraphKeys.GLOBAL_STEP] = sess.run(global_step)
+  eval_input_fn.input_creator.stop()
+  result_queue.put(eval_result)
+
+
+def local_sharded_evaluate(pipeline_config,
+                           eval_checkpoint_path='',
+                           eval_data_path=None,
+                           eval_result_filename='eval_result.txt',
+                           num_workers=None):
+  """Evaluate a EasyRec model with multiple local worker processes.
+
+  The eval files are split into shards, balanced by file sizes, and each
+  worker process restores the same checkpoint and evaluates a shard. For
+  CSVInput with fewer files than workers, the records are sharded.
+  The metric states of the shards, such as the confusion matrices of auc,
+  the per key labels and predictions of gauc and the sums of mean metrics,
+  are merged, so the result is the same as evaluate.
+
+  Args:
+    pipeline_config: either EasyRecConfig path or its instance
+    eval_checkpoint_path: if specified, will use this model instead of
+        model specified by model_dir in pipeline_config_path
+    eval_data_path: eval data path, default use eval data in pipeline_config
+        could be a path or a list of paths
+    eval_result_filename: evaluation result metrics save path.
+    num_workers: number of worker processes, default is the number of cpus
+
+  Returns:
+    A dict of evaluation metrics: the metrics are specified in
+        pipeline_config_path
+    global_step: the global step for which this evaluation was performed.
+  """
+  pipeline_config = config_util.get_configs_from_pipeline_file(pipeline_config)
+  if pipeline_config.fg_json_path:
+    fg_util.load_fg_json_to_config(pipeline_config)
+  if eval_data_path is not None:
+    logging.info('Evaluating on data: %s' % eval_data_path)
+    set_eval_input_path(pipeline_config, eval_data_path)
+  eval_data = get_eval_input_path(pipeline_config)
+  data_config = pipeline_config.data_config
+  if data_config.HasField('sampler'):
+    logging.warning('the negative samples are sampled in each worker, '
+                    'recommend to use hitrate.py for models with samplers')
+  ckpt_path = _get_ckpt_path(pipeline_config, eval_checkpoint_path)
+
+  if not num_workers:
+    num_workers = multiprocessing.cpu_count()
+  shards = _get_local_eval_shards(
+      eval_data,
+      num_workers,
+      shard_records=data_config.input_type == data_config.InputType.CSVInput)
+  num_shards = len(shards)
+  num_threads = max(multiprocessing.cpu_count() // num_shards, 1)
+  max_steps = None
+  if pipeline_config.eval_config.num_examples > 0:
+    max_steps = int(
+        math.ceil(
+            float(pipeline_config.eval_config.num_examples) /
+            data_config.batch_size / num_shards))
+  logging.info('local sharded evaluation with %d workers' % num_shards)
+
+  # tensorflow is not fork safe
+  mp_ctxt = multiprocessing.get_context('spawn')
+  state_queue = mp_ctxt.Queue()
+  result_queue = mp_ctxt.Queue()
+  procs = []
+  for shard_id, shard in enumerate(shards):
+    proc = mp_ctxt.Process(
+        target=_local_eval_shard,
+        args=(pipeline_config, ckpt_path, shard, shard_id, num_shards,
+              max_steps, num_threads, state_queue, result_queue))
+    proc.start()
+    procs.append(proc)
+  try:
+    while True:
+      try:
+        eval_result = result_queue.get(timeout=5)
+        break
+      except queue.Empty:
+        failed = [x.exitcode for x in procs if x.exitcode not in [None, 0]]
+        if len(failed) > 0:
+          raise RuntimeError('local eval workers failed, exitcodes: %s' %
+                             ','.join([str(x) for x in failed]))
+  finally:
+    for proc in procs:
+      if proc.is_alive():
+        proc.terminate()
+      proc.join()
+  logging.info('Evaluate finish')
+
+  print('eval_result = ', eval_result)
+  logging.info('eval_result = {0}'.format(eval_result))
+  # write eval result to file
+  model_dir = pipeline_config.model_dir
+  eval_result_file = os.path.join(model_dir, eval_result_filename)
+  logging.info('save eval result to file %s' % eval_result_file)
+  with gfile.GFile(eval_result_file, 'w') as ofile:
+    result_to_write = {}
+    for key in sorted(eval_result):
+      # skip logging binary data
+      if isinstance(eval_result[key], six.binary_type):
+        continue
+      # convert numpy float to python float
+      result_to_write[key] = eval_result[key].item()
+    ofile.write(json.dumps(result_to_write, indent=2))
+  return eval_result
+
+
 def predict(pipeline_config, checkpoint_path='', data_path=None):
   """Predict a EasyRec model defined in pipeline_config_path.
 
@@ -836,6 +1078,8 @@ def export(export_dir,
   with gfile.GFile(saved_pb_path, 'wb') as fout:
     fout.write(saved_model.SerializeToString())
 
+  _post_export(export_config, data_config.separator, final_export_dir)
+
   logging.info('model has been exported to %s successfully' % final_export_dir)
   return final_export_dir
 
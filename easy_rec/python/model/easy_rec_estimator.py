@@ -36,7 +36,9 @@ from easy_rec.python.protos.train_pb2 import DistributionStrategy
 from easy_rec.python.utils import constant
 from easy_rec.python.utils import embedding_utils
 from easy_rec.python.utils import estimator_utils
+from easy_rec.python.utils import ev_budget
 from easy_rec.python.utils import hvd_utils
+from easy_rec.python.utils import input_profiler
 from easy_rec.python.utils import pai_util
 from easy_rec.python.utils.multi_optimizer import MultiOptimizer
 
@@ -154,6 +156,9 @@ class EasyRecEstimator(tf.estimator.Estimator):
 
   def _train_model_fn(self, features, labels, run_config):
     tf.keras.backend.set_learning_phase(1)
+    data_config = self._pipeline_config.data_config
+    if data_config.profile_input:
+      input_ready_time = input_profiler.input_ready_time(features, labels)
     model = self._model_cls(
         self.model_config,
         self.feature_configs,
@@ -205,7 +210,8 @@ class EasyRecEstimator(tf.estimator.Estimator):
       # register for increment update, such as batchnorm moving_mean and moving_variance
       global_vars = {x.name: x for x in tf.global_variables()}
       for x in update_ops:
-        if isinstance(x, ops.Operation) and x.inputs[0].name in global_vars:
+        if isinstance(x, ops.Operation) and len(x.inputs) > 0 and \
+            x.inputs[0].name in global_vars:
           ops.add_to_collection(constant.DENSE_UPDATE_VARIABLES,
                                 global_vars[x.inputs[0].name])
       update_op = tf.group(*update_ops, name='update_barrier')
@@ -442,6 +448,12 @@ class EasyRecEstimator(tf.estimator.Estimator):
           ready_for_local_init_op=tf.report_uninitialized_variables(
               var_list=initialize_var_list))
       # saver hook
+      train_config = self.train_config
+      embedding_quantization_config = None
+      if self.export_config.HasField('embedding_quantization'):
+        # incremental updates are consumed by the exported model
+        embedding_quantization_config = \
+            self.export_config.embedding_quantization
       saver_hook = estimator_utils.CheckpointSaverHook(
           checkpoint_dir=self.model_dir,
           save_secs=self._config.save_checkpoints_secs,
@@ -449,9 +461,18 @@ class EasyRecEstimator(tf.estimator.Estimator):
           scaffold=scaffold,
           write_graph=self.train_config.write_graph,
           data_offset_var=data_offset_var,
-          increment_save_config=self.incr_save_config)
+          increment_save_config=self.incr_save_config,
+          async_checkpoint=train_config.async_checkpoint,
+          async_checkpoint_local_dir=train_config.async_checkpoint_local_dir,
+          embedding_quantization_config=embedding_quantization_config)
       if estimator_utils.is_chief() or self.embedding_parallel:
         hooks.append(saver_hook)
+      if self.incr_save_config is not None and \
+          len(tf.get_collection(ev_budget.KEY_BUDGETS)) > 0:
+        # the key budgets are counted in each worker
+        hooks.append(
+            estimator_utils.EvictedKeysHook(self.model_dir,
+                                            self.incr_save_config))
       if estimator_utils.is_chief():
         hooks.append(
             basic_session_run_hooks.StepCounterHook(
@@ -463,6 +484,14 @@ class EasyRecEstimator(tf.estimator.Estimator):
           save_steps=log_step_count_steps, output_dir=self.model_dir)
       hooks.append(profile_hook)
 
+    if data_config.profile_input:
+      hooks.append(
+          input_profiler.InputProfilerHook(
+              input_ready_time,
+              report_steps=log_step_count_steps,
+              num_parallel_calls=data_config.num_parallel_calls,
+              prefetch_size=data_config.prefetch_size))
+
     return tf.estimator.EstimatorSpec(
         mode=tf.estimator.ModeKeys.TRAIN,
         loss=loss,
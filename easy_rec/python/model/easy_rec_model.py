@@ -19,6 +19,7 @@ from easy_rec.python.layers.backbone import Backbone
 from easy_rec.python.utils import constant
 from easy_rec.python.utils import estimator_utils
 from easy_rec.python.utils import restore_filter
+from easy_rec.python.utils import user_side_util
 from easy_rec.python.utils.load_class import get_register_class_meta
 
 try:
@@ -43,7 +44,9 @@ if tf.__version__ >= '2.0':
 
 _EASY_REC_MODEL_CLASS_MAP = {}
 _meta_type = get_register_class_meta(
-    _EASY_REC_MODEL_CLASS_MAP, have_abstract_class=True)
+    _EASY_REC_MODEL_CLASS_MAP,
+    have_abstract_class=True,
+    registry='EasyRecModel')
 
 
 class EasyRecModel(six.with_metaclass(_meta_type, object)):
@@ -198,7 +201,8 @@ class EasyRecModel(six.with_metaclass(_meta_type, object)):
     outputs = {}
     for feature_name in self._feature_dict:
       out_name = 'feature_' + feature_name
-      feature_value = self._feature_dict[feature_name]
+      feature_value = user_side_util.maybe_broadcast(
+          feature_name, self._feature_dict[feature_name])
       if isinstance(feature_value, tf.SparseTensor):
         sparse_values = feature_value.values
         if sparse_values.dtype != tf.string:
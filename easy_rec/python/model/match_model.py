@@ -1,11 +1,13 @@
 # -*- encoding:utf-8 -*-
 # Copyright (c) Alibaba, Inc. and its affiliates.
 import logging
+import math
 import os
 
 import tensorflow as tf
 
 from easy_rec.python.builders import loss_builder
+from easy_rec.python.core.frequency_estimator import FrequencyEstimator
 from easy_rec.python.model.easy_rec_model import EasyRecModel
 from easy_rec.python.protos.loss_pb2 import LossType
 from easy_rec.python.protos.simi_pb2 import Similarity
@@ -47,26 +49,162 @@ class MatchModel(EasyRecModel):
       logging.info('item_id feature is: %s' % sub_model_config.item_id)
       self._item_ids = features[sub_model_config.item_id]
 
+    self._memory_config = None
+    self._memory_logits_bias = None
+    if self._model_config.HasField('cross_batch_memory') and is_training \
+        and self._loss_type == LossType.SOFTMAX_CROSS_ENTROPY:
+      self._memory_config = self._model_config.cross_batch_memory
+      logging.info('use cross batch memory of size %d' %
+                   self._memory_config.memory_size)
+
+    self._frequency_estimator = None
+    self._item_log_prob = None
+    if self._model_config.HasField('sampling_bias_correction') and \
+        is_training and self._loss_type == LossType.SOFTMAX_CROSS_ENTROPY:
+      assert self._item_ids is not None, \
+          'item_id must be set for sampling_bias_correction'
+      correction_config = self._model_config.sampling_bias_correction
+      self._frequency_estimator = FrequencyEstimator(
+          correction_config.num_buckets, correction_config.num_hashes,
+          correction_config.alpha)
+
   def _mask_in_batch(self, logits):
     batch_size = tf.shape(logits)[0]
+    if self._item_log_prob is not None:
+      # logQ correction of in-batch negatives
+      logits = tf.concat([
+          logits[:, :batch_size] - self._item_log_prob[None, :],
+          logits[:, batch_size:]],
+          axis=1)  # yapf: disable
     if getattr(self._model_config, 'ignore_in_batch_neg_sam', False):
       in_batch = logits[:, :batch_size] - (
           1 - tf.diag(tf.ones([batch_size], dtype=tf.float32))) * 1e32
-      return tf.concat([in_batch, logits[:, batch_size:]], axis=1)
-    else:
+      logits = tf.concat([in_batch, logits[:, batch_size:]], axis=1)
+    elif self._item_ids is not None:
+      mask_in_batch_neg = tf.to_float(
+          tf.equal(self._item_ids[None, :batch_size],
+                   self._item_ids[:batch_size, None])) - tf.diag(
+                       tf.ones([batch_size], dtype=tf.float32))
+      tf.summary.scalar('in_batch_neg_conflict',
+                        tf.reduce_sum(mask_in_batch_neg))
+      logits = tf.concat([
+          logits[:, :batch_size] - mask_in_batch_neg * 1e32,
+          logits[:, batch_size:]],
+          axis=1)  # yapf: disable
+
+    if self._memory_logits_bias is not None:
+      # memory negatives are the last memory_size columns
+      memory_size = self._memory_config.memory_size
+      logits = tf.concat([
+          logits[:, :-memory_size],
+          logits[:, -memory_size:] + self._memory_logits_bias],
+          axis=1)  # yapf: disable
+    return logits
+
+  def _cross_batch_memory_sim(self, user_emb, pos_item_emb):
+    """Similarity between user_emb and item embeddings of previous batches.
+
+    The memory is a FIFO queue of item tower embeddings(and item ids),
+    it is updated with pos_item_emb after the similarity is computed.
+    Empty, too stale or id conflicted entries are masked out in
+    _mask_in_batch through self._memory_logits_bias.
+
+    Args:
+      user_emb: [batch_size, emb_dim] user tower embeddings.
+      pos_item_emb: [batch_size, emb_dim] item tower embeddings of
+        the positive items.
+
+    Return:
+      [batch_size, memory_size] similarity to memory item embeddings.
+    """
+    memory_size = self._memory_config.memory_size
+    emb_dim = pos_item_emb.get_shape()[-1]
+    batch_size = tf.shape(pos_item_emb)[0]
+    var_kwargs = {
+        'trainable': False,
+        'collections': [tf.GraphKeys.LOCAL_VARIABLES],
+        'use_resource': True
+    }
+    with tf.variable_scope('cross_batch_memory'):
+      memory_emb = tf.get_variable(
+          'item_emb',
+          shape=[memory_size, emb_dim],
+          dtype=tf.float32,
+          initializer=tf.zeros_initializer(),
+          **var_kwargs)
+      # the global_step when the entry is written, -1 for empty entries
+      memory_step = tf.get_variable(
+          'write_step',
+          shape=[memory_size],
+          dtype=tf.int64,
+          initializer=tf.constant_initializer(-1),
+          **var_kwargs)
+      memory_ptr = tf.get_variable(
+          'ptr',
+          shape=[],
+          dtype=tf.int64,
+          initializer=tf.zeros_initializer(),
+          **var_kwargs)
+      memory_ids = None
       if self._item_ids is not None:
-        mask_in_batch_neg = tf.to_float(
-            tf.equal(self._item_ids[None, :batch_size],
-                     self._item_ids[:batch_size, None])) - tf.diag(
-                         tf.ones([batch_size], dtype=tf.float32))
-        tf.summary.scalar('in_batch_neg_conflict',
-                          tf.reduce_sum(mask_in_batch_neg))
-        return tf.concat([
-            logits[:, :batch_size] - mask_in_batch_neg * 1e32,
-            logits[:, batch_size:]],
-            axis=1)  # yapf: disable
-      else:
-        return logits
+        memory_ids = tf.get_variable(
+            'item_id',
+            shape=[memory_size],
+            dtype=self._item_ids.dtype,
+            initializer=tf.zeros_initializer(),
+            **var_kwargs)
+
+    global_step = tf.train.get_or_create_global_step()
+    memory_emb_val = memory_emb.read_value()
+    memory_step_val = memory_step.read_value()
+    memory_sim = tf.matmul(user_emb, memory_emb_val, transpose_b=True)
+
+    memory_age = global_step - memory_step_val
+    valid = tf.logical_and(memory_step_val >= 0,
+                           global_step >= self._memory_config.start_step)
+    if self._memory_config.max_staleness > 0:
+      valid = tf.logical_and(valid,
+                             memory_age <= self._memory_config.max_staleness)
+    tf.summary.scalar('cross_batch_memory/num_valid',
+                      tf.reduce_sum(tf.to_float(valid)))
+    logits_bias = (1.0 - tf.to_float(valid[None, :])) * -1e32
+    if self._memory_config.staleness_decay < 1.0:
+      assert self._memory_config.staleness_decay > 0, \
+          'staleness_decay must be in (0, 1]'
+      logits_bias += tf.to_float(memory_age[None, :]) * math.log(
+          self._memory_config.staleness_decay)
+
+    if memory_ids is not None:
+      memory_ids_val = memory_ids.read_value()
+      conflict = tf.to_float(
+          tf.equal(self._item_ids[:batch_size, None], memory_ids_val[None, :]))
+      tf.summary.scalar('cross_batch_memory/neg_conflict',
+                        tf.reduce_sum(conflict * tf.to_float(valid[None, :])))
+      logits_bias -= conflict * 1e32
+      if self._frequency_estimator is not None:
+        logits_bias -= self._frequency_estimator.log_prob(memory_ids_val)[
+            None, :]
+    self._memory_logits_bias = logits_bias
+
+    # enqueue current batch after the memory is read
+    with tf.control_dependencies([memory_sim, logits_bias]):
+      num_write = tf.minimum(tf.to_int64(batch_size), memory_size)
+      write_start = memory_ptr.assign_add(num_write) - num_write
+      write_indices = tf.mod(write_start + tf.range(num_write, dtype=tf.int64),
+                             memory_size)
+      start_idx = tf.to_int64(batch_size) - num_write
+      update_ops = [
+          tf.scatter_update(memory_emb, write_indices,
+                            tf.stop_gradient(pos_item_emb[start_idx:])),
+          tf.scatter_update(memory_step, write_indices,
+                            tf.fill([num_write], global_step))
+      ]
+      if memory_ids is not None:
+        update_ops.append(
+            tf.scatter_update(memory_ids, write_indices,
+                              self._item_ids[start_idx:batch_size]))
+    tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, tf.group(*update_ops))
+    return memory_sim
 
   def _list_wise_sim(self, user_emb, item_emb):
     batch_size = tf.shape(user_emb)[0]
@@ -97,7 +235,7 @@ class MatchModel(EasyRecModel):
       simple_user_item_sim = tf.matmul(user_emb, tf.transpose(simple_item_emb))
 
     if hard_neg_indices is None:
-      return simple_user_item_sim
+      user_item_sim = simple_user_item_sim
     else:
       user_emb_expand = tf.gather(user_emb, hard_neg_indices[:, 0])
       hard_neg_user_item_sim = tf.reduce_sum(
@@ -118,7 +256,23 @@ class MatchModel(EasyRecModel):
       #   user_item_sim.append(hard_neg_user_item_sim)
       # return tf.concat(user_item_sim, axis=1)
 
-      return tf.concat([simple_user_item_sim, hard_neg_user_item_sim], axis=1)
+      user_item_sim = tf.concat([simple_user_item_sim, hard_neg_user_item_sim],
+                                axis=1)
+
+    if self._memory_config is not None:
+      memory_sim = self._cross_batch_memory_sim(user_emb,
+                                                simple_item_emb[:batch_size])
+      user_item_sim = tf.concat([user_item_sim, memory_sim], axis=1)
+
+    if self._frequency_estimator is not None:
+      pos_item_ids = self._item_ids[:batch_size]
+      self._item_log_prob = self._frequency_estimator.log_prob(pos_item_ids)
+      tf.summary.histogram('item_log_prob', self._item_log_prob)
+      tf.add_to_collection(
+          tf.GraphKeys.UPDATE_OPS,
+          self._frequency_estimator.update(
+              pos_item_ids, tf.train.get_or_create_global_step()))
+    return user_item_sim
 
   def _point_wise_sim(self, user_emb, item_emb):
     user_item_sim = tf.reduce_sum(
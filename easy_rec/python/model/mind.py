@@ -422,6 +422,11 @@ class MIND(MatchModel):
     return metric_dict
 
   def get_outputs(self):
+    if self._model_config.export_user_capsules:
+      # export the outputs of the user tower only, the item tower is still
+      # built, but the item embeddings and logits are not exported, so they
+      # are not fetched at serving time
+      return ['user_emb', 'user_emb_num', 'user_interests', 'high_capsules']
     if self._loss_type == LossType.CLASSIFICATION:
       return [
           'logits', 'probs', 'user_emb', 'item_emb', 'user_emb_num',
@@ -1,4 +1,6 @@
 #!/usr/bin/bash
+# usage: build_ops.sh [load_embed|parse_rtp], build all ops by default
+target=$1
 TF_INC=$(python -c 'import tensorflow as tf; print(tf.sysconfig.get_include())')
 TF_LFLAGS=$(python -c 'import tensorflow as tf; print(" ".join(tf.sysconfig.get_link_flags()))')
 TF_ABI=$(python -c 'import tensorflow as tf; print(str(tf.sysconfig.CXX11_ABI_FLAG if "CXX11_ABI_FLAG" in dir(tf.sysconfig) else 0))')
@@ -23,6 +25,9 @@ then
    mkdir -p $ops_bin_dir
 fi
 
+if [ -z "$target" ] || [ "$target" == "load_embed" ]
+then
+
 ops_bin=${ops_bin_dir}/libload_embed.so
 
 g++ -D_GLIBCXX_USE_CXX11_ABI=$TF_ABI -shared -O3 -DNDEBUG -Wl,-rpath,'$ORIGIN'  -fpermissive -mfma -fopenmp  ${ops_src_dir}/load_kv_embed.cc ${ops_src_dir}/load_dense_embed.cc -o ${ops_bin}  -fPIC -I $TF_INC $TF_LFLAGS -L/lib64
@@ -34,3 +39,22 @@ then
    echo "build failed"
    exit $err_code
 fi
+
+fi
+
+if [ -z "$target" ] || [ "$target" == "parse_rtp" ]
+then
+
+ops_bin=${ops_bin_dir}/libparse_rtp.so
+
+g++ -std=c++17 -D_GLIBCXX_USE_CXX11_ABI=$TF_ABI -shared -O3 -DNDEBUG -Wl,-rpath,'$ORIGIN'  ${ops_src_dir}/parse_rtp.cc -o ${ops_bin}  -fPIC -I $TF_INC $TF_LFLAGS -L/lib64
+
+python -c "import tensorflow as tf; tf.load_op_library('$ops_bin')"
+err_code=$?
+if [ $err_code -ne 0 ]
+then
+   echo "build failed"
+   exit $err_code
+fi
+
+fi
@@ -0,0 +1,120 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import easy_rec
+from easy_rec.python.utils.tf_utils import get_tf_type
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+try:
+  parse_rtp_op_path = os.path.join(easy_rec.ops_dir, 'libparse_rtp.so')
+  parse_rtp_op = tf.load_op_library(parse_rtp_op_path)
+  logging.info('load parse_rtp op from %s succeed' % parse_rtp_op_path)
+except Exception as ex:
+  logging.warning('load parse_rtp op failed: %s, '
+                  'build it with easy_rec/python/ops/build_ops.sh' % str(ex))
+  parse_rtp_op = None
+
+# seconds between the warnings on the invalid lines
+_LOG_INTERVAL_SECS = 60
+
+
+class _ErrorCounter(object):
+  """Invalid lines parsed by the parse_rtp op in this process."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.error_count = 0
+    self.line_count = 0
+    self._last_log_time = 0
+
+  def update(self, error_count, line_count):
+    with self._lock:
+      self.error_count += int(error_count)
+      self.line_count += int(line_count)
+      now = time.time()
+      if error_count > 0 and now - self._last_log_time >= _LOG_INTERVAL_SECS:
+        self._last_log_time = now
+        logging.warning(
+            'parse_rtp: %d of %d lines are invalid and filled with defaults, '
+            'set data_config.check_mode to fail on them' %
+            (self.error_count, self.line_count))
+      return np.int64(self.error_count)
+
+
+_error_counter = _ErrorCounter()
+
+
+def get_error_count():
+  """Number of invalid lines parsed in this process so far."""
+  return _error_counter.error_count
+
+
+def parse_rtp(lines,
+              field_types,
+              field_defaults,
+              separator,
+              rtp_separator='',
+              num_cols=-1,
+              label_cols=None,
+              feature_col=-1,
+              check_mode=False):
+  """Parse rtp lines into typed columns with the fused parse_rtp op.
+
+  Args:
+    lines: string tensor of shape [batch_size], the rtp lines, or the
+      feature columns if rtp_separator is empty.
+    field_types: DatasetConfig.FieldType of label columns followed by
+      feature columns.
+    field_defaults: default values of label columns followed by
+      feature columns.
+    separator: separator of features, must be one char.
+    rtp_separator: separator of columns.
+    num_cols: expected number of columns, -1 means not checked.
+    label_cols: column ids of labels.
+    feature_col: column id of features, negative id counts from the end.
+    check_mode: if true, fail when there are invalid lines, otherwise the
+      invalid values are replaced by defaults, and the invalid lines are
+      counted(see get_error_count) and logged periodically.
+
+  Return:
+    list of tensors, label columns followed by feature columns.
+  """
+  assert parse_rtp_op is not None, 'parse_rtp op is not available'
+  assert len(separator) == 1, \
+      'invalid data_config.separator(%s) len(%d) != 1' % (
+          separator, len(separator))
+  fields, error_count = parse_rtp_op.parse_rtp(
+      lines,
+      Tout=[get_tf_type(x) for x in field_types],
+      defaults=[str(x) for x in field_defaults],
+      rtp_separator=rtp_separator,
+      num_cols=num_cols,
+      label_cols=list(label_cols) if label_cols else [],
+      feature_col=feature_col,
+      separator=separator)
+  if check_mode:
+    check_op = tf.assert_equal(
+        error_count,
+        tf.constant(0, dtype=tf.int64),
+        message='parse_rtp found invalid lines, '
+        'please check separator, rtp_separator and data.')
+    with tf.control_dependencies([check_op]):
+      fields = [tf.identity(x) for x in fields]
+  else:
+    total_error_count = tf.py_func(
+        _error_counter.update,
+        [error_count, tf.size(lines, out_type=tf.int64)],
+        tf.int64,
+        stateful=True)
+    with tf.control_dependencies([total_error_count]):
+      fields = [tf.identity(x) for x in fields]
+  return list(fields)
@@ -0,0 +1,276 @@
+#include <atomic>
+#include <string>
+#include <vector>
+
+#include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/framework/op.h"
+#include "tensorflow/core/framework/op_kernel.h"
+#include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/framework/tensor.h"
+#include "tensorflow/core/framework/types.h"
+#include "tensorflow/core/lib/core/status.h"
+#include "tensorflow/core/lib/strings/numbers.h"
+#include "tensorflow/core/platform/logging.h"
+#include "tensorflow/core/platform/types.h"
+#include "tensorflow/core/util/work_sharder.h"
+
+namespace tensorflow {
+
+REGISTER_OP("ParseRtp")
+    .Input("lines: string")
+    .Output("values: Tout")
+    .Output("error_count: int64")
+    .Attr("Tout: list({int32, int64, float, double, bool, string}) >= 1")
+    .Attr("defaults: list(string)")
+    .Attr("rtp_separator: string = ''")
+    .Attr("num_cols: int = -1")
+    .Attr("label_cols: list(int) = []")
+    .Attr("feature_col: int = -1")
+    .Attr("separator: string")
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+      shape_inference::ShapeHandle lines;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 1, &lines));
+      for (int i = 0; i < c->num_outputs() - 1; ++i) {
+        c->set_output(i, lines);
+      }
+      c->set_output(c->num_outputs() - 1, c->Scalar());
+      return Status();
+    })
+    .Doc(R"doc(
+Parse a batch of rtp lines into typed columns in one pass.
+
+Each line is optionally split by rtp_separator into columns first, the label
+columns are selected by label_cols, and the feature column(selected by
+feature_col) is split by separator into one value per feature. Empty values
+are replaced by defaults. Lines with wrong number of columns or values that
+could not be converted are filled with defaults and counted in error_count,
+instead of failing the whole batch.
+
+lines: rtp lines, or the feature column only if rtp_separator is empty.
+values: label columns followed by feature columns.
+error_count: number of lines with errors.
+Tout: types of label columns followed by feature columns.
+defaults: default values of label columns followed by feature columns.
+rtp_separator: separator of columns, empty means lines are feature columns.
+num_cols: expected number of columns, -1 means not checked.
+label_cols: column ids of labels.
+feature_col: column id of features, negative id counts from the end.
+separator: separator of features, must be one char.
+)doc");
+
+class ParseRtpOp : public OpKernel {
+ public:
+  explicit ParseRtpOp(OpKernelConstruction* ctx) : OpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("Tout", &out_types_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("defaults", &defaults_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("rtp_separator", &rtp_separator_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_cols", &num_cols_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("label_cols", &label_cols_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("feature_col", &feature_col_));
+    std::string separator;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("separator", &separator));
+    OP_REQUIRES(ctx, separator.size() == 1,
+                errors::InvalidArgument("separator must be one char, got: ",
+                                        separator));
+    separator_ = separator[0];
+    OP_REQUIRES(ctx, out_types_.size() == defaults_.size(),
+                errors::InvalidArgument("len(Tout)=", out_types_.size(),
+                                        " != len(defaults)=", defaults_.size()));
+    OP_REQUIRES(ctx, out_types_.size() > label_cols_.size(),
+                errors::InvalidArgument("no feature columns"));
+    OP_REQUIRES(ctx, !rtp_separator_.empty() || label_cols_.empty(),
+                errors::InvalidArgument(
+                    "label_cols requires rtp_separator to split columns"));
+    num_features_ = out_types_.size() - label_cols_.size();
+    default_nums_.resize(defaults_.size(), 0.0);
+    default_ints_.resize(defaults_.size(), 0);
+    for (size_t i = 0; i < defaults_.size(); ++i) {
+      if (out_types_[i] == DT_STRING || out_types_[i] == DT_BOOL ||
+          defaults_[i].empty()) {
+        continue;
+      }
+      OP_REQUIRES(ctx,
+                  ParseNumber(out_types_[i], defaults_[i], &default_ints_[i],
+                              &default_nums_[i]),
+                  errors::InvalidArgument("invalid default value: ",
+                                          defaults_[i], " of type ",
+                                          DataTypeString(out_types_[i])));
+    }
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    const Tensor& lines_t = ctx->input(0);
+    OP_REQUIRES(ctx, TensorShapeUtils::IsVector(lines_t.shape()),
+                errors::InvalidArgument("lines must be a vector, got shape: ",
+                                        lines_t.shape().DebugString()));
+    auto lines = lines_t.flat<tstring>();
+    const int64 batch_size = lines.size();
+
+    OpOutputList values;
+    OP_REQUIRES_OK(ctx, ctx->output_list("values", &values));
+    std::vector<Tensor*> outputs(out_types_.size(), nullptr);
+    for (size_t i = 0; i < out_types_.size(); ++i) {
+      OP_REQUIRES_OK(ctx, values.allocate(i, TensorShape({batch_size}),
+                                          &outputs[i]));
+    }
+
+    std::atomic<int64> error_count(0);
+    auto parse_range = [&](int64 start, int64 end) {
+      std::vector<StringPiece> cols;
+      std::vector<StringPiece> feas;
+      int64 num_errors = 0;
+      for (int64 row = start; row < end; ++row) {
+        bool valid = true;
+        StringPiece line(lines(row).data(), lines(row).size());
+        StringPiece feature_str = line;
+        if (!rtp_separator_.empty()) {
+          Split(line, rtp_separator_, &cols);
+          if (num_cols_ > 0 && static_cast<int64>(cols.size()) != num_cols_) {
+            valid = false;
+          }
+          for (size_t i = 0; i < label_cols_.size(); ++i) {
+            StringPiece val;
+            if (label_cols_[i] < static_cast<int64>(cols.size())) {
+              val = cols[label_cols_[i]];
+            }
+            valid &= SetValue(i, row, val, outputs[i]);
+          }
+          int64 feature_col =
+              feature_col_ >= 0 ? feature_col_ : cols.size() + feature_col_;
+          if (feature_col >= 0 && feature_col < static_cast<int64>(cols.size())) {
+            feature_str = cols[feature_col];
+          } else {
+            feature_str = StringPiece();
+            valid = false;
+          }
+        }
+        Split(feature_str, StringPiece(&separator_, 1), &feas);
+        if (static_cast<int64>(feas.size()) != num_features_) {
+          valid = false;
+        }
+        for (int64 i = 0; i < num_features_; ++i) {
+          int64 out_id = label_cols_.size() + i;
+          StringPiece val;
+          if (i < static_cast<int64>(feas.size())) {
+            val = feas[i];
+          }
+          valid &= SetValue(out_id, row, val, outputs[out_id]);
+        }
+        if (!valid) {
+          if (num_errors == 0 && error_count.load() == 0) {
+            LOG(WARNING) << "invalid rtp line: "
+                         << std::string(line.substr(0, 1024));
+          }
+          ++num_errors;
+        }
+      }
+      error_count += num_errors;
+    };
+
+    auto worker_threads = ctx->device()->tensorflow_cpu_worker_threads();
+    const int64 cost_per_row = 64 * out_types_.size();
+    Shard(worker_threads->num_threads, worker_threads->workers, batch_size,
+          cost_per_row, parse_range);
+
+    Tensor* error_count_t = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output("error_count", TensorShape({}),
+                                             &error_count_t));
+    error_count_t->scalar<int64>()() = error_count.load();
+  }
+
+ private:
+  static void Split(StringPiece str, StringPiece sep,
+                    std::vector<StringPiece>* toks) {
+    toks->clear();
+    size_t start = 0;
+    while (true) {
+      size_t pos = str.find(sep, start);
+      if (pos == StringPiece::npos) {
+        toks->emplace_back(str.substr(start));
+        break;
+      }
+      toks->emplace_back(str.substr(start, pos - start));
+      start = pos + sep.size();
+    }
+  }
+
+  // parse an integer for the int types, so that int64 ids are not rounded
+  // through double, and strings like "1.7" are rejected instead of truncated.
+  static bool ParseNumber(DataType dtype, StringPiece val, int64* int_val,
+                          double* num) {
+    switch (dtype) {
+      case DT_INT32: {
+        int32 v;
+        if (!strings::safe_strto32(val, &v)) {
+          return false;
+        }
+        *int_val = v;
+        return true;
+      }
+      case DT_INT64:
+        return strings::safe_strto64(val, int_val);
+      default:
+        return strings::safe_strtod(val, num);
+    }
+  }
+
+  // convert val to the type of output out_id, return false if the conversion
+  // fails, in which case the default value is used.
+  bool SetValue(int64 out_id, int64 row, StringPiece val, Tensor* out) const {
+    const DataType dtype = out_types_[out_id];
+    if (dtype == DT_STRING) {
+      if (val.empty()) {
+        val = defaults_[out_id];
+      }
+      out->flat<tstring>()(row) = tstring(val.data(), val.size());
+      return true;
+    }
+    if (dtype == DT_BOOL) {
+      if (val.empty()) {
+        val = defaults_[out_id];
+      }
+      out->flat<bool>()(row) = (val == "true" || val == "True");
+      return true;
+    }
+    int64 int_val = default_ints_[out_id];
+    double num = default_nums_[out_id];
+    bool valid = true;
+    if (!val.empty() && !ParseNumber(dtype, val, &int_val, &num)) {
+      int_val = default_ints_[out_id];
+      num = default_nums_[out_id];
+      valid = false;
+    }
+    switch (dtype) {
+      case DT_INT32:
+        out->flat<int32>()(row) = static_cast<int32>(int_val);
+        break;
+      case DT_INT64:
+        out->flat<int64>()(row) = int_val;
+        break;
+      case DT_FLOAT:
+        out->flat<float>()(row) = static_cast<float>(num);
+        break;
+      case DT_DOUBLE:
+        out->flat<double>()(row) = num;
+        break;
+      default:
+        break;
+    }
+    return valid;
+  }
+
+  DataTypeVector out_types_;
+  std::vector<std::string> defaults_;
+  std::vector<double> default_nums_;
+  std::vector<int64> default_ints_;
+  std::string rtp_separator_;
+  int64 num_cols_;
+  std::vector<int64> label_cols_;
+  int64 feature_col_;
+  char separator_;
+  int64 num_features_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("ParseRtp").Device(DEVICE_CPU), ParseRtpOp);
+
+}  // namespace tensorflow
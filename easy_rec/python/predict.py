@@ -10,6 +10,7 @@ from tensorflow.python.lib.io import file_io
 
 from easy_rec.python.inference.csv_predictor import CSVPredictor
 from easy_rec.python.inference.hive_predictor import HivePredictor
+from easy_rec.python.inference.output_sink import create_output_sink
 from easy_rec.python.inference.parquet_predictor import ParquetPredictor
 from easy_rec.python.inference.parquet_predictor_v2 import ParquetPredictorV2
 from easy_rec.python.main import predict
@@ -51,6 +52,13 @@ tf.app.flags.DEFINE_string(
     'output columns, such as: score float. multiple columns are separated by ,')
 tf.app.flags.DEFINE_string('output_sep', chr(1),
                            'separator of predict result file')
+tf.app.flags.DEFINE_string(
+    'output_format', 'csv', 'format of predict result files: csv | parquet, '
+    'parquet files are written in columnar batches without string formatting')
+tf.app.flags.DEFINE_integer('parquet_row_group_size', 65536,
+                            'max number of rows of parquet row groups')
+tf.app.flags.DEFINE_string('parquet_compression', 'snappy',
+                           'compression codec of parquet files')
 tf.app.flags.DEFINE_string('selected_cols', None, '')
 tf.app.flags.DEFINE_string('fg_json_path', '', '')
 tf.app.flags.DEFINE_string('ds_vector_recall', '', '')
@@ -135,6 +143,17 @@ def main(argv):
     else:
       worker_num = 1
       task_index = 0
+    output_sink = None
+    if FLAGS.output_format != 'csv':
+      assert input_type not in [
+          data_config.HiveParquetInput, data_config.HiveInput
+      ], 'output_format %s is not supported for hive tables' % FLAGS.output_format
+      output_sink = create_output_sink(
+          FLAGS.output_format,
+          FLAGS.output_path,
+          task_index,
+          row_group_size=FLAGS.parquet_row_group_size,
+          compression=FLAGS.parquet_compression)
     predictor.predict_impl(
         FLAGS.input_path,
         FLAGS.output_path,
@@ -142,7 +161,8 @@ def main(argv):
         output_cols=FLAGS.output_cols,
         batch_size=FLAGS.batch_size,
         slice_id=task_index,
-        slice_num=worker_num)
+        slice_num=worker_num,
+        output_sink=output_sink)
   else:
     logging.info('Predict by checkpoint_path.')
     assert FLAGS.model_dir or FLAGS.pipeline_config_path, 'At least one of model_dir and pipeline_config_path exists.'
@@ -0,0 +1,116 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.utils import estimator_utils
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  from tensorflow.python.framework.ops import disable_eager_execution
+
+  disable_eager_execution()
+  tf = tf.compat.v1
+
+
+class AsyncCheckpointTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+    self._model_dir = os.path.join(self._test_dir, 'model')
+    self._local_dir = os.path.join(self._test_dir, 'local')
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def _train(self, async_checkpoint, num_steps=10):
+    with tf.Graph().as_default():
+      global_step = tf.train.get_or_create_global_step()
+      embed = tf.get_variable(
+          'embed', [10, 4],
+          partitioner=tf.fixed_size_partitioner(3),
+          initializer=tf.zeros_initializer())
+      bias = tf.get_variable('bias', [4], initializer=tf.zeros_initializer())
+      data_offset_var = tf.get_variable(
+          'data_offset', [1],
+          dtype=tf.string,
+          initializer=tf.constant_initializer(''),
+          trainable=False,
+          collections=[tf.GraphKeys.LOCAL_VARIABLES])
+      step_one = tf.cast(global_step + 1, tf.float32)
+      train_op = tf.group(
+          embed.assign_add(tf.ones([10, 4])),
+          bias.assign(tf.fill([4], step_one)),
+          data_offset_var.assign(
+              tf.strings.join(
+                  ['{"0": ',
+                   tf.strings.as_string([global_step + 1]), '}'])),
+          tf.assign_add(global_step, 1))
+      var_list = [global_step, bias] + list(embed)
+      scaffold = tf.train.Scaffold(
+          saver=tf.train.Saver(
+              var_list=var_list,
+              sharded=True,
+              max_to_keep=3,
+              save_relative_paths=True))
+      saver_hook = estimator_utils.CheckpointSaverHook(
+          checkpoint_dir=self._model_dir,
+          save_steps=2,
+          scaffold=scaffold,
+          data_offset_var=data_offset_var,
+          async_checkpoint=async_checkpoint,
+          async_checkpoint_local_dir=self._local_dir)
+      with tf.train.MonitoredSession(
+          session_creator=tf.train.ChiefSessionCreator(
+              scaffold=scaffold, checkpoint_dir=self._model_dir),
+          hooks=[saver_hook]) as sess:
+        for _ in range(num_steps):
+          sess.run(train_op)
+
+  def _load(self, ckpt_path):
+    reader = tf.train.NewCheckpointReader(ckpt_path)
+    return reader.get_tensor('embed'), reader.get_tensor('bias')
+
+  def test_async_checkpoint(self):
+    self._train(async_checkpoint=True)
+    ckpt_state = tf.train.get_checkpoint_state(self._model_dir)
+    self.assertEqual(
+        os.path.basename(ckpt_state.model_checkpoint_path), 'model.ckpt-10')
+    self.assertEqual(
+        [os.path.basename(x) for x in ckpt_state.all_model_checkpoint_paths],
+        ['model.ckpt-6', 'model.ckpt-8', 'model.ckpt-10'])
+    for step in [6, 8, 10]:
+      ckpt_path = os.path.join(self._model_dir, 'model.ckpt-%d' % step)
+      embed, bias = self._load(ckpt_path)
+      self.assertAllClose(embed, np.full([10, 4], step))
+      self.assertAllClose(bias, np.full([4], step))
+      self.assertTrue(os.path.exists(ckpt_path + '.meta'))
+      with open(ckpt_path + '.offset', 'r') as fin:
+        self.assertEqual(json.load(fin), {'0': step})
+    self.assertFalse(
+        os.path.exists(os.path.join(self._model_dir, 'model.ckpt-4.index')))
+    # all the files are uploaded to model_dir
+    self.assertEqual(os.listdir(self._local_dir), [])
+
+    # restore and continue training
+    self._train(async_checkpoint=True, num_steps=2)
+    embed, bias = self._load(os.path.join(self._model_dir, 'model.ckpt-12'))
+    self.assertAllClose(embed, np.full([10, 4], 12))
+    self.assertAllClose(bias, np.full([4], 12))
+
+  def test_async_sync_compatible(self):
+    self._train(async_checkpoint=False, num_steps=4)
+    self._train(async_checkpoint=True, num_steps=4)
+    ckpt_state = tf.train.get_checkpoint_state(self._model_dir)
+    self.assertEqual(
+        [os.path.basename(x) for x in ckpt_state.all_model_checkpoint_paths],
+        ['model.ckpt-4', 'model.ckpt-6', 'model.ckpt-8'])
+    embed, _ = self._load(ckpt_state.model_checkpoint_path)
+    self.assertAllClose(embed, np.full([10, 4], 8))
+
+
+if __name__ == '__main__':
+  tf.test.main()
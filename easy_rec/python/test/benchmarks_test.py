@@ -0,0 +1,133 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from easy_rec.python.benchmarks import compare
+from easy_rec.python.benchmarks import results
+from easy_rec.python.benchmarks import run
+from easy_rec.python.benchmarks import stages
+from easy_rec.python.benchmarks.synthetic_data import SyntheticDataGenerator
+from easy_rec.python.utils import config_util
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+_CONFIG_PATH = 'samples/model_config/multi_tower_on_taobao.config'
+
+
+class BenchmarksTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = tempfile.mkdtemp(prefix='benchmarks_test_')
+
+  def tearDown(self):
+    shutil.rmtree(self._test_dir)
+
+  def test_synthetic_data(self):
+    pipeline_config = config_util.get_configs_from_pipeline_file(_CONFIG_PATH)
+    rows = SyntheticDataGenerator(pipeline_config, seed=1).generate(100)
+    self.assertEqual(
+        rows,
+        SyntheticDataGenerator(pipeline_config, seed=1).generate(100))
+    field_names = [
+        x.input_name for x in pipeline_config.data_config.input_fields
+    ]
+    label_id = field_names.index('clk')
+    for row in rows:
+      self.assertEqual(len(row), len(field_names))
+      self.assertIn(row[label_id], ['0', '1'])
+
+    feature_configs = config_util.get_compatible_feature_configs(
+        pipeline_config)
+    tag_config = [
+        x for x in feature_configs if x.input_names[0] == 'tag_brand_list'
+    ][0]
+    tag_id = field_names.index('tag_brand_list')
+    for row in rows:
+      for tag in row[tag_id].split(tag_config.separator):
+        self.assertLess(int(tag), tag_config.hash_bucket_size)
+
+  def test_layers(self):
+    metrics = stages.benchmark_layers(8, 1, 2, ['mlp', 'din'])
+    self.assertEqual(
+        sorted(metrics.keys()), [
+            'layers/din/forward_backward_ms', 'layers/din/forward_ms',
+            'layers/mlp/forward_backward_ms', 'layers/mlp/forward_ms'
+        ])
+    for metric in metrics.values():
+      self.assertGreater(metric['value'], 0)
+      self.assertFalse(metric['higher_is_better'])
+
+  def test_compare_results(self):
+    baseline = {
+        'metrics': {
+            'train/steps_per_sec':
+                results.make_metric(10, 'steps/s', True),
+            'predict/p99_ms':
+                results.make_metric(4, 'ms', False),
+            'input/samples_per_sec':
+                results.make_metric(1000, 'samples/s', True)
+        }
+    }
+    current = {
+        'metrics': {
+            'train/steps_per_sec': results.make_metric(8, 'steps/s', True),
+            'predict/p99_ms': results.make_metric(3, 'ms', False),
+            'embedding/forward_ms': results.make_metric(1, 'ms', False)
+        }
+    }
+    rows = {
+        x['name']: x for x in results.compare_results(baseline, current, 0.1)
+    }
+    self.assertAllClose(rows['train/steps_per_sec']['change'], -0.2)
+    self.assertTrue(rows['train/steps_per_sec']['regressed'])
+    self.assertAllClose(rows['predict/p99_ms']['change'], 0.25)
+    self.assertFalse(rows['predict/p99_ms']['regressed'])
+    self.assertIsNone(rows['input/samples_per_sec']['current'])
+    self.assertTrue(rows['input/samples_per_sec']['regressed'])
+    self.assertIn('MISSING', results.format_comparison(list(rows.values())))
+    self.assertIsNone(rows['embedding/forward_ms']['baseline'])
+    self.assertFalse(rows['embedding/forward_ms']['regressed'])
+    rows = results.compare_results(baseline, current, 0.3, '^predict/')
+    self.assertEqual([x['name'] for x in rows], ['predict/p99_ms'])
+
+  def test_run_and_compare(self):
+    output_path = os.path.join(self._test_dir, 'benchmark.json')
+    args = run.get_parser().parse_args([
+        '--pipeline_config_path', _CONFIG_PATH, '--stages',
+        'input,embedding,train,predict', '--batch_size', '32', '--num_samples',
+        '200', '--num_warmup', '1', '--num_runs', '3', '--work_dir',
+        self._test_dir, '--output_path', output_path
+    ])
+    metrics = run.run(args)
+    for name in [
+        'input/samples_per_sec', 'embedding/forward_ms', 'train/steps_per_sec',
+        'predict/qps', 'predict/p99_ms'
+    ]:
+      self.assertGreater(metrics[name]['value'], 0)
+    saved = results.load_results(output_path)
+    self.assertEqual(saved['metrics'], metrics)
+    self.assertEqual(saved['env']['tf_version'], tf.__version__)
+
+    compare_args = compare.get_parser().parse_args(
+        ['--baseline', output_path, '--current', output_path])
+    self.assertEqual(compare.main(compare_args), 0)
+    metrics['predict/p99_ms']['value'] *= 2
+    results.save_results(
+        os.path.join(self._test_dir, 'regressed.json'), metrics)
+    compare_args.current = os.path.join(self._test_dir, 'regressed.json')
+    self.assertEqual(compare.main(compare_args), 1)
+    # a metric missing from the current run fails the comparison
+    metrics['predict/p99_ms']['value'] /= 2
+    metrics.pop('predict/qps')
+    results.save_results(os.path.join(self._test_dir, 'missing.json'), metrics)
+    compare_args.current = os.path.join(self._test_dir, 'missing.json')
+    self.assertEqual(compare.main(compare_args), 1)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,107 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import logging
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.layers.capsule_layer import CapsuleLayer
+from easy_rec.python.protos.mind_pb2 import Capsule
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+def _skewed_lengths(batch_size, max_seq_len, seed=0):
+  # most users have short histories
+  rng = np.random.RandomState(seed)
+  lengths = np.minimum(rng.zipf(1.5, size=batch_size), max_seq_len)
+  lengths[:4] = [max_seq_len, 1, 9, max_seq_len // 2]
+  return lengths.astype(np.int32)
+
+
+class CapsuleLayerTest(tf.test.TestCase):
+
+  def _build(self, ragged_routing, is_training, seq_width=64):
+    capsule_config = Capsule(
+        max_k=4,
+        max_seq_len=64,
+        high_dim=16,
+        num_iters=3,
+        ragged_routing=ragged_routing)
+    seq_feas = tf.placeholder(tf.float32, [None, seq_width, 8])
+    seq_lens = tf.placeholder(tf.int32, [None])
+    with tf.variable_scope('capsule', reuse=tf.AUTO_REUSE):
+      high_capsules, num_capsules = CapsuleLayer(capsule_config,
+                                                 is_training)(seq_feas,
+                                                              seq_lens)
+    return seq_feas, seq_lens, high_capsules, num_capsules
+
+  def _inputs(self, batch_size, seq_width=64):
+    lengths = _skewed_lengths(batch_size, seq_width)
+    feas = np.random.RandomState(1).normal(
+        size=[batch_size, seq_width, 8]).astype(np.float32)
+    feas *= (np.arange(seq_width)[None, :] < lengths[:, None])[:, :, None]
+    return feas, lengths
+
+  def test_ragged_routing_eval(self):
+    feas, lengths = self._inputs(256)
+    with tf.Graph().as_default():
+      dense = self._build(False, False)
+      ragged = self._build(True, False)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        dense_caps, dense_num = sess.run(dense[2:], {
+            dense[0]: feas,
+            dense[1]: lengths
+        })
+        ragged_caps, ragged_num = sess.run(ragged[2:], {
+            ragged[0]: feas,
+            ragged[1]: lengths
+        })
+    self.assertAllEqual(dense_num, ragged_num)
+    self.assertAllClose(dense_caps, ragged_caps, atol=1e-5)
+
+  def test_ragged_routing_train(self):
+    # sequences shorter than max_seq_len
+    feas, lengths = self._inputs(64, seq_width=20)
+    with tf.Graph().as_default():
+      seq_feas, seq_lens, high_capsules, num_capsules = self._build(
+          True, True, seq_width=20)
+      grads = tf.gradients(tf.reduce_sum(high_capsules), [seq_feas])
+      grads = [tf.convert_to_tensor(grads[0])]
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        caps, num, grad = sess.run([high_capsules, num_capsules, grads[0]], {
+            seq_feas: feas,
+            seq_lens: lengths
+        })
+    self.assertEqual(caps.shape, (64, 4, 16))
+    # padded capsules are zeros
+    cap_mask = np.arange(4)[None, :] < num[:, None]
+    self.assertAllEqual(np.linalg.norm(caps, axis=2) > 0, cap_mask)
+    # no gradients on the padded positions
+    seq_mask = np.arange(20)[None, :] < lengths[:, None]
+    self.assertAllEqual(
+        np.abs(grad).sum(axis=2)[~seq_mask], np.zeros([np.sum(~seq_mask)]))
+
+  def test_benchmark(self):
+    feas, lengths = self._inputs(4096)
+    logging.info('mean seq_len = %.2f' % np.mean(lengths))
+    for ragged_routing in [False, True]:
+      with tf.Graph().as_default():
+        seq_feas, seq_lens, high_capsules, _ = self._build(ragged_routing, True)
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          feed_dict = {seq_feas: feas, seq_lens: lengths}
+          sess.run(high_capsules, feed_dict)
+          start = time.time()
+          for _ in range(10):
+            sess.run(high_capsules, feed_dict)
+          logging.info('ragged_routing=%s: %.2f ms/batch' %
+                       (ragged_routing, (time.time() - start) * 100))
+
+
+if __name__ == '__main__':
+  tf.test.main()
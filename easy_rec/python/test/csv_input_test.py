@@ -5,6 +5,7 @@
 import os
 import unittest
 
+import numpy as np
 import tensorflow as tf
 from google.protobuf import text_format
 
@@ -14,6 +15,7 @@ from easy_rec.python.protos.dataset_pb2 import DatasetConfig
 from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import test_utils
 from easy_rec.python.utils.test_utils import RunAsSubprocess
 
 if tf.__version__ >= '2.0':
@@ -335,6 +337,126 @@ class CSVInputTest(tf.test.TestCase):
       sess.run(init_op)
       feature_dict, label_dict = sess.run([features, labels])
 
+  def _create_cache_input_obj(self, cache_dir, num_epochs, input_path):
+    data_config_str = """
+      input_fields {
+        input_name: 'label'
+        input_type: FLOAT
+      }
+      input_fields {
+        input_name: 'field[1-3]'
+        input_type: STRING
+      }
+      label_fields: 'label'
+      batch_size: 32
+      num_epochs: %d
+      prefetch_size: 32
+      auto_expand_input_fields: true
+      cache_dir: '%s'
+    """ % (num_epochs, cache_dir)
+    feature_config_str = """
+      input_names: 'field1'
+      feature_type: IdFeature
+      embedding_dim: 32
+      hash_bucket_size: 2000
+    """
+    dataset_config = DatasetConfig()
+    text_format.Merge(data_config_str, dataset_config)
+    feature_config = FeatureConfig()
+    text_format.Merge(feature_config_str, feature_config)
+    return CSVInput(dataset_config, [feature_config], input_path)
+
+  def _create_cache_input(self, cache_dir, num_epochs):
+    train_input_fn = self._create_cache_input_obj(
+        cache_dir, num_epochs, self._input_path).create_input()
+    dataset = train_input_fn(mode=tf.estimator.ModeKeys.TRAIN)
+    iterator = dataset.make_initializable_iterator()
+    _, labels = iterator.get_next()
+    return labels['label'], iterator.initializer
+
+  def _get_num_batches(self):
+    with open(self._input_path, 'r') as fin:
+      return (len(fin.readlines()) + 31) // 32
+
+  def test_csv_data_cache_version(self):
+    cache_dir = test_utils.get_tmp_dir()
+    mode = tf.estimator.ModeKeys.TRAIN
+    train_input = self._create_cache_input_obj(cache_dir, 1, self._input_path)
+    self.assertIsNotNone(train_input._get_cache_path(mode))
+    # tables could not be fingerprinted, and are cached only with a version
+    table_input = self._create_cache_input_obj(cache_dir, 1,
+                                               'odps://project/tables/t')
+    self.assertIsNone(table_input._get_cache_path(mode))
+    table_input._data_config.cache_version = 'ds=20240101'
+    cache_path = table_input._get_cache_path(mode)
+    self.assertIsNotNone(cache_path)
+    table_input._data_config.cache_version = 'ds=20240102'
+    self.assertNotEqual(table_input._get_cache_path(mode), cache_path)
+    test_utils.clean_up(cache_dir)
+
+  @RunAsSubprocess
+  def test_csv_data_cache(self):
+    cache_dir = test_utils.get_tmp_dir()
+    labels, init_op = self._create_cache_input(cache_dir, 2)
+    num_batches = self._get_num_batches()
+    with self.test_session() as sess:
+      sess.run(init_op)
+      epoch_labels = []
+      for _ in range(2 * num_batches):
+        epoch_labels.append(sess.run(labels))
+      with self.assertRaises(tf.errors.OutOfRangeError):
+        sess.run(labels)
+    # the second epoch is read from the cache
+    self.assertAllClose(
+        np.sort(np.concatenate(epoch_labels[:num_batches])),
+        np.sort(np.concatenate(epoch_labels[num_batches:])))
+    cache_files = tf.gfile.Glob(
+        os.path.join(cache_dir, '*', 'train_0_of_1', 'cache.index'))
+    self.assertEqual(len(cache_files), 1)
+    test_utils.clean_up(cache_dir)
+
+  @RunAsSubprocess
+  def test_csv_data_cache_concurrent_writers(self):
+    cache_dir = test_utils.get_tmp_dir()
+    num_batches = self._get_num_batches()
+    cache_pattern = os.path.join(cache_dir, '*', 'train_0_of_1')
+    # two jobs with the same configs write the cache concurrently
+    graph_a = tf.Graph()
+    with graph_a.as_default():
+      labels_a, init_op_a = self._create_cache_input(cache_dir, 1)
+    graph_b = tf.Graph()
+    with graph_b.as_default():
+      labels_b, init_op_b = self._create_cache_input(cache_dir, 1)
+    self.assertEqual(len(tf.gfile.Glob(cache_pattern + '.tmp_*')), 2)
+    with tf.Session(graph=graph_a) as sess_a, \
+        tf.Session(graph=graph_b) as sess_b:
+      sess_a.run(init_op_a)
+      sess_b.run(init_op_b)
+      job_a_labels = [sess_a.run(labels_a) for _ in range(num_batches)]
+      with self.assertRaises(tf.errors.OutOfRangeError):
+        sess_a.run(labels_a)
+      # job a commits the cache while job b is still writing its own
+      self.assertEqual(len(tf.gfile.Glob(cache_pattern + '.tmp_*')), 1)
+      self.assertEqual(
+          len(tf.gfile.Glob(os.path.join(cache_pattern, 'cache.index'))), 1)
+      for _ in range(num_batches):
+        sess_b.run(labels_b)
+      with self.assertRaises(tf.errors.OutOfRangeError):
+        sess_b.run(labels_b)
+    self.assertEqual(len(tf.gfile.Glob(cache_pattern)), 1)
+    self.assertEqual(len(tf.gfile.Glob(cache_pattern + '.tmp_*')), 0)
+
+    # later jobs read the committed cache
+    with tf.Graph().as_default():
+      labels_c, init_op_c = self._create_cache_input(cache_dir, 1)
+      with tf.Session() as sess_c:
+        sess_c.run(init_op_c)
+        job_c_labels = [sess_c.run(labels_c) for _ in range(num_batches)]
+    self.assertAllClose(
+        np.sort(np.concatenate(job_a_labels)),
+        np.sort(np.concatenate(job_c_labels)))
+    test_utils.clean_up(cache_dir)
+
 
 if __name__ == '__main__':
   tf.test.main()
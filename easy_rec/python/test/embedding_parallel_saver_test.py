@@ -0,0 +1,129 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.compat import embedding_parallel_saver
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class EmbeddingParallelSaverTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+    self._ckpt_path = os.path.join(self._test_dir, 'model.ckpt-100')
+    os.makedirs(self._ckpt_path + '-embedding')
+    self._var_name = 'input_layer/embed:0'
+    self._file_var_name = self._var_name.replace('/', '__')
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def _save_dense(self, embed, part_num):
+    """Save the global table in the layout of EmbeddingParallelSaver."""
+    embed_part_size = (len(embed) + part_num - 1) // part_num
+    for part_id in range(part_num):
+      part_embed = np.zeros([embed_part_size, embed.shape[1]], np.float32)
+      part_rows = embed[part_id::part_num]
+      part_embed[:len(part_rows)] = part_rows
+      with open(
+          self._ckpt_path + '-embedding/embed-%s-part-%d.bin' %
+          (self._file_var_name, part_id), 'wb') as fout:
+        fout.write(part_embed.tobytes())
+    embedding_parallel_saver._write_embed_index(
+        self._ckpt_path, self._file_var_name, {
+            'part_num': part_num,
+            'embed_dim': embed.shape[1],
+            'part_rows': [embed_part_size] * part_num
+        })
+
+  def test_load_dense_embed(self):
+    embed_dim = 5
+    embed = np.random.uniform(size=[37, embed_dim]).astype(np.float32)
+    self.assertFalse(
+        embedding_parallel_saver._has_embed_index(
+            self._ckpt_path.encode('utf-8'), self._var_name.encode('utf-8')))
+    for saved_part_num in [1, 3, 4]:
+      self._save_dense(embed, saved_part_num)
+      self.assertTrue(
+          embedding_parallel_saver._has_embed_index(
+              self._ckpt_path.encode('utf-8'), self._var_name.encode('utf-8')))
+      for part_num in [1, 2, 3, 4, 6]:
+        embed_part_size = (len(embed) + part_num - 1) // part_num
+        for part_id in range(part_num):
+          part_embed = embedding_parallel_saver._load_indexed_dense_embed(
+              self._ckpt_path.encode('utf-8'), self._var_name.encode('utf-8'),
+              embed_dim, embed_part_size, part_id, part_num)
+          expect_embed = np.zeros([embed_part_size, embed_dim], np.float32)
+          part_rows = embed[part_id::part_num]
+          expect_embed[:len(part_rows)] = part_rows
+          self.assertAllEqual(part_embed, expect_embed)
+
+  def test_load_kv_embed(self):
+    embed_dim = 4
+    num_buckets = 8
+    keys = np.random.choice(10000, size=300, replace=False).astype(np.int64)
+    vals = np.random.uniform(size=[300, embed_dim]).astype(np.float32)
+    saved_part_num = 3
+    for part_id in range(saved_part_num):
+      part_keys, part_vals, bucket_offsets = \
+          embedding_parallel_saver._group_by_bucket(
+              keys[part_id::saved_part_num], vals[part_id::saved_part_num],
+              num_buckets)
+      part_prefix = self._ckpt_path + '-embedding/embed-%s-part-%d' % (
+          self._file_var_name, part_id)
+      for suffix, arr in [('.key', part_keys), ('.val', part_vals),
+                          ('.bucket', bucket_offsets)]:
+        with open(part_prefix + suffix, 'wb') as fout:
+          fout.write(arr.tobytes())
+    embedding_parallel_saver._write_embed_index(
+        self._ckpt_path, self._file_var_name, {
+            'part_num': saved_part_num,
+            'embed_dim': embed_dim,
+            'key_dtype': 'int64',
+            'num_buckets': num_buckets
+        })
+
+    key_to_val = dict(zip(keys, vals))
+    # 2 and 4 divide num_buckets, 3 does not
+    for part_num in [2, 3, 4]:
+      all_keys = []
+      for part_id in range(part_num):
+        part_keys, part_vals = embedding_parallel_saver._load_indexed_kv_embed(
+            self._ckpt_path.encode('utf-8'), self._var_name.encode('utf-8'),
+            embed_dim, part_id, part_num)
+        self.assertTrue(np.all(part_keys % part_num == part_id))
+        for key, val in zip(part_keys, part_vals):
+          self.assertAllEqual(val, key_to_val[key])
+        all_keys.extend(part_keys)
+      self.assertAllEqual(sorted(all_keys), sorted(keys))
+
+  def test_read_rows_remote(self):
+    # ranged reads are used for non local paths
+    embed = np.random.uniform(size=[1000, 3]).astype(np.float32)
+    embed_file = os.path.join(self._test_dir, 'embed.bin')
+    with open(embed_file, 'wb') as fout:
+      fout.write(embed.tobytes())
+    row_ids = np.concatenate([np.arange(5, 20, 3), np.arange(900, 1000)])
+    remote_file = 'file://' + os.path.abspath(embed_file)
+    max_span_bytes = embedding_parallel_saver._MAX_READ_SPAN_BYTES
+    try:
+      for max_span in [max_span_bytes, 24]:
+        embedding_parallel_saver._MAX_READ_SPAN_BYTES = max_span
+        rows = embedding_parallel_saver._read_rows(remote_file, np.float32, 3,
+                                                   row_ids)
+        self.assertAllEqual(rows, embed[row_ids])
+    finally:
+      embedding_parallel_saver._MAX_READ_SPAN_BYTES = max_span_bytes
+    rows = embedding_parallel_saver._read_rows(embed_file, np.float32, 3,
+                                               row_ids)
+    self.assertAllEqual(rows, embed[row_ids])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,185 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.ops import lookup_ops
+
+from easy_rec.python.inference.predictor import PredictorImpl
+from easy_rec.python.protos.export_pb2 import EmbeddingQuantization
+from easy_rec.python.utils import embedding_quantization as eq
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class EmbeddingQuantizationTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    self._table = rng.normal(scale=0.1, size=[100, 10]).astype(np.float32)
+    # constant rows and large values
+    self._table[3] = 0.25
+    self._table[7, :2] = [1e5, -1e5]
+
+  def test_pack_unpack(self):
+    for precision, max_err in [(eq.FP16, 1e-3), (eq.INT8, 2e-3)]:
+      codes, scale, offset = eq.quantize(self._table, precision)
+      expected = eq.dequantize(codes, scale, offset)
+      packed = eq.pack(self._table, precision)
+      self.assertEqual(packed.shape, (100, eq.packed_dim(10, precision)))
+      self.assertTrue(np.all(packed < 2**24))
+      self.assertAllEqual(eq.unpack(packed, precision, 10), expected)
+      self.assertAllEqual(expected[3], self._table[3])
+      rows = np.arange(100) != 7
+      self.assertLess(
+          np.max(np.abs(expected[rows] - self._table[rows])), max_err)
+      with tf.Graph().as_default():
+        table = tf.constant(self._table)
+        packed_tensor = eq.pack_tensor(table, precision)
+        with tf.Session() as sess:
+          packed_res, unpacked_res, fake_res = sess.run([
+              packed_tensor,
+              eq.unpack_tensor(packed_tensor, precision, 10),
+              eq.fake_quantize_tensor(table, precision)
+          ])
+      self.assertAllEqual(packed_res, packed)
+      self.assertAllEqual(unpacked_res, expected)
+      self.assertAllClose(fake_res, expected)
+    # fp16: 20 bytes => 7 words, int8: 10 + 8 bytes => 6 words
+    self.assertEqual(eq.packed_dim(10, eq.FP16), 7)
+    self.assertEqual(eq.packed_dim(10, eq.INT8), 6)
+
+  def test_packed_lookup(self):
+    indices = np.array([[0, 0], [0, 1], [0, 2], [2, 0], [3, 0], [3, 1]],
+                       dtype=np.int64)
+    ids = np.array([5, 9, 5, 0, 9, 99], dtype=np.int64)
+    weights = np.array([1.0, 0.5, 2.0, 3.0, 1.0, 0.1], dtype=np.float32)
+    dense_shape = np.array([5, 3], dtype=np.int64)
+    for precision in [eq.FP16, eq.INT8]:
+      for combiner in ['sum', 'mean', 'sqrtn']:
+        with tf.Graph().as_default():
+          packed_table = tf.constant(eq.pack(self._table, precision))
+          lookup_indices, lookup_ids, lookup_shape, unique_idx = \
+              eq.packed_lookup_inputs(tf.constant(ids))
+          # the kv lookup sums the packed rows of each bag
+          packed_rows = tf.nn.embedding_lookup_sparse(
+              packed_table,
+              tf.SparseTensor(lookup_indices, lookup_ids, lookup_shape),
+              None,
+              combiner='sum')
+          outputs = eq.combine_packed_rows(packed_rows, unique_idx,
+                                           indices, dense_shape,
+                                           tf.constant(weights), combiner,
+                                           precision, 10)
+          table = tf.constant(
+              eq.dequantize(*eq.quantize(self._table, precision)))
+          expected = tf.nn.safe_embedding_lookup_sparse(
+              [table],
+              tf.SparseTensor(indices, ids, dense_shape),
+              tf.SparseTensor(indices, weights, dense_shape),
+              combiner=combiner)
+          with tf.Session() as sess:
+            outputs, expected = sess.run([outputs, expected])
+        self.assertEqual(outputs.shape, (5, 10))
+        self.assertAllClose(outputs, expected, atol=1e-6)
+        self.assertAllEqual(outputs[1], np.zeros([10]))
+
+  def _build_saved_model(self, export_dir):
+    with tf.Graph().as_default():
+      item_id = tf.placeholder(tf.string, [None], name='input_1')
+      user_id = tf.placeholder(tf.int64, [None], name='input_2')
+      table = lookup_ops.index_table_from_tensor(['a', 'b', 'c'],
+                                                 num_oov_buckets=1)
+      item_emb = tf.get_variable(
+          'input_layer/item_id_embedding/embedding_weights', [1000, 16])
+      user_emb = tf.get_variable(
+          'input_layer/user_id_embedding/embedding_weights', [1000, 16])
+      item_net = tf.nn.embedding_lookup(item_emb, table.lookup(item_id))
+      user_net = tf.nn.embedding_lookup(user_emb, user_id)
+      net = tf.concat([item_net, user_net], axis=1)
+      logits = tf.layers.dense(tf.layers.dense(net, 8, tf.nn.relu), 1)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+        signature = tf.saved_model.signature_def_utils.predict_signature_def(
+            inputs={
+                'item_id': item_id,
+                'user_id': user_id
+            },
+            outputs={'logits': logits})
+        builder.add_meta_graph_and_variables(
+            sess, [tf.saved_model.tag_constants.SERVING],
+            signature_def_map={'serving_default': signature},
+            main_op=tf.tables_initializer())
+        builder.save()
+
+  def test_quantize_saved_model(self):
+    test_dir = tempfile.mkdtemp(prefix='embedding_quantization_test_')
+    export_dir = os.path.join(test_dir, 'export')
+    self._build_saved_model(export_dir)
+    inputs = {
+        'item_id': np.array(['a', 'c', 'x', 'b'], dtype=np.object_),
+        'user_id': np.array([1, 10, 100, 999], dtype=np.int64)
+    }
+    expected = PredictorImpl(export_dir).predict(inputs)['logits']
+
+    quantization_config = EmbeddingQuantization(precision=eq.INT8)
+    quantization_config.embedding_precisions.add(
+        embedding_name='item_id_embedding', precision=eq.FP16)
+    quantized, max_diff = eq.quantize_saved_model(export_dir,
+                                                  quantization_config)
+    self.assertEqual(
+        quantized, {
+            'input_layer/item_id_embedding': (eq.FP16, 64000, 32000),
+            'input_layer/user_id_embedding': (eq.INT8, 64000, 24000)
+        })
+    self.assertLess(max_diff, 1e-2)
+    variables = dict(
+        tf.train.list_variables(
+            os.path.join(export_dir, 'variables', 'variables')))
+    self.assertNotIn('input_layer/user_id_embedding/embedding_weights',
+                     variables)
+    self.assertEqual(
+        variables[
+            'input_layer/user_id_embedding/embedding_weights/quantized_codes'],
+        [1000, 16])
+    self.assertIn(
+        'input_layer/user_id_embedding/embedding_weights/quantized_scale',
+        variables)
+    self.assertEqual(
+        sorted(os.listdir(export_dir)), ['saved_model.pb', 'variables'])
+    outputs = PredictorImpl(export_dir).predict(inputs)['logits']
+    self.assertAllClose(outputs, expected, atol=1e-2)
+    shutil.rmtree(test_dir)
+
+  def test_quantize_saved_model_max_output_diff(self):
+    test_dir = tempfile.mkdtemp(prefix='embedding_quantization_test_')
+    export_dir = os.path.join(test_dir, 'export')
+    self._build_saved_model(export_dir)
+    with open(os.path.join(export_dir, 'saved_model.pb'), 'rb') as fin:
+      saved_model = fin.read()
+    quantization_config = EmbeddingQuantization(
+        precision=eq.INT8, max_output_diff=1e-9)
+    quantized, max_diff = eq.quantize_saved_model(export_dir,
+                                                  quantization_config)
+    self.assertEqual(quantized, {})
+    self.assertGreater(max_diff, 1e-9)
+    # the float model is kept
+    with open(os.path.join(export_dir, 'saved_model.pb'), 'rb') as fin:
+      self.assertEqual(fin.read(), saved_model)
+    variables = dict(
+        tf.train.list_variables(
+            os.path.join(export_dir, 'variables', 'variables')))
+    self.assertIn('input_layer/user_id_embedding/embedding_weights', variables)
+    self.assertEqual(
+        sorted(os.listdir(export_dir)), ['saved_model.pb', 'variables'])
+    self.assertFalse(os.path.exists(export_dir + '_quantized'))
+    shutil.rmtree(test_dir)
+
+
+if __name__ == '__main__':
+  tf.test.main()
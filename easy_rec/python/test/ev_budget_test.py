@@ -0,0 +1,260 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.protos.train_pb2 import IncrementSaveConfig
+from easy_rec.python.utils import constant
+from easy_rec.python.utils import estimator_utils
+from easy_rec.python.utils import ev_budget
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+def _zipf_stream(num_batches, batch_size, vocab_size, seed=0):
+  rng = np.random.RandomState(seed)
+  for _ in range(num_batches):
+    keys = rng.zipf(1.2, size=batch_size)
+    yield np.where(keys > vocab_size, keys % vocab_size, keys).astype(np.int64)
+
+
+def _auc(labels, preds):
+  order = np.argsort(preds, kind='stable')
+  ranks = np.empty([len(preds)], dtype=np.float64)
+  ranks[order] = np.arange(1, len(preds) + 1)
+  num_pos = np.sum(labels)
+  num_neg = len(labels) - num_pos
+  return (np.sum(ranks[labels == 1]) - num_pos * (num_pos + 1) / 2.0) / (
+      num_pos * num_neg)
+
+
+class EVBudgetTest(tf.test.TestCase):
+
+  def test_count_min_sketch(self):
+    sketch = ev_budget.CountMinSketch(4096, depth=4)
+    self.assertEqual(sketch.width, 4096)
+    counts = {}
+    for keys in _zipf_stream(20, 1000, 100000):
+      uniq_keys, key_counts = np.unique(keys, return_counts=True)
+      sketch.add(uniq_keys, key_counts)
+      for k, c in zip(uniq_keys.tolist(), key_counts.tolist()):
+        counts[k] = counts.get(k, 0) + c
+    keys = np.array(list(counts.keys()), dtype=np.int64)
+    true_counts = np.array([counts[k] for k in keys.tolist()])
+    estimates = sketch.estimate(keys)
+    self.assertTrue(np.all(estimates >= true_counts))
+    # the heavy hitters are estimated accurately
+    top = np.argsort(-true_counts)[:20]
+    self.assertAllClose(
+        estimates[top] / true_counts[top], np.ones([20]), atol=0.05)
+    sketch.decay()
+    self.assertTrue(np.all(sketch.estimate(keys) <= estimates // 2))
+
+  def test_evicted_keys_not_recorded(self):
+    # without a consumer, the evicted keys are not kept
+    key_budget = ev_budget.KeyBudget(max_rows=100)
+    table_id = key_budget.register_table('user_id', 8)
+    for keys in _zipf_stream(20, 256, 10000):
+      key_budget.update(table_id, keys)
+    self.assertLessEqual(key_budget.num_rows, 100)
+    self.assertEqual(key_budget._evicted_keys, [[]])
+    self.assertEqual(len(key_budget.pop_evicted_keys(table_id)), 0)
+
+  def test_memory_cap(self):
+    for evict_strategy in [ev_budget.EVICT_LFU, ev_budget.EVICT_LRU]:
+      key_budget = ev_budget.KeyBudget(
+          max_rows=500, evict_strategy=evict_strategy, evict_ratio=0.2)
+      table_id = key_budget.register_table('user_id', 8)
+      key_budget.record_evicted_keys()
+      counts = np.zeros([100001], dtype=np.int64)
+      evicted_keys = []
+      for keys in _zipf_stream(100, 256, 100000):
+        admitted = key_budget.update(table_id, keys)
+        self.assertLessEqual(key_budget.num_rows, 500)
+        self.assertEqual(key_budget.total_cost, key_budget.num_rows)
+        resident_keys = key_budget.resident_keys(table_id)
+        self.assertTrue(np.all(np.isin(keys[admitted], resident_keys)))
+        evicted_keys.append(key_budget.pop_evicted_keys(table_id))
+        self.assertFalse(np.any(np.isin(evicted_keys[-1], resident_keys)))
+        np.add.at(counts, keys, 1)
+      evicted_keys = np.concatenate(evicted_keys)
+      self.assertGreater(len(evicted_keys), 0)
+      # the most frequent keys are kept
+      top_keys = np.argsort(-counts)[:50]
+      self.assertGreater(
+          np.mean(np.isin(top_keys, key_budget.resident_keys(table_id))), 0.9)
+
+  def test_shared_bytes_budget(self):
+    key_budget = ev_budget.KeyBudget(max_bytes=20000)
+    table_a = key_budget.register_table('a', 8)
+    table_b = key_budget.register_table('b', 16)
+    self.assertEqual(key_budget.register_table('a', 8), table_a)
+    for keys in _zipf_stream(50, 128, 10000):
+      key_budget.update(table_a, keys)
+      key_budget.update(table_b, keys * 7)
+      self.assertLessEqual(key_budget.total_cost, 20000)
+    self.assertEqual(
+        key_budget.total_cost,
+        len(key_budget.resident_keys(table_a)) * 40 +
+        len(key_budget.resident_keys(table_b)) * 72)
+
+  def test_sketch_admission(self):
+    key_budget = ev_budget.KeyBudget(
+        filter_freq=3, admit_strategy=ev_budget.ADMIT_COUNT_MIN_SKETCH)
+    table_id = key_budget.register_table('item_id', 8)
+    self.assertAllEqual(
+        key_budget.update(table_id, [1, 2, 2, 3, 3, 3]),
+        [False, False, False, True, True, True])
+    self.assertAllEqual(
+        key_budget.update(table_id, [1, 2, 3]), [False, True, True])
+    # without budget, admitted keys are not tracked
+    self.assertEqual(key_budget.num_rows, 0)
+
+  def test_auc_impact(self):
+    vocab_size = 50000
+    rng = np.random.RandomState(2)
+    true_weights = rng.normal(size=[vocab_size + 1]) * 2
+
+    def _batches(num_batches, seed):
+      for keys in _zipf_stream(num_batches, 1000, vocab_size, seed):
+        probs = 1.0 / (1.0 + np.exp(-true_weights[keys]))
+        yield keys, (rng.uniform(size=len(keys)) < probs).astype(np.int64)
+
+    def _train_eval(key_budget):
+      table_id = None
+      if key_budget is not None:
+        table_id = key_budget.register_table('item_id', 1)
+        key_budget.record_evicted_keys()
+      weights = np.zeros([vocab_size + 1])
+      for keys, labels in _batches(200, seed=3):
+        admitted = np.ones([len(keys)], dtype=bool)
+        if key_budget is not None:
+          admitted = key_budget.update(table_id, keys)
+          # evicted rows are deleted, and restart from zeros if admitted
+          weights[key_budget.pop_evicted_keys(table_id)] = 0
+        probs = 1.0 / (1.0 + np.exp(-weights[keys]))
+        np.add.at(weights, keys[admitted], 0.5 * (labels - probs)[admitted])
+      eval_keys, eval_labels = next(_batches(1, seed=4))
+      if key_budget is not None:
+        resident = np.isin(eval_keys, key_budget.resident_keys(table_id))
+        weights[eval_keys[~resident]] = 0
+      return _auc(eval_labels, weights[eval_keys])
+
+    full_auc = _train_eval(None)
+    key_budget = ev_budget.KeyBudget(
+        max_rows=4000,
+        filter_freq=2,
+        admit_strategy=ev_budget.ADMIT_COUNT_MIN_SKETCH)
+    budget_auc = _train_eval(key_budget)
+    logging.info('auc without budget: %.4f, auc with budget: %.4f' %
+                 (full_auc, budget_auc))
+    self.assertLessEqual(key_budget.num_rows, 4000)
+    self.assertGreater(full_auc, 0.7)
+    self.assertGreater(budget_auc, full_auc - 0.03)
+
+  def test_filter_sparse_ids(self):
+    with tf.Graph().as_default():
+      key_budget = ev_budget.KeyBudget(
+          filter_freq=2, admit_strategy=ev_budget.ADMIT_COUNT_MIN_SKETCH)
+      with tf.variable_scope('input_layer/item_id_embedding'):
+        embedding_weights = tf.get_variable('embedding_weights', [100, 4])
+      sparse_ids = tf.SparseTensor(
+          indices=[[0, 0], [0, 1], [1, 0], [2, 0]],
+          values=tf.constant([5, 7, 5, 9], dtype=tf.int64),
+          dense_shape=[3, 2])
+      sparse_weights = tf.SparseTensor(
+          indices=sparse_ids.indices,
+          values=[1.0, 2.0, 3.0, 4.0],
+          dense_shape=sparse_ids.dense_shape)
+      filter_ids, filter_weights = ev_budget.filter_sparse_ids(
+          key_budget, embedding_weights, 4, sparse_ids, sparse_weights)
+      self.assertEqual(key_budget.table_names,
+                       ['input_layer/item_id_embedding'])
+      self.assertEqual(tf.get_collection(ev_budget.KEY_BUDGETS), [key_budget])
+      ragged_ids = tf.RaggedTensor.from_row_lengths(
+          tf.constant([5, 7, 7, 11], dtype=tf.int64), [2, 1, 1])
+      filter_ragged_ids, _ = ev_budget.filter_sparse_ids(
+          key_budget, embedding_weights, 4, ragged_ids, None)
+      with self.test_session() as sess:
+        ids, weights = sess.run([filter_ids, filter_weights])
+        self.assertAllEqual(ids.values, [5, 5])
+        self.assertAllEqual(ids.indices, [[0, 0], [1, 0]])
+        self.assertAllEqual(ids.dense_shape, [3, 2])
+        self.assertAllEqual(weights.values, [1.0, 3.0])
+        self.assertEqual(
+            sess.run(filter_ragged_ids).to_list(), [[5, 7], [7], []])
+
+  def test_evicted_keys_hook(self):
+    test_dir = tempfile.mkdtemp(prefix='ev_budget_test_')
+    tf_config = os.environ.get('TF_CONFIG')
+    # the evicted keys are sent by the workers as well as the chief
+    os.environ['TF_CONFIG'] = json.dumps({
+        'cluster': {
+            'chief': ['localhost:2221'],
+            'worker': ['localhost:2222']
+        },
+        'task': {
+            'type': 'worker',
+            'index': 0
+        }
+    })
+    try:
+      with tf.Graph().as_default():
+        global_step = tf.train.get_or_create_global_step()
+        key_budget = ev_budget.KeyBudget(max_rows=50)
+        with tf.variable_scope('input_layer/user_id_embedding'):
+          embedding_weights = tf.get_variable('embedding_weights', [1000, 4])
+        tf.add_to_collection(constant.SPARSE_UPDATE_VARIABLES,
+                             (embedding_weights, tf.int64))
+        ids = tf.random.uniform([64], maxval=1000, dtype=tf.int64)
+        sparse_ids = tf.SparseTensor(
+            tf.stack([tf.range(64, dtype=tf.int64),
+                      tf.zeros([64], tf.int64)],
+                     axis=1), ids, [64, 1])
+        filter_ids, _ = ev_budget.filter_sparse_ids(key_budget,
+                                                    embedding_weights, 4,
+                                                    sparse_ids, None)
+        train_op = tf.group(
+            tf.assign_add(global_step, 1), tf.size(filter_ids.values))
+        incr_save_config = IncrementSaveConfig(sparse_save_steps=5)
+        incr_save_config.fs.incr_save_dir = 'incr_save'
+        hook = estimator_utils.EvictedKeysHook(test_dir, incr_save_config)
+        with tf.train.SingularMonitoredSession(hooks=[hook]) as sess:
+          for _ in range(20):
+            sess.run(train_op)
+      save_paths = sorted(
+          glob.glob(os.path.join(test_dir, 'incr_save', 'sparse_evict_*')))
+      save_paths = [x for x in save_paths if not x.endswith('.done')]
+      self.assertGreater(len(save_paths), 1)
+      num_keys = 0
+      for save_path in save_paths:
+        # the task index of the worker is 1
+        self.assertTrue(save_path.endswith('_1'))
+        with open(save_path, 'rb') as fin:
+          buf = fin.read()
+        header = np.frombuffer(buf[:20], dtype=np.int32)
+        self.assertAllEqual(header[[0, 1, 3]], [2, 1, 0])
+        keys = np.frombuffer(buf[20:], dtype=np.int64)
+        self.assertEqual(len(keys), header[4])
+        num_keys += len(keys)
+      # all the evicted keys are sent and drained
+      self.assertGreater(num_keys, 0)
+      self.assertEqual(len(key_budget.pop_evicted_keys(0)), 0)
+    finally:
+      if tf_config is None:
+        del os.environ['TF_CONFIG']
+      else:
+        os.environ['TF_CONFIG'] = tf_config
+      shutil.rmtree(test_dir)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,122 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import glob
+import logging
+import os
+import struct
+import threading
+
+import tensorflow as tf
+from tensorflow.core.framework import summary_pb2
+from tensorflow.core.util import event_pb2
+
+from easy_rec.python.utils import test_utils
+from easy_rec.python.utils.eval_metrics_index import SIDECAR_FILE_NAME
+from easy_rec.python.utils.eval_metrics_index import EvalMetricsIndex
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class EvalMetricsIndexTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def _write_summary(self, writer, step, **metrics):
+    values = [
+        summary_pb2.Summary.Value(tag=k, simple_value=v)
+        for k, v in metrics.items()
+    ]
+    writer.add_summary(summary_pb2.Summary(value=values), step)
+    writer.flush()
+
+  def test_eval_metrics_index(self):
+    with tf.Graph().as_default():
+      writer = tf.summary.FileWriter(self._test_dir)
+    self._write_summary(writer, 100, auc=0.75, loss=0.5)
+    index = EvalMetricsIndex(self._test_dir)
+    self.assertEqual(index.update(), 2)
+    self.assertEqual(index.eval_metrics(), {100: {'auc': 0.75, 'loss': 0.5}})
+    self.assertEqual(index.update(), 0)
+
+    # only the new events are read
+    self._write_summary(writer, 200, auc=0.7, loss=0.4)
+    self.assertEqual(index.update(), 1)
+    self.assertEqual(list(index.eval_metrics().keys()), [100, 200])
+    self.assertAllClose(index.eval_metrics()[200]['auc'], 0.7)
+
+    # the record being written is read in the next update
+    event_path = glob.glob(os.path.join(self._test_dir, '*.tfevents.*'))[0]
+    with open(event_path, 'rb') as fin:
+      data = fin.read()
+    writer.close()
+    event = event_pb2.Event(step=300)
+    event.summary.value.add(tag='auc', simple_value=0.8)
+    with open(event_path, 'ab') as fout:
+      fout.write(self._record(event.SerializeToString())[:10])
+    self.assertEqual(index.update(), 0)
+    with open(event_path, 'wb') as fout:
+      fout.write(data + self._record(event.SerializeToString()))
+    self.assertEqual(index.update(), 1)
+    self.assertAllClose(index.eval_metrics()[300]['auc'], 0.8)
+
+    # restored from the sidecar file
+    self.assertTrue(
+        os.path.exists(os.path.join(self._test_dir, SIDECAR_FILE_NAME)))
+    new_index = EvalMetricsIndex(self._test_dir)
+    self.assertEqual(new_index.update(), 0)
+    self.assertEqual(new_index.eval_metrics(), index.eval_metrics())
+
+  def test_concurrent_sidecar_writers(self):
+    with tf.Graph().as_default():
+      writer = tf.summary.FileWriter(self._test_dir)
+    # a large sidecar file, which takes a while to write
+    for step in range(2000):
+      self._write_summary(writer, step, auc=0.75)
+    writer.close()
+    indices = [EvalMetricsIndex(self._test_dir) for _ in range(4)]
+    for index in indices:
+      index.update()
+
+    failures = []
+
+    class _FailureHandler(logging.Handler):
+
+      def emit(self, record):
+        if 'failed to save' in record.getMessage():
+          failures.append(record.getMessage())
+
+    def _write(index):
+      for _ in range(10):
+        index._write_sidecar()
+
+    handler = _FailureHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+      threads = [threading.Thread(target=_write, args=(x,)) for x in indices]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    finally:
+      logging.getLogger().removeHandler(handler)
+    # each writer renames its own tmp file
+    self.assertEqual(failures, [])
+    self.assertEqual(
+        glob.glob(os.path.join(self._test_dir, SIDECAR_FILE_NAME + '.tmp*')),
+        [])
+    new_index = EvalMetricsIndex(self._test_dir)
+    self.assertEqual(new_index.update(), 0)
+    self.assertEqual(len(new_index.eval_metrics()), 2000)
+
+  def _record(self, data):
+    # the crcs are not checked by the index
+    return struct.pack('<Q', len(data)) + b'\0' * 4 + data + b'\0' * 4
+
+
+if __name__ == '__main__':
+  tf.test.main()
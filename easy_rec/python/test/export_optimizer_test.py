@@ -0,0 +1,152 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import collections
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.core.framework import types_pb2
+from tensorflow.core.protobuf import saved_model_pb2
+from tensorflow.python.ops import lookup_ops
+
+from easy_rec.python.inference.predictor import PredictorImpl
+from easy_rec.python.protos.export_pb2 import GraphOptimization
+from easy_rec.python.utils import export_optimizer
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class ExportOptimizerTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = tempfile.mkdtemp(prefix='export_optimizer_test_')
+    self._export_dir = os.path.join(self._test_dir, 'export')
+    self._export_model(self._export_dir)
+    self._inputs = {
+        'item_id': np.array(['1', '3', '5', '7', '9', 'x'], dtype=np.object_),
+        'price': np.array([0.1, 0.5, 1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+    }
+    self._expected = PredictorImpl(self._export_dir).predict(self._inputs)
+
+  def tearDown(self):
+    shutil.rmtree(self._test_dir)
+
+  def _export_model(self, export_dir):
+    with tf.Graph().as_default():
+      item_id = tf.placeholder(tf.string, [None], name='input_1')
+      price = tf.placeholder(tf.float32, [None], name='input_2')
+      # not a serving input, folded as a constant
+      price_scale = tf.placeholder_with_default(0.1, [], name='price_scale')
+      vocab = [str(x) for x in range(10)]
+      table = lookup_ops.index_table_from_tensor(vocab, default_value=0)
+      embedding = tf.get_variable('item_id_embedding', [1000, 8])
+      item_emb = tf.nn.embedding_lookup(embedding, table.lookup(item_id))
+      net = tf.concat([item_emb, price[:, None] * price_scale], axis=1)
+      stat_initializer = tf.random_uniform_initializer(0.5, 1.5)
+      for units in [16, 8]:
+        net = tf.layers.dense(net, units)
+        net = tf.layers.batch_normalization(
+            net,
+            training=False,
+            gamma_initializer=stat_initializer,
+            beta_initializer=stat_initializer,
+            moving_mean_initializer=stat_initializer,
+            moving_variance_initializer=stat_initializer)
+        net = tf.nn.relu(net)
+        net = tf.layers.dropout(net, 0.5, training=False)
+      logits = tf.squeeze(
+          tf.layers.dense(net, 1, bias_initializer=stat_initializer), axis=1)
+      # unused in serving
+      tf.summary.scalar('logits', tf.reduce_mean(logits))
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+        signature = tf.saved_model.signature_def_utils.predict_signature_def(
+            inputs={
+                'item_id': item_id,
+                'price': price
+            },
+            outputs={
+                'logits': logits,
+                'probs': tf.sigmoid(logits)
+            })
+        builder.add_meta_graph_and_variables(
+            sess, [tf.saved_model.tag_constants.SERVING],
+            signature_def_map={'serving_default': signature},
+            main_op=tf.tables_initializer())
+        builder.save()
+
+  def _load_graph_def(self):
+    saved_model = saved_model_pb2.SavedModel()
+    with open(os.path.join(self._export_dir, 'saved_model.pb'), 'rb') as fin:
+      saved_model.ParseFromString(fin.read())
+    return saved_model.meta_graphs[0].graph_def
+
+  def test_optimize_saved_model(self):
+    report = export_optimizer.optimize_saved_model(
+        self._export_dir,
+        GraphOptimization(max_freeze_size=256, prehash_vocab=True))
+    self.assertTrue(report['parity'])
+    self.assertLess(report['num_nodes_after'], report['num_nodes_before'])
+    self.assertGreater(report['latency_before'], 0)
+    self.assertGreater(report['latency_after'], 0)
+
+    graph_def = self._load_graph_def()
+    op_counts = collections.Counter([node.op for node in graph_def.node])
+    # dense + batch_norm + relu are fused into one op
+    self.assertEqual(op_counts['_FusedMatMul'], 3)
+    self.assertEqual(op_counts['MatMul'], 0)
+    self.assertEqual(op_counts['Rsqrt'], 0)
+    self.assertEqual(op_counts['ScalarSummary'], 0)
+    # the embedding is not frozen
+    self.assertEqual(op_counts['ResourceGather'], 1)
+    tables = [node for node in graph_def.node if node.op == 'HashTableV2']
+    self.assertEqual(len(tables), 1)
+    self.assertEqual(tables[0].attr['key_dtype'].type, types_pb2.DT_INT64)
+
+    outputs = PredictorImpl(self._export_dir).predict(self._inputs)
+    for name in ['logits', 'probs']:
+      self.assertAllClose(outputs[name], self._expected[name], atol=1e-5)
+
+  def test_parity_failure(self):
+    graph_def = self._load_graph_def()
+    report = export_optimizer.optimize_saved_model(
+        self._export_dir, GraphOptimization(parity_tolerance=-1.0))
+    self.assertFalse(report['parity'])
+    # the exported model is kept unchanged
+    self.assertEqual(self._load_graph_def(), graph_def)
+    self.assertFalse(os.path.exists(self._export_dir + '_optimized'))
+
+  def test_optimization_failure(self):
+    export_dir = os.path.join(self._test_dir, 'export_features')
+    with tf.Graph().as_default():
+      # the inputs are joined in one string, but there is no input_reshape
+      # to get the number of input fields, so the check inputs could not
+      # be generated
+      features = tf.placeholder(tf.string, [None], name='features')
+      with tf.Session() as sess:
+        builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+        signature = tf.saved_model.signature_def_utils.predict_signature_def(
+            inputs={'features': features},
+            outputs={'length': tf.strings.length(features)})
+        builder.add_meta_graph_and_variables(
+            sess, [tf.saved_model.tag_constants.SERVING],
+            signature_def_map={'serving_default': signature})
+        builder.save()
+    with open(os.path.join(export_dir, 'saved_model.pb'), 'rb') as fin:
+      saved_model_bytes = fin.read()
+    report = export_optimizer.optimize_saved_model(export_dir,
+                                                   GraphOptimization())
+    self.assertFalse(report['parity'])
+    self.assertIn('number of input fields', report['error'])
+    # the exported model is kept unchanged
+    with open(os.path.join(export_dir, 'saved_model.pb'), 'rb') as fin:
+      self.assertEqual(fin.read(), saved_model_bytes)
+    self.assertFalse(os.path.exists(export_dir + '_optimized'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -163,6 +163,79 @@ class ExportTest(tf.test.TestCase):
         extract_data_func=self._extract_data,
         keys=['probs', 'logits', 'probs_y', 'logits_y', 'y'])
 
+  @RunAsSubprocess
+  def _predict_user_items_and_check(self,
+                                    data_path,
+                                    share_export_dir,
+                                    base_export_dir,
+                                    input_names,
+                                    tol=1e-5):
+    share_predictor = Predictor(share_export_dir)
+    base_predictor = Predictor(base_export_dir)
+    user_input_names = share_predictor._predictor_impl.user_input_names
+    assert len(user_input_names) > 0, 'user side inputs are not exported'
+    with open(data_path, 'r') as fin:
+      inputs = []
+      for line_str in fin:
+        line_toks = line_str.strip().split(',')
+        inputs.append(dict(zip(input_names, line_toks)))
+    user_data = {k: inputs[0][k] for k in user_input_names}
+    item_data_list = [{k: v
+                       for k, v in x.items()
+                       if k not in user_input_names}
+                      for x in inputs[:200]]
+    share_res = share_predictor.predict_user_items(
+        user_data, item_data_list, batch_size=64)
+    base_res = base_predictor.predict(
+        [dict(x, **user_data) for x in item_data_list], batch_size=64)
+    for val0, val1 in zip(share_res, base_res):
+      diff = np.abs(val0['probs'] - val1['probs'])
+      assert diff < tol, 'too much difference: %.6f, tol=%.6f' % (diff, tol)
+
+  def test_share_user_side(self):
+    test_dir = test_utils.get_tmp_dir()
+    logging.info('test dir: %s' % test_dir)
+    pipeline_config_path = 'samples/model_config/din_on_taobao.config'
+    self.assertTrue(
+        test_utils.test_single_train_eval(
+            pipeline_config_path, test_dir=test_dir))
+    test_utils.set_gpu_id(None)
+
+    config_path = os.path.join(test_dir, 'pipeline.config')
+    pipeline_config = config_util.get_configs_from_pipeline_file(config_path)
+    pipeline_config.export_config.multi_placeholder = True
+    config_util.save_pipeline_config(pipeline_config, test_dir,
+                                     'pipeline_base.config')
+    pipeline_config.export_config.user_feature_groups.append('user')
+    pipeline_config.export_config.user_input_names.extend(
+        ['tag_category_list', 'tag_brand_list'])
+    config_util.save_pipeline_config(pipeline_config, test_dir,
+                                     'pipeline_share.config')
+
+    export_dirs = {}
+    for name in ['base', 'share']:
+      export_dir = os.path.join(test_dir, 'export_%s/' % name)
+      export_cmd = """
+        python -m easy_rec.python.export
+          --pipeline_config_path %s
+          --export_dir %s
+      """ % (os.path.join(test_dir, 'pipeline_%s.config' % name), export_dir)
+      proc = test_utils.run_cmd(export_cmd,
+                                '%s/log_export_%s.txt' % (test_dir, name))
+      proc.wait()
+      self.assertTrue(proc.returncode == 0)
+      export_dirs[name] = gfile.Glob(export_dir + '[0-9][0-9][0-9]*')[0]
+
+    input_names = [
+        x.input_name for x in pipeline_config.data_config.input_fields
+    ][2:]
+    test_data_path = os.path.join(test_dir, 'pred_input_data')
+    self._extract_data(
+        pipeline_config.eval_input_path, test_data_path, offset=2)
+    self._predict_user_items_and_check(test_data_path, export_dirs['share'],
+                                       export_dirs['base'], input_names)
+    test_utils.clean_up(test_dir)
+
   def _export_test(self,
                    pipeline_config_path,
                    extract_data_func=None,
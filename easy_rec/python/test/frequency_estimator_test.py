@@ -0,0 +1,60 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.core.frequency_estimator import FrequencyEstimator
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class FrequencyEstimatorTest(tf.test.TestCase):
+
+  def test_frequency_estimator(self):
+    with tf.Graph().as_default():
+      item_ids = tf.placeholder(tf.string, shape=[None])
+      global_step = tf.placeholder(tf.int64, shape=[])
+      estimator = FrequencyEstimator(num_buckets=1024, alpha=0.1)
+      log_prob = estimator.log_prob(item_ids, global_step)
+      update_op = estimator.update(item_ids, global_step)
+      with self.test_session() as sess:
+        sess.run(tf.global_variables_initializer())
+        # item a occurs every step, b every 4 steps, c every 10 steps
+        for step in range(1000):
+          batch = ['a']
+          if step % 4 == 0:
+            batch.append('b')
+          if step % 10 == 0:
+            batch.append('c')
+          sess.run(update_op, feed_dict={item_ids: batch, global_step: step})
+        probs = np.exp(
+            sess.run(
+                log_prob,
+                feed_dict={
+                    item_ids: ['a', 'b', 'c', 'd'],
+                    global_step: 1000
+                }))
+    # item d is not seen, which is estimated to occur once in 1001 steps
+    self.assertAllClose(probs, [1.0, 0.25, 0.1, 1.0 / 1001], atol=1e-3)
+    self.assertAllClose(probs[3], 1.0 / 1001)
+
+  def test_read_before_update(self):
+    with tf.Graph().as_default():
+      item_ids = tf.constant([1, 2, 2], dtype=tf.int64)
+      global_step = tf.placeholder(tf.int64, shape=[])
+      estimator = FrequencyEstimator(num_buckets=1024)
+      log_prob = estimator.log_prob(item_ids, global_step)
+      update_op = estimator.update(item_ids, global_step)
+      with self.test_session() as sess:
+        sess.run(tf.global_variables_initializer())
+        log_prob_val, _ = sess.run([log_prob, update_op],
+                                   feed_dict={global_step: 9})
+        # the items not seen are estimated to occur once in 10 steps
+        self.assertAllClose(log_prob_val, [-np.log(10.0)] * 3)
+        log_prob_val = sess.run(log_prob, feed_dict={global_step: 10})
+        self.assertAllClose(log_prob_val, [-np.log(10.0)] * 3)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -4,11 +4,18 @@
 import json
 import logging
 import os
+import random
 import time
 
 import numpy as np
 import tensorflow as tf
 
+from easy_rec.python.hpo.local_hpo import TRIAL_COMPLETED
+from easy_rec.python.hpo.local_hpo import TRIAL_PENDING
+from easy_rec.python.hpo.local_hpo import TRIAL_STOPPED
+from easy_rec.python.hpo.local_hpo import AshaScheduler
+from easy_rec.python.hpo.local_hpo import LocalHPO
+from easy_rec.python.hpo.local_hpo import sample_hyperparams
 from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import hpo_util
@@ -25,6 +32,74 @@ else:
   GPUOptions = tf.GPUOptions
   ConfigProto = tf.ConfigProto
 
+# a stub of train_eval which takes the same arguments, the auc of trial_k
+# is 1 / (k + 1), an eval summary is written every 10 steps, and the trained
+# steps are saved so that a relaunched trial continues from them.
+_STUB_TRIAL = """
+import argparse
+import json
+import os
+import sys
+import time
+
+import tensorflow as tf
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--pipeline_config_path', type=str)
+parser.add_argument('--model_dir', type=str)
+parser.add_argument('--edit_config_json', type=str)
+parser.add_argument('--continue_train', action='store_true')
+args, _ = parser.parse_known_args()
+
+tf.compat.v1.disable_eager_execution()
+num_steps = json.loads(args.edit_config_json)['train_config.num_steps']
+trial_id = int(os.path.basename(args.model_dir).split('_')[-1])
+step_path = os.path.join(args.model_dir, 'global_step')
+start_step = 0
+if args.continue_train and os.path.exists(step_path):
+  with open(step_path, 'r') as fin:
+    start_step = int(fin.read())
+print('start from global_step %d' % start_step)
+sys.stdout.flush()
+writer = tf.compat.v1.summary.FileWriter(
+    os.path.join(args.model_dir, 'eval_val'))
+for step in range(start_step + 10, num_steps + 1, 10):
+  time.sleep(1)
+  summary = tf.compat.v1.Summary(value=[
+      tf.compat.v1.Summary.Value(tag='auc', simple_value=1.0 / (trial_id + 1))
+  ])
+  writer.add_summary(summary, step)
+  writer.flush()
+  with open(step_path, 'w') as fout:
+    fout.write(str(step))
+writer.close()
+"""
+
+
+class _Interrupted(Exception):
+  pass
+
+
+class _StubLocalHPO(LocalHPO):
+  """Run the stub trials, and interrupt the search at interrupt_step."""
+
+  def __init__(self, stub_path, interrupt_step=None, **kwargs):
+    super(_StubLocalHPO, self).__init__(**kwargs)
+    self._stub_path = stub_path
+    self._interrupt_step = interrupt_step
+
+  def _trial_cmd(self, trial, worker_id):
+    cmd = super(_StubLocalHPO, self)._trial_cmd(trial, worker_id)
+    # replace "-m easy_rec.python.train_eval" with the stub
+    return [cmd[0], self._stub_path] + cmd[3:]
+
+  def _poll(self, trial):
+    super(_StubLocalHPO, self)._poll(trial)
+    global_step = trial.last_result[0]
+    if self._interrupt_step is not None and global_step is not None and \
+        global_step >= self._interrupt_step:
+      raise _Interrupted()
+
 
 class HPOTest(tf.test.TestCase):
 
@@ -230,6 +305,100 @@ class HPOTest(tf.test.TestCase):
     hpo_util.save_eval_metrics('data/test/hpo_test/', tmp_file, False)
     test_utils.clean_up(test_dir)
 
+  def test_sample_hyperparams(self):
+    with gfile.GFile('samples/hpo/hyperparams.json', 'r') as fin:
+      hyperparams = json.load(fin)
+    params = sample_hyperparams(hyperparams, random.Random(2020))
+    assert params['feature_config.features[:].embedding_dim'] in [
+        '16', '32', '48', '64', '80'
+    ]
+    with gfile.GFile('samples/hpo/search_space.json', 'r') as fin:
+      search_space = json.load(fin)
+    params = sample_hyperparams(search_space, random.Random(2020))
+    assert set(params.keys()) == set(search_space.keys())
+    reg = params['model_config.embedding_regularization']
+    assert reg >= 0.000001 and reg <= 0.0001
+    # the same seed samples the same params
+    assert params == sample_hyperparams(search_space, random.Random(2020))
+
+  def test_asha_scheduler(self):
+    scheduler = AshaScheduler(
+        min_steps=100, max_steps=1000, reduction_factor=3, mode='max')
+    assert scheduler.milestones == [100, 300, 900]
+    # not reached the first rung
+    assert not scheduler.on_result(0, 50, 0.5)
+    assert not scheduler.on_result(0, 100, 0.7)
+    assert not scheduler.on_result(1, 120, 0.8)
+    # worse than the top 1/3 at rung 100
+    assert scheduler.on_result(2, 100, 0.6)
+    assert not scheduler.on_result(3, 100, 0.9)
+    # metric is recorded once for each rung
+    assert not scheduler.on_result(3, 200, 0.1)
+    assert not scheduler.on_result(1, 300, 0.85)
+    assert scheduler.on_result(3, 300, 0.8)
+
+    scheduler = AshaScheduler(
+        min_steps=100, max_steps=1000, reduction_factor=2, mode='min')
+    assert not scheduler.on_result(0, 100, 0.5)
+    assert scheduler.on_result(1, 100, 0.6)
+    assert not scheduler.on_result(2, 100, 0.4)
+
+  def test_local_hpo(self):
+    test_dir = test_utils.get_tmp_dir()
+    stub_path = os.path.join(test_dir, 'stub_trial.py')
+    with open(stub_path, 'w') as fout:
+      fout.write(_STUB_TRIAL)
+    exp_dir = os.path.join(test_dir, 'exp')
+    hpo_args = dict(
+        config_path='samples/model_config/deepfm_combo_on_avazu_ctr.config',
+        hyperparams={'x': {
+            '_type': 'choice',
+            '_value': [16, 32]
+        }},
+        exp_dir=exp_dir,
+        max_parallel=1,
+        total_trial_num=3,
+        min_steps=10,
+        max_steps=40,
+        reduction_factor=2,
+        poll_interval=0.2)
+
+    # interrupt the search while trial_0 is running
+    local_hpo = _StubLocalHPO(stub_path, interrupt_step=20, **hpo_args)
+    with self.assertRaises(_Interrupted):
+      local_hpo.run()
+    trial = local_hpo._trials[0]
+    assert trial.proc.poll() is not None, 'trial_0 is not killed'
+    with open(os.path.join(exp_dir, 'trials.json'), 'r') as fin:
+      trials = json.load(fin)['trials']
+    assert len(trials) == 1
+
+    # resume the search, trial_0 continues from the trained steps
+    local_hpo = _StubLocalHPO(stub_path, **hpo_args)
+    assert local_hpo._trials[0].status == TRIAL_PENDING
+    best_trial = local_hpo.run()
+    with open(os.path.join(exp_dir, 'trial_0.log'), 'r') as fin:
+      start_steps = [
+          int(line.split()[-1])
+          for line in fin
+          if line.startswith('start from global_step')
+      ]
+    assert len(start_steps) == 2 and start_steps[0] == 0
+    assert start_steps[1] >= 10, 'trial_0 is not resumed'
+
+    with open(os.path.join(exp_dir, 'trials.json'), 'r') as fin:
+      trials = json.load(fin)['trials']
+    assert [x['status'] for x in trials
+            ] == [TRIAL_COMPLETED, TRIAL_STOPPED, TRIAL_STOPPED]
+    assert trials[0]['results'] == [[10, 1.0], [20, 1.0], [30, 1.0], [40, 1.0]]
+    # trial_1 and trial_2 are worse than trial_0 at the first rung
+    for trial_id in [1, 2]:
+      steps = [x[0] for x in trials[trial_id]['results']]
+      assert steps[-1] < 40, 'trial_%d is not stopped early' % trial_id
+      assert local_hpo._trials[trial_id].proc.poll() is not None
+    assert best_trial.trial_id == 0
+    test_utils.clean_up(test_dir)
+
 
 if __name__ == '__main__':
   tf.test.main()
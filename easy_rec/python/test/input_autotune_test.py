@@ -0,0 +1,124 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+from google.protobuf import text_format
+
+from easy_rec.python.input.csv_input import CSVInput
+from easy_rec.python.input.parquet_input import ParquetInput
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
+from easy_rec.python.utils import input_autotune
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class InputAutoTuneTest(tf.test.TestCase):
+
+  def _create_input(self, auto_tune_str):
+    data_config_str = """
+      input_fields {
+        input_name: 'label'
+        input_type: FLOAT
+      }
+      input_fields {
+        input_name: 'field[1-3]'
+        input_type: STRING
+      }
+      label_fields: 'label'
+      batch_size: 32
+      num_epochs: 10
+      prefetch_size: 32
+      auto_expand_input_fields: true
+      auto_tune {
+        %s
+      }
+    """ % auto_tune_str
+    feature_config_str = """
+      input_names: 'field1'
+      feature_type: IdFeature
+      embedding_dim: 32
+      hash_bucket_size: 2000
+    """
+    data_config = DatasetConfig()
+    text_format.Merge(data_config_str, data_config)
+    feature_config = FeatureConfig()
+    text_format.Merge(feature_config_str, feature_config)
+    return CSVInput(data_config, [feature_config], 'data/test/test.csv')
+
+  def _read_batches(self, train_input, num_batches):
+    with tf.Graph().as_default():
+      train_input_fn = train_input.create_input()
+      dataset = train_input_fn(mode=tf.estimator.ModeKeys.TRAIN)
+      iterator = dataset.make_initializable_iterator()
+      features, labels = iterator.get_next()
+      with tf.Session() as sess:
+        sess.run(iterator.initializer)
+        for _ in range(num_batches):
+          sess.run([features, labels])
+
+  def test_auto_tune(self):
+    train_input = self._create_input("""
+        num_profile_batches: 5
+        max_parallel_calls: 4
+        max_prefetch_size: 8
+    """)
+    origin_config = train_input._data_config
+    self._read_batches(train_input, 3)
+    tuned_config = train_input._data_config
+    self.assertIn(tuned_config.num_parallel_calls, [1, 2, 4])
+    self.assertIn(tuned_config.prefetch_size, [1, 2, 4, 8])
+    self.assertGreaterEqual(tuned_config.prefetch_size,
+                            tuned_config.num_parallel_calls)
+    self.assertEqual(train_input._prefetch_size, tuned_config.prefetch_size)
+    # the configured data_config is not changed
+    self.assertEqual(origin_config.num_parallel_calls, 8)
+    self.assertEqual(origin_config.prefetch_size, 32)
+
+  def test_auto_tune_adaptive(self):
+    train_input = self._create_input("""
+        num_profile_batches: 5
+        max_parallel_calls: 2
+        max_prefetch_size: 4
+        adaptive: true
+    """)
+    self._read_batches(train_input, 3)
+    self.assertEqual(train_input._prefetch_size, input_autotune.AUTOTUNE)
+
+  def test_not_tunable(self):
+    train_input = self._create_input('max_parallel_calls: 2')
+    train_input._data_config.input_type = DatasetConfig.KafkaInput
+    data_config = input_autotune.auto_tune(train_input)
+    self.assertIs(data_config, train_input._data_config)
+
+  def test_parquet_num_proc(self):
+    test_dir = tempfile.mkdtemp(prefix='input_autotune_test_')
+    for i in range(16):
+      open(os.path.join(test_dir, 'part_%d.parquet' % i), 'w').close()
+    input_path = os.path.join(test_dir, '*.parquet')
+    train_input = self._create_input('')
+    train_input = ParquetInput(train_input._data_config,
+                               train_input._feature_configs, input_path)
+    # the reader processes are not tuned, keep the default
+    self.assertEqual(train_input._num_proc, 8)
+    train_input._data_config.auto_tune.max_parallel_calls = 2
+    train_input = ParquetInput(train_input._data_config,
+                               train_input._feature_configs, input_path)
+    self.assertEqual(train_input._num_proc, 2)
+    shutil.rmtree(test_dir)
+
+  def test_buffer_bytes(self):
+    # 2 stages * (4 + 8) batches + 1000 samples of 100 bytes
+    self.assertEqual(
+        input_autotune.get_buffer_bytes(3200, 32, 4, 8, 1000),
+        2 * 3200 * 12 + 100 * 1000)
+    self.assertEqual(list(input_autotune._doubling(12)), [1, 2, 4, 8, 12])
+    self.assertEqual(list(input_autotune._doubling(8, 2)), [2, 4, 8])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,146 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import multiprocessing
+import time
+
+import numpy as np
+import tensorflow as tf
+from google.protobuf import text_format
+
+from easy_rec.python.input.csv_input import CSVInput
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
+from easy_rec.python.utils import input_profiler
+from easy_rec.python.utils.input_profiler import StageStats
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class InputProfilerTest(tf.test.TestCase):
+
+  def test_csv_input(self):
+    data_config_str = """
+      input_fields {
+        input_name: 'label'
+        input_type: FLOAT
+      }
+      input_fields {
+        input_name: 'field[1-3]'
+        input_type: STRING
+      }
+      label_fields: 'label'
+      batch_size: 32
+      num_epochs: 1
+      auto_expand_input_fields: true
+      profile_input: true
+    """
+    feature_config_str = """
+      input_names: 'field1'
+      feature_type: IdFeature
+      embedding_dim: 32
+      hash_bucket_size: 2000
+    """
+    dataset_config = DatasetConfig()
+    text_format.Merge(data_config_str, dataset_config)
+    feature_config = FeatureConfig()
+    text_format.Merge(feature_config_str, feature_config)
+    input_path = 'data/test/test.csv'
+    with open(input_path, 'r') as fin:
+      num_batches = (len(fin.readlines()) + 31) // 32
+
+    profiler = input_profiler.get_profiler()
+    last_stats = profiler.snapshot()
+    with tf.Graph().as_default():
+      train_input_fn = CSVInput(dataset_config, [feature_config],
+                                input_path).create_input()
+      dataset = train_input_fn(mode=tf.estimator.ModeKeys.TRAIN)
+      iterator = dataset.make_initializable_iterator()
+      features, labels = iterator.get_next()
+      with tf.Session() as sess:
+        sess.run(iterator.initializer)
+        for _ in range(num_batches):
+          feature_dict, label_dict = sess.run([features, labels])
+          self.assertIn('field1', feature_dict)
+          self.assertIn('label', label_dict)
+    stats = profiler.snapshot()
+    for stage in [input_profiler.PARSE_STAGE, input_profiler.PREPROCESS_STAGE]:
+      window_stats = stats[stage] - last_stats.get(stage, StageStats())
+      self.assertEqual(window_stats.count, num_batches)
+      self.assertGreater(window_stats.total, 0)
+
+  def test_profile_generator(self):
+
+    def _generator(num):
+      for i in range(num):
+        time.sleep(0.01)
+        yield i
+
+    profiler = input_profiler.InputProfiler()
+    generator_fn = profiler.profile_generator(input_profiler.READ_STAGE,
+                                              _generator)
+    self.assertEqual(list(generator_fn(3)), [0, 1, 2])
+    stats = profiler.snapshot()[input_profiler.READ_STAGE]
+    self.assertEqual(stats.count, 3)
+    self.assertGreaterEqual(stats.max_secs, 0.01)
+    self.assertGreaterEqual(stats.total, 0.03)
+
+  def test_bottleneck_report(self):
+    step_secs = [0.1] * 10
+    # the steps wait 50ms for the parse, which takes 400ms per batch
+    stage_stats = {
+        'parse': StageStats(10, 4.0, 0.5),
+        'preprocess': StageStats(10, 0.5, 0.06)
+    }
+    _, suggestion = input_profiler.bottleneck_report(
+        stage_stats, step_secs, [0.05] * 10, 4, 32, max_parallel_calls=32)
+    self.assertEqual(suggestion['num_parallel_calls'], 8)
+    self.assertEqual(suggestion['prefetch_size'], 32)
+    # capped by the cpus
+    _, suggestion = input_profiler.bottleneck_report(
+        stage_stats, step_secs, [0.05] * 10, 4, 32, max_parallel_calls=6)
+    self.assertEqual(suggestion['num_parallel_calls'], 6)
+
+    # fast enough on average, the steps wait for the slow batches
+    stage_stats = {'parse': StageStats(10, 0.8, 0.45)}
+    _, suggestion = input_profiler.bottleneck_report(
+        stage_stats, step_secs, [0.02] * 10, 4, 2, max_parallel_calls=32)
+    self.assertEqual(suggestion['num_parallel_calls'], 4)
+    self.assertEqual(suggestion['prefetch_size'], 7)
+
+    # the input is not the bottleneck
+    lines, suggestion = input_profiler.bottleneck_report(
+        stage_stats, step_secs, [0.001] * 10, 4, 2, max_parallel_calls=32)
+    self.assertEqual(suggestion, {'num_parallel_calls': 4, 'prefetch_size': 2})
+    self.assertIn('not the bottleneck', lines[-1])
+
+  def test_profiler_hook(self):
+
+    def _slow_parse(x):
+      return tf.py_func(lambda v: time.sleep(0.02) or v, [x], tf.int64)
+
+    profiler = input_profiler.InputProfiler()
+    with tf.Graph().as_default():
+      dataset = tf.data.Dataset.range(20).map(
+          profiler.profile_fn(input_profiler.PARSE_STAGE, _slow_parse))
+      features = tf.data.make_one_shot_iterator(dataset).get_next()
+      hook = input_profiler.InputProfilerHook(
+          input_profiler.input_ready_time(features),
+          report_steps=10,
+          num_parallel_calls=1,
+          prefetch_size=1,
+          profiler=profiler)
+      values = []
+      with tf.train.MonitoredSession(hooks=[hook]) as sess:
+        for _ in range(20):
+          values.append(sess.run(features))
+    self.assertAllEqual(values, np.arange(20))
+    self.assertEqual(profiler.snapshot()[input_profiler.PARSE_STAGE].count, 20)
+    # the steps only wait for the input, more parallel calls are suggested
+    # if there are more cpus
+    self.assertGreaterEqual(hook.last_suggestion['num_parallel_calls'],
+                            min(multiprocessing.cpu_count(), 2))
+
+
+if __name__ == '__main__':
+  tf.test.main()
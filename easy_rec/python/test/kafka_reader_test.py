@@ -0,0 +1,199 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import collections
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from google.protobuf import text_format
+
+from easy_rec.python.input.kafka_input import KafkaInput
+from easy_rec.python.input.kafka_reader import KafkaParallelReader
+from easy_rec.python.protos.data_source_pb2 import KafkaServer
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  from tensorflow.python.framework.ops import disable_eager_execution
+
+  disable_eager_execution()
+  tf = tf.compat.v1
+
+Message = collections.namedtuple('Message', ['offset', 'value'])
+
+
+class FileConsumer(object):
+  """A fake kafka consumer, each partition is a file, one message per line."""
+
+  def __init__(self, data_dir):
+    self._data_dir = data_dir
+    self._messages = {}
+    self._positions = {}
+
+  def partitions_for_topic(self, topic):
+    return set(int(x.split('.')[0]) for x in os.listdir(self._data_dir))
+
+  def assign(self, topic_parts):
+    for topic_part in topic_parts:
+      with open(
+          os.path.join(self._data_dir, '%d.txt' % topic_part.partition),
+          'rb') as fin:
+        self._messages[topic_part] = [x.rstrip(b'\n') for x in fin]
+      self._positions[topic_part] = 0
+
+  def seek(self, topic_part, offset):
+    self._positions[topic_part] = offset
+
+  def poll(self, timeout_ms=0, max_records=None):
+    records = {}
+    for topic_part, messages in self._messages.items():
+      start = self._positions[topic_part]
+      end = min(len(messages), start + max_records)
+      if end > start:
+        records[topic_part] = [
+            Message(offset, messages[offset]) for offset in range(start, end)
+        ]
+        self._positions[topic_part] = end
+    return records
+
+  def close(self):
+    pass
+
+
+class FileKafkaInput(KafkaInput):
+
+  def __init__(self, data_dir, *args, **kwargs):
+    self._data_dir = data_dir
+    super(FileKafkaInput, self).__init__(*args, **kwargs)
+
+  def _create_consumer(self, group_id='kafka_dataset_consumer', **kwargs):
+    return FileConsumer(self._data_dir)
+
+
+class KafkaReaderTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+    self._data_dir = os.path.join(self._test_dir, 'topic')
+    os.makedirs(self._data_dir)
+    self._num_messages = [23, 5, 0, 17]
+    for part_id, num_message in enumerate(self._num_messages):
+      with open(os.path.join(self._data_dir, '%d.txt' % part_id), 'w') as fout:
+        for offset in range(num_message):
+          fout.write('%d,%d,%d_%d\n' % (offset % 2, part_id, part_id, offset))
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def test_parallel_reader(self):
+    reader = KafkaParallelReader(
+        'test_topic', {
+            0: 0,
+            1: 0,
+            2: 0,
+            3: 5
+        },
+        lambda: FileConsumer(self._data_dir),
+        batch_size=7,
+        num_threads=2,
+        max_poll_records=4,
+        eof=True)
+    self.assertEqual(reader.partitions, [0, 1, 2, 3])
+    read_offsets = collections.defaultdict(list)
+    last_marks = np.array([0, 0, 0, 5])
+    num_batches = 0
+    for messages, high_water_marks in reader.batches():
+      num_batches += 1
+      for msg in messages:
+        _, part_id, offset = msg.decode('utf-8').split(',')
+        read_offsets[int(part_id)].append(int(offset.split('_')[1]))
+      self.assertTrue(np.all(high_water_marks >= last_marks))
+      for part_id, offsets in read_offsets.items():
+        self.assertEqual(high_water_marks[part_id], offsets[-1])
+      last_marks = high_water_marks
+    self.assertEqual(num_batches, 6)
+    self.assertEqual(read_offsets[0], list(range(23)))
+    self.assertEqual(read_offsets[1], list(range(5)))
+    self.assertEqual(read_offsets[3], list(range(5, 17)))
+    self.assertAllEqual(last_marks, [22, 4, 0, 16])
+
+  def test_parallel_reader_error(self):
+
+    def _consumer_fn():
+      raise IOError('broker is down')
+
+    reader = KafkaParallelReader(
+        'test_topic', {0: 0}, _consumer_fn, batch_size=7, eof=True)
+    with self.assertRaises(IOError):
+      list(reader.batches())
+
+  def test_kafka_input(self):
+    data_config_str = """
+      input_fields {
+        input_name: 'label'
+        input_type: INT32
+      }
+      input_fields {
+        input_name: 'part_id'
+        input_type: STRING
+      }
+      input_fields {
+        input_name: 'msg_id'
+        input_type: STRING
+      }
+      label_fields: 'label'
+      batch_size: 8
+      input_type: KafkaInput
+    """
+    data_config = DatasetConfig()
+    text_format.Merge(data_config_str, data_config)
+    feature_configs = []
+    for input_name in ['part_id', 'msg_id']:
+      feature_config = FeatureConfig()
+      feature_config.input_names.append(input_name)
+      feature_config.hash_bucket_size = 100
+      feature_configs.append(feature_config)
+    kafka_config = KafkaServer()
+    text_format.Merge(
+        """
+      server: '127.0.0.1:9092'
+      topic: 'test_topic'
+      group: 'test_group'
+      offset_info: '{"0": 3}'
+      num_reader_threads: 2
+      eof: true
+    """, kafka_config)
+
+    # worker 0 of 2 workers reads partition 0 and 2
+    kafka_input = FileKafkaInput(
+        self._data_dir,
+        data_config,
+        feature_configs,
+        kafka_config,
+        task_index=0,
+        task_num=2)
+    offset_path = os.path.join(self._test_dir, 'model.ckpt-10.offset')
+    with open(offset_path, 'w') as fout:
+      json.dump({'0': 10, '1': 2}, fout)
+    kafka_input.restore(os.path.join(self._test_dir, 'model.ckpt-10'))
+
+    with tf.Graph().as_default():
+      dataset = kafka_input.create_input()(mode=tf.estimator.ModeKeys.TRAIN)
+      features, labels = tf.data.make_one_shot_iterator(dataset).get_next()
+      msg_ids = []
+      with tf.Session() as sess:
+        while True:
+          try:
+            features_val, labels_val = sess.run([features, labels])
+          except tf.errors.OutOfRangeError:
+            break
+          msg_ids.extend(features_val['msg_id'])
+          data_offset = json.loads(features_val[KafkaInput.DATA_OFFSET])
+    self.assertEqual(msg_ids, [b'0_%d' % x for x in range(10, 23)])
+    self.assertEqual(data_offset, {'0': 22, '2': 0})
+
+
+if __name__ == '__main__':
+  tf.test.main()
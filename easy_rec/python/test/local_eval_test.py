@@ -0,0 +1,132 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.core import metrics as metrics_lib
+from easy_rec.python.main import _get_local_eval_shards
+from easy_rec.python.main import evaluate
+from easy_rec.python.main import local_sharded_evaluate
+from easy_rec.python.utils import config_util
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class LocalEvalTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+    self._success = True
+    logging.info('Testing %s.%s' % (type(self).__name__, self._testMethodName))
+
+  def tearDown(self):
+    test_utils.set_gpu_id(None)
+    if self._success:
+      test_utils.clean_up(self._test_dir)
+
+  def _write_files(self, sizes):
+    paths = []
+    for i, size in enumerate(sizes):
+      path = os.path.join(self._test_dir, 'data_%d' % i)
+      with open(path, 'w') as fout:
+        fout.write('x' * size)
+      paths.append(path)
+    return paths
+
+  def test_local_eval_shards(self):
+    paths = self._write_files([100, 60, 50, 40, 10])
+    shards = _get_local_eval_shards(','.join(paths), 2)
+    # the largest file is assigned to the smallest shard
+    self.assertEqual(shards, [(','.join([paths[0], paths[3]]), 0, 1),
+                              (','.join([paths[1], paths[2], paths[4]]), 0, 1)])
+    pattern = os.path.join(self._test_dir, 'data_*')
+    shards = _get_local_eval_shards([pattern], 8)
+    self.assertEqual(len(shards), 5)
+    shards = _get_local_eval_shards(paths[:2], 3, shard_records=True)
+    self.assertEqual(shards, [(','.join(paths[:2]), i, 3) for i in range(3)])
+
+  def test_merge_separated_auc_states(self):
+    state_a = metrics_lib.SeparatedAucState('mean_by_sample_num')
+    state_a.separated_label[1].extend([0, 1])
+    state_a.separated_prediction[1].extend([0.2, 0.8])
+    state_a.separated_weights[1] += 2
+    state_b = metrics_lib.SeparatedAucState('mean_by_sample_num')
+    state_b.separated_label[1].append(1)
+    state_b.separated_prediction[1].append(0.6)
+    state_b.separated_weights[1] += 1
+    merged = metrics_lib.SeparatedAucState('mean_by_sample_num')
+    merged.merge_state(state_a.get_state())
+    merged.merge_state(state_b.get_state())
+    self.assertEqual(merged.separated_label[1], [0, 1, 1])
+    self.assertEqual(merged.separated_prediction[1], [0.2, 0.8, 0.6])
+    self.assertEqual(merged.separated_weights[1], 3)
+
+    merged_states = metrics_lib.merge_metric_states([{
+        'variables': {
+            'auc/true_positives': np.array([1.0, 2.0])
+        },
+        'python_states': [state_a.get_state()]
+    }, {
+        'variables': {
+            'auc/true_positives': np.array([3.0, 4.0])
+        },
+        'python_states': [state_b.get_state()]
+    }])
+    self.assertAllClose(merged_states['variables']['auc/true_positives'],
+                        [4.0, 6.0])
+    self.assertEqual(len(merged_states['python_states']), 2)
+
+  def _check_eval_result(self, eval_result, expected):
+    self.assertEqual(sorted(eval_result.keys()), sorted(expected.keys()))
+    for key in ['auc', 'gauc']:
+      self.assertAllClose(eval_result[key], expected[key], atol=1e-5)
+    # the means of the batch losses depend on how the batches are split
+    self.assertAllClose(eval_result['loss'], expected['loss'], atol=1e-2)
+
+  def test_local_sharded_evaluate(self):
+    # split the eval data into 3 files
+    eval_paths = []
+    with open('data/test/tb_data/taobao_test_data', 'r') as fin:
+      lines = fin.readlines()
+    for i in range(3):
+      eval_path = os.path.join(self._test_dir, 'eval_data_%d' % i)
+      with open(eval_path, 'w') as fout:
+        fout.writelines(lines[i * 700:(i + 1) * 700])
+      eval_paths.append(eval_path)
+
+    def _post_config(pipeline_config):
+      pipeline_config.eval_input_path = ','.join(eval_paths)
+      pipeline_config.data_config.batch_size = 256
+      pipeline_config.eval_config.metrics_set.add().auc.num_thresholds = 10000
+      return pipeline_config
+
+    self._success = test_utils.test_single_train_eval(
+        'samples/model_config/multi_tower_on_taobao_gauc.config',
+        self._test_dir,
+        process_pipeline_func=_post_config,
+        total_steps=10)
+    self.assertTrue(self._success)
+
+    pipeline_config_path = os.path.join(self._test_dir, 'pipeline.config')
+    pipeline_config = config_util.get_configs_from_pipeline_file(
+        pipeline_config_path)
+    pipeline_config.eval_config.num_examples = 0
+    expected = evaluate(pipeline_config)
+    # shard by files
+    eval_result = local_sharded_evaluate(pipeline_config, num_workers=2)
+    self._check_eval_result(eval_result, expected)
+    self.assertEqual(eval_result['global_step'], expected['global_step'])
+    # shard by records
+    eval_result = local_sharded_evaluate(
+        pipeline_config, eval_data_path=eval_paths[0], num_workers=2)
+    expected = evaluate(pipeline_config, eval_data_path=eval_paths[0])
+    self._check_eval_result(eval_result, expected)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,140 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.core.local_sampler import LocalHardNegativeSamplerV2
+from easy_rec.python.core.local_sampler import LocalNegativeSampler
+from easy_rec.python.core.local_sampler import LocalNegativeSamplerV2
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class LocalSamplerTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(2020)
+    self._test_dir = test_utils.get_tmp_dir()
+    self._item_path = os.path.join(self._test_dir, 'item')
+    self._edge_path = os.path.join(self._test_dir, 'edge')
+    self._hard_neg_edge_path = os.path.join(self._test_dir, 'hard_neg_edge')
+    # the shared arrays are removed with the test dir
+    self._shm_dir = os.path.join(self._test_dir, 'shm')
+    with open(self._item_path, 'w') as fout:
+      fout.write('id:int64\tweight:float\tfeature:string\n')
+      for item_id in range(100):
+        fout.write('%d\t1.0\t%d:cate_%d\n' % (item_id, item_id, item_id % 5))
+    with open(self._edge_path, 'w') as fout:
+      fout.write('userid:int64\titemid:int64\tweight:float\n')
+      # user 0 has positive edges with items 0-19
+      for item_id in range(20):
+        fout.write('0\t%d\t1.0\n' % item_id)
+    with open(self._hard_neg_edge_path, 'w') as fout:
+      fout.write('userid:int64\titemid:int64\tweight:float\n')
+      for item_id in [7, 3, 5]:
+        fout.write('1\t%d\t1.0\n' % item_id)
+    self._fields = [
+        DatasetConfig.Field(
+            input_name='item_id', input_type=DatasetConfig.INT64),
+        DatasetConfig.Field(input_name='cate', input_type=DatasetConfig.STRING)
+    ]
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def test_negative_sampler(self):
+    with tf.Graph().as_default():
+      sampler = LocalNegativeSampler(
+          self._item_path,
+          self._fields,
+          num_sample=50,
+          batch_size=4,
+          shm_dir=self._shm_dir)
+      ids = tf.constant(list(range(20)), dtype=tf.int64)
+      features = sampler.get(ids)
+      with self.test_session() as sess:
+        for _ in range(3):
+          item_ids, cates = sess.run([features['item_id'], features['cate']])
+          self.assertEqual(len(item_ids), 50)
+          # items in batch are rejected
+          self.assertTrue(np.all(item_ids >= 20))
+          for item_id, cate in zip(item_ids, cates):
+            self.assertEqual(cate, b'cate_%d' % (item_id % 5))
+      graph_dirs = os.listdir(
+          os.path.join(self._shm_dir, 'easy_rec_local_graph'))
+      self.assertEqual(len(graph_dirs), 1)
+
+  def test_hard_negative_sampler_v2(self):
+    with tf.Graph().as_default():
+      sampler = LocalHardNegativeSamplerV2(
+          '',
+          self._item_path,
+          self._edge_path,
+          self._hard_neg_edge_path,
+          self._fields,
+          num_sample=8,
+          num_hard_sample=2,
+          batch_size=4,
+          shm_dir=self._shm_dir)
+      src_ids = tf.constant([0, 1], dtype=tf.int64)
+      dst_ids = tf.constant([1, 2], dtype=tf.int64)
+      features = sampler.get(src_ids, dst_ids)
+      with self.test_session() as sess:
+        item_ids, hard_neg_indices = sess.run(
+            [features['item_id'], features['hard_neg_indices']])
+      # the first 2 negatives(expand_factor = 2) are sampled for user 0,
+      # which have no edges with user 0
+      self.assertTrue(np.all(item_ids[:2] >= 20))
+      # neighbors are sorted by item id, and at most num_hard_sample
+      self.assertAllEqual(item_ids[8:], [3, 5])
+      self.assertAllEqual(hard_neg_indices, [[1, 0], [1, 1]])
+
+  def test_empty_batch(self):
+    with tf.Graph().as_default():
+      neg_sampler = LocalNegativeSampler(
+          self._item_path,
+          self._fields,
+          num_sample=8,
+          batch_size=4,
+          shm_dir=self._shm_dir)
+      neg_sampler_v2 = LocalNegativeSamplerV2(
+          '',
+          self._item_path,
+          self._edge_path,
+          self._fields,
+          num_sample=8,
+          batch_size=4,
+          shm_dir=self._shm_dir)
+      hard_neg_sampler_v2 = LocalHardNegativeSamplerV2(
+          '',
+          self._item_path,
+          self._edge_path,
+          self._hard_neg_edge_path,
+          self._fields,
+          num_sample=8,
+          num_hard_sample=2,
+          batch_size=4,
+          shm_dir=self._shm_dir)
+      empty_ids = tf.constant([], dtype=tf.int64)
+      features = neg_sampler.get(empty_ids)
+      features_v2 = neg_sampler_v2.get(empty_ids, empty_ids)
+      hard_features_v2 = hard_neg_sampler_v2.get(empty_ids, empty_ids)
+      with self.test_session() as sess:
+        item_ids, item_ids_v2, hard_item_ids_v2, hard_neg_indices = sess.run([
+            features['item_id'], features_v2['item_id'],
+            hard_features_v2['item_id'], hard_features_v2['hard_neg_indices']
+        ])
+      self.assertEqual(len(item_ids), 8)
+      self.assertEqual(len(item_ids_v2), 8)
+      # no hard negatives for the empty batch
+      self.assertEqual(len(hard_item_ids_v2), 8)
+      self.assertEqual(hard_neg_indices.shape, (0, 2))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,168 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from easy_rec.python.inference.local_vector_retrieve import LocalVectorRetrieve
+from easy_rec.python.inference.vector_retrieve import to_np_array
+from easy_rec.python.utils import test_utils
+from easy_rec.python.utils import vector_index
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class LocalVectorRetrieveTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+    rng = np.random.RandomState(1)
+    self._ndim = 8
+    self._docs = rng.uniform(-1, 1, [500, self._ndim]).astype(np.float32)
+    self._queries = rng.uniform(-1, 1, [70, self._ndim]).astype(np.float32)
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def _exact_top_k(self, k, distance):
+    if distance == vector_index.DISTANCE_INNER_PRODUCT:
+      scores = -np.matmul(self._queries, self._docs.T)
+    else:
+      scores = np.sum(
+          np.square(self._queries[:, None, :] - self._docs[None, :, :]), axis=2)
+    return np.argsort(scores, axis=1)[:, :k]
+
+  def _write_vectors(self, path, ids, vectors):
+    with open(path, 'w') as fout:
+      for vid, vector in zip(ids, vectors):
+        fout.write('%s\t%s\n' % (vid, ','.join('%.6f' % x for x in vector)))
+
+  def test_parse_vectors(self):
+    vectors = vector_index.parse_vectors(['0.1,0.2', '-1,3e-2'], 2)
+    self.assertAllClose(vectors, [[0.1, 0.2], [-1, 0.03]])
+    vectors = vector_index.parse_vectors(
+        np.array([b'0.1;0.2', b'-1;3']), 2, ';')
+    self.assertAllClose(vectors, [[0.1, 0.2], [-1, 3]])
+    with self.assertRaises(ValueError):
+      vector_index.parse_vectors(['0.1,0.2', ''], 2)
+
+  def test_to_np_array(self):
+    feats = to_np_array((b'0.1;0.2;0.3', b'-1;3;2'), ';')
+    self.assertAllClose(feats, [[0.1, 0.2, 0.3], [-1, 3, 2]])
+    # empty batches
+    self.assertEqual(to_np_array((), ',', 3).shape, (0, 3))
+    self.assertEqual(to_np_array((), ',').shape, (0, 0))
+
+  def test_numpy_index(self):
+    for distance in [
+        vector_index.DISTANCE_INNER_PRODUCT, vector_index.DISTANCE_L2
+    ]:
+      expect_ids = self._exact_top_k(10, distance)
+      index = vector_index.create_index(
+          self._ndim, 'flat', distance=distance, backend='numpy')
+      index.add(self._docs)
+      ids, _ = index.search(self._queries, 10)
+      self.assertAllEqual(ids, expect_ids)
+
+      # probe all the clusters, the same as exact search
+      index = vector_index.create_index(
+          self._ndim,
+          'ivfflat',
+          distance=distance,
+          nlist=16,
+          nprobe=16,
+          backend='numpy')
+      index.train(self._docs)
+      index.add(self._docs)
+      ids, _ = index.search(self._queries, 10)
+      self.assertAllEqual(ids, expect_ids)
+
+    # more neighbours than docs
+    index = vector_index.create_index(
+        self._ndim, 'ivfflat', nlist=4, nprobe=1, backend='numpy')
+    index.train(self._docs[:8])
+    index.add(self._docs[:8])
+    ids, scores = index.search(self._queries, 10)
+    self.assertTrue(np.all(ids[:, -2:] == -1))
+
+  def test_save_load_index(self):
+    index_dir = os.path.join(self._test_dir, 'index')
+    index = vector_index.create_index(
+        self._ndim, 'ivfflat', nlist=16, nprobe=4, backend='numpy')
+    index.train(self._docs)
+    index.add(self._docs)
+    ids, scores = index.search(self._queries, 5)
+    vector_index.save_index(index, np.arange(500) + 1000, index_dir)
+    index_load, doc_ids = vector_index.load_index(index_dir)
+    ids_load, scores_load = index_load.search(self._queries, 5)
+    self.assertAllEqual(ids, ids_load)
+    self.assertAllClose(scores, scores_load)
+    self.assertEqual(doc_ids[3], 1003)
+
+  @unittest.skipIf(vector_index.faiss is None, 'faiss is not installed')
+  def test_faiss_index(self):
+    index_dir = os.path.join(self._test_dir, 'index')
+    expect_ids = self._exact_top_k(10, vector_index.DISTANCE_INNER_PRODUCT)
+    index = vector_index.create_index(self._ndim, 'flat', backend='faiss')
+    index.add(self._docs)
+    vector_index.save_index(index, np.arange(500), index_dir)
+    index, _ = vector_index.load_index(index_dir)
+    ids, _ = index.search(self._queries, 10)
+    self.assertAllEqual(ids, expect_ids)
+
+  def _test_retrieve(self, output_path, num_workers, index_type, **kwargs):
+    query_path = os.path.join(self._test_dir, 'query.csv')
+    doc_path = os.path.join(self._test_dir, 'doc.csv')
+    self._write_vectors(query_path, np.arange(len(self._queries)),
+                        self._queries)
+    self._write_vectors(doc_path, ['d%d' % x for x in range(len(self._docs))],
+                        self._docs)
+    knn = LocalVectorRetrieve(
+        query_path,
+        doc_path,
+        output_path,
+        self._ndim,
+        batch_size=16,
+        index_type=index_type,
+        num_workers=num_workers,
+        **kwargs)
+    knn(top_n=5)
+    if output_path.endswith('.parquet'):
+      result = pd.read_parquet(output_path)
+    else:
+      result = pd.read_csv(
+          output_path,
+          sep='\t',
+          header=None,
+          names=['query_id', 'doc_id', 'distance'])
+    self.assertEqual(len(result), len(self._queries) * 5)
+    expect_ids = self._exact_top_k(5, vector_index.DISTANCE_INNER_PRODUCT)
+    for query_id, group in result.groupby('query_id'):
+      self.assertEqual(
+          list(group['doc_id']), ['d%d' % x for x in expect_ids[query_id]])
+      self.assertAllClose(
+          group['distance'].values,
+          np.matmul(self._docs[expect_ids[query_id]], self._queries[query_id]),
+          atol=1e-4)
+
+  def test_retrieve_multi_process(self):
+    self._test_retrieve(
+        os.path.join(self._test_dir, 'result.csv'),
+        num_workers=2,
+        index_type='ivfflat',
+        nlist=8,
+        nprobe=8)
+
+  def test_retrieve_parquet_output(self):
+    self._test_retrieve(
+        os.path.join(self._test_dir, 'result.parquet'),
+        num_workers=1,
+        index_type='flat')
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,72 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import tensorflow as tf
+
+from easy_rec.python.inference import output_sink
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class OutputSinkTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def test_to_arrow_array(self):
+    arr = output_sink.to_arrow_array(np.array([1, 2], dtype=np.int64))
+    self.assertEqual(arr.type, pa.int64())
+    arr = output_sink.to_arrow_array(np.array([[0.5], [1.5]], dtype=np.float32))
+    self.assertEqual(arr.type, pa.float32())
+    self.assertEqual(arr.to_pylist(), [0.5, 1.5])
+    arr = output_sink.to_arrow_array(
+        np.array([b'a', b'\xe4\xb8\xad'], dtype=object))
+    self.assertEqual(arr.type, pa.string())
+    self.assertEqual(arr.to_pylist(), ['a', u'中'])
+    # invalid utf-8 bytes are ignored
+    arr = output_sink.to_arrow_array(np.array([b'a\xff', b'b'], dtype=object))
+    self.assertEqual(arr.to_pylist(), ['a', 'b'])
+    arr = output_sink.to_arrow_array(
+        np.arange(6, dtype=np.float32).reshape([2, 3]))
+    self.assertEqual(arr.type, pa.list_(pa.float32(), 3))
+    self.assertEqual(arr.to_pylist(), [[0, 1, 2], [3, 4, 5]])
+
+  def test_parquet_sink(self):
+    output_path = os.path.join(self._test_dir, 'output')
+    sink = output_sink.create_output_sink(
+        'parquet', output_path, 3, row_group_size=100)
+    embeddings = np.random.uniform(size=[250, 4]).astype(np.float32)
+    for start in range(0, 250, 32):
+      end = min(start + 32, 250)
+      sink.write([('embedding', embeddings[start:end]),
+                  ('id',
+                   np.array([b'%d' % x for x in range(start, end)],
+                            dtype=object)),
+                  ('label', np.arange(start, end, dtype=np.int32))])
+    sink.close()
+
+    parquet_file = pq.ParquetFile(os.path.join(output_path, 'part-3.parquet'))
+    # 100, 100 and 50 rows
+    self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+    table = parquet_file.read()
+    self.assertEqual(table.column_names, ['embedding', 'id', 'label'])
+    self.assertEqual(table.schema.field('label').type, pa.int32())
+    self.assertAllClose(
+        np.array(table.column('embedding').to_pylist()), embeddings)
+    self.assertEqual(
+        table.column('id').to_pylist(), [str(x) for x in range(250)])
+
+    self.assertIsNone(output_sink.create_output_sink('csv', output_path, 0))
+
+
+if __name__ == '__main__':
+  tf.test.main()
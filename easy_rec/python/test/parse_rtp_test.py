@@ -0,0 +1,185 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import os
+import unittest
+
+import numpy as np
+import tensorflow as tf
+from google.protobuf import text_format
+
+from easy_rec.python.input.rtp_input import RTPInput
+from easy_rec.python.ops import gen_parse_rtp_op
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+from easy_rec.python.protos.feature_config_pb2 import FeatureConfig
+from easy_rec.python.utils import test_utils
+
+if tf.__version__ >= '2.0':
+  from tensorflow.python.framework.ops import disable_eager_execution
+
+  disable_eager_execution()
+  tf = tf.compat.v1
+
+
+@unittest.skipIf(gen_parse_rtp_op.parse_rtp_op is None,
+                 'parse_rtp op is not available')
+class ParseRtpTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._test_dir = test_utils.get_tmp_dir()
+
+  def tearDown(self):
+    test_utils.clean_up(self._test_dir)
+
+  def test_parse_rtp(self):
+    lines = tf.constant([
+        '1;a;0.5\x021\x02x\x1dy',
+        '0;b;\x02\x02',
+        '1;c;0.5\x02abc\x02z',
+        '0;d;0.5\x022',
+    ])
+    fields, error_count = gen_parse_rtp_op.parse_rtp_op.parse_rtp(
+        lines,
+        Tout=[tf.int32, tf.float32, tf.int64, tf.string],
+        defaults=['0', '0.0', '7', 'def'],
+        rtp_separator=';',
+        num_cols=3,
+        label_cols=[0],
+        feature_col=2,
+        separator='\x02')
+    with self.test_session() as sess:
+      labels, fea0, fea1, fea2, error_count = sess.run(
+          list(fields) + [error_count])
+    self.assertAllEqual(labels, [1, 0, 1, 0])
+    self.assertAllClose(fea0, [0.5, 0.0, 0.5, 0.5])
+    # abc could not be converted, replaced by default
+    self.assertAllEqual(fea1, [1, 7, 7, 2])
+    # the last line has 2 features only
+    self.assertAllEqual(fea2, [b'x\x1dy', b'def', b'z', b'def'])
+    self.assertEqual(error_count, 2)
+
+  def test_parse_rtp_int(self):
+    lines = tf.constant([
+        '1234567890123456789\x021', '9007199254740993\x021.7', '-5\x02',
+        '1e3\x022147483648'
+    ])
+    fields, error_count = gen_parse_rtp_op.parse_rtp_op.parse_rtp(
+        lines,
+        Tout=[tf.int64, tf.int32],
+        defaults=['-1', '9'],
+        separator='\x02')
+    with self.test_session() as sess:
+      ids, vals, error_count = sess.run(list(fields) + [error_count])
+    # int64 ids are not rounded through double, non-integer values and
+    # int32 overflows are replaced by defaults
+    self.assertAllEqual(ids, [1234567890123456789, 9007199254740993, -5, -1])
+    self.assertAllEqual(vals, [1, 9, 9, 9])
+    self.assertEqual(error_count, 2)
+
+  def test_parse_rtp_error_count(self):
+    lines = tf.constant(['0.5\x021', '0.5', 'x\x022'])
+    fields = gen_parse_rtp_op.parse_rtp(
+        lines, [DatasetConfig.FLOAT, DatasetConfig.INT64], [0.0, 0], '\x02')
+    error_count = gen_parse_rtp_op.get_error_count()
+    with self.test_session() as sess:
+      sess.run(fields)
+      self.assertEqual(gen_parse_rtp_op.get_error_count(), error_count + 2)
+      sess.run(fields)
+      self.assertEqual(gen_parse_rtp_op.get_error_count(), error_count + 4)
+
+  def test_parse_rtp_check_mode(self):
+    lines = tf.constant(['0.5\x021', '0.5'])
+    fields = gen_parse_rtp_op.parse_rtp(
+        lines, [DatasetConfig.FLOAT, DatasetConfig.INT64], [0.0, 0],
+        '\x02',
+        check_mode=True)
+    with self.test_session() as sess:
+      with self.assertRaises(tf.errors.InvalidArgumentError):
+        sess.run(fields)
+
+  def _read_rtp_input(self, input_path, fused_rtp_parse):
+    data_config_str = """
+      input_fields {
+        input_name: 'label'
+        input_type: INT32
+      }
+      input_fields {
+        input_name: 'price'
+        input_type: FLOAT
+      }
+      input_fields {
+        input_name: 'user_id'
+        input_type: STRING
+      }
+      input_fields {
+        input_name: 'tags'
+        input_type: STRING
+        default_val: 'none'
+      }
+      label_fields: 'label'
+      batch_size: 8
+      num_epochs: 1
+      shuffle: false
+      separator: '\\002'
+      selected_cols: '0,2'
+      rtp_separator: ';'
+    """
+    data_config = DatasetConfig()
+    text_format.Merge(data_config_str, data_config)
+    data_config.fused_rtp_parse = fused_rtp_parse
+    feature_configs = []
+    for input_name in ['price', 'user_id', 'tags']:
+      feature_config = FeatureConfig()
+      feature_config.input_names.append(input_name)
+      if input_name == 'price':
+        feature_config.feature_type = FeatureConfig.RawFeature
+      elif input_name == 'user_id':
+        feature_config.feature_type = FeatureConfig.IdFeature
+        feature_config.hash_bucket_size = 100
+        feature_config.embedding_dim = 4
+      else:
+        feature_config.feature_type = FeatureConfig.TagFeature
+        feature_config.separator = '\x1d'
+        feature_config.hash_bucket_size = 100
+        feature_config.embedding_dim = 4
+      feature_configs.append(feature_config)
+
+    with tf.Graph().as_default():
+      input_fn = RTPInput(data_config, feature_configs,
+                          input_path).create_input()
+      dataset = input_fn(mode=tf.estimator.ModeKeys.EVAL)
+      features, labels = tf.data.make_one_shot_iterator(dataset).get_next()
+      results = []
+      with tf.Session() as sess:
+        while True:
+          try:
+            results.append(sess.run([features, labels]))
+          except tf.errors.OutOfRangeError:
+            break
+    return results
+
+  def test_rtp_input_fused(self):
+    input_path = os.path.join(self._test_dir, 'rtp_data.txt')
+    with open(input_path, 'w') as fout:
+      for i in range(20):
+        fout.write('%d;item_%d;%s\x02u%d\x02%s\n' %
+                   (i % 2, i, str(i * 0.5) if i % 3 else '', i,
+                    'a\x1db' if i % 4 else ''))
+    results = self._read_rtp_input(input_path, False)
+    fused_results = self._read_rtp_input(input_path, True)
+    self.assertEqual(len(results), len(fused_results))
+    num_default_tags = 0
+    for (features, labels), (fused_features,
+                             fused_labels) in zip(results, fused_results):
+      self.assertAllEqual(labels['label'], fused_labels['label'])
+      self.assertAllClose(features['price'], fused_features['price'])
+      self.assertAllEqual(features['user_id'], fused_features['user_id'])
+      tags = features['tags']
+      fused_tags = fused_features['tags']
+      self.assertAllEqual(tags.indices, fused_tags.indices)
+      self.assertAllEqual(tags.values, fused_tags.values)
+      num_default_tags += np.sum(fused_tags.values == b'none')
+    self.assertEqual(num_default_tags, 5)
+
+
+if __name__ == '__main__':
+  tf.test.main()
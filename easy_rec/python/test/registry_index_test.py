@@ -0,0 +1,42 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import sys
+
+import tensorflow as tf
+
+from easy_rec.python.input.input import Input
+from easy_rec.python.model.easy_rec_model import EasyRecModel
+from easy_rec.python.tools.gen_registry_index import build_registry_index
+from easy_rec.python.utils.load_class import load_keras_layer
+from easy_rec.python.utils.registry_index import REGISTRY_INDEX
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class RegistryIndexTest(tf.test.TestCase):
+
+  def test_registry_index_up_to_date(self):
+    self.assertEqual(
+        build_registry_index(), REGISTRY_INDEX,
+        'registry index is out of date, please run: '
+        'python -m easy_rec.python.tools.gen_registry_index')
+
+  def test_create_class(self):
+    for registry, cls in [('EasyRecModel', EasyRecModel), ('Input', Input)]:
+      for name, module in REGISTRY_INDEX[registry].items():
+        registered_cls = cls.create_class(name)
+        self.assertEqual(registered_cls.__module__, 'easy_rec.python.' + module)
+
+  def test_load_keras_layer(self):
+    layer_cls, customize = load_keras_layer('MLP')
+    self.assertTrue(customize)
+    self.assertEqual(layer_cls.__name__, 'MLP')
+    self.assertIn('easy_rec.python.layers.keras.blocks', sys.modules)
+    layer_cls, customize = load_keras_layer('Dense')
+    self.assertFalse(customize)
+    self.assertEqual(layer_cls, tf.keras.layers.Dense)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,86 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.layers.keras import data_augment
+from easy_rec.python.protos.seq_encoder_pb2 import SequenceAugment
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class SeqAugmentTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._lengths = np.array([10, 7, 1, 0, 4, 10], dtype=np.int32)
+    batch_size, max_len = len(self._lengths), 10
+    # item i of row b is b * 100 + i + 1, and the paddings are zeros
+    items = np.arange(max_len)[None, :] + 1 + \
+        np.arange(batch_size)[:, None] * 100
+    items = np.where(
+        np.arange(max_len)[None, :] < self._lengths[:, None], items, 0)
+    self._items = items
+    self._seq = np.tile(items[:, :, None], [1, 1, 2]).astype(np.float32)
+
+  def _run(self, fn, num_runs=1):
+    with tf.Graph().as_default():
+      outputs = fn(tf.constant(self._seq), tf.constant(self._lengths))
+      with self.test_session() as sess:
+        return [sess.run(outputs) for _ in range(num_runs)]
+
+  def test_item_mask(self):
+    mask_emb = np.array([[-1.0, -1.0]], dtype=np.float32)
+    counts = np.zeros([10])
+    for seq, length in self._run(
+        lambda x, y: data_augment.item_mask(x, y, mask_emb, 0.3), 200):
+      self.assertAllEqual(length, self._lengths)
+      masked = seq[:, :, 0] == -1
+      self.assertAllEqual(np.sum(masked, axis=1), np.floor(self._lengths * 0.3))
+      self.assertAllEqual(seq[:, :, 0][~masked], self._items[~masked])
+      counts += masked[0]
+    # positions are masked uniformly
+    self.assertAllClose(counts / 200.0, np.full([10], 0.3), atol=0.12)
+
+  def test_item_crop(self):
+    for seq, length in self._run(lambda x, y: data_augment.item_crop(x, y, 0.6),
+                                 20):
+      self.assertAllEqual(length,
+                          np.floor(self._lengths * 0.6).astype(np.int32))
+      for row, items, num_left in zip(seq[:, :, 0], self._items, length):
+        self.assertAllEqual(row[num_left:], np.zeros([10 - num_left]))
+        if num_left > 0:
+          begin = int(row[0]) % 100 - 1
+          self.assertAllEqual(row[:num_left], items[begin:begin + num_left])
+
+  def test_item_reorder(self):
+    for seq, length in self._run(
+        lambda x, y: data_augment.item_reorder(x, y, 0.5), 20):
+      self.assertAllEqual(length, self._lengths)
+      for row, items, num_reorder in zip(seq[:, :, 0], self._items,
+                                         np.floor(self._lengths * 0.5)):
+        self.assertAllEqual(np.sort(row), np.sort(items))
+        moved = np.where(row != items)[0]
+        if len(moved) > 0:
+          self.assertLessEqual(moved[-1] - moved[0], num_reorder - 1)
+
+  def test_sequence_augment(self):
+    aug_param = SequenceAugment(mask_rate=0.5, crop_rate=0.5, reorder_rate=0.5)
+    mask_emb = np.array([[-1.0, -1.0]], dtype=np.float32)
+    methods = np.zeros([3])
+    for seq, length in self._run(
+        lambda x, y: data_augment.sequence_augment(x, y, mask_emb, aug_param),
+        100):
+      self.assertEqual(seq.shape, self._seq.shape)
+      row, num_items = seq[0, :, 0], length[0]
+      if num_items == 5:
+        methods[0] += 1
+      elif np.any(row == -1):
+        methods[1] += 1
+      else:
+        methods[2] += 1
+    self.assertAllClose(methods / 100.0, np.full([3], 1 / 3.0), atol=0.15)
+
+
+if __name__ == '__main__':
+  tf.test.main()
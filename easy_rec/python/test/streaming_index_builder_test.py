@@ -0,0 +1,144 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from easy_rec.python.utils import streaming_index_builder
+from easy_rec.python.utils import vector_index
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+class _RecordIndex(object):
+  """Record the added vectors, in the api of faiss indexes."""
+
+  def __init__(self, need_train):
+    self.is_trained = not need_train
+    self.train_vectors = None
+    self.vectors = []
+
+  def train(self, vectors):
+    self.train_vectors = np.array(vectors)
+    self.is_trained = True
+
+  def add(self, vectors):
+    assert self.is_trained
+    self.vectors.append(np.array(vectors))
+
+
+class StreamingIndexBuilderTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(1)
+    self._vectors = rng.uniform(-1, 1, [1000, 8]).astype(np.float32)
+
+  def _batches(self, batch_size):
+    for start in range(0, len(self._vectors), batch_size):
+      yield self._vectors[start:start + batch_size]
+
+  def test_reservoir_sampler(self):
+    sampler = streaming_index_builder.ReservoirSampler(100, 8)
+    sampler.add(self._vectors[:30])
+    self.assertAllEqual(sampler.sample, self._vectors[:30])
+    for start in range(30, 1000, 70):
+      sampler.add(self._vectors[start:start + 70])
+    self.assertEqual(len(sampler.sample), 100)
+    # every sampled row is a distinct row of the stream
+    rows = set(map(tuple, self._vectors))
+    self.assertEqual(len(set(map(tuple, sampler.sample))), 100)
+    self.assertTrue(all(tuple(x) in rows for x in sampler.sample))
+
+    # each vector is sampled with probability 0.1
+    counts = np.zeros([10], dtype=np.int64)
+    vectors = np.arange(1000, dtype=np.float32).reshape([-1, 1])
+    for seed in range(200):
+      sampler = streaming_index_builder.ReservoirSampler(100, 1, seed=seed)
+      for start in range(0, 1000, 64):
+        sampler.add(vectors[start:start + 64])
+      counts += np.bincount(
+          (sampler.sample[:, 0] // 100).astype(np.int64), minlength=10)
+    self.assertAllClose(counts / 2000.0, np.full([10], 1.0), atol=0.1)
+
+  def test_vector_chunks(self):
+    chunks = streaming_index_builder.VectorChunks(8, 64)
+    for batch in self._batches(50):
+      chunks.append(batch)
+    self.assertEqual(len(chunks), 1000)
+    self.assertEqual(chunks.num_full_chunks, 15)
+    full_chunks = list(chunks.pop_chunks(full_only=True))
+    self.assertEqual(len(full_chunks), 15)
+    self.assertEqual(len(chunks), 40)
+    last_chunks = list(chunks.pop_chunks())
+    self.assertEqual(len(chunks), 0)
+    self.assertEqual(len(last_chunks[0]), 40)
+    self.assertAllEqual(
+        np.concatenate(full_chunks + last_chunks), self._vectors)
+
+  def test_build_shards(self):
+    for need_train in [False, True]:
+      builder = streaming_index_builder.StreamingIndexBuilder(
+          lambda: _RecordIndex(need_train),
+          8,
+          num_shards=3,
+          train_sample_size=200,
+          chunk_size=64)
+      shard_ids = []
+      for batch in self._batches(37):
+        shard_ids.append(builder.add(batch))
+        # the vectors are buffered until the index is trained, then only
+        # the partial chunks are
+        if builder.num_vectors >= 200:
+          self.assertLess(builder.num_buffered, 3 * 64)
+        else:
+          self.assertEqual(builder.num_buffered, builder.num_vectors)
+      self.assertAllEqual(np.concatenate(shard_ids), np.arange(1000) % 3)
+      indexes = builder.finish()
+      self.assertEqual(len(indexes), 3)
+      for shard_id, index in enumerate(indexes):
+        self.assertAllEqual(
+            np.concatenate(index.vectors), self._vectors[shard_id::3])
+        if need_train:
+          self.assertEqual(len(index.train_vectors), 200)
+
+  @unittest.skipIf(vector_index.faiss is None, 'faiss is not installed')
+  def test_build_faiss_ivf(self):
+    faiss = vector_index.faiss
+
+    def _create_index():
+      quantizer = faiss.IndexFlatIP(8)
+      index = faiss.IndexIVFFlat(quantizer, 8, 4, faiss.METRIC_INNER_PRODUCT)
+      index.own_fields = True
+      quantizer.this.disown()
+      return index
+
+    builder = streaming_index_builder.StreamingIndexBuilder(
+        _create_index,
+        8,
+        num_shards=2,
+        train_sample_size=300,
+        chunk_size=128,
+        clone_fn=faiss.clone_index)
+    for batch in self._batches(100):
+      builder.add(batch)
+    indexes = builder.finish()
+    self.assertEqual([x.ntotal for x in indexes], [500, 500])
+    # search all the lists, the same as exact search
+    queries = self._vectors[:10]
+    expect = np.argsort(-np.matmul(queries, self._vectors.T), axis=1)[:, :5]
+    scores, ids = [], []
+    for shard_id, index in enumerate(indexes):
+      index.nprobe = 4
+      shard_scores, shard_ids = index.search(queries, 5)
+      scores.append(shard_scores)
+      ids.append(shard_ids * 2 + shard_id)
+    scores = np.concatenate(scores, axis=1)
+    ids = np.concatenate(ids, axis=1)
+    order = np.argsort(-scores, axis=1)[:, :5]
+    self.assertAllEqual(np.take_along_axis(ids, order, axis=1), expect)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -479,6 +479,18 @@ class TrainEvalTest(tf.test.TestCase):
         'samples/model_config/dssm_on_taobao.config', self._test_dir)
     self.assertTrue(self._success)
 
+  def test_dssm_cross_batch_memory(self):
+    self._success = test_utils.test_single_train_eval(
+        'samples/model_config/dssm_cross_batch_memory_on_taobao.config',
+        self._test_dir)
+    self.assertTrue(self._success)
+
+  def test_dssm_sampling_bias_correction(self):
+    self._success = test_utils.test_single_train_eval(
+        'samples/model_config/dssm_sampling_bias_correction_on_taobao.config',
+        self._test_dir)
+    self.assertTrue(self._success)
+
   def test_dropoutnet(self):
     self._success = test_utils.test_single_train_eval(
         'samples/model_config/dropoutnet_on_taobao.config', self._test_dir)
@@ -744,6 +756,13 @@ class TrainEvalTest(tf.test.TestCase):
         post_check_func=test_utils.test_feature_selection)
     self.assertTrue(self._success)
 
+  def test_autoint_permutation_feature_importance(self):
+    self._success = test_utils.test_single_train_eval(
+        'samples/model_config/autoint_on_taobao.config',
+        self._test_dir,
+        post_check_func=test_utils.test_permutation_feature_importance)
+    self.assertTrue(self._success)
+
   def test_dbmtl_variational_dropout_feature_num(self):
     self._success = test_utils.test_single_train_eval(
         'samples/model_config/dbmtl_variational_dropout_feature_num.config',
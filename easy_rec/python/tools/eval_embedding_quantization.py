@@ -0,0 +1,178 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Measure the metric drop of quantizing each embedding.
+
+Each embedding is quantized(and dequantized) alone to each precision, and the
+model is evaluated on the eval data. The lowest precision whose metric drop is
+within max_metric_drop is suggested for each embedding, as an
+export_config.embedding_quantization config.
+"""
+import json
+import logging
+import os
+import re
+import sys
+
+import tensorflow as tf
+from google.protobuf import text_format
+from tensorflow.python.platform import gfile
+
+from easy_rec.python.main import _create_estimator
+from easy_rec.python.main import _create_eval_export_spec
+from easy_rec.python.main import _get_ckpt_path
+from easy_rec.python.protos.export_pb2 import EmbeddingPrecision
+from easy_rec.python.protos.export_pb2 import EmbeddingQuantization
+from easy_rec.python.utils import config_util
+from easy_rec.python.utils import embedding_quantization
+from easy_rec.python.utils import fg_util
+from easy_rec.python.utils import io_util
+from easy_rec.python.utils import proto_util
+from easy_rec.python.utils.config_util import get_eval_input_path
+from easy_rec.python.utils.config_util import set_eval_input_path
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+logging.basicConfig(
+    format='[%(levelname)s] %(asctime)s %(filename)s:%(lineno)d : %(message)s',
+    level=logging.INFO)
+tf.app.flags.DEFINE_string('pipeline_config_path', None,
+                           'Path to pipeline config file.')
+tf.app.flags.DEFINE_string(
+    'checkpoint_path', '', 'checkpoint to be evaluated, default is the '
+    'latest checkpoint in model_dir')
+tf.app.flags.DEFINE_string('eval_input_path', None, 'eval data path')
+tf.app.flags.DEFINE_string('precisions', 'fp16,int8',
+                           'precisions to be evaluated, separated by ,')
+tf.app.flags.DEFINE_string('metric', 'auc', 'metric used to compare')
+tf.app.flags.DEFINE_float(
+    'max_metric_drop', 0.001,
+    'max metric drop of the suggested precision of each embedding')
+tf.app.flags.DEFINE_string('output_path', '',
+                           'path to save the evaluation results in json')
+FLAGS = tf.app.flags.FLAGS
+
+
+class FakeQuantizeHook(tf.train.SessionRunHook):
+  """Replace the restored embedding by its quantized values."""
+
+  def __init__(self, embed_name, precision):
+    self._embed_name = embed_name
+    self._precision = precision
+    self._quantize_op = None
+
+  def begin(self):
+    assign_ops = []
+    for var in tf.global_variables():
+      embed_name, _ = proto_util.get_norm_embed_name(var.name)
+      if embed_name == self._embed_name:
+        assign_ops.append(
+            tf.assign(
+                var,
+                embedding_quantization.fake_quantize_tensor(
+                    var.read_value(), self._precision)))
+    self._quantize_op = tf.group(assign_ops)
+
+  def after_create_session(self, session, coord):
+    session.run(self._quantize_op)
+
+
+def _get_embeddings(checkpoint_path):
+  """Number of rows and dimension of the embeddings in the checkpoint."""
+  embeddings = {}
+  for name, shape in tf.train.list_variables(checkpoint_path):
+    # skip the optimizer slots
+    if re.search('/embedding_weights(/part_[0-9]+)?$', name) is None:
+      continue
+    embed_name, _ = proto_util.get_norm_embed_name(name + ':0')
+    num_rows, dim = embeddings.get(embed_name, (0, shape[1]))
+    embeddings[embed_name] = (num_rows + shape[0], dim)
+  return embeddings
+
+
+def main(argv):
+  pipeline_config = config_util.get_configs_from_pipeline_file(
+      FLAGS.pipeline_config_path)
+  if pipeline_config.fg_json_path:
+    fg_util.load_fg_json_to_config(pipeline_config)
+  if FLAGS.eval_input_path:
+    set_eval_input_path(pipeline_config, FLAGS.eval_input_path)
+  precisions = [
+      EmbeddingPrecision.Value(x.strip().upper())
+      for x in FLAGS.precisions.split(',')
+  ]
+
+  estimator, _ = _create_estimator(pipeline_config)
+  eval_spec = _create_eval_export_spec(pipeline_config,
+                                       get_eval_input_path(pipeline_config))
+  ckpt_path = _get_ckpt_path(pipeline_config, FLAGS.checkpoint_path)
+  embeddings = _get_embeddings(ckpt_path)
+  logging.info('embeddings: %s' % embeddings)
+
+  def _evaluate(hooks):
+    eval_result = estimator.evaluate(
+        eval_spec.input_fn,
+        eval_spec.steps,
+        hooks=hooks,
+        checkpoint_path=ckpt_path)
+    return float(eval_result[FLAGS.metric])
+
+  base_metric = _evaluate([])
+  logging.info('baseline %s = %.6f' % (FLAGS.metric, base_metric))
+
+  results = []
+  quantization_config = EmbeddingQuantization()
+  for embed_name in sorted(embeddings.keys()):
+    num_rows, dim = embeddings[embed_name]
+    result = {
+        'embedding_name': embed_name,
+        'num_rows': num_rows,
+        'dim': dim,
+        'fp32_bytes': num_rows * dim * 4
+    }
+    best_precision = embedding_quantization.FP32
+    for precision in precisions:
+      metric = _evaluate([FakeQuantizeHook(embed_name, precision)])
+      precision_name = embedding_quantization.precision_name(precision)
+      result['%s_bytes' % precision_name] = num_rows * \
+          embedding_quantization.row_bytes(dim, precision)
+      result['%s_%s_drop' % (precision_name, FLAGS.metric)] = \
+          base_metric - metric
+      logging.info('%s %s: %s = %.6f, drop = %.6f' %
+                   (embed_name, precision_name, FLAGS.metric, metric,
+                    base_metric - metric))
+      if base_metric - metric <= FLAGS.max_metric_drop and \
+          embedding_quantization.row_bytes(dim, precision) < \
+          embedding_quantization.row_bytes(dim, best_precision):
+        best_precision = precision
+    result['suggested_precision'] = embedding_quantization.precision_name(
+        best_precision)
+    results.append(result)
+    if best_precision != embedding_quantization.FP32:
+      quantization_config.embedding_precisions.add(
+          embedding_name=embed_name, precision=best_precision)
+  if hasattr(eval_spec.input_fn, 'input_creator'):
+    eval_spec.input_fn.input_creator.stop()
+
+  suggested_config = text_format.MessageToString(
+      quantization_config, as_one_line=False)
+  logging.info('suggested export_config.embedding_quantization:\n%s' %
+               suggested_config)
+  if FLAGS.output_path:
+    output_dir = os.path.dirname(FLAGS.output_path)
+    if output_dir and not gfile.Exists(output_dir):
+      gfile.MakeDirs(output_dir)
+    with gfile.GFile(FLAGS.output_path, 'w') as fout:
+      json.dump(
+          {
+              'baseline_%s' % FLAGS.metric: base_metric,
+              'embeddings': results,
+              'embedding_quantization': suggested_config
+          },
+          fout,
+          indent=2)
+
+
+if __name__ == '__main__':
+  sys.argv = io_util.filter_unknown_args(FLAGS, sys.argv)
+  tf.app.run()
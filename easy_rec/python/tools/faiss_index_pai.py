@@ -4,82 +4,165 @@ from __future__ import print_function
 
 import logging
 import os
+import shutil
 import sys
+import tempfile
 
 import faiss
 import numpy as np
 import tensorflow as tf
 
+from easy_rec.python.inference.local_vector_retrieve import read_vectors
 from easy_rec.python.utils import io_util
+from easy_rec.python.utils.streaming_index_builder import StreamingIndexBuilder
+from easy_rec.python.utils.streaming_index_builder import VectorChunks
+from easy_rec.python.utils.vector_index import parse_vectors
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
 
 logging.basicConfig(
     level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
 
 tf.app.flags.DEFINE_string('tables', '', 'tables passed by pai command')
+tf.app.flags.DEFINE_string(
+    'input_path', '', 'local or oss csv/parquet embedding files, '
+    'schema: (id, embedding), used if tables is not set')
+tf.app.flags.DEFINE_string('embedding_delimiter', ',',
+                           'delimiter of embedding strings')
 tf.app.flags.DEFINE_integer('batch_size', 1024, 'batch size')
 tf.app.flags.DEFINE_integer('embedding_dim', 32, 'embedding dimension')
 tf.app.flags.DEFINE_string('index_output_dir', '', 'index output directory')
-tf.app.flags.DEFINE_string('index_type', 'IVFFlat', 'index type')
+tf.app.flags.DEFINE_string('index_type', 'IVFFlat',
+                           'index type: IVFFlat | IVFPQ | HNSWFlat')
 tf.app.flags.DEFINE_integer('ivf_nlist', 1000, 'nlist')
+tf.app.flags.DEFINE_integer('ivf_pq_m', 8, 'number of sub quantizers of IVFPQ')
 tf.app.flags.DEFINE_integer('hnsw_M', 32, 'hnsw M')
 tf.app.flags.DEFINE_integer('hnsw_efConstruction', 200, 'hnsw efConstruction')
+tf.app.flags.DEFINE_integer(
+    'train_sample_size', 0, 'number of the first embeddings to train '
+    'IVFFlat/IVFPQ, default to 256 * max(ivf_nlist, 256)')
+tf.app.flags.DEFINE_integer('chunk_size', 65536,
+                            'number of embeddings added to index at a time')
+tf.app.flags.DEFINE_integer('num_shards', 1, 'number of index shards')
 tf.app.flags.DEFINE_integer('debug', 0, 'debug index')
 
 FLAGS = tf.app.flags.FLAGS
 
 
-def main(argv):
-  reader = tf.python_io.TableReader(
-      FLAGS.tables, slice_id=0, slice_count=1, capacity=FLAGS.batch_size * 2)
-  i = 0
-  id_map_f = tf.gfile.GFile(
-      os.path.join(FLAGS.index_output_dir, 'id_mapping'), 'w')
-  embeddings = []
-  while True:
-    try:
-      records = reader.read(FLAGS.batch_size)
-      for j, record in enumerate(records):
-        if isinstance(record[0], bytes):
-          eid = record[0].decode('utf-8')
-        id_map_f.write('%s\n' % eid)
-
-      embeddings.extend(
-          [list(map(float, record[1].split(b','))) for record in records])
-      i += 1
-      if i % 100 == 0:
-        logging.info('read %d embeddings.' % (i * FLAGS.batch_size))
-    except tf.python_io.OutOfRangeException:
-      break
-  reader.close()
-  id_map_f.close()
-
-  logging.info('Building faiss index..')
-  if FLAGS.index_type == 'IVFFlat':
+def _create_index():
+  if FLAGS.index_type in ['IVFFlat', 'IVFPQ']:
     quantizer = faiss.IndexFlatIP(FLAGS.embedding_dim)
-    index = faiss.IndexIVFFlat(quantizer, FLAGS.embedding_dim, FLAGS.ivf_nlist,
-                               faiss.METRIC_INNER_PRODUCT)
+    if FLAGS.index_type == 'IVFFlat':
+      index = faiss.IndexIVFFlat(quantizer, FLAGS.embedding_dim,
+                                 FLAGS.ivf_nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+      index = faiss.IndexIVFPQ(quantizer, FLAGS.embedding_dim, FLAGS.ivf_nlist,
+                               FLAGS.ivf_pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+    # quantizer must be kept alive with the index
+    index.own_fields = True
+    quantizer.this.disown()
   elif FLAGS.index_type == 'HNSWFlat':
     index = faiss.IndexHNSWFlat(FLAGS.embedding_dim, FLAGS.hnsw_M,
                                 faiss.METRIC_INNER_PRODUCT)
     index.hnsw.efConstruction = FLAGS.hnsw_efConstruction
   else:
     raise NotImplementedError
+  return index
+
+
+def _read_embeddings():
+  """Yield batches of (ids, embeddings)."""
+  if FLAGS.tables:
+    reader = tf.python_io.TableReader(
+        FLAGS.tables, slice_id=0, slice_count=1, capacity=FLAGS.batch_size * 2)
+    while True:
+      try:
+        records = reader.read(FLAGS.batch_size)
+      except tf.python_io.OutOfRangeException:
+        break
+      ids = [
+          x[0].decode('utf-8') if isinstance(x[0], bytes) else x[0]
+          for x in records
+      ]
+      yield ids, parse_vectors([x[1] for x in records], FLAGS.embedding_dim,
+                               FLAGS.embedding_delimiter)
+    reader.close()
+  else:
+    for ids, embeddings in read_vectors(
+        FLAGS.input_path,
+        FLAGS.embedding_dim,
+        delimiter=FLAGS.embedding_delimiter,
+        batch_size=FLAGS.batch_size):
+      yield ids, embeddings
 
-  embeddings = np.array(embeddings)
-  if FLAGS.index_type == 'IVFFlat':
-    logging.info('train embeddings...')
-    index.train(embeddings)
 
-  logging.info('build embeddings...')
-  index.add(embeddings)
-  faiss.write_index(index, 'faiss_index')
+def _write_index(index, index_name):
+  tmp_dir = tempfile.mkdtemp(prefix='faiss_index_')
+  try:
+    tmp_path = os.path.join(tmp_dir, index_name)
+    faiss.write_index(index, tmp_path)
+    tf.gfile.Copy(
+        tmp_path,
+        os.path.join(FLAGS.index_output_dir, index_name),
+        overwrite=True)
+  finally:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
 
-  with tf.gfile.GFile(
-      os.path.join(FLAGS.index_output_dir, 'faiss_index'), 'wb') as f_out:
-    with open('faiss_index', 'rb') as f_in:
-      f_out.write(f_in.read())
 
+def _shard_name(name, shard_id):
+  if FLAGS.num_shards == 1:
+    return name
+  return '%s_part_%d' % (name, shard_id)
+
+
+def main(argv):
+  assert FLAGS.tables or FLAGS.input_path, \
+      'either tables or input_path should be set'
+  train_sample_size = FLAGS.train_sample_size
+  if train_sample_size <= 0:
+    train_sample_size = 256 * max(FLAGS.ivf_nlist, 256)
+  builder = StreamingIndexBuilder(
+      _create_index,
+      FLAGS.embedding_dim,
+      num_shards=FLAGS.num_shards,
+      train_sample_size=train_sample_size,
+      chunk_size=FLAGS.chunk_size,
+      clone_fn=faiss.clone_index)
+  if not tf.gfile.IsDirectory(FLAGS.index_output_dir):
+    tf.gfile.MakeDirs(FLAGS.index_output_dir)
+  id_map_fs = [
+      tf.gfile.GFile(
+          os.path.join(FLAGS.index_output_dir,
+                       _shard_name('id_mapping', shard_id)), 'w')
+      for shard_id in range(FLAGS.num_shards)
+  ]
+  debug_embeddings = None
   if FLAGS.debug != 0:
+    debug_embeddings = VectorChunks(FLAGS.embedding_dim, FLAGS.chunk_size)
+
+  for i, (ids, embeddings) in enumerate(_read_embeddings()):
+    shard_ids = builder.add(embeddings)
+    ids = np.asarray(ids)
+    for shard_id, id_map_f in enumerate(id_map_fs):
+      shard_eids = ids[shard_ids == shard_id]
+      if len(shard_eids) > 0:
+        id_map_f.write(''.join('%s\n' % eid for eid in shard_eids))
+    if debug_embeddings is not None:
+      debug_embeddings.append(embeddings)
+    if (i + 1) % 100 == 0:
+      logging.info('read %d embeddings.' % builder.num_vectors)
+  for id_map_f in id_map_fs:
+    id_map_f.close()
+
+  logging.info('Building faiss index with %d embeddings..' %
+               builder.num_vectors)
+  indexes = builder.finish()
+  for shard_id, index in enumerate(indexes):
+    _write_index(index, _shard_name('faiss_index', shard_id))
+
+  if debug_embeddings is not None:
+    embeddings = np.concatenate(list(debug_embeddings.pop_chunks()), axis=0)
     # IVFFlat
     for ivf_nlist in [100, 500, 1000, 2000]:
       quantizer = faiss.IndexFlatIP(FLAGS.embedding_dim)
@@ -87,12 +170,7 @@ def main(argv):
                                  faiss.METRIC_INNER_PRODUCT)
       index.train(embeddings)
       index.add(embeddings)
-      index_name = 'faiss_index_ivfflat_nlist%d' % ivf_nlist
-      faiss.write_index(index, index_name)
-      with tf.gfile.GFile(
-          os.path.join(FLAGS.index_output_dir, index_name), 'wb') as f_out:
-        with open(index_name, 'rb') as f_in:
-          f_out.write(f_in.read())
+      _write_index(index, 'faiss_index_ivfflat_nlist%d' % ivf_nlist)
 
     # HNSWFlat
     for hnsw_M in [16, 32, 64, 128]:
@@ -103,12 +181,8 @@ def main(argv):
                                     faiss.METRIC_INNER_PRODUCT)
         index.hnsw.efConstruction = hnsw_efConstruction
         index.add(embeddings)
-        index_name = 'faiss_index_hnsw_M%d_ef%d' % (hnsw_M, hnsw_efConstruction)
-        faiss.write_index(index, index_name)
-        with tf.gfile.GFile(
-            os.path.join(FLAGS.index_output_dir, index_name), 'wb') as f_out:
-          with open(index_name, 'rb') as f_in:
-            f_out.write(f_in.read())
+        _write_index(
+            index, 'faiss_index_hnsw_M%d_ef%d' % (hnsw_M, hnsw_efConstruction))
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@ from __future__ import division
 from __future__ import print_function
 
 import json
+import multiprocessing
 import os
 import sys
 from collections import OrderedDict
@@ -11,8 +12,11 @@ import pandas as pd
 import tensorflow as tf
 from tensorflow.python.framework.meta_graph import read_meta_graph_file
 
+from easy_rec.python.inference.predictor import PredictorImpl
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
 from easy_rec.python.utils import config_util
 from easy_rec.python.utils import io_util
+from easy_rec.python.utils.input_utils import get_type_defaults
 
 if tf.__version__ >= '2.0':
   tf = tf.compat.v1
@@ -34,6 +38,27 @@ tf.app.flags.DEFINE_integer(
 tf.app.flags.DEFINE_string('fg_path', '', 'fg config path')
 tf.app.flags.DEFINE_bool('visualize', False,
                          'visualization feature selection result or not')
+# flags for permutation feature importance
+tf.app.flags.DEFINE_string('saved_model_dir', '', 'exported saved_model dir')
+tf.app.flags.DEFINE_string('input_path', '',
+                           'eval data path, csv files separated by ,')
+tf.app.flags.DEFINE_integer('num_samples', 100000,
+                            'number of eval samples sampled from input_path')
+tf.app.flags.DEFINE_string(
+    'method', 'permutation', 'permutation: shuffle the values of a feature, '
+    'ablation: replace the values of a feature with the default value')
+tf.app.flags.DEFINE_integer('num_repeats', 5,
+                            'number of permutations for each feature')
+tf.app.flags.DEFINE_integer('batch_size', 8192,
+                            'max number of samples in one session run')
+tf.app.flags.DEFINE_integer('num_workers', 1, 'number of predictor processes')
+tf.app.flags.DEFINE_string('output_name', 'probs',
+                           'saved_model output used as predictions')
+tf.app.flags.DEFINE_string(
+    'label_name', '', 'label field, default is data_config.label_fields[0]')
+tf.app.flags.DEFINE_string('gauc_key', '',
+                           'input field used as user id to compute gauc')
+tf.app.flags.DEFINE_integer('seed', 2020, 'random seed')
 FLAGS = tf.app.flags.FLAGS
 
 
@@ -300,6 +325,268 @@ class VariationalDropoutFS:
       plt.savefig(f, format='png')
 
 
+_NUMPY_TYPES = {
+    DatasetConfig.INT32: np.int32,
+    DatasetConfig.INT64: np.int64,
+    DatasetConfig.STRING: object,
+    DatasetConfig.BOOL: np.bool_,
+    DatasetConfig.FLOAT: np.float32,
+    DatasetConfig.DOUBLE: np.float64
+}
+
+# state of predictor processes
+_worker_state = {}
+
+
+def _gauc(labels, predictions, groups):
+  """Mean auc of the groups with both positive and negative samples."""
+  from sklearn.metrics import roc_auc_score
+  _, group_ids = np.unique(groups, return_inverse=True)
+  order = np.argsort(group_ids, kind='stable')
+  boundaries = np.flatnonzero(np.diff(group_ids[order])) + 1
+  aucs = []
+  for ids in np.split(order, boundaries):
+    if 0 < np.sum(labels[ids]) < len(ids):
+      aucs.append(roc_auc_score(labels[ids], predictions[ids]))
+  return np.mean(aucs) if len(aucs) > 0 else 0.0
+
+
+def _init_worker(saved_model_dir, columns, defaults, labels, groups,
+                 output_name, batch_size, method):
+  _worker_state['predictor'] = PredictorImpl(saved_model_dir)
+  _worker_state['columns'] = columns
+  _worker_state['defaults'] = defaults
+  _worker_state['labels'] = labels
+  _worker_state['groups'] = groups
+  _worker_state['output_name'] = output_name
+  _worker_state['batch_size'] = batch_size
+  _worker_state['method'] = method
+
+
+def _eval_variants(variants):
+  """Evaluate a chunk of variants in batched session runs.
+
+  Args:
+    variants: list of (input_name, repeat_id), input_name None means
+      the baseline without permutation.
+
+  Return:
+    list of (input_name, repeat_id, auc, gauc)
+  """
+  from sklearn.metrics import roc_auc_score
+  predictor = _worker_state['predictor']
+  columns = _worker_state['columns']
+  labels = _worker_state['labels']
+  groups = _worker_state['groups']
+  batch_size = _worker_state['batch_size']
+  num_rows = len(labels)
+
+  # stack the variants into one feed, so that the permutations of
+  # several features are evaluated in one session run
+  feed_dict = {}
+  for name, values in columns.items():
+    variant_values = []
+    for input_name, repeat_id in variants:
+      if input_name != name:
+        variant_values.append(values)
+      elif _worker_state['method'] == 'ablation':
+        variant_values.append(
+            np.full_like(values, _worker_state['defaults'][name]))
+      else:
+        rng = np.random.RandomState(repeat_id)
+        variant_values.append(values[rng.permutation(num_rows)])
+    feed_dict[name] = np.concatenate(variant_values)
+
+  predictions = []
+  total_rows = num_rows * len(variants)
+  for start in range(0, total_rows, batch_size):
+    batch_dict = {k: v[start:start + batch_size] for k, v in feed_dict.items()}
+    outputs = predictor.predict(batch_dict, [_worker_state['output_name']])
+    predictions.append(np.reshape(outputs[_worker_state['output_name']], [-1]))
+  predictions = np.concatenate(predictions)
+
+  results = []
+  for vid, (input_name, repeat_id) in enumerate(variants):
+    variant_preds = predictions[vid * num_rows:(vid + 1) * num_rows]
+    auc = roc_auc_score(labels, variant_preds)
+    gauc = _gauc(labels, variant_preds, groups) if groups is not None else None
+    results.append((input_name, repeat_id, auc, gauc))
+  return results
+
+
+class PermutationFS:
+  """Model agnostic feature importance by permutation or ablation.
+
+  The saved_model is evaluated on sampled eval data, with the values of one
+  feature shuffled(or replaced by the default value) at a time, the drop of
+  auc/gauc compared to the baseline is the importance of the feature.
+  """
+
+  def __init__(self,
+               config_path,
+               saved_model_dir,
+               input_path,
+               output_dir,
+               num_samples=100000,
+               method='permutation',
+               num_repeats=5,
+               batch_size=8192,
+               num_workers=1,
+               output_name='probs',
+               label_name='',
+               gauc_key='',
+               seed=2020):
+    assert method in ['permutation', 'ablation'], 'invalid method: %s' % method
+    self._config = config_util.get_configs_from_pipeline_file(config_path)
+    self._saved_model_dir = saved_model_dir
+    self._input_path = input_path
+    self._output_dir = output_dir
+    if not tf.gfile.Exists(self._output_dir):
+      tf.gfile.MakeDirs(self._output_dir)
+    self._num_samples = num_samples
+    self._method = method
+    self._num_repeats = num_repeats if method == 'permutation' else 1
+    self._batch_size = batch_size
+    self._num_workers = num_workers
+    self._output_name = output_name
+    data_config = self._config.data_config
+    self._label_name = label_name if label_name else data_config.label_fields[0]
+    self._gauc_key = gauc_key
+    self._seed = seed
+
+  def _sample_lines(self):
+    """Reservoir sampling of num_samples lines from input_path."""
+    rng = np.random.RandomState(self._seed)
+    data_config = self._config.data_config
+    lines = []
+    line_id = 0
+    for input_path in self._input_path.split(','):
+      for file_path in tf.gfile.Glob(input_path):
+        with tf.gfile.GFile(file_path, 'r') as fin:
+          if data_config.with_header:
+            fin.readline()
+          for line in fin:
+            if len(lines) < self._num_samples:
+              lines.append(line)
+            else:
+              pos = rng.randint(0, line_id + 1)
+              if pos < self._num_samples:
+                lines[pos] = line
+            line_id += 1
+    tf.logging.info('sample %d lines from %d lines' % (len(lines), line_id))
+    return lines
+
+  def _load_data(self, input_names):
+    data_config = self._config.data_config
+    lines = self._sample_lines()
+    field_ids = {
+        x.input_name: i for i, x in enumerate(data_config.input_fields)
+    }
+    rows = [line.rstrip('\r\n').split(data_config.separator) for line in lines]
+    columns = {}
+    defaults = {}
+    for input_name in input_names:
+      if input_name not in field_ids:
+        raise ValueError(
+            'input %s of saved_model is not in data_config.input_fields, '
+            'please export with export_config.multi_placeholder=true' %
+            input_name)
+      input_field = data_config.input_fields[field_ids[input_name]]
+      default_val = get_type_defaults(input_field.input_type,
+                                      input_field.default_val)
+      values = [x[field_ids[input_name]] for x in rows]
+      if input_field.input_type != DatasetConfig.STRING:
+        values = [x if x != '' else default_val for x in values]
+      values = np.array(values).astype(_NUMPY_TYPES[input_field.input_type])
+      columns[input_name] = values
+      defaults[input_name] = default_val
+    labels = np.array([float(x[field_ids[self._label_name]]) for x in rows
+                       ]) > 0.5
+    groups = None
+    if self._gauc_key:
+      groups = np.array([x[field_ids[self._gauc_key]] for x in rows])
+    return columns, defaults, labels.astype(np.int32), groups
+
+  def process(self):
+    predictor = PredictorImpl(self._saved_model_dir)
+    input_names = predictor.input_names
+    del predictor
+    columns, defaults, labels, groups = self._load_data(input_names)
+    num_rows = len(labels)
+
+    variants = [(None, 0)]
+    for input_name in input_names:
+      for repeat_id in range(self._num_repeats):
+        variants.append((input_name, self._seed + repeat_id))
+    variants_per_run = max(1, self._batch_size // num_rows)
+    chunks = [
+        variants[i:i + variants_per_run]
+        for i in range(0, len(variants), variants_per_run)
+    ]
+    tf.logging.info('evaluate %d variants in %d chunks with %d workers' %
+                    (len(variants), len(chunks), self._num_workers))
+
+    init_args = (self._saved_model_dir, columns, defaults, labels, groups,
+                 self._output_name, self._batch_size, self._method)
+    results = []
+    if self._num_workers > 1:
+      # spawn new processes, as forked tensorflow sessions are not safe
+      pool = multiprocessing.get_context('spawn').Pool(
+          self._num_workers, initializer=_init_worker, initargs=init_args)
+      try:
+        for chunk_results in pool.imap_unordered(_eval_variants, chunks):
+          results.extend(chunk_results)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      _init_worker(*init_args)
+      for chunk in chunks:
+        results.extend(_eval_variants(chunk))
+
+    feature_importance = self._get_feature_importance(results)
+    self._dump_to_csv(feature_importance)
+    return feature_importance
+
+  def _get_feature_importance(self, results):
+    """Mean and 95% confidence interval of metric drops over repeats."""
+    base_auc, base_gauc = [x[2:] for x in results if x[0] is None][0]
+    tf.logging.info('baseline auc = %.6f gauc = %s' % (base_auc, base_gauc))
+    metric_drops = OrderedDict()
+    for input_name, _, auc, gauc in results:
+      if input_name is None:
+        continue
+      drops = metric_drops.setdefault(input_name, {'auc': [], 'gauc': []})
+      drops['auc'].append(base_auc - auc)
+      if gauc is not None:
+        drops['gauc'].append(base_gauc - gauc)
+
+    feature_importance = []
+    for input_name, drops in metric_drops.items():
+      importance = OrderedDict(feature_name=input_name)
+      for metric_name in ['auc', 'gauc']:
+        vals = np.array(drops[metric_name])
+        if len(vals) == 0:
+          continue
+        ci = 1.96 * np.std(
+            vals, ddof=1) / np.sqrt(len(vals)) if len(vals) > 1 else 0.0
+        importance['%s_drop' % metric_name] = np.mean(vals)
+        importance['%s_drop_ci' % metric_name] = ci
+      feature_importance.append(importance)
+    feature_importance.sort(key=lambda x: x['auc_drop'], reverse=True)
+    for importance in feature_importance:
+      tf.logging.info(json.dumps(importance))
+    return feature_importance
+
+  def _dump_to_csv(self, feature_importance):
+    """Dump feature importance data to a csv file."""
+    with tf.gfile.Open(
+        os.path.join(self._output_dir,
+                     'feature_importance_%s.csv' % self._method), 'w') as f:
+      df = pd.DataFrame(feature_importance)
+      df.to_csv(f, index=False)
+
+
 if __name__ == '__main__':
   sys.argv = io_util.filter_unknown_args(FLAGS, sys.argv)
   if FLAGS.model_type == 'variational_dropout':
@@ -311,6 +598,22 @@ if __name__ == '__main__':
         fg_path=FLAGS.fg_path,
         visualize=FLAGS.visualize)
     fs.process()
+  elif FLAGS.model_type == 'permutation':
+    fs = PermutationFS(
+        FLAGS.config_path,
+        FLAGS.saved_model_dir,
+        FLAGS.input_path,
+        FLAGS.output_dir,
+        num_samples=FLAGS.num_samples,
+        method=FLAGS.method,
+        num_repeats=FLAGS.num_repeats,
+        batch_size=FLAGS.batch_size,
+        num_workers=FLAGS.num_workers,
+        output_name=FLAGS.output_name,
+        label_name=FLAGS.label_name,
+        gauc_key=FLAGS.gauc_key,
+        seed=FLAGS.seed)
+    fs.process()
   else:
     raise ValueError('Unknown feature selection model type %s' %
                      FLAGS.model_type)
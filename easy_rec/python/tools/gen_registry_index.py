@@ -0,0 +1,159 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Generate easy_rec/python/utils/registry_index.py.
+
+The index maps the names of registered classes(models, inputs, predictors)
+and keras layers to the modules defining them, so that only the modules
+named by the config are imported. The source files are parsed with ast,
+nothing is imported.
+
+Usage:
+  python -m easy_rec.python.tools.gen_registry_index
+  # check the index is up to date, exit with 1 if not
+  python -m easy_rec.python.tools.gen_registry_index --check
+"""
+import argparse
+import ast
+import logging
+import os
+import sys
+
+logging.basicConfig(
+    level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_PATH = os.path.join(PYTHON_DIR, 'utils/registry_index.py')
+
+# registry name => (module defining the root class, directories to scan)
+REGISTRIES = {
+    'EasyRecModel': ('model.easy_rec_model', ['model']),
+    'Input': ('input.input', ['input']),
+    'PredictorInterface': ('inference.predictor', ['inference']),
+}
+KERAS_LAYER_REGISTRY = 'KerasLayer'
+KERAS_LAYER_PACKAGE = 'layers.keras'
+
+HEADER = """# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+# This file is generated by easy_rec/python/tools/gen_registry_index.py,
+# do not edit it manually.
+# Module paths are relative to easy_rec.python.
+"""
+
+
+def _base_name(node):
+  if isinstance(node, ast.Name):
+    return node.id
+  elif isinstance(node, ast.Attribute):
+    return node.attr
+  return None
+
+
+def _parse_classes(python_dir, sub_dir):
+  """Parse (module, class_name, base_names) of top level classes."""
+  classes = []
+  root_dir = os.path.join(python_dir, sub_dir)
+  for file_name in sorted(os.listdir(root_dir)):
+    if not file_name.endswith('.py') or file_name.endswith('_test.py'):
+      continue
+    module = sub_dir.replace('/', '.') + '.' + file_name[:-3]
+    with open(os.path.join(root_dir, file_name), 'r') as fin:
+      tree = ast.parse(fin.read(), file_name)
+    for node in tree.body:
+      if isinstance(node, ast.ClassDef):
+        base_names = [_base_name(x) for x in node.bases]
+        classes.append((module, node.name, base_names))
+  return classes
+
+
+def _build_registry(python_dir, root_module, sub_dirs, root_name):
+  classes = []
+  for sub_dir in sub_dirs:
+    classes.extend(_parse_classes(python_dir, sub_dir))
+  registry = {root_name: root_module}
+  updated = True
+  while updated:
+    updated = False
+    for module, class_name, base_names in classes:
+      if class_name in registry:
+        continue
+      if any(x in registry for x in base_names):
+        registry[class_name] = module
+        updated = True
+  for module, class_name, base_names in classes:
+    if class_name in registry and registry[class_name] != module and \
+        any(x in registry for x in base_names):
+      raise ValueError('class %s is defined in both %s and %s' %
+                       (class_name, registry[class_name], module))
+  return registry
+
+
+def _build_keras_layers(python_dir):
+  """Parse the layers exported by easy_rec/python/layers/keras/__init__.py."""
+  init_path = os.path.join(python_dir, KERAS_LAYER_PACKAGE.replace('.', '/'),
+                           '__init__.py')
+  with open(init_path, 'r') as fin:
+    tree = ast.parse(fin.read(), init_path)
+  registry = {}
+  for node in tree.body:
+    if isinstance(node, ast.ImportFrom) and node.level == 1:
+      for alias in node.names:
+        registry[alias.asname or alias.name] = \
+            KERAS_LAYER_PACKAGE + '.' + node.module
+  return registry
+
+
+def build_registry_index(python_dir=PYTHON_DIR):
+  """Build the registry index by parsing the source files.
+
+  Args:
+    python_dir: path to easy_rec/python
+
+  Return:
+    dict of registry name => {class name => module relative to easy_rec.python}
+  """
+  index = {}
+  for root_name, (root_module, sub_dirs) in REGISTRIES.items():
+    index[root_name] = _build_registry(python_dir, root_module, sub_dirs,
+                                       root_name)
+  index[KERAS_LAYER_REGISTRY] = _build_keras_layers(python_dir)
+  return index
+
+
+def format_registry_index(index):
+  lines = [HEADER, 'REGISTRY_INDEX = {']
+  for registry in sorted(index.keys()):
+    lines.append("    '%s': {" % registry)
+    for class_name in sorted(index[registry].keys()):
+      lines.append("        '%s': '%s'," %
+                   (class_name, index[registry][class_name]))
+    lines.append('    },')
+  lines.append('}')
+  return '\n'.join(lines) + '\n'
+
+
+def main(args):
+  index_str = format_registry_index(build_registry_index())
+  if args.check:
+    with open(INDEX_PATH, 'r') as fin:
+      if fin.read() != index_str:
+        logging.error('%s is out of date, please run: '
+                      'python -m easy_rec.python.tools.gen_registry_index' %
+                      INDEX_PATH)
+        return 1
+    logging.info('%s is up to date' % INDEX_PATH)
+    return 0
+  with open(INDEX_PATH, 'w') as fout:
+    fout.write(index_str)
+  logging.info('write registry index to %s' % INDEX_PATH)
+  return 0
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      default=False,
+      help='check the registry index is up to date')
+  sys.exit(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Benchmark the time of importing easy_rec modules.
+
+Each statement is run in a new python process for several times, the
+time of importing tensorflow is also reported as the baseline.
+
+Usage:
+  python -m easy_rec.python.tools.import_time_benchmark --num_runs 5
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
+
+DEFAULT_STATEMENTS = [
+    'import tensorflow',
+    'import easy_rec',
+    'from easy_rec.python.inference.predictor import PredictorImpl',
+    'import easy_rec.python.main',
+    'from easy_rec.python.utils import load_class;'
+    'load_class.auto_import()',
+]
+
+
+def time_statement(statement, num_runs):
+  """Run statement in new processes and return the elapsed seconds."""
+  elapsed = []
+  for _ in range(num_runs):
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', statement],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+    elapsed.append(time.time() - start)
+  return elapsed
+
+
+def main(args):
+  statements = args.statements if args.statements else DEFAULT_STATEMENTS
+  results = []
+  for statement in statements:
+    elapsed = time_statement(statement, args.num_runs)
+    res = {
+        'statement': statement,
+        'min': float(np.min(elapsed)),
+        'median': float(np.median(elapsed))
+    }
+    logging.info('%-70s min=%.3fs median=%.3fs' %
+                 (statement, res['min'], res['median']))
+    results.append(res)
+  if args.output_path:
+    with open(args.output_path, 'w') as fout:
+      json.dump(results, fout, indent=2)
+    logging.info('save results to %s' % args.output_path)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--num_runs', type=int, default=3, help='number of runs per statement')
+  parser.add_argument(
+      '--statements',
+      type=str,
+      nargs='*',
+      default=None,
+      help='python statements to benchmark')
+  parser.add_argument(
+      '--output_path', type=str, default=None, help='save results as json')
+  main(parser.parse_args())
@@ -0,0 +1,116 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Retrieve top n neighbours of query vectors on a single machine.
+
+Usage:
+  python -m easy_rec.python.tools.local_vector_retrieve
+    --query_path query_vectors.csv --doc_path doc_vectors.csv
+    --output_path knn_result.parquet --knn_feature_dims 128
+    --knn_num_neighbours 100 --knn_index_type ivfflat
+"""
+import argparse
+import logging
+import sys
+
+from easy_rec.python.inference.local_vector_retrieve import LocalVectorRetrieve
+from easy_rec.python.utils import vector_index
+
+logging.basicConfig(
+    format='[%(levelname)s] %(asctime)s %(filename)s:%(lineno)d : %(message)s',
+    level=logging.INFO)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--query_path',
+      type=str,
+      default='',
+      help='query vector files, csv or parquet, schema: (id, vector)')
+  parser.add_argument(
+      '--doc_path',
+      type=str,
+      default='',
+      help='doc vector files, csv or parquet, schema: (id, vector)')
+  parser.add_argument(
+      '--output_path',
+      type=str,
+      default='',
+      help='output file, parquet if ends with .parquet, else csv, '
+      'schema: (query_id, doc_id, distance)')
+  parser.add_argument(
+      '--index_dir',
+      type=str,
+      default='',
+      help='directory to save the index, the index is reused if exists')
+  parser.add_argument(
+      '--knn_distance',
+      type=str,
+      default='inner_product',
+      choices=['l2', 'inner_product'],
+      help='distance type')
+  parser.add_argument(
+      '--knn_num_neighbours', type=int, default=100, help='top n')
+  parser.add_argument(
+      '--knn_feature_dims', type=int, default=0, help='vector dimension')
+  parser.add_argument(
+      '--knn_feature_delimiter',
+      type=str,
+      default=',',
+      help='delimiter of vector elements')
+  parser.add_argument(
+      '--field_sep',
+      type=str,
+      default='\t',
+      help='field separator of csv files')
+  parser.add_argument(
+      '--knn_index_type',
+      type=str,
+      default='ivfflat',
+      choices=vector_index.INDEX_TYPES,
+      help='index type')
+  parser.add_argument(
+      '--knn_nlist', type=int, default=100, help='number of clusters')
+  parser.add_argument(
+      '--knn_nprobe', type=int, default=10, help='number of clusters to probe')
+  parser.add_argument(
+      '--knn_compress_dim',
+      type=int,
+      default=8,
+      help='number of sub quantizers of ivfpq')
+  parser.add_argument(
+      '--hnsw_m', type=int, default=32, help='number of neighbours of hnsw')
+  parser.add_argument(
+      '--hnsw_ef_search', type=int, default=64, help='hnsw efSearch')
+  parser.add_argument(
+      '--batch_size', type=int, default=1024, help='query batch size')
+  parser.add_argument(
+      '--num_workers',
+      type=int,
+      default=0,
+      help='number of search processes, default to cpu count')
+  args = parser.parse_args()
+
+  for arg_name in ['query_path', 'doc_path', 'output_path', 'knn_feature_dims']:
+    if not getattr(args, arg_name):
+      logging.error('%s is not set' % arg_name)
+      sys.exit(1)
+
+  knn = LocalVectorRetrieve(
+      args.query_path,
+      args.doc_path,
+      args.output_path,
+      args.knn_feature_dims,
+      delimiter=args.knn_feature_delimiter,
+      field_sep=args.field_sep,
+      batch_size=args.batch_size,
+      index_type=args.knn_index_type,
+      nlist=args.knn_nlist,
+      nprobe=args.knn_nprobe,
+      distance=vector_index.DISTANCE_INNER_PRODUCT
+      if args.knn_distance == 'inner_product' else vector_index.DISTANCE_L2,
+      m=args.knn_compress_dim,
+      hnsw_m=args.hnsw_m,
+      ef_search=args.hnsw_ef_search,
+      num_workers=args.num_workers,
+      index_dir=args.index_dir)
+  knn(args.knn_num_neighbours)
@@ -0,0 +1,250 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Save checkpoints without blocking the training loop.
+
+The variables are copied into host memory in the training session, which
+is fast compared with serializing them to model_dir(usually on oss). The
+copies are then written to local disk shard by shard and uploaded to
+model_dir in a background thread. The checkpoint state file is updated
+only after the upload completes, so the readers(evaluator, exporter,
+restarted jobs) never see incomplete checkpoints.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import tensorflow as tf
+from tensorflow.python.ops import gen_io_ops
+from tensorflow.python.platform import gfile
+from tensorflow.python.training import checkpoint_management
+
+try:
+  from tensorflow.python.training.saving import saveable_object_util
+except ImportError:
+  saveable_object_util = None
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+def _get_saveable_specs(saver):
+  """Get the specs of the saveables of saver, grouped by device."""
+  var_list = saver._var_list
+  if saveable_object_util is not None:
+    names_to_saveables = saveable_object_util.op_list_to_dict(var_list)
+    saveables = saveable_object_util.validate_and_slice_inputs(
+        names_to_saveables)
+  else:
+    from tensorflow.python.training.saver import BaseSaverBuilder
+    names_to_saveables = BaseSaverBuilder.OpListToDict(var_list)
+    saveables = BaseSaverBuilder()._ValidateAndSliceInputs(names_to_saveables)
+  shards = {}
+  for saveable in saveables:
+    for spec in saveable.specs:
+      shards.setdefault(spec.device, []).append(spec)
+  return [shards[x] for x in sorted(shards.keys())]
+
+
+class AsyncCheckpointWriter(object):
+
+  def __init__(self,
+               saver,
+               checkpoint_dir,
+               checkpoint_basename='model.ckpt',
+               local_dir=None,
+               data_offset_var=None,
+               write_meta_graph=True):
+    """Create the writer, must be called before the graph is finalized.
+
+    Args:
+      saver: tf.train.Saver, whose var_list and max_to_keep are used.
+      checkpoint_dir: directory to save the checkpoints.
+      checkpoint_basename: base name of the checkpoint files.
+      local_dir: local directory to write the checkpoints before uploading,
+        if not set, checkpoint_dir is used if it is local, otherwise a
+        temporary directory is used.
+      data_offset_var: data offset variable, saved to the .offset files.
+      write_meta_graph: whether to write the .meta files.
+    """
+    self._saver = saver
+    self._checkpoint_dir = checkpoint_dir
+    self._checkpoint_basename = checkpoint_basename
+    self._tmp_local_dir = None
+    if not local_dir:
+      if '://' not in checkpoint_dir:
+        local_dir = checkpoint_dir
+      else:
+        local_dir = tempfile.mkdtemp(prefix='async_checkpoint_')
+        self._tmp_local_dir = local_dir
+    self._local_dir = local_dir
+    if not gfile.IsDirectory(self._local_dir):
+      gfile.MakeDirs(self._local_dir)
+    self._data_offset_var = data_offset_var
+    self._write_meta_graph = write_meta_graph
+    self._meta_graph_def = None
+    self._max_to_keep = saver._max_to_keep
+
+    self._shards = _get_saveable_specs(saver)
+    # spec.tensor may create read ops, so evaluate it only once
+    self._fetches = [[spec.tensor for spec in specs] for specs in self._shards]
+    self._build_write_graph()
+    if data_offset_var is not None:
+      self._fetches.append(data_offset_var)
+
+    ckpt_state = checkpoint_management.get_checkpoint_state(checkpoint_dir)
+    if ckpt_state is not None:
+      self._checkpoints = list(ckpt_state.all_model_checkpoint_paths)
+    else:
+      self._checkpoints = []
+    self._thread = None
+    self._error = None
+    self._finished_steps = []
+    self._lock = threading.Lock()
+
+  def _build_write_graph(self):
+    """Build the graph to write the snapshots, shard by shard."""
+    self._write_graph = tf.Graph()
+    with self._write_graph.as_default(), tf.device('/cpu:0'):
+      self._prefix_ph = tf.placeholder(tf.string, [], name='prefix')
+      tmp_prefix = tf.string_join([self._prefix_ph, '_temp/part'])
+      num_shards = tf.constant(len(self._shards))
+      self._value_phs = []
+      shard_files = []
+      save_ops = []
+      for shard_id, (specs,
+                     tensors) in enumerate(zip(self._shards, self._fetches)):
+        phs = [tf.placeholder(x.dtype, x.get_shape()) for x in tensors]
+        self._value_phs.append(phs)
+        shard_file = gen_io_ops.sharded_filename(tmp_prefix, shard_id,
+                                                 num_shards)
+        save_ops.append(
+            gen_io_ops.save_v2(shard_file, [spec.name for spec in specs],
+                               [spec.slice_spec for spec in specs], phs))
+        shard_files.append(shard_file)
+      with tf.control_dependencies(save_ops):
+        self._write_op = gen_io_ops.merge_v2_checkpoints(
+            tf.stack(shard_files), self._prefix_ph, delete_old_dirs=True)
+    self._write_sess = tf.Session(graph=self._write_graph)
+
+  def save(self, session, step):
+    """Snapshot the variables and write them in background.
+
+    Waits for the previous checkpoint to finish, so that at most one
+    snapshot is being written.
+
+    Args:
+      session: the training session.
+      step: global step.
+    """
+    self.wait()
+    if self._write_meta_graph and self._meta_graph_def is None:
+      self._meta_graph_def = tf.train.export_meta_graph(
+          saver_def=self._saver.saver_def).SerializeToString()
+    start_ts = time.time()
+    values = session.run(self._fetches)
+    data_offset = values.pop() if self._data_offset_var is not None else None
+    logging.info('snapshot variables for step %d takes %.3fs' %
+                 (step, time.time() - start_ts))
+    self._thread = threading.Thread(
+        target=self._write, args=(step, values, data_offset))
+    self._thread.start()
+
+  def _write(self, step, values, data_offset):
+    try:
+      start_ts = time.time()
+      prefix_name = '%s-%d' % (self._checkpoint_basename, step)
+      local_prefix = os.path.join(self._local_dir, prefix_name)
+      feed_dict = {self._prefix_ph: local_prefix}
+      for phs, shard_values in zip(self._value_phs, values):
+        feed_dict.update(zip(phs, shard_values))
+      self._write_sess.run(self._write_op, feed_dict=feed_dict)
+      if self._meta_graph_def is not None:
+        with gfile.GFile(local_prefix + '.meta', 'wb') as fout:
+          fout.write(self._meta_graph_def)
+      write_ts = time.time()
+
+      save_prefix = os.path.join(self._checkpoint_dir, prefix_name)
+      if self._local_dir != self._checkpoint_dir:
+        local_files = gfile.Glob(local_prefix + '.*')
+        # upload data files first, then index and meta
+        local_files.sort(key=lambda x: ('.data-' not in x, x))
+        for local_file in local_files:
+          gfile.Copy(
+              local_file,
+              os.path.join(self._checkpoint_dir, os.path.basename(local_file)),
+              overwrite=True)
+          gfile.Remove(local_file)
+
+      if data_offset is not None:
+        data_offset_json = {}
+        for x in data_offset:
+          if x:
+            data_offset_json.update(json.loads(x))
+        with gfile.GFile(save_prefix + '.offset', 'w') as fout:
+          json.dump(data_offset_json, fout)
+
+      self._update_checkpoint_state(save_prefix)
+      logging.info('async save checkpoint %s done, write takes %.3fs, '
+                   'upload takes %.3fs' %
+                   (save_prefix, write_ts - start_ts, time.time() - write_ts))
+      with self._lock:
+        self._finished_steps.append(step)
+    except Exception as ex:
+      logging.exception('async save checkpoint for step %d failed: %s' %
+                        (step, str(ex)))
+      self._error = ex
+
+  def _update_checkpoint_state(self, save_prefix):
+    if save_prefix in self._checkpoints:
+      self._checkpoints.remove(save_prefix)
+    self._checkpoints.append(save_prefix)
+    if self._max_to_keep:
+      while len(self._checkpoints) > self._max_to_keep:
+        old_prefix = self._checkpoints.pop(0)
+        for old_file in gfile.Glob(old_prefix + '.*'):
+          try:
+            gfile.Remove(old_file)
+          except Exception as ex:
+            logging.warning('failed to remove %s: %s' % (old_file, str(ex)))
+    checkpoint_management.update_checkpoint_state_internal(
+        save_dir=self._checkpoint_dir,
+        model_checkpoint_path=save_prefix,
+        all_model_checkpoint_paths=self._checkpoints,
+        save_relative_paths=True)
+
+  def wait(self):
+    """Wait for the checkpoint being written, raise if it failed."""
+    if self._thread is not None:
+      start_ts = time.time()
+      self._thread.join()
+      self._thread = None
+      wait_secs = time.time() - start_ts
+      if wait_secs > 1:
+        logging.info('wait %.3fs for async save checkpoint' % wait_secs)
+    self._raise_error()
+
+  def _raise_error(self):
+    if self._error is not None:
+      error = self._error
+      self._error = None
+      raise error
+
+  def pop_finished_steps(self):
+    """Return the steps of checkpoints finished since the last call."""
+    self._raise_error()
+    with self._lock:
+      finished_steps = self._finished_steps
+      self._finished_steps = []
+    return finished_steps
+
+  def close(self):
+    self.wait()
+    if self._write_sess is not None:
+      self._write_sess.close()
+      self._write_sess = None
+    if self._tmp_local_dir is not None:
+      shutil.rmtree(self._tmp_local_dir, ignore_errors=True)
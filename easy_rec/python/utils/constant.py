@@ -26,6 +26,12 @@ EmbeddingParallel = 'EmbeddingParallel'
 # environ variable to force embedding placement on cpu
 EmbeddingOnCPU = 'place_embedding_on_cpu'
 
+# graph collections used to share user side computation
+# across the candidate items of one request on serving
+USER_SIDE_INPUTS = 'USER_SIDE_INPUTS'
+USER_SIDE_FEATURES = 'USER_SIDE_FEATURES'
+CANDIDATE_BATCH_SIZE = 'CANDIDATE_BATCH_SIZE'
+
 
 def enable_avx_str_split():
   os.environ[ENABLE_AVX_STR_SPLIT] = '1'
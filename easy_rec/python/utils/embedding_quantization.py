@@ -0,0 +1,589 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Low precision(fp16, int8) storage and lookup of the exported embeddings.
+
+Int8 rows are stored as uint8 codes with a float32 scale and offset per row:
+    value = code * scale + offset
+where offset is the minimum of the row and scale = (max - min) / 255.
+
+The redis/oss kv stores and the incremental update messages carry float32
+values, so a quantized row is transferred as a byte string packed 3 bytes
+per float32 word. Each word is an integer in [0, 2^24) which is exactly
+representable in float32, so it survives the copies and the single value
+sums done by the kv lookup operators. The packed rows are looked up with
+each id in its own bag, and unpacked, dequantized and combined in the graph.
+"""
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.core.framework import attr_value_pb2
+from tensorflow.core.protobuf import saved_model_pb2
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.platform import gfile
+from tensorflow.python.saved_model import constants
+from tensorflow.python.saved_model import signature_constants
+from tensorflow.python.saved_model import tag_constants
+from tensorflow.python.saved_model.loader_impl import SavedModelLoader
+
+from easy_rec.python.protos.export_pb2 import EmbeddingPrecision
+from easy_rec.python.utils import export_optimizer
+from easy_rec.python.utils import proto_util
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+FP32 = EmbeddingPrecision.FP32
+FP16 = EmbeddingPrecision.FP16
+INT8 = EmbeddingPrecision.INT8
+
+_INT8_LEVELS = 255.0
+_FP16_MAX = float(np.finfo(np.float16).max)
+_BYTES_PER_WORD = 3
+_GATHER_OPS = ['ResourceGather', 'GatherV2', 'Gather']
+
+
+def precision_name(precision):
+  return EmbeddingPrecision.Name(precision).lower()
+
+
+def get_embedding_precision(quantization_config, embed_name):
+  """Precision of the embedding.
+
+  Args:
+    quantization_config: protos.EmbeddingQuantization or None
+    embed_name: normalized embedding name, such as
+      input_layer/user_id_embedding, see proto_util.get_norm_embed_name
+  """
+  if quantization_config is None:
+    return FP32
+  short_name = embed_name.split('/')[-1]
+  for x in quantization_config.embedding_precisions:
+    if x.embedding_name in [embed_name, short_name]:
+      return x.precision
+  return quantization_config.precision
+
+
+def row_bytes(dim, precision):
+  if precision == FP16:
+    return dim * 2
+  elif precision == INT8:
+    # uint8 codes + float32 scale + float32 offset
+    return dim + 8
+  return dim * 4
+
+
+def packed_dim(dim, precision):
+  """Number of float32 words of a packed row."""
+  if precision == FP32:
+    return dim
+  return (row_bytes(dim, precision) + _BYTES_PER_WORD - 1) // _BYTES_PER_WORD
+
+
+def quantize(values, precision):
+  """Quantize the rows of values.
+
+  Return:
+    codes: float16 for fp16, uint8 for int8
+    scale, offset: float32 [..., 1] for int8, None otherwise
+  """
+  values = np.asarray(values, dtype=np.float32)
+  if precision == FP16:
+    return np.clip(values, -_FP16_MAX, _FP16_MAX).astype(np.float16), None, None
+  elif precision == INT8:
+    offset = np.min(values, axis=-1, keepdims=True)
+    scale = (np.max(values, axis=-1, keepdims=True) - offset) / _INT8_LEVELS
+    codes = np.round((values - offset) / np.where(scale > 0, scale, 1.0))
+    codes = np.clip(codes, 0, _INT8_LEVELS).astype(np.uint8)
+    return codes, scale.astype(np.float32), offset
+  return values, None, None
+
+
+def dequantize(codes, scale=None, offset=None):
+  values = codes.astype(np.float32)
+  if scale is not None:
+    values = values * scale + offset
+  return values
+
+
+def pack(values, precision):
+  """Quantize the rows of values [N, dim] and pack them to float32 words."""
+  values = np.asarray(values, dtype=np.float32)
+  if precision == FP32:
+    return values
+  num_rows, dim = values.shape
+  codes, scale, offset = quantize(values, precision)
+  if precision == FP16:
+    row = codes.astype('<f2').view(np.uint8)
+  else:
+    scale = scale.astype('<f4').view(np.uint8)
+    offset = offset.astype('<f4').view(np.uint8)
+    row = np.concatenate([codes, scale, offset], axis=1)
+  num_words = packed_dim(dim, precision)
+  row = np.pad(row, [[0, 0], [0, num_words * _BYTES_PER_WORD - row.shape[1]]])
+  row = row.reshape([num_rows, num_words, _BYTES_PER_WORD]).astype(np.int32)
+  words = row[:, :, 0] | (row[:, :, 1] << 8) | (row[:, :, 2] << 16)
+  return words.astype(np.float32)
+
+
+def unpack(words, precision, dim):
+  """Unpack and dequantize the packed rows [N, packed_dim]."""
+  words = np.asarray(words, dtype=np.float32)
+  if precision == FP32:
+    return words
+  words = np.round(words).astype(np.int32)
+  row = np.stack([words & 255, (words >> 8) & 255, (words >> 16) & 255],
+                 axis=-1).astype(np.uint8)
+  row = row.reshape([words.shape[0], -1])
+  if precision == FP16:
+    return np.ascontiguousarray(row[:, :dim * 2]).view('<f2').astype(np.float32)
+  scale = np.ascontiguousarray(row[:, dim:dim + 4]).view('<f4')
+  offset = np.ascontiguousarray(row[:, dim + 4:dim + 8]).view('<f4')
+  return dequantize(row[:, :dim], scale, offset)
+
+
+def _quantize_tensor(values, precision):
+  if precision == FP16:
+    return tf.cast(tf.clip_by_value(values, -_FP16_MAX, _FP16_MAX),
+                   tf.float16), None, None
+  offset = tf.reduce_min(values, axis=-1, keepdims=True)
+  scale = (tf.reduce_max(values, axis=-1, keepdims=True) -
+           offset) / _INT8_LEVELS
+  codes = tf.round(
+      (values - offset) / tf.where(scale > 0, scale, tf.ones_like(scale)))
+  codes = tf.cast(tf.clip_by_value(codes, 0, _INT8_LEVELS), tf.uint8)
+  return codes, scale, offset
+
+
+def dequantize_tensor(codes, scale=None, offset=None):
+  values = tf.cast(codes, tf.float32)
+  if scale is not None:
+    values = values * scale + offset
+  return values
+
+
+def fake_quantize_tensor(values, precision):
+  """Quantize and dequantize values, used to evaluate the precision loss."""
+  if precision == FP32:
+    return values
+  return dequantize_tensor(*_quantize_tensor(values, precision))
+
+
+def _to_bytes(values):
+  # values: [N, d], return uint8 [N, d * num_bytes] in little endian
+  return tf.reshape(tf.bitcast(values, tf.uint8), [tf.shape(values)[0], -1])
+
+
+def pack_tensor(values, precision):
+  """Quantize the rows of values [N, dim] and pack them to float32 words."""
+  values = tf.convert_to_tensor(values, dtype=tf.float32)
+  if precision == FP32:
+    return values
+  dim = int(values.get_shape()[-1])
+  codes, scale, offset = _quantize_tensor(values, precision)
+  if precision == FP16:
+    row = _to_bytes(codes)
+  else:
+    row = tf.concat([codes, _to_bytes(scale), _to_bytes(offset)], axis=1)
+  num_words = packed_dim(dim, precision)
+  row = tf.pad(
+      row,
+      [[0, 0], [0, num_words * _BYTES_PER_WORD - row_bytes(dim, precision)]])
+  row = tf.cast(tf.reshape(row, [-1, num_words, _BYTES_PER_WORD]), tf.int32)
+  words = row[:, :, 0] + row[:, :, 1] * 256 + row[:, :, 2] * 65536
+  return tf.cast(words, tf.float32)
+
+
+def unpack_tensor(words, precision, dim):
+  """Unpack and dequantize the packed rows [N, packed_dim]."""
+  if precision == FP32:
+    return words
+  words = tf.cast(tf.round(words), tf.int32)
+  row = [
+      tf.bitwise.bitwise_and(tf.bitwise.right_shift(words, shift), 255)
+      for shift in [0, 8, 16]
+  ]
+  row = tf.stack(row, axis=-1)
+  row = tf.reshape(
+      tf.cast(row, tf.uint8),
+      [-1, packed_dim(dim, precision) * _BYTES_PER_WORD])
+  if precision == FP16:
+    codes = tf.bitcast(tf.reshape(row[:, :dim * 2], [-1, dim, 2]), tf.float16)
+    return dequantize_tensor(codes)
+  scale = tf.bitcast(tf.reshape(row[:, dim:dim + 4], [-1, 1, 4]), tf.float32)
+  offset = tf.bitcast(
+      tf.reshape(row[:, dim + 4:dim + 8], [-1, 1, 4]), tf.float32)
+  return dequantize_tensor(row[:, :dim], scale, offset)
+
+
+def packed_lookup_inputs(values):
+  """Sparse inputs to look up the packed row of each unique id in its own bag.
+
+  Args:
+    values: ids of the sparse input
+
+  Return:
+    indices, values, dense_shape of the unique ids, and the positions of
+    the ids in the unique ids.
+  """
+  unique_ids, unique_idx = tf.unique(values)
+  num_ids = tf.size(unique_ids, out_type=tf.int64)
+  bag_ids = tf.range(num_ids)
+  indices = tf.stack([bag_ids, tf.zeros_like(bag_ids)], axis=1)
+  dense_shape = tf.stack([num_ids, tf.ones_like(num_ids)])
+  return indices, unique_ids, dense_shape, unique_idx
+
+
+def combine_packed_rows(packed_rows, unique_idx, indices, dense_shape, weights,
+                        combiner, precision, dim):
+  """Dequantize the packed rows of the unique ids and combine them.
+
+  Args:
+    packed_rows: [num_unique_ids, packed_dim] looked up from the kv store
+    unique_idx: positions of the ids in the unique ids
+    indices: indices of the sparse input
+    dense_shape: dense_shape of the sparse input
+    weights: weights of the ids, or [] if not weighted
+    combiner: sum, mean or sqrtn
+    precision: precision of the embedding
+    dim: embedding dimension
+
+  Return:
+    combined embeddings of shape dense_shape[:-1] + [dim]
+  """
+  rows = unpack_tensor(packed_rows, precision, dim)
+  indices = tf.cast(indices, tf.int64)
+  dense_shape = tf.cast(dense_shape, tf.int64)
+  sp_ids = tf.SparseTensor(indices, tf.cast(unique_idx, tf.int64), dense_shape)
+  sp_weights = None
+  if isinstance(weights, tf.Tensor):
+    sp_weights = tf.SparseTensor(indices, weights, dense_shape)
+  return tf.nn.safe_embedding_lookup_sparse([rows],
+                                            sp_ids,
+                                            sp_weights,
+                                            combiner=combiner)
+
+
+def _fetch_ops(graph, signature_def):
+  """Ops reachable from the outputs of the signature."""
+  fetch_ops = set()
+  stack = [
+      graph.get_tensor_by_name(x.name).op
+      for x in signature_def.outputs.values()
+  ]
+  while stack:
+    op = stack.pop()
+    if op in fetch_ops:
+      continue
+    fetch_ops.add(op)
+    stack.extend([x.op for x in op.inputs] + list(op.control_inputs))
+  return fetch_ops
+
+
+def _find_gathers(var_op, fetch_ops):
+  """Find the serving gathers on the embedding variable.
+
+  Return:
+    list of gather ops, None if the variable is used by the serving outputs
+    other than row gathering.
+  """
+  reads = [var_op]
+  if var_op.type != 'VarHandleOp':
+    # Identity reads of ref variables
+    reads.extend([
+        x for x in var_op.outputs[0].consumers()
+        if x.type == 'Identity' and x in fetch_ops
+    ])
+  gathers = []
+  for read in reads:
+    for op in read.outputs[0].consumers():
+      if op not in fetch_ops or op in reads:
+        continue
+      if op.type not in _GATHER_OPS or op.inputs[0] is not read.outputs[0]:
+        return None
+      if op.type == 'ResourceGather' and op.get_attr('batch_dims') != 0:
+        return None
+      if op.type == 'GatherV2' and tensor_util.constant_value(
+          op.inputs[2]) != 0:
+        return None
+      gathers.append(op)
+  return gathers
+
+
+def _quantize_variable(var, gathers, precision):
+  """Replace the gathers on var by dequantized gathers on quantized variables.
+
+  Return:
+    the quantized variables: codes, scale and offset, scale and offset
+    are None for fp16
+  """
+  num_rows, dim = var.get_shape().as_list()
+  quant_vars = [('quantized_codes', [num_rows, dim],
+                 tf.float16 if precision == FP16 else tf.uint8)]
+  if precision == INT8:
+    quant_vars.append(('quantized_scale', [num_rows, 1], tf.float32))
+    quant_vars.append(('quantized_offset', [num_rows, 1], tf.float32))
+  quant_vars = [
+      tf.get_variable(
+          '%s/%s' % (var.op.name, name),
+          shape=shape,
+          dtype=dtype,
+          initializer=tf.zeros_initializer(),
+          trainable=False,
+          use_resource=True) for name, shape, dtype in quant_vars
+  ]
+  quant_vars += [None] * (3 - len(quant_vars))
+
+  for gather in gathers:
+    ids = gather.inputs[1]
+    with tf.name_scope(gather.name + '/dequantize'):
+      rows = [tf.gather(x, ids) if x is not None else None for x in quant_vars]
+      new_output = dequantize_tensor(*rows)
+    for consumer in gather.outputs[0].consumers():
+      for input_id, x in enumerate(consumer.inputs):
+        if x is gather.outputs[0]:
+          consumer._update_input(input_id, new_output)
+  return [x for x in quant_vars if x is not None]
+
+
+def _remove_from_collections(graph, var):
+  # the variable and its handle(such as in the rank service collections)
+  for key in graph.get_all_collection_keys():
+    collection = graph.get_collection_ref(key)
+    collection[:] = [
+        x for x in collection
+        if (x if isinstance(x, tf.Operation) else getattr(x, 'op', None)
+            ) is not var.op
+    ]
+
+
+def _drop_colocations(graph, var_names):
+  # ops colocated with the dropped variables(such as the embedding lookups)
+  # keep the variables in the stripped graph
+  drop_locs = set([('loc:@' + x).encode('utf-8') for x in var_names])
+  for op in graph.get_operations():
+    try:
+      locs = op.get_attr('_class')
+    except ValueError:
+      continue
+    if not drop_locs.intersection(locs):
+      continue
+    locs = [x for x in locs if x not in drop_locs]
+    if locs:
+      op._set_attr(
+          '_class',
+          attr_value_pb2.AttrValue(
+              list=attr_value_pb2.AttrValue.ListValue(s=locs)))
+    else:
+      op._clear_attr('_class')
+
+
+def quantize_graph(graph, meta_graph_def, quantization_config):
+  """Quantize the embedding variables of the imported serving graph.
+
+  The gathers on the quantized embeddings are replaced before the graph is
+  run, the quantized variables are assigned after the variables are restored.
+
+  Args:
+    graph: graph in which the saved_model is imported
+    meta_graph_def: the serving meta_graph_def
+    quantization_config: protos.EmbeddingQuantization
+
+  Return:
+    a tuple of (the saver of the quantized variables, a list of (embedding
+    variable, precision, quantized variables), and a dict of embedding name to
+    (precision, number of bytes before and after)).
+  """
+  signature_def = meta_graph_def.signature_def[
+      signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY]
+  fetch_ops = _fetch_ops(graph, signature_def)
+  quantized = {}
+  quantized_vars = []
+  dropped_vars = []
+  for var in list(graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)):
+    embed_name, _ = proto_util.get_norm_embed_name(var.name)
+    if embed_name is None or 'EmbeddingVariable' in str(type(var)):
+      continue
+    precision = get_embedding_precision(quantization_config, embed_name)
+    if precision == FP32:
+      continue
+    gathers = _find_gathers(var.op, fetch_ops)
+    if gathers is None:
+      logging.warning('%s is not only used by gathers, will not be quantized' %
+                      var.op.name)
+      continue
+    num_rows, dim = var.get_shape().as_list()
+    quantized_vars.append(
+        (var, precision, _quantize_variable(var, gathers, precision)))
+    _remove_from_collections(graph, var)
+    dropped_vars.append(var.op.name)
+    _, old_bytes, new_bytes = quantized.get(embed_name, (precision, 0, 0))
+    quantized[embed_name] = (precision, old_bytes + num_rows * dim * 4,
+                             new_bytes + num_rows * row_bytes(dim, precision))
+  _drop_colocations(graph, dropped_vars)
+  saver = tf.train.Saver(sharded=True, allow_empty=True)
+  return saver, quantized_vars, quantized
+
+
+def _replace_saved_model(src_dir, saved_model_dir):
+  """Replace the variables and saved_model.pb of saved_model_dir.
+
+  The new files are staged in saved_model_dir first and swapped in with
+  renames, the original variables are restored if the swap fails.
+  """
+  variables_dir = os.path.join(saved_model_dir, constants.VARIABLES_DIRECTORY)
+  saved_model_path = os.path.join(saved_model_dir,
+                                  constants.SAVED_MODEL_FILENAME_PB)
+  staging_dir = variables_dir + '.quantized'
+  backup_dir = variables_dir + '.float'
+  for tmp_dir in [staging_dir, backup_dir]:
+    if gfile.Exists(tmp_dir):
+      gfile.DeleteRecursively(tmp_dir)
+  try:
+    export_optimizer.copy_dir(
+        os.path.join(src_dir, constants.VARIABLES_DIRECTORY), staging_dir)
+    gfile.Copy(
+        os.path.join(src_dir, constants.SAVED_MODEL_FILENAME_PB),
+        saved_model_path + '.quantized',
+        overwrite=True)
+    gfile.Rename(variables_dir, backup_dir)
+    try:
+      gfile.Rename(staging_dir, variables_dir)
+      gfile.Rename(
+          saved_model_path + '.quantized', saved_model_path, overwrite=True)
+    except Exception:
+      if gfile.Exists(variables_dir):
+        gfile.DeleteRecursively(variables_dir)
+      gfile.Rename(backup_dir, variables_dir)
+      raise
+  finally:
+    for tmp_path in [staging_dir, saved_model_path + '.quantized']:
+      if gfile.Exists(tmp_path):
+        if gfile.IsDirectory(tmp_path):
+          gfile.DeleteRecursively(tmp_path)
+        else:
+          gfile.Remove(tmp_path)
+  gfile.DeleteRecursively(backup_dir)
+
+
+def quantize_saved_model(saved_model_dir,
+                         quantization_config,
+                         separator=',',
+                         num_check_samples=64):
+  """Quantize the embedding variables of an exported saved_model in place.
+
+  Args:
+    saved_model_dir: directory of the exported saved_model
+    quantization_config: protos.EmbeddingQuantization
+    separator: separator of the input fields if multi_placeholder is false
+    num_check_samples: number of sample inputs used to compare the outputs
+
+  Return:
+    a dict of embedding name to (precision, number of bytes before and
+    after the quantization), and the max output diff on the sample inputs.
+    The model is left unchanged and the dict is empty if the max output
+    diff exceeds quantization_config.max_output_diff.
+  """
+  if not isinstance(saved_model_dir, str):
+    saved_model_dir = saved_model_dir.decode('utf-8')
+  saved_model = saved_model_pb2.SavedModel()
+  with gfile.GFile(
+      os.path.join(saved_model_dir, constants.SAVED_MODEL_FILENAME_PB),
+      'rb') as fin:
+    saved_model.ParseFromString(fin.read())
+  meta_graph_def = export_optimizer.get_serving_meta_graph(saved_model)
+
+  quantized_dir = saved_model_dir.rstrip('/') + '_quantized'
+  if gfile.Exists(quantized_dir):
+    gfile.DeleteRecursively(quantized_dir)
+  with tf.Graph().as_default() as graph:
+    loader = SavedModelLoader(saved_model_dir)
+    restore_saver, _ = loader.load_graph(graph, [tag_constants.SERVING])
+    saver, quantized_vars, quantized = quantize_graph(graph, meta_graph_def,
+                                                      quantization_config)
+    if not quantized:
+      logging.info('no embeddings are quantized')
+      return quantized, 0.0
+    with tf.Session() as sess:
+      loader.restore_variables(sess, restore_saver)
+      for var, precision, quant_vars in quantized_vars:
+        for quant_var, value in zip(quant_vars,
+                                    quantize(sess.run(var), precision)):
+          if quant_var is not None:
+            quant_var.load(value, sess)
+      gfile.MakeDirs(os.path.join(quantized_dir, constants.VARIABLES_DIRECTORY))
+      saver.save(
+          sess,
+          os.path.join(quantized_dir, constants.VARIABLES_DIRECTORY,
+                       constants.VARIABLES_FILENAME),
+          write_meta_graph=False,
+          write_state=False)
+      new_meta_graph_def = tf.train.export_meta_graph(
+          saver_def=saver.as_saver_def(),
+          clear_devices=True,
+          strip_default_attrs=True)
+
+  # the graph is stripped to the nodes used by the signatures, the new saver
+  # and the init ops, the float embeddings are dropped
+  new_meta_graph_def.meta_info_def.CopyFrom(meta_graph_def.meta_info_def)
+  new_meta_graph_def.asset_file_def.extend(meta_graph_def.asset_file_def)
+  for key, signature_def in meta_graph_def.signature_def.items():
+    new_meta_graph_def.signature_def[key].CopyFrom(signature_def)
+  keep_nodes = export_optimizer.get_keep_nodes(new_meta_graph_def)
+  graph_def = tf.graph_util.extract_sub_graph(new_meta_graph_def.graph_def,
+                                              list(keep_nodes))
+  node_names = set([node.name for node in graph_def.node])
+  for key in list(new_meta_graph_def.collection_def.keys()):
+    collection_def = new_meta_graph_def.collection_def[key]
+    if collection_def.HasField('node_list'):
+      values = [
+          x for x in collection_def.node_list.value
+          if x.lstrip('^').split(':')[0] in node_names
+      ]
+      del collection_def.node_list.value[:]
+      collection_def.node_list.value.extend(values)
+  new_meta_graph_def.graph_def.CopyFrom(graph_def)
+  meta_graph_def.CopyFrom(new_meta_graph_def)
+  for sub_dir in [constants.ASSETS_DIRECTORY, constants.EXTRA_ASSETS_DIRECTORY]:
+    if gfile.Exists(os.path.join(saved_model_dir, sub_dir)):
+      export_optimizer.copy_dir(
+          os.path.join(saved_model_dir, sub_dir),
+          os.path.join(quantized_dir, sub_dir))
+  with gfile.GFile(
+      os.path.join(quantized_dir, constants.SAVED_MODEL_FILENAME_PB),
+      'wb') as fout:
+    fout.write(saved_model.SerializeToString())
+
+  try:
+    inputs = export_optimizer.sample_inputs(
+        meta_graph_def.signature_def[
+            signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY], graph_def,
+        num_check_samples, separator)
+    outputs, _ = export_optimizer.check_model(saved_model_dir, inputs, 0)
+    quantized_outputs, _ = export_optimizer.check_model(quantized_dir, inputs,
+                                                        0)
+    max_diff = 0.0
+    for name, output in outputs.items():
+      if output.dtype.kind in 'fc':
+        max_diff = max(
+            max_diff,
+            float(
+                np.max(np.abs(output - quantized_outputs[name]), initial=0.0)))
+    for embed_name, (precision, old_bytes, new_bytes) in quantized.items():
+      logging.info(
+          'quantize %s to %s: %d bytes => %d bytes' %
+          (embed_name, precision_name(precision), old_bytes, new_bytes))
+    logging.info('max output diff of the quantized model = %g' % max_diff)
+
+    max_output_diff = quantization_config.max_output_diff
+    if max_output_diff > 0 and max_diff > max_output_diff:
+      logging.error(
+          'max output diff %g exceeds max_output_diff %g, keep the float '
+          'embeddings in %s' % (max_diff, max_output_diff, saved_model_dir))
+      return {}, max_diff
+    _replace_saved_model(quantized_dir, saved_model_dir)
+    logging.info('quantized model is saved to %s' % saved_model_dir)
+  finally:
+    gfile.DeleteRecursively(quantized_dir)
+  return quantized, max_diff
@@ -22,14 +22,19 @@ from tensorflow.python.framework import ops
 from tensorflow.python.ops import array_ops
 from tensorflow.python.platform import gfile
 from tensorflow.python.training import basic_session_run_hooks
+from tensorflow.python.training import saver as tf_saver
 from tensorflow.python.training import session_run_hook
 from tensorflow.python.training.summary_io import SummaryWriterCache
 
 from easy_rec.python.ops.incr_record import get_sparse_indices
 from easy_rec.python.ops.incr_record import kv_resource_incr_gather
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import embedding_quantization
 from easy_rec.python.utils import embedding_utils
+from easy_rec.python.utils import ev_budget
+from easy_rec.python.utils import proto_util
 from easy_rec.python.utils import shape_utils
+from easy_rec.python.utils.async_checkpoint import AsyncCheckpointWriter
 
 from tensorflow.python.training.basic_session_run_hooks import SecondOrStepTimer  # NOQA
 
@@ -304,6 +309,19 @@ class ProgressHook(SessionRunHook):
       self._progress_file.close()
 
 
+def get_incr_save_dir(increment_save_config, checkpoint_dir):
+  fs = increment_save_config.fs
+  if fs.relative:
+    incr_save_dir = os.path.join(checkpoint_dir, fs.incr_save_dir)
+  else:
+    incr_save_dir = fs.incr_save_dir
+  if not incr_save_dir.endswith('/'):
+    incr_save_dir += '/'
+  if not gfile.IsDirectory(incr_save_dir):
+    gfile.MakeDirs(incr_save_dir)
+  return incr_save_dir
+
+
 class CheckpointSaverHook(CheckpointSaverHook):
   """Saves checkpoints every N steps or seconds."""
 
@@ -317,7 +335,10 @@ class CheckpointSaverHook(CheckpointSaverHook):
                listeners=None,
                write_graph=True,
                data_offset_var=None,
-               increment_save_config=None):
+               increment_save_config=None,
+               async_checkpoint=False,
+               async_checkpoint_local_dir=None,
+               embedding_quantization_config=None):
     """Initializes a `CheckpointSaverHook`.
 
     Args:
@@ -333,6 +354,12 @@ class CheckpointSaverHook(CheckpointSaverHook):
       write_graph: whether to save graph.pbtxt.
       data_offset_var: data offset variable.
       increment_save_config: parameters for saving increment checkpoints.
+      async_checkpoint: snapshot the variables to host memory and write the
+        checkpoints to checkpoint_dir in background.
+      async_checkpoint_local_dir: local directory to write the checkpoints
+        before uploading to checkpoint_dir, only used if async_checkpoint.
+      embedding_quantization_config: protos.EmbeddingQuantization, the sparse
+        updates of the quantized embeddings are packed as in the kv store.
 
     Raises:
       ValueError: One of `save_steps` or `save_secs` should be set.
@@ -351,6 +378,10 @@ class CheckpointSaverHook(CheckpointSaverHook):
     self._steps_per_run = 1
     self._write_graph = write_graph
     self._data_offset_var = data_offset_var
+    self._async_checkpoint = async_checkpoint
+    self._async_checkpoint_local_dir = async_checkpoint_local_dir
+    self._async_writer = None
+    self._async_wait = False
 
     self._task_idx, self._task_num = get_task_index_and_num()
 
@@ -366,6 +397,13 @@ class CheckpointSaverHook(CheckpointSaverHook):
 
       self._dense_name_to_ids = embedding_utils.get_dense_name_to_ids()
       self._sparse_name_to_ids = embedding_utils.get_sparse_name_to_ids()
+      self._norm_name_to_ids = embedding_utils.get_norm_name_to_ids()
+      self._sparse_precisions = {}
+      for sparse_var, _ in ops.get_collection(constant.SPARSE_UPDATE_VARIABLES):
+        norm_name, _ = proto_util.get_norm_embed_name(sparse_var.name)
+        self._sparse_precisions[sparse_var.name] = \
+            embedding_quantization.get_embedding_precision(
+                embedding_quantization_config, norm_name)
 
       with gfile.GFile(
           os.path.join(checkpoint_dir, constant.DENSE_UPDATE_VARIABLES),
@@ -438,15 +476,8 @@ class CheckpointSaverHook(CheckpointSaverHook):
             api_version_auto_timeout_ms=self._kafka_timeout_ms,
             request_timeout_ms=self._kafka_timeout_ms)
       elif increment_save_config.HasField('fs'):
-        fs = increment_save_config.fs
-        if fs.relative:
-          self._incr_save_dir = os.path.join(checkpoint_dir, fs.incr_save_dir)
-        else:
-          self._incr_save_dir = fs.incr_save_dir
-        if not self._incr_save_dir.endswith('/'):
-          self._incr_save_dir += '/'
-        if not gfile.IsDirectory(self._incr_save_dir):
-          gfile.MakeDirs(self._incr_save_dir)
+        self._incr_save_dir = get_incr_save_dir(increment_save_config,
+                                                checkpoint_dir)
       elif increment_save_config.HasField('datahub'):
         raise NotImplementedError('datahub increment saving is in development.')
       else:
@@ -458,6 +489,28 @@ class CheckpointSaverHook(CheckpointSaverHook):
       self._dense_timer = None
       self._sparse_timer = None
 
+  def begin(self):
+    super(CheckpointSaverHook, self).begin()
+    if not self._async_checkpoint:
+      return
+    saver = self._get_saver()
+    if type(saver) is not tf_saver.Saver:
+      logging.warning(
+          'async_checkpoint is not supported by saver %s, will save '
+          'checkpoints synchronously' % type(saver).__name__)
+      return
+    try:
+      self._async_writer = AsyncCheckpointWriter(
+          saver,
+          self._checkpoint_dir,
+          checkpoint_basename=os.path.basename(self._save_path),
+          local_dir=self._async_checkpoint_local_dir,
+          data_offset_var=self._data_offset_var,
+          write_meta_graph=self._write_graph)
+    except Exception as ex:
+      logging.warning('failed to create async checkpoint writer: %s, will '
+                      'save checkpoints synchronously' % str(ex))
+
   def after_create_session(self, session, coord):
     global_step = session.run(self._global_step_tensor)
     if self._write_graph:
@@ -567,7 +620,8 @@ class CheckpointSaverHook(CheckpointSaverHook):
         if tmp_var._save_slice_info is not None:
           tmp_key += tmp_var._save_slice_info.var_offset[0]
       bytes_buf += tmp_key.tobytes()
-      bytes_buf += tmp_val.tobytes()
+      bytes_buf += embedding_quantization.pack(
+          tmp_val, self._sparse_precisions[tmp_var.name]).tobytes()
     if self._kafka_producer is not None:
       msg_key = 'sparse_update_%d' % global_step
       send_res = self._kafka_producer.send(
@@ -599,6 +653,9 @@ class CheckpointSaverHook(CheckpointSaverHook):
 
   def after_run(self, run_context, run_values):
     super(CheckpointSaverHook, self).after_run(run_context, run_values)
+    if self._async_writer is not None and self._after_async_save(
+        run_context.session):
+      run_context.request_stop()
     stale_global_step = run_values.results
     global_step = -1
     if self._dense_timer is not None and self._dense_timer.should_trigger_for_step(
@@ -615,8 +672,38 @@ class CheckpointSaverHook(CheckpointSaverHook):
       self._sparse_timer.update_last_triggered_step(global_step)
       self._send_sparse(global_step, run_context.session)
 
+  def _async_save(self, session, step):
+    """Snapshot the variables and save them in background."""
+    logging.info('Async saving checkpoints for %d into %s.', step,
+                 self._save_path)
+    for l in self._listeners:  # noqa: E741
+      l.before_save(session, step)
+    self._async_writer.save(session, step)
+    if self._async_wait:
+      self._async_writer.wait()
+    return self._after_async_save(session)
+
+  def _after_async_save(self, session):
+    """Notify the listeners of finished async saves, returns should_stop."""
+    should_stop = False
+    for step in self._async_writer.pop_finished_steps():
+      self._summary_writer.add_session_log(
+          tf.SessionLog(
+              status=tf.SessionLog.CHECKPOINT, checkpoint_path=self._save_path),
+          step)
+      for l in self._listeners:  # noqa: E741
+        if l.after_save(session, step):
+          logging.info(
+              'A CheckpointSaverListener requested that training be stopped. '
+              'listener: {}'.format(l))
+          should_stop = True
+    return should_stop
+
   def _save(self, session, step):
     """Saves the latest checkpoint, returns should_stop."""
+    if self._async_writer is not None:
+      return self._async_save(session, step)
+
     logging.info('Saving checkpoints for %d into %s.', step, self._save_path)
 
     for l in self._listeners:  # noqa: E741
@@ -655,7 +742,15 @@ class CheckpointSaverHook(CheckpointSaverHook):
 
   def end(self, session):
     global_step = session.run(self._global_step_tensor)
+    if self._async_writer is not None:
+      # the last checkpoint must be finished before the listeners end
+      self._async_wait = True
+      self._async_writer.wait()
+      self._after_async_save(session)
     super(CheckpointSaverHook, self).end(session)
+    if self._async_writer is not None:
+      self._async_writer.close()
+      self._async_writer = None
     if self._dense_timer is not None and \
         global_step != self._dense_timer.last_triggered_step():
       self._dense_timer.update_last_triggered_step(global_step)
@@ -666,6 +761,91 @@ class CheckpointSaverHook(CheckpointSaverHook):
       self._send_sparse(global_step, session)
 
 
+class EvictedKeysHook(SessionRunHook):
+  """Send the keys evicted by the key budgets with the incremental updates.
+
+  The key budgets are counted in each worker, so the hook runs on every
+  worker, and sends the keys evicted in the worker at the frequency of the
+  sparse updates. The evicted keys are recorded only if the hook is used.
+  """
+
+  def __init__(self, checkpoint_dir, increment_save_config):
+    self._task_idx, _ = get_task_index_and_num()
+    self._norm_name_to_ids = embedding_utils.get_norm_name_to_ids()
+    save_secs = increment_save_config.sparse_save_secs
+    save_steps = increment_save_config.sparse_save_steps
+    self._timer = SecondOrStepTimer(
+        every_secs=save_secs if save_secs > 0 else None,
+        every_steps=save_steps if save_steps > 0 else None)
+    self._kafka_producer = None
+    self._incr_save_dir = None
+    if increment_save_config.HasField('kafka'):
+      # the topic is created by the CheckpointSaverHook of the chief
+      self._topic = increment_save_config.kafka.topic
+      kafka_timeout_ms = int(os.environ.get('KAFKA_TIMEOUT', 600)) * 1000
+      self._kafka_producer = KafkaProducer(
+          bootstrap_servers=increment_save_config.kafka.server.split(','),
+          max_request_size=int(
+              os.environ.get('KAFKA_MAX_REQ_SIZE', 1024 * 1024 * 64)),
+          api_version_auto_timeout_ms=kafka_timeout_ms,
+          request_timeout_ms=kafka_timeout_ms)
+    elif increment_save_config.HasField('fs'):
+      self._incr_save_dir = get_incr_save_dir(increment_save_config,
+                                              checkpoint_dir)
+
+  def begin(self):
+    self._global_step_tensor = tf.train.get_or_create_global_step()
+    ev_budget.record_evicted_keys()
+    self._timer.update_last_triggered_step(0)
+
+  def before_run(self, run_context):
+    return session_run_hook.SessionRunArgs(self._global_step_tensor)
+
+  def after_run(self, run_context, run_values):
+    global_step = run_values.results + 1
+    if self._timer.should_trigger_for_step(global_step):
+      self._timer.update_last_triggered_step(global_step)
+      self._send_evicted(global_step)
+
+  def end(self, session):
+    self._send_evicted(session.run(self._global_step_tensor))
+
+  def _send_evicted(self, global_step):
+    evicted_keys = ev_budget.get_evicted_keys(self._norm_name_to_ids)
+    if len(evicted_keys) == 0:
+      return
+
+    # build msg header
+    # 2 means sparse evict messages, keys are int64
+    msg_header = [2, len(evicted_keys), global_step]
+    for tmp_id, tmp_key in evicted_keys:
+      msg_header.append(tmp_id)
+      msg_header.append(len(tmp_key))
+    bytes_buf = np.array(msg_header, dtype=np.int32).tobytes()
+    for _, tmp_key in evicted_keys:
+      bytes_buf += tmp_key.astype(np.int64).tobytes()
+
+    msg_key = 'sparse_evict_%d_%d' % (global_step, self._task_idx)
+    if self._kafka_producer is not None:
+      send_res = self._kafka_producer.send(
+          self._topic, bytes_buf, key=msg_key.encode('utf-8'))
+      logging.info('kafka send evict: %d %s' %
+                   (global_step, send_res.exception))
+
+    if self._incr_save_dir is not None:
+      save_path = os.path.join(self._incr_save_dir, msg_key)
+      with gfile.GFile(save_path, 'wb') as fout:
+        fout.write(bytes_buf)
+      save_flag = save_path + '.done'
+      with gfile.GFile(save_flag, 'w') as fout:
+        fout.write(msg_key)
+
+    logging.info(
+        'global_step=%d, task_index=%d, evict sparse keys, msg_num=%d, '
+        'key_num=%d' % (global_step, self._task_idx, len(evicted_keys),
+                        sum(len(x[1]) for x in evicted_keys)))
+
+
 class NumpyCheckpointRestoreHook(SessionRunHook):
   """Restore variable from numpy checkpoint."""
 
@@ -0,0 +1,416 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Memory budget of embedding variables.
+
+EmbeddingVariables grow with the number of distinct keys seen in training.
+KeyBudget bounds the rows(or bytes) of a group of embedding variables:
+  - admission: new keys are counted in a count-min sketch and admitted after
+    filter_freq occurrences, so there are no per key counters for the long
+    tail keys which are never admitted;
+  - eviction: when the admitted rows exceed the budget, the least frequently
+    (LFU) or least recently(LRU) used rows are evicted, until the rows are
+    below (1 - evict_ratio) of the budget.
+
+The ids not admitted or evicted are removed from the sparse ids before the
+embedding lookup, so they are neither created nor updated in the embedding
+variables; the stale rows are released by steps_to_live. The evicted keys are
+recorded only if they are consumed, they are sent with the incremental
+updates by each worker, see easy_rec.python.utils.estimator_utils
+.EvictedKeysHook.
+
+The budget is a per worker soft limit: it is kept in the memory of each
+training process, counts the keys seen by that process only, and is rebuilt
+from the input stream after restart. It does not free the rows in the
+embedding variables on the parameter servers, which are released by
+steps_to_live only, so with N workers the parameter servers may hold up to
+N times the budget.
+"""
+import logging
+import threading
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework import sparse_tensor
+
+from easy_rec.python.utils import proto_util
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+ADMIT_COUNTER = 'COUNTER'
+ADMIT_COUNT_MIN_SKETCH = 'COUNT_MIN_SKETCH'
+EVICT_LFU = 'LFU'
+EVICT_LRU = 'LRU'
+
+# graph collection of the KeyBudgets used by embedding variables
+KEY_BUDGETS = 'KEY_BUDGETS'
+
+# bytes of int64 keys
+_KEY_BYTES = 8
+
+
+class CountMinSketch(object):
+  """Approximate key counts in a [depth, width] table of counters.
+
+  Each row uses a multiply-shift hash, the estimated count of a key is the
+  min of its counters in all rows, which is never less than the true count.
+  """
+
+  def __init__(self, width, depth=4, seed=0):
+    self._log_width = max(int(np.ceil(np.log2(max(width, 2)))), 1)
+    self._width = 1 << self._log_width
+    rng = np.random.RandomState(seed)
+    # odd multipliers of multiply-shift hashing
+    self._multipliers = (rng.randint(
+        0, 2**63, size=[depth, 1], dtype=np.uint64) << np.uint64(1)) | \
+        np.uint64(1)
+    self._table = np.zeros([depth, self._width], dtype=np.int32)
+
+  @property
+  def width(self):
+    return self._width
+
+  @property
+  def depth(self):
+    return len(self._table)
+
+  def _hash(self, keys):
+    keys = np.asarray(keys, dtype=np.int64).view(np.uint64).reshape([1, -1])
+    return (keys * self._multipliers) >> np.uint64(64 - self._log_width)
+
+  def add(self, keys, counts=1):
+    """Add keys, counts is an array of the same length as keys or a scalar."""
+    counts = np.broadcast_to(np.asarray(counts, dtype=np.int32), [len(keys)])
+    for row, hashes in zip(self._table, self._hash(keys)):
+      np.add.at(row, hashes, counts)
+
+  def estimate(self, keys):
+    hashes = self._hash(keys)
+    return np.min(
+        [row[row_hashes] for row, row_hashes in zip(self._table, hashes)],
+        axis=0)
+
+  def decay(self):
+    """Halve the counts, so that the sketch follows the recent stream."""
+    self._table >>= 1
+
+
+class KeyBudget(object):
+  """Admission and eviction of the keys of a group of embedding variables.
+
+  The budget is counted in this process only, see the module docstring.
+
+  Args:
+    max_rows: max number of rows of all the variables, 0 for unlimited.
+    max_bytes: max bytes of keys and embeddings of all the variables, a row
+      costs 8 + embedding_dim * 4 bytes, 0 for unlimited.
+    filter_freq: keys are admitted after filter_freq occurrences, only used
+      if admit_strategy is COUNT_MIN_SKETCH.
+    admit_strategy: COUNTER, all keys are admitted into the budget and are
+      filtered by EmbeddingVariable; or COUNT_MIN_SKETCH.
+    evict_strategy: LFU or LRU.
+    evict_ratio: evict rows until the rows are below
+      (1 - evict_ratio) * budget.
+    sketch_width: width of the count-min sketch, 0 for
+      max(4 * max_rows, 65536), or 2 ** 20 if max_rows is not set.
+    sketch_depth: depth of the count-min sketch.
+    seed: seed of the sketch hashes.
+  """
+
+  def __init__(self,
+               max_rows=0,
+               max_bytes=0,
+               filter_freq=0,
+               admit_strategy=ADMIT_COUNTER,
+               evict_strategy=EVICT_LFU,
+               evict_ratio=0.1,
+               sketch_width=0,
+               sketch_depth=4,
+               seed=0):
+    assert max_rows <= 0 or max_bytes <= 0, \
+        'only one of max_rows and max_bytes could be set'
+    assert admit_strategy in [ADMIT_COUNTER, ADMIT_COUNT_MIN_SKETCH], \
+        'invalid admit_strategy: %s' % admit_strategy
+    assert evict_strategy in [EVICT_LFU, EVICT_LRU], \
+        'invalid evict_strategy: %s' % evict_strategy
+    assert 0 < evict_ratio < 1, 'evict_ratio must be in (0, 1)'
+    self._max_cost = max_rows if max_rows > 0 else max(max_bytes, 0)
+    self._count_bytes = max_bytes > 0
+    self._filter_freq = filter_freq
+    self._evict_strategy = evict_strategy
+    self._evict_ratio = evict_ratio
+    self._sketch = None
+    if admit_strategy == ADMIT_COUNT_MIN_SKETCH and filter_freq > 1:
+      if sketch_width <= 0:
+        sketch_width = max(4 * max_rows, 65536) if max_rows > 0 else 2**20
+      self._sketch = CountMinSketch(sketch_width, sketch_depth, seed)
+    self._rng = np.random.RandomState(seed)
+
+    self._lock = threading.Lock()
+    self._table_names = []
+    self._table_costs = np.zeros([0], dtype=np.float64)
+    self._table_salts = np.zeros([0], dtype=np.int64)
+    # key => slot for each table
+    self._key_slots = []
+    # evicted keys of each table, only recorded if record_evicted_keys
+    self._record_evicted = False
+    self._evicted_keys = []
+    # attributes of the slots
+    self._slot_keys = np.zeros([0], dtype=np.int64)
+    self._slot_tables = np.zeros([0], dtype=np.int32)
+    self._slot_freqs = np.zeros([0], dtype=np.float64)
+    self._slot_times = np.zeros([0], dtype=np.int64)
+    self._slot_valid = np.zeros([0], dtype=bool)
+    self._free_slots = np.zeros([0], dtype=np.int64)
+    self._num_slots = 0
+    self._total_cost = 0.0
+    self._clock = 0
+
+  @property
+  def max_cost(self):
+    """Max rows or bytes, 0 for unlimited."""
+    return self._max_cost
+
+  @property
+  def total_cost(self):
+    """Admitted rows or bytes."""
+    return self._total_cost
+
+  @property
+  def num_rows(self):
+    return sum(len(x) for x in self._key_slots)
+
+  @property
+  def table_names(self):
+    return list(self._table_names)
+
+  def register_table(self, name, embedding_dim):
+    """Register an embedding variable, returns the table id.
+
+    Args:
+      name: normalized name of the embedding variable.
+      embedding_dim: embedding dimension, used to compute row bytes.
+    """
+    with self._lock:
+      if name in self._table_names:
+        return self._table_names.index(name)
+      row_cost = _KEY_BYTES + embedding_dim * 4 if self._count_bytes else 1
+      self._table_names.append(name)
+      self._table_costs = np.append(self._table_costs, row_cost)
+      self._table_salts = np.append(
+          self._table_salts,
+          self._rng.randint(-2**63, 2**63 - 1, dtype=np.int64))
+      self._key_slots.append({})
+      self._evicted_keys.append([])
+      return len(self._table_names) - 1
+
+  def resident_keys(self, table_id):
+    """Admitted keys of the table."""
+    return np.array(list(self._key_slots[table_id].keys()), dtype=np.int64)
+
+  def record_evicted_keys(self):
+    """Record the evicted keys to be consumed by pop_evicted_keys.
+
+    The evicted keys are not recorded by default, so that they do not
+    accumulate without a consumer.
+    """
+    self._record_evicted = True
+
+  def pop_evicted_keys(self, table_id):
+    """Return and clear the keys evicted from the table."""
+    with self._lock:
+      evicted_keys = self._evicted_keys[table_id]
+      self._evicted_keys[table_id] = []
+    if len(evicted_keys) == 0:
+      return np.zeros([0], dtype=np.int64)
+    return np.concatenate(evicted_keys)
+
+  def update(self, table_id, keys):
+    """Count keys of a batch and return whether they are admitted.
+
+    Args:
+      table_id: id returned by register_table.
+      keys: int array of keys, may contain duplicates.
+
+    Return:
+      bool array, True for the keys admitted after the update.
+    """
+    keys = np.asarray(keys).astype(np.int64, copy=False)
+    if len(keys) == 0:
+      return np.zeros([0], dtype=bool)
+    uniq_keys, inverse, counts = np.unique(
+        keys, return_inverse=True, return_counts=True)
+    with self._lock:
+      self._clock += 1
+      if self._max_cost <= 0:
+        # without budget, the sketch counts never decay, so the admitted keys
+        # keep admitted and are not tracked
+        return self._admit(table_id, uniq_keys, counts)[0][inverse]
+      key_slots = self._key_slots[table_id]
+      slots = np.array([key_slots.get(k, -1) for k in uniq_keys.tolist()],
+                       dtype=np.int64)
+      resident = slots >= 0
+      resident_slots = slots[resident]
+      self._slot_freqs[resident_slots] += counts[resident]
+      self._slot_times[resident_slots] = self._clock
+
+      new_ids = np.where(~resident)[0]
+      admitted, freqs = self._admit(table_id, uniq_keys[new_ids],
+                                    counts[new_ids])
+      new_ids = new_ids[admitted]
+      if len(new_ids) > 0:
+        new_slots = self._alloc(len(new_ids))
+        new_keys = uniq_keys[new_ids]
+        self._slot_keys[new_slots] = new_keys
+        self._slot_tables[new_slots] = table_id
+        self._slot_freqs[new_slots] = freqs[admitted]
+        self._slot_times[new_slots] = self._clock
+        self._slot_valid[new_slots] = True
+        key_slots.update(zip(new_keys.tolist(), new_slots.tolist()))
+        slots[new_ids] = new_slots
+        self._total_cost += len(new_ids) * self._table_costs[table_id]
+        if self._total_cost > self._max_cost:
+          self._evict()
+      # keys of the batch may be evicted as well
+      admitted = slots >= 0
+      admitted[admitted] = self._slot_valid[slots[admitted]]
+      return admitted[inverse]
+
+  def _admit(self, table_id, keys, counts):
+    """Return admitted mask and the estimated counts of new keys."""
+    if self._sketch is None:
+      return np.ones([len(keys)], dtype=bool), counts.astype(np.float64)
+    sketch_keys = keys ^ self._table_salts[table_id]
+    self._sketch.add(sketch_keys, counts)
+    freqs = self._sketch.estimate(sketch_keys)
+    return freqs >= self._filter_freq, freqs.astype(np.float64)
+
+  def _alloc(self, num):
+    num_free = min(num, len(self._free_slots))
+    slots = self._free_slots[:num_free]
+    self._free_slots = self._free_slots[num_free:]
+    num_new = num - num_free
+    if self._num_slots + num_new > len(self._slot_keys):
+      capacity = max(2 * len(self._slot_keys), self._num_slots + num_new, 1024)
+      for attr in [
+          '_slot_keys', '_slot_tables', '_slot_freqs', '_slot_times',
+          '_slot_valid'
+      ]:
+        old_vals = getattr(self, attr)
+        new_vals = np.zeros([capacity], dtype=old_vals.dtype)
+        new_vals[:len(old_vals)] = old_vals
+        setattr(self, attr, new_vals)
+    new_slots = np.arange(
+        self._num_slots, self._num_slots + num_new, dtype=np.int64)
+    self._num_slots += num_new
+    return np.concatenate([slots, new_slots])
+
+  def _evict(self):
+    used_slots = np.where(self._slot_valid[:self._num_slots])[0]
+    if self._evict_strategy == EVICT_LFU:
+      # among rows of the same frequency, the least recently used go first
+      order = np.lexsort(
+          (self._slot_times[used_slots], self._slot_freqs[used_slots]))
+    else:
+      order = np.argsort(self._slot_times[used_slots], kind='stable')
+    costs = self._table_costs[self._slot_tables[used_slots[order]]]
+    target_cost = self._max_cost * (1 - self._evict_ratio)
+    num_evict = int(
+        np.searchsorted(
+            np.cumsum(costs), self._total_cost - target_cost, side='left')) + 1
+    num_evict = min(num_evict, len(order))
+    evict_slots = used_slots[order[:num_evict]]
+    evict_tables = self._slot_tables[evict_slots]
+    evict_keys = self._slot_keys[evict_slots]
+    for table_id in np.unique(evict_tables).tolist():
+      table_keys = evict_keys[evict_tables == table_id]
+      key_slots = self._key_slots[table_id]
+      for k in table_keys.tolist():
+        del key_slots[k]
+      if self._record_evicted:
+        self._evicted_keys[table_id].append(table_keys)
+    self._slot_valid[evict_slots] = False
+    self._free_slots = np.concatenate([self._free_slots, evict_slots])
+    self._total_cost = max(self._total_cost - np.sum(costs[:num_evict]), 0.0)
+    # aging, so that the frequencies follow the recent stream
+    if self._evict_strategy == EVICT_LFU:
+      self._slot_freqs[:self._num_slots] *= 0.5
+    if self._sketch is not None:
+      self._sketch.decay()
+    logging.info('evict %d rows, %.0f of %d rows(bytes) left' %
+                 (num_evict, self._total_cost, self._max_cost))
+
+
+def get_embedding_name(embedding_weights):
+  """Normalized name of embedding variables.
+
+  The same as the names used by embedding_utils.get_norm_name_to_ids.
+  """
+  if isinstance(embedding_weights, list):
+    embedding_weights = embedding_weights[0]
+  elif hasattr(embedding_weights, '_get_variable_list'):
+    embedding_weights = embedding_weights._get_variable_list()[0]
+  return proto_util.get_norm_embed_name(embedding_weights.name)[0]
+
+
+def filter_sparse_ids(key_budget, embedding_weights, embedding_dim, sparse_ids,
+                      sparse_weights):
+  """Remove the ids not admitted by key_budget.
+
+  Args:
+    key_budget: a KeyBudget.
+    embedding_weights: embedding variable.
+    embedding_dim: embedding dimension.
+    sparse_ids: SparseTensor or RaggedTensor of int ids.
+    sparse_weights: weights of sparse_ids or None.
+
+  Return:
+    filtered sparse_ids and sparse_weights.
+  """
+  table_id = key_budget.register_table(
+      get_embedding_name(embedding_weights), embedding_dim)
+  if key_budget not in tf.get_collection(KEY_BUDGETS):
+    tf.add_to_collection(KEY_BUDGETS, key_budget)
+  is_sparse = isinstance(sparse_ids, sparse_tensor.SparseTensor)
+  ids = sparse_ids.values if is_sparse else sparse_ids.flat_values
+  assert ids.dtype.is_integer, 'key budget only supports int ids'
+
+  def _update(keys):
+    return key_budget.update(table_id, keys)
+
+  admitted = tf.py_func(_update, [ids], tf.bool, stateful=True)
+  admitted.set_shape(ids.get_shape())
+  if is_sparse:
+    sparse_ids = tf.sparse.retain(sparse_ids, admitted)
+    if sparse_weights is not None:
+      sparse_weights = tf.sparse.retain(sparse_weights, admitted)
+  else:
+    admitted = sparse_ids.with_flat_values(admitted)
+    sparse_ids = tf.ragged.boolean_mask(sparse_ids, admitted)
+    if sparse_weights is not None:
+      sparse_weights = tf.ragged.boolean_mask(sparse_weights, admitted)
+  return sparse_ids, sparse_weights
+
+
+def record_evicted_keys():
+  """Record the evicted keys of the key budgets in the default graph."""
+  for key_budget in tf.get_collection(KEY_BUDGETS):
+    key_budget.record_evicted_keys()
+
+
+def get_evicted_keys(name_to_ids):
+  """Pop the evicted keys of the key budgets in the default graph.
+
+  Args:
+    name_to_ids: normalized embedding names to embedding ids.
+
+  Return:
+    list of (embedding_id, int64 keys).
+  """
+  evicted_keys = []
+  for key_budget in tf.get_collection(KEY_BUDGETS):
+    for table_id, name in enumerate(key_budget.table_names):
+      keys = key_budget.pop_evicted_keys(table_id)
+      if len(keys) > 0 and name in name_to_ids:
+        evicted_keys.append((int(name_to_ids[name]), keys))
+  return evicted_keys
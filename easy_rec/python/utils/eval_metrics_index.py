@@ -0,0 +1,185 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Incremental index of the eval metrics in event files.
+
+Instead of re-scanning all the event files on every check, the index tails
+each event file from the byte offset it has read, and keeps the metrics of
+each file in memory. The offsets and metrics are also saved to a sidecar
+file in the eval dir, so that restarted jobs do not need to re-scan the
+event files either.
+"""
+import collections
+import json
+import logging
+import os
+import struct
+import threading
+import uuid
+
+import tensorflow as tf
+from tensorflow.core.util import event_pb2
+
+if tf.__version__ >= '2.0':
+  gfile = tf.compat.v1.gfile
+else:
+  gfile = tf.gfile
+
+SIDECAR_FILE_NAME = '.eval_metrics_index.json'
+
+# tfrecord format: uint64 length, uint32 masked crc of length,
+# byte data[length], uint32 masked crc of data
+_HEADER_SIZE = 12
+_FOOTER_SIZE = 4
+
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def get_eval_metrics_index(eval_dir, event_file_pattern='*.tfevents.*'):
+  """Get the index shared in the process.
+
+  Args:
+    eval_dir: directory containing the event files.
+    event_file_pattern: glob pattern of event files relative to eval_dir.
+
+  Return:
+    an EvalMetricsIndex object.
+  """
+  key = (eval_dir, event_file_pattern)
+  with _index_cache_lock:
+    if key not in _index_cache:
+      _index_cache[key] = EvalMetricsIndex(eval_dir, event_file_pattern)
+    return _index_cache[key]
+
+
+class EvalMetricsIndex(object):
+
+  def __init__(self,
+               eval_dir,
+               event_file_pattern='*.tfevents.*',
+               save_sidecar=True):
+    """Create the index, load the sidecar file if exists.
+
+    Args:
+      eval_dir: directory containing the event files.
+      event_file_pattern: glob pattern of event files relative to eval_dir.
+      save_sidecar: whether to save the offsets and metrics to sidecar file.
+    """
+    self._eval_dir = eval_dir
+    self._event_file_pattern = event_file_pattern
+    self._save_sidecar = save_sidecar
+    self._sidecar_path = os.path.join(eval_dir, SIDECAR_FILE_NAME)
+    # event file name => {'offset': int, 'metrics': {step: {tag: value}}}
+    self._files = {}
+    self._lock = threading.Lock()
+    self._load_sidecar()
+
+  def _load_sidecar(self):
+    if not gfile.Exists(self._sidecar_path):
+      return
+    try:
+      with gfile.GFile(self._sidecar_path, 'r') as fin:
+        files = json.load(fin)
+      for file_name, file_info in files.items():
+        metrics = {int(k): v for k, v in file_info['metrics'].items()}
+        self._files[file_name] = {
+            'offset': file_info['offset'],
+            'metrics': metrics
+        }
+    except Exception as ex:
+      # fall back to re-scan the event files
+      logging.warning('failed to load %s: %s' % (self._sidecar_path, str(ex)))
+      self._files = {}
+
+  def _write_sidecar(self):
+    # processes sharing the eval dir, such as the evaluator and the
+    # exporters, write to their own tmp files and rename them in place
+    tmp_path = '%s.tmp_%d_%s' % (self._sidecar_path, os.getpid(),
+                                 uuid.uuid4().hex)
+    try:
+      with gfile.GFile(tmp_path, 'w') as fout:
+        json.dump(self._files, fout)
+      gfile.Rename(tmp_path, self._sidecar_path, overwrite=True)
+    except Exception as ex:
+      logging.warning('failed to save %s: %s' % (self._sidecar_path, str(ex)))
+      if gfile.Exists(tmp_path):
+        gfile.Remove(tmp_path)
+
+  def _tail(self, event_path, file_info):
+    """Read the complete records after offset, return number of new events."""
+    with gfile.GFile(event_path, 'rb') as fin:
+      fin.seek(file_info['offset'])
+      data = fin.read()
+    pos = 0
+    num_events = 0
+    while pos + _HEADER_SIZE <= len(data):
+      length = struct.unpack('<Q', data[pos:pos + 8])[0]
+      record_end = pos + _HEADER_SIZE + length + _FOOTER_SIZE
+      if record_end > len(data):
+        # the record is being written
+        break
+      event = event_pb2.Event()
+      event.ParseFromString(data[pos + _HEADER_SIZE:record_end - _FOOTER_SIZE])
+      pos = record_end
+      num_events += 1
+      if not event.HasField('summary'):
+        continue
+      metrics = {}
+      for value in event.summary.value:
+        if value.HasField('simple_value'):
+          metrics[value.tag] = value.simple_value
+      if metrics:
+        step_metrics = file_info['metrics'].setdefault(event.step, {})
+        step_metrics.update(metrics)
+    file_info['offset'] += pos
+    return num_events
+
+  def update(self):
+    """Read the new events in the event files.
+
+    Return:
+      number of new events read.
+    """
+    with self._lock:
+      if not gfile.Exists(self._eval_dir):
+        return 0
+      event_paths = gfile.Glob(
+          os.path.join(self._eval_dir, self._event_file_pattern))
+      event_paths = {os.path.basename(x): x for x in event_paths}
+      updated = False
+      for file_name in list(self._files.keys()):
+        if file_name not in event_paths:
+          del self._files[file_name]
+          updated = True
+      num_events = 0
+      for file_name, event_path in sorted(event_paths.items()):
+        file_info = self._files.get(file_name, None)
+        file_size = gfile.Stat(event_path).length
+        if file_info is not None and file_size < file_info['offset']:
+          # the file is rewritten, read it from the beginning
+          file_info = None
+        if file_info is None:
+          file_info = {'offset': 0, 'metrics': {}}
+          self._files[file_name] = file_info
+          updated = True
+        if file_size > file_info['offset']:
+          num_events += self._tail(event_path, file_info)
+          updated = True
+      if updated and self._save_sidecar:
+        self._write_sidecar()
+      return num_events
+
+  def eval_metrics(self):
+    """Get the eval metrics of all event files.
+
+    Return:
+      an OrderedDict of global steps => dict of metric names and values,
+      sorted by global steps.
+    """
+    eval_metrics_dict = collections.defaultdict(dict)
+    with self._lock:
+      for file_name in sorted(self._files.keys()):
+        for step, metrics in self._files[file_name]['metrics'].items():
+          eval_metrics_dict[step].update(metrics)
+    return collections.OrderedDict(
+        sorted(eval_metrics_dict.items(), key=lambda t: t[0]))
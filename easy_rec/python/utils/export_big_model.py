@@ -24,6 +24,7 @@ from tensorflow.python.training.saver import export_meta_graph
 
 import easy_rec
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import embedding_quantization
 from easy_rec.python.utils import estimator_utils
 from easy_rec.python.utils import io_util
 from easy_rec.python.utils import proto_util
@@ -40,6 +41,24 @@ GPUOptions = config_pb2.GPUOptions
 INCR_UPDATE_SIGNATURE_KEY = 'incr_update_sig'
 
 
+def _get_quantization_config(pipeline_config):
+  export_config = pipeline_config.export_config
+  if export_config.HasField('embedding_quantization'):
+    return export_config.embedding_quantization
+  return None
+
+
+def _pack_embedding(values, norm_name, quantization_config):
+  """Embedding values written to the kv store, packed if quantized."""
+  precision = embedding_quantization.get_embedding_precision(
+      quantization_config, norm_name)
+  if precision == embedding_quantization.FP32:
+    return values
+  logging.info('write %s to kv store in %s' %
+               (norm_name, embedding_quantization.precision_name(precision)))
+  return embedding_quantization.pack_tensor(values, precision)
+
+
 def export_big_model(export_dir, pipeline_config, redis_params,
                      serving_input_fn, estimator, checkpoint_path, verbose):
   for key in redis_params:
@@ -67,6 +86,7 @@ def export_big_model(export_dir, pipeline_config, redis_params,
     checkpoint_path = estimator_utils.latest_checkpoint(
         pipeline_config.model_dir)
   logging.info('checkpoint_path = %s' % checkpoint_path)
+  quantization_config = _get_quantization_config(pipeline_config)
 
   server = None
   cluster = None
@@ -175,9 +195,14 @@ def export_big_model(export_dir, pipeline_config, redis_params,
       with tf.device(tmp_dev):
         tmp_names = [embed_norm_name[v] for v in tmp_vars]
         tmp_spos = [np.array(embed_spos[v], dtype=np.int64) for v in tmp_vars]
+        tmp_vals = [
+            _pack_embedding(v,
+                            proto_util.get_norm_embed_name(v.name)[0],
+                            quantization_config) for v in tmp_vars
+        ]
         write_kv_res = kv_module.write_kv(
             tmp_names,
-            tmp_vars,
+            tmp_vals,
             tmp_spos,
             url=redis_url,
             password=redis_passwd,
@@ -194,7 +219,9 @@ def export_big_model(export_dir, pipeline_config, redis_params,
         tmp_vs = embedding_vars[tmp_dev]
         tmp_sparse_names = [norm_name_to_ids[x[0]] for x in tmp_vs]
         tmp_sparse_keys = [x[1] for x in tmp_vs]
-        tmp_sparse_vals = [x[2] for x in tmp_vs]
+        tmp_sparse_vals = [
+            _pack_embedding(x[2], x[0], quantization_config) for x in tmp_vs
+        ]
         write_sparse_kv_res = sparse_kv_module.write_sparse_kv(
             tmp_sparse_names,
             tmp_sparse_vals,
@@ -244,6 +271,7 @@ def export_big_model(export_dir, pipeline_config, redis_params,
       redis_cache_names=redis_cache_names,
       meta_graph_def=meta_graph_def,
       norm_name_to_ids=norm_name_to_ids,
+      embedding_quantization=quantization_config,
       debug_dir=export_dir if verbose else '')
   meta_graph_editor.edit_graph()
   tf.reset_default_graph()
@@ -321,6 +349,7 @@ def export_big_model_to_oss(export_dir, pipeline_config, oss_params,
     checkpoint_path = estimator_utils.latest_checkpoint(
         pipeline_config.model_dir)
   logging.info('checkpoint_path = %s' % checkpoint_path)
+  quantization_config = _get_quantization_config(pipeline_config)
 
   server = None
   cluster = None
@@ -429,9 +458,14 @@ def export_big_model_to_oss(export_dir, pipeline_config, oss_params,
       with tf.device(tmp_dev):
         tmp_names = [embed_norm_name[v] for v in tmp_vars]
         tmp_spos = [np.array(embed_spos[v], dtype=np.int64) for v in tmp_vars]
+        tmp_vals = [
+            _pack_embedding(v,
+                            proto_util.get_norm_embed_name(v.name)[0],
+                            quantization_config) for v in tmp_vars
+        ]
         write_kv_res = kv_module.oss_write_kv(
             tmp_names,
-            tmp_vars,
+            tmp_vals,
             tmp_spos,
             osspath=oss_path,
             endpoint=oss_endpoint,
@@ -448,7 +482,9 @@ def export_big_model_to_oss(export_dir, pipeline_config, oss_params,
         tmp_vs = embedding_vars[tmp_dev]
         tmp_sparse_names = [norm_name_to_ids[x[0]] for x in tmp_vs]
         tmp_sparse_keys = [x[1] for x in tmp_vs]
-        tmp_sparse_vals = [x[2] for x in tmp_vs]
+        tmp_sparse_vals = [
+            _pack_embedding(x[2], x[0], quantization_config) for x in tmp_vs
+        ]
         tmp_part_ids = [x[3] for x in tmp_vs]
         write_sparse_kv_res = kv_module.oss_write_sparse_kv(
             tmp_sparse_names,
@@ -500,6 +536,7 @@ def export_big_model_to_oss(export_dir, pipeline_config, oss_params,
       oss_timeout=oss_params.get('oss_timeout', 1500),
       meta_graph_def=meta_graph_def,
       norm_name_to_ids=norm_name_to_ids,
+      embedding_quantization=quantization_config,
       incr_update_params=oss_params.get('incr_update', None),
       debug_dir=export_dir if verbose else '')
   meta_graph_editor.edit_graph_for_oss()
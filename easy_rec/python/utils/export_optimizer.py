@@ -0,0 +1,609 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Post-export optimizations of the serving graph for cpu inference.
+
+The exported graph is frozen(small variables only), stripped to the nodes
+reachable from the signatures, the saver and the init ops, folded and fused
+by grappler. The optimized model replaces the exported one only if the
+outputs on the sample inputs are the same.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.core.framework import types_pb2
+from tensorflow.core.framework import variable_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow.core.protobuf import rewriter_config_pb2
+from tensorflow.core.protobuf import saved_model_pb2
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.grappler import tf_optimizer
+from tensorflow.python.platform import gfile
+from tensorflow.python.saved_model import constants
+from tensorflow.python.saved_model import signature_constants
+from tensorflow.python.saved_model import tag_constants
+
+from easy_rec.python.inference.predictor import PredictorImpl
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+_VARIABLE_OPS = ['VarHandleOp', 'VariableV2', 'Variable']
+_FLOAT_TYPES = [types_pb2.DT_FLOAT, types_pb2.DT_DOUBLE, types_pb2.DT_HALF]
+# collections only used in training, which are dropped from the serving graph
+_TRAINING_COLLECTIONS = [
+    tf.GraphKeys.SUMMARIES, tf.GraphKeys.REGULARIZATION_LOSSES,
+    tf.GraphKeys.LOSSES, tf.GraphKeys.UPDATE_OPS, tf.GraphKeys.TRAIN_OP
+]
+_VARIABLE_COLLECTIONS = [
+    tf.GraphKeys.GLOBAL_VARIABLES, tf.GraphKeys.LOCAL_VARIABLES,
+    tf.GraphKeys.TRAINABLE_VARIABLES, tf.GraphKeys.MODEL_VARIABLES,
+    tf.GraphKeys.GLOBAL_STEP
+]
+# ops fused by the grappler remapper, which only fuses the ops placed on cpu
+_FUSED_OPS = [
+    'MatMul', 'BiasAdd', 'Relu', 'Relu6', 'Elu', 'LeakyRelu', 'Tanh', 'Sigmoid'
+]
+# the vocabularies are hashed by StringToHashBucketFast(Fingerprint64)
+_VOCAB_HASH_BUCKETS = 2**63 - 1
+
+
+def _node_name(tensor_name):
+  return tensor_name.lstrip('^').split(':')[0]
+
+
+def _ancestors(graph_def, node_names):
+  nodes = {node.name: node for node in graph_def.node}
+  visited = set()
+  stack = list(node_names)
+  while stack:
+    name = stack.pop()
+    if name in visited or name not in nodes:
+      continue
+    visited.add(name)
+    stack.extend([_node_name(x) for x in nodes[name].input])
+  return visited
+
+
+def get_serving_meta_graph(saved_model):
+  for meta_graph_def in saved_model.meta_graphs:
+    if tag_constants.SERVING in meta_graph_def.meta_info_def.tags:
+      return meta_graph_def
+  raise ValueError('no meta graph is tagged with %s' % tag_constants.SERVING)
+
+
+def get_keep_nodes(meta_graph_def):
+  """Nodes kept in the optimized graph: signatures, saver, init ops, vars."""
+  keep_nodes = set()
+  for signature_def in meta_graph_def.signature_def.values():
+    for tensor_info in list(signature_def.inputs.values()) + list(
+        signature_def.outputs.values()):
+      keep_nodes.add(_node_name(tensor_info.name))
+  saver_def = meta_graph_def.saver_def
+  for name in [
+      saver_def.filename_tensor_name, saver_def.save_tensor_name,
+      saver_def.restore_op_name
+  ]:
+    if name:
+      keep_nodes.add(_node_name(name))
+  for asset_file_def in meta_graph_def.asset_file_def:
+    keep_nodes.add(_node_name(asset_file_def.tensor_info.name))
+  for key, collection_def in meta_graph_def.collection_def.items():
+    if key in _TRAINING_COLLECTIONS:
+      continue
+    if collection_def.HasField('node_list'):
+      keep_nodes.update([_node_name(x) for x in collection_def.node_list.value])
+    elif key in _VARIABLE_COLLECTIONS:
+      for value in collection_def.bytes_list.value:
+        variable_def = variable_pb2.VariableDef()
+        variable_def.ParseFromString(value)
+        for name in [
+            variable_def.variable_name, variable_def.initializer_name,
+            variable_def.snapshot_name, variable_def.initial_value_name
+        ]:
+          if name:
+            keep_nodes.add(_node_name(name))
+  return keep_nodes
+
+
+def _freeze_variables(sess, graph_def, output_nodes, max_freeze_size):
+  """Replace the reads of the small variables by constants.
+
+  Only the reads reachable from the outputs are replaced, the variables
+  themselves are kept for the saver, the larger variables(such as
+  embeddings) are not frozen to keep the graph small.
+
+  Return:
+    number of frozen variables
+  """
+  nodes = {node.name: node for node in graph_def.node}
+  reads = []
+  for name in _ancestors(graph_def, output_nodes):
+    node = nodes[name]
+    if node.op not in ['ReadVariableOp', 'Identity'] or not node.input:
+      continue
+    var_node = nodes.get(_node_name(node.input[0]))
+    if var_node is None or var_node.op not in _VARIABLE_OPS:
+      continue
+    var_size = tf.TensorShape(var_node.attr['shape'].shape).num_elements()
+    if var_size is None or var_size > max_freeze_size:
+      continue
+    reads.append(node)
+  values = sess.run([node.name + ':0' for node in reads])
+  frozen_vars = set()
+  for node, value in zip(reads, values):
+    frozen_vars.add(_node_name(node.input[0]))
+    control_inputs = [x for x in node.input if x.startswith('^')]
+    node.op = 'Const'
+    del node.input[:]
+    node.input.extend(control_inputs)
+    node.ClearField('attr')
+    node.attr['value'].tensor.CopyFrom(tensor_util.make_tensor_proto(value))
+    node.attr['dtype'].type = node.attr['value'].tensor.dtype
+  return len(frozen_vars)
+
+
+def _freeze_placeholder_defaults(graph_def, output_nodes, input_nodes):
+  """Placeholders with default values which are not inputs(is_training etc.)."""
+  nodes = {node.name: node for node in graph_def.node}
+  for name in _ancestors(graph_def, output_nodes):
+    node = nodes[name]
+    if node.op == 'PlaceholderWithDefault' and name not in input_nodes:
+      dtype = node.attr['dtype'].type
+      node.op = 'Identity'
+      node.ClearField('attr')
+      node.attr['T'].type = dtype
+
+
+def _run_grappler(graph_def, keep_nodes, optimizers):
+  meta_graph_def = meta_graph_pb2.MetaGraphDef()
+  meta_graph_def.graph_def.CopyFrom(graph_def)
+  # grappler keeps the fetch nodes in the train_op collection
+  meta_graph_def.collection_def[tf.GraphKeys.TRAIN_OP].node_list.value.extend(
+      sorted(keep_nodes))
+  config = tf.ConfigProto()
+  rewrite_options = config.graph_options.rewrite_options
+  rewrite_options.optimizers.extend(optimizers)
+  rewrite_options.meta_optimizer_iterations = rewriter_config_pb2.RewriterConfig.TWO
+  rewrite_options.min_graph_nodes = -1
+  return tf_optimizer.OptimizeGraph(config, meta_graph_def)
+
+
+def _attr(node, key):
+  # reading a missing key of the proto map inserts a default value
+  return node.attr[key] if key in node.attr else None
+
+
+def _const_value(node):
+  if node is None or node.op != 'Const':
+    return None
+  return tensor_util.MakeNdarray(node.attr['value'].tensor)
+
+
+def _add_const(graph_def, name, value):
+  node = graph_def.node.add()
+  node.name = name
+  node.op = 'Const'
+  node.attr['value'].tensor.CopyFrom(tensor_util.make_tensor_proto(value))
+  node.attr['dtype'].type = node.attr['value'].tensor.dtype
+  return name
+
+
+def _channel_value(value, num_channels):
+  """Broadcast a const which could be added to(multiplied by) a channel."""
+  if value is None or value.ndim > 2 or (value.ndim == 2 and
+                                         value.shape[0] != 1):
+    return None
+  if value.size not in [1, num_channels]:
+    return None
+  return np.broadcast_to(value.reshape([-1]), [num_channels])
+
+
+def _split_const_input(node, nodes):
+  """Return (const value, the other input name) of a binary op."""
+  if len([x for x in node.input if not x.startswith('^')]) != 2:
+    return None, None
+  for const_id in [1, 0]:
+    value = _const_value(nodes.get(_node_name(node.input[const_id])))
+    if value is not None and ':' not in node.input[const_id]:
+      return value, node.input[1 - const_id]
+  return None, None
+
+
+def _fold_batch_norms(graph_def, keep_nodes):
+  """Fold the scales and shifts of the frozen batch norms into dense layers.
+
+  y = matmul(x, w) + b
+  z = y * scale + shift
+  are rewritten into z = matmul(x, w * scale) + (b * scale + shift), so that
+  the dense layer, the batch norm and the activation are fused into one op.
+
+  Return:
+    number of folded ops
+  """
+  num_folded = 0
+  while True:
+    nodes = {node.name: node for node in graph_def.node}
+    num_consumers = {}
+    for node in graph_def.node:
+      for x in node.input:
+        name = _node_name(x)
+        num_consumers[name] = num_consumers.get(name, 0) + 1
+
+    def _foldable(name):
+      node = nodes.get(_node_name(name))
+      if node is None or ':' in name or name.startswith('^'):
+        return None
+      if name in keep_nodes or num_consumers.get(name, 0) != 1:
+        return None
+      if _attr(node, 'T') is None or node.attr['T'].type not in _FLOAT_TYPES:
+        return None
+      return node
+
+    folded = False
+    for node in list(graph_def.node):
+      if node.op not in ['Mul', 'Add', 'AddV2', 'Sub', 'BiasAdd']:
+        continue
+      if node.op == 'BiasAdd':
+        value, input_name = _const_value(nodes.get(_node_name(
+            node.input[1]))), node.input[0]
+      else:
+        value, input_name = _split_const_input(node, nodes)
+      if value is None:
+        continue
+      if node.op == 'Sub' and _node_name(
+          node.input[1]) != _node_name(input_name):
+        value = -value
+      elif node.op == 'Sub':
+        continue
+      y = _foldable(input_name)
+      if y is None or y.op not in ['MatMul', 'BiasAdd']:
+        continue
+      if node.op == 'BiasAdd' and y.op == 'MatMul':
+        continue
+      if y.op == 'BiasAdd':
+        bias = _const_value(nodes.get(_node_name(y.input[1])))
+        matmul = _foldable(y.input[0])
+        if bias is None or matmul is None or matmul.op != 'MatMul':
+          continue
+      else:
+        matmul, bias = y, None
+      kernel = _const_value(nodes.get(_node_name(matmul.input[1])))
+      transpose_a, transpose_b = [
+          _attr(matmul, key) is not None and matmul.attr[key].b
+          for key in ['transpose_a', 'transpose_b']
+      ]
+      if kernel is None or kernel.ndim != 2 or transpose_a:
+        continue
+      num_channels = kernel.shape[0] if transpose_b else kernel.shape[1]
+      value = _channel_value(value, num_channels)
+      if value is None:
+        continue
+      if bias is None:
+        bias = np.zeros([num_channels], dtype=kernel.dtype)
+      if node.op == 'Mul':
+        kernel = kernel * (value[:, None] if transpose_b else value[None, :])
+        matmul.input[1] = _add_const(graph_def, node.name + '/folded_kernel',
+                                     kernel)
+        bias = bias * value
+      else:
+        bias = bias + value
+      control_inputs = [x for x in node.input if x.startswith('^')]
+      dtype = node.attr['T'].type
+      del node.input[:]
+      node.input.extend([
+          matmul.name,
+          _add_const(graph_def, node.name +
+                     '/folded_bias', bias.astype(kernel.dtype))
+      ] + control_inputs)
+      node.op = 'BiasAdd'
+      node.ClearField('attr')
+      node.attr['T'].type = dtype
+      num_folded += 1
+      folded = True
+      # the consumers are changed, recount before the next fold
+      break
+    if not folded:
+      return num_folded
+
+
+def _hash_vocab(keys):
+  with tf.Graph().as_default():
+    hashed = tf.string_to_hash_bucket_fast(keys, _VOCAB_HASH_BUCKETS)
+    with tf.Session() as sess:
+      return sess.run(hashed)
+
+
+def _prehash_vocab_tables(graph_def):
+  """Replace string vocabulary tables by int64 tables of the key hashes.
+
+  The string keys of the tables initialized from constants(vocab_list)
+  are hashed at export, and the lookup keys are hashed before lookup, which
+  saves the memory and initialization time of the string keys.
+
+  Return:
+    number of rewritten tables
+  """
+  consumers = {}
+  for node in graph_def.node:
+    for x in node.input:
+      consumers.setdefault(_node_name(x), []).append(node)
+  nodes = {node.name: node for node in graph_def.node}
+  num_tables = 0
+  for table in list(graph_def.node):
+    if table.op != 'HashTableV2' or \
+        table.attr['key_dtype'].type != types_pb2.DT_STRING:
+      continue
+    table_consumers = consumers.get(table.name, [])
+    init_ops = [
+        x for x in table_consumers
+        if x.op in ['InitializeTableV2', 'LookupTableImportV2']
+    ]
+    lookups = [x for x in table_consumers if x.op == 'LookupTableFindV2']
+    # tables exported or modified are not rewritten
+    other_ops = [
+        x for x in table_consumers
+        if x not in init_ops + lookups and x.op != 'LookupTableSizeV2'
+    ]
+    if len(init_ops) != 1 or other_ops:
+      continue
+    init_op = init_ops[0]
+    keys = _const_value(nodes.get(_node_name(init_op.input[1])))
+    if keys is None:
+      continue
+    hashed_keys = _hash_vocab(keys.reshape([-1]))
+    if len(np.unique(hashed_keys)) != hashed_keys.size:
+      logging.warning('hash collisions in vocabulary of %s' % table.name)
+      continue
+    init_op.input[1] = _add_const(graph_def, init_op.name + '/hashed_keys',
+                                  hashed_keys.reshape(keys.shape))
+    key_attr = 'Tkey' if init_op.op == 'InitializeTableV2' else 'Tin'
+    init_op.attr[key_attr].type = types_pb2.DT_INT64
+    table.attr['key_dtype'].type = types_pb2.DT_INT64
+    for lookup in lookups:
+      hash_node = graph_def.node.add()
+      hash_node.name = lookup.name + '/hash_keys'
+      hash_node.op = 'StringToHashBucketFast'
+      hash_node.input.append(lookup.input[1])
+      hash_node.attr['num_buckets'].i = _VOCAB_HASH_BUCKETS
+      hash_node.device = lookup.device
+      lookup.input[1] = hash_node.name
+      lookup.attr['Tin'].type = types_pb2.DT_INT64
+    num_tables += 1
+  return num_tables
+
+
+def optimize_graph(sess, meta_graph_def, optimize_config):
+  """Optimize the serving graph of a loaded saved_model.
+
+  Args:
+    sess: session in which the saved_model is loaded
+    meta_graph_def: the serving meta_graph_def
+    optimize_config: protos.GraphOptimization
+
+  Return:
+    the optimized graph_def
+  """
+  graph_def = tf.GraphDef()
+  graph_def.CopyFrom(meta_graph_def.graph_def)
+  keep_nodes = get_keep_nodes(meta_graph_def)
+  output_nodes, input_nodes = set(), set()
+  for signature_def in meta_graph_def.signature_def.values():
+    output_nodes.update(
+        [_node_name(x.name) for x in signature_def.outputs.values()])
+    input_nodes.update(
+        [_node_name(x.name) for x in signature_def.inputs.values()])
+
+  optimizers = ['pruning', 'dependency']
+  if optimize_config.fold_constants:
+    num_frozen = _freeze_variables(sess, graph_def, output_nodes,
+                                   optimize_config.max_freeze_size)
+    logging.info('%d variables are frozen' % num_frozen)
+    _freeze_placeholder_defaults(graph_def, output_nodes, input_nodes)
+    optimizers = ['pruning', 'constfold', 'arithmetic', 'dependency']
+  graph_def = tf.graph_util.extract_sub_graph(graph_def, list(keep_nodes))
+  graph_def = _run_grappler(graph_def, keep_nodes, optimizers)
+
+  if optimize_config.fold_constants and optimize_config.fold_batch_norms:
+    num_folded = _fold_batch_norms(graph_def, keep_nodes)
+    logging.info('%d batch norms and bias adds are folded' % num_folded)
+  if optimize_config.prehash_vocab:
+    num_tables = _prehash_vocab_tables(graph_def)
+    logging.info('%d vocabulary tables are pre-hashed' % num_tables)
+  if optimize_config.fuse_ops:
+    for node in graph_def.node:
+      if node.op in _FUSED_OPS and not node.device:
+        node.device = '/device:CPU:0'
+    optimizers = optimizers + ['remap']
+  graph_def = _run_grappler(graph_def, keep_nodes, optimizers)
+  return graph_def
+
+
+def copy_dir(src_dir, dst_dir):
+  for root, _, files in gfile.Walk(src_dir):
+    rel_dir = os.path.relpath(root, src_dir)
+    gfile.MakeDirs(os.path.join(dst_dir, rel_dir))
+    for file_name in files:
+      gfile.Copy(
+          os.path.join(root, file_name),
+          os.path.join(dst_dir, rel_dir, file_name),
+          overwrite=True)
+
+
+def _write_saved_model(saved_model, meta_graph_def, graph_def, saved_model_dir,
+                       output_dir):
+  meta_graph_def.graph_def.CopyFrom(graph_def)
+  node_names = set([node.name for node in graph_def.node])
+  for key in list(meta_graph_def.collection_def.keys()):
+    collection_def = meta_graph_def.collection_def[key]
+    if key in _TRAINING_COLLECTIONS:
+      del meta_graph_def.collection_def[key]
+    elif collection_def.HasField('node_list'):
+      values = [
+          x for x in collection_def.node_list.value
+          if _node_name(x) in node_names
+      ]
+      del collection_def.node_list.value[:]
+      collection_def.node_list.value.extend(values)
+  for sub_dir in [
+      constants.VARIABLES_DIRECTORY, constants.ASSETS_DIRECTORY,
+      constants.EXTRA_ASSETS_DIRECTORY
+  ]:
+    if gfile.Exists(os.path.join(saved_model_dir, sub_dir)):
+      copy_dir(
+          os.path.join(saved_model_dir, sub_dir),
+          os.path.join(output_dir, sub_dir))
+  with gfile.GFile(
+      os.path.join(output_dir, constants.SAVED_MODEL_FILENAME_PB),
+      'wb') as fout:
+    fout.write(saved_model.SerializeToString())
+
+
+def sample_inputs(signature_def, graph_def, num_samples, separator):
+  """Generate random inputs according to the signature."""
+  rng = np.random.RandomState(0)
+  inputs = {}
+  for name, tensor_info in signature_def.inputs.items():
+    dtype = tf.as_dtype(tensor_info.dtype)
+    shape = [
+        num_samples if dim.size < 0 else dim.size
+        for dim in tensor_info.tensor_shape.dim
+    ]
+    if dtype.is_floating:
+      inputs[name] = rng.uniform(size=shape).astype(dtype.as_numpy_dtype)
+    elif dtype.is_integer:
+      inputs[name] = rng.randint(0, 10, size=shape).astype(dtype.as_numpy_dtype)
+    elif dtype == tf.string:
+      inputs[name] = rng.randint(
+          0, 10, size=shape).astype(np.str_).astype(np.object_)
+    else:
+      raise ValueError('unsupported input type: %s[%s]' % (name, dtype.name))
+
+  if len(signature_def.inputs) == 1 and 'features' in signature_def.inputs:
+    # all the inputs are joined by the separator in one string
+    nodes = {node.name: node for node in graph_def.node}
+    reshape = nodes.get('input_reshape')
+    if reshape is None or _const_value(nodes.get(_node_name(
+        reshape.input[1]))) is None:
+      raise ValueError('could not find the number of input fields')
+    num_fields = _const_value(nodes[_node_name(reshape.input[1])])[-1]
+    lines = [
+        separator.join(rng.randint(0, 10, size=[num_fields]).astype(np.str_))
+        for _ in range(num_samples)
+    ]
+    inputs['features'] = np.array(lines, dtype=np.object_)
+  return inputs
+
+
+def check_model(saved_model_dir, inputs, num_runs):
+  predictor = PredictorImpl(saved_model_dir)
+  outputs = predictor.predict(inputs)
+  for _ in range(min(num_runs, 5)):
+    predictor.predict(inputs)
+  start = time.time()
+  for _ in range(num_runs):
+    predictor.predict(inputs)
+  latency = (time.time() - start) * 1000.0 / max(num_runs, 1)
+  del predictor
+  return outputs, latency
+
+
+def optimize_saved_model(saved_model_dir, optimize_config, separator=','):
+  """Optimize an exported saved_model for cpu serving in place.
+
+  The optimization is best effort, if it fails, the exported model is kept
+  unchanged and the export is not failed.
+
+  Args:
+    saved_model_dir: directory of the exported saved_model
+    optimize_config: protos.GraphOptimization
+    separator: separator of the input fields if multi_placeholder is false
+
+  Return:
+    a dict of the optimization report: parity, max_diff, latencies in ms and
+    number of nodes before and after the optimization, or parity(False) and
+    error if the optimization fails.
+  """
+  if not isinstance(saved_model_dir, str):
+    saved_model_dir = saved_model_dir.decode('utf-8')
+  try:
+    return _optimize_saved_model(saved_model_dir, optimize_config, separator)
+  except Exception as ex:
+    logging.warning('graph optimization of %s failed, keep the exported '
+                    'model unchanged: %s' % (saved_model_dir, str(ex)))
+    return {'parity': False, 'error': str(ex)}
+
+
+def _optimize_saved_model(saved_model_dir, optimize_config, separator):
+  saved_model = saved_model_pb2.SavedModel()
+  with gfile.GFile(
+      os.path.join(saved_model_dir, constants.SAVED_MODEL_FILENAME_PB),
+      'rb') as fin:
+    saved_model.ParseFromString(fin.read())
+  meta_graph_def = get_serving_meta_graph(saved_model)
+  num_nodes_before = len(meta_graph_def.graph_def.node)
+
+  with tf.Graph().as_default():
+    with tf.Session() as sess:
+      tf.saved_model.loader.load(sess, [tag_constants.SERVING], saved_model_dir)
+      graph_def = optimize_graph(sess, meta_graph_def, optimize_config)
+
+  report = {
+      'num_nodes_before': num_nodes_before,
+      'num_nodes_after': len(graph_def.node)
+  }
+  signature_def = meta_graph_def.signature_def[
+      signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY]
+  inputs = sample_inputs(signature_def, meta_graph_def.graph_def,
+                         optimize_config.num_check_samples, separator)
+
+  optimized_dir = saved_model_dir.rstrip('/') + '_optimized'
+  if gfile.Exists(optimized_dir):
+    gfile.DeleteRecursively(optimized_dir)
+  _write_saved_model(saved_model, meta_graph_def, graph_def, saved_model_dir,
+                     optimized_dir)
+  try:
+    outputs, report['latency_before'] = check_model(
+        saved_model_dir, inputs, optimize_config.num_check_runs)
+    optimized_outputs, report['latency_after'] = check_model(
+        optimized_dir, inputs, optimize_config.num_check_runs)
+    report['max_diff'] = 0.0
+    report['parity'] = True
+    for name, output in outputs.items():
+      optimized_output = optimized_outputs[name]
+      if output.dtype.kind in 'fc':
+        report['max_diff'] = max(
+            report['max_diff'],
+            float(np.max(np.abs(output - optimized_output), initial=0.0)))
+        report['parity'] = report['parity'] and np.allclose(
+            output,
+            optimized_output,
+            rtol=optimize_config.parity_tolerance,
+            atol=optimize_config.parity_tolerance)
+      else:
+        report['parity'] = report['parity'] and np.array_equal(
+            output, optimized_output)
+    logging.info(
+        'graph optimization: nodes %d => %d, latency %.3f ms => %.3f ms'
+        ' per batch of %d samples, max output diff = %g' %
+        (report['num_nodes_before'], report['num_nodes_after'],
+         report['latency_before'], report['latency_after'],
+         optimize_config.num_check_samples, report['max_diff']))
+    if report['parity']:
+      # copy and rename, so that the exported model is not left broken
+      saved_model_path = os.path.join(saved_model_dir,
+                                      constants.SAVED_MODEL_FILENAME_PB)
+      gfile.Copy(
+          os.path.join(optimized_dir, constants.SAVED_MODEL_FILENAME_PB),
+          saved_model_path + '.tmp',
+          overwrite=True)
+      gfile.Rename(saved_model_path + '.tmp', saved_model_path, overwrite=True)
+      logging.info('optimized model is saved to %s' % saved_model_dir)
+    else:
+      logging.error('outputs of the optimized model are different, '
+                    'keep the exported model unchanged')
+  finally:
+    gfile.DeleteRecursively(optimized_dir)
+  return report
@@ -0,0 +1,240 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Tune num_parallel_calls and prefetch_size of the train input at startup.
+
+The train dataset is built with each setting in a separate graph, and the
+batches per second of get_next are timed on the train data. The search is
+bounded: num_parallel_calls is doubled until the throughput stops improving
+by more than tolerance, then prefetch_size is doubled from the chosen
+num_parallel_calls. Settings whose buffered batches and shuffle buffer
+exceed the ram budget are skipped, and the search stops after
+max_tune_secs. The smallest setting within tolerance of the best
+throughput is chosen.
+"""
+import logging
+import multiprocessing
+import time
+
+import numpy as np
+import psutil
+import tensorflow as tf
+
+from easy_rec.python.protos.dataset_pb2 import DatasetConfig
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+if hasattr(tf.data, 'AUTOTUNE'):
+  AUTOTUNE = tf.data.AUTOTUNE
+else:
+  AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+# inputs which could not be read again at startup
+_NOT_TUNABLE_INPUTS = [
+    DatasetConfig.KafkaInput, DatasetConfig.DataHubInput,
+    DatasetConfig.ParquetInput
+]
+# batches run before timing, the first one fills the shuffle buffer
+_NUM_WARMUP_BATCHES = 2
+
+
+def get_max_parallel_calls(auto_tune_config):
+  if auto_tune_config.max_parallel_calls > 0:
+    return auto_tune_config.max_parallel_calls
+  return multiprocessing.cpu_count()
+
+
+def get_ram_budget(auto_tune_config):
+  """Ram budget in bytes."""
+  if auto_tune_config.ram_budget_mb > 0:
+    return auto_tune_config.ram_budget_mb * 1024 * 1024
+  return int(psutil.virtual_memory().total * 0.1)
+
+
+def get_buffer_bytes(batch_bytes, batch_size, num_parallel_calls, prefetch_size,
+                     shuffle_buffer_size):
+  """Estimated bytes of the batches buffered by the input.
+
+  The parse and preprocess stages each keep num_parallel_calls batches in
+  flight and prefetch_size batches in the prefetch buffer.
+  """
+  sample_bytes = float(batch_bytes) / max(batch_size, 1)
+  return int(2 * batch_bytes * (num_parallel_calls + prefetch_size) +
+             sample_bytes * shuffle_buffer_size)
+
+
+def _get_nbytes(values):
+  nbytes = 0
+  for value in tf.nest.flatten(values):
+    value = np.asarray(value)
+    if value.dtype == np.object_:
+      nbytes += sum([len(x) for x in value.flat])
+    else:
+      nbytes += value.nbytes
+  return nbytes
+
+
+def _doubling(max_value, min_value=1):
+  value = min(min_value, max_value)
+  while value < max_value:
+    yield value
+    value *= 2
+  yield max_value
+
+
+def _time_input(input_obj, params, data_config, num_batches):
+  """Time the train input built with data_config.
+
+  Return:
+    a tuple of (batches per second, bytes of a batch)
+  """
+  input_obj._data_config = data_config
+  input_obj._prefetch_size = data_config.prefetch_size
+  with tf.Graph().as_default():
+    dataset = input_obj._build(tf.estimator.ModeKeys.TRAIN, params)
+    iterator = tf.data.make_initializable_iterator(dataset)
+    next_batch = iterator.get_next()
+    init_ops = [
+        iterator.initializer,
+        tf.tables_initializer(),
+        tf.global_variables_initializer(),
+        tf.local_variables_initializer()
+    ]
+    num_timed = 0
+    batch_bytes = 0
+    elapsed = 0.0
+    with tf.Session() as sess:
+      sess.run(init_ops)
+      try:
+        batch_bytes = _get_nbytes(sess.run(next_batch))
+        for _ in range(_NUM_WARMUP_BATCHES - 1):
+          sess.run(next_batch)
+        start = time.time()
+        for _ in range(num_batches):
+          sess.run(next_batch)
+          num_timed += 1
+      except tf.errors.OutOfRangeError:
+        logging.warning('auto_tune: the train data has too few batches')
+      if num_timed > 0:
+        elapsed = time.time() - start
+  throughput = num_timed / elapsed if elapsed > 0 else 0.0
+  return throughput, batch_bytes
+
+
+def auto_tune(input_obj, params=None):
+  """Tune num_parallel_calls and prefetch_size of input_obj.
+
+  Args:
+    input_obj: Input object whose data_config has auto_tune set
+    params: params passed to Input._build
+
+  Return:
+    a copy of data_config with the tuned num_parallel_calls and
+    prefetch_size, or data_config itself if the input is not tunable
+  """
+  data_config = input_obj._data_config
+  config = data_config.auto_tune
+  if input_obj._sampler is not None or \
+      data_config.input_type in _NOT_TUNABLE_INPUTS:
+    logging.warning('auto_tune is not supported with samplers or '
+                    'streaming inputs, use the configured settings')
+    return data_config
+
+  max_parallel_calls = get_max_parallel_calls(config)
+  max_prefetch_size = max(config.max_prefetch_size, 1)
+  ram_budget = get_ram_budget(config)
+  start_time = time.time()
+  # (num_parallel_calls, prefetch_size) => batches per second
+  throughputs = {}
+  batch_bytes = [0]
+
+  def _buffer_bytes(num_parallel_calls, prefetch_size):
+    return get_buffer_bytes(batch_bytes[0], data_config.batch_size,
+                            num_parallel_calls, prefetch_size,
+                            data_config.shuffle_buffer_size)
+
+  def _try(num_parallel_calls, prefetch_size):
+    key = (num_parallel_calls, prefetch_size)
+    if key in throughputs:
+      return throughputs[key]
+    if time.time() - start_time > config.max_tune_secs:
+      logging.info('auto_tune: max_tune_secs exceeded')
+      return None
+    if _buffer_bytes(num_parallel_calls, prefetch_size) > ram_budget:
+      logging.info('auto_tune: num_parallel_calls=%d prefetch_size=%d '
+                   'exceeds ram budget %dMB' %
+                   (num_parallel_calls, prefetch_size, ram_budget >> 20))
+      return None
+    candidate = DatasetConfig()
+    candidate.CopyFrom(data_config)
+    candidate.num_parallel_calls = num_parallel_calls
+    candidate.prefetch_size = prefetch_size
+    throughput, candidate_bytes = _time_input(input_obj, params, candidate,
+                                              config.num_profile_batches)
+    batch_bytes[0] = max(batch_bytes[0], candidate_bytes)
+    throughputs[key] = throughput
+    logging.info('auto_tune: num_parallel_calls=%d prefetch_size=%d '
+                 '%.2f batches/s' %
+                 (num_parallel_calls, prefetch_size, throughput))
+    return throughput
+
+  def _sweep(candidates):
+    best = 0.0
+    for num_parallel_calls, prefetch_size in candidates:
+      throughput = _try(num_parallel_calls, prefetch_size)
+      if throughput is None or throughput <= best * (1 + config.tolerance):
+        break
+      best = throughput
+
+  def _smallest(candidates):
+    valid = sorted([x for x in set(candidates) if x in throughputs])
+    if len(valid) == 0:
+      return None
+    best = max([throughputs[x] for x in valid])
+    return [
+        x for x in valid if throughputs[x] >= best * (1 - config.tolerance)
+    ][0]
+
+  prefetch_size = min(data_config.prefetch_size, max_prefetch_size)
+  try:
+    candidates = [(x, prefetch_size) for x in _doubling(max_parallel_calls)]
+    _sweep(candidates)
+    if len(throughputs) == 0 or max(throughputs.values()) <= 0:
+      logging.warning('auto_tune: could not time the train input, use the '
+                      'configured settings')
+      return data_config
+    num_parallel_calls, _ = _smallest(candidates)
+    # buffer at least a batch for each parallel call, so that the parallel
+    # calls are not blocked when the train step is slower than usual
+    candidates = [(num_parallel_calls, x)
+                  for x in _doubling(max_prefetch_size, num_parallel_calls)]
+    _sweep(candidates)
+    chosen = _smallest(candidates)
+    if chosen is not None:
+      prefetch_size = chosen[1]
+  finally:
+    input_obj._data_config = data_config
+    input_obj._prefetch_size = data_config.prefetch_size
+
+  tuned_config = DatasetConfig()
+  tuned_config.CopyFrom(data_config)
+  tuned_config.num_parallel_calls = num_parallel_calls
+  tuned_config.prefetch_size = prefetch_size
+  logging.info('auto_tune: choose num_parallel_calls=%d prefetch_size=%d, '
+               '%.2f batches/s, buffers about %.1fMB, tuned in %.1fs' %
+               (num_parallel_calls, prefetch_size,
+                throughputs.get((num_parallel_calls, prefetch_size), 0.0),
+                _buffer_bytes(num_parallel_calls, prefetch_size) / 1024.0 /
+                1024.0, time.time() - start_time))
+  return tuned_config
+
+
+def set_ram_budget(dataset, auto_tune_config):
+  """Bound the memory of the buffers sized by tf.data autotune."""
+  options = tf.data.Options()
+  if not hasattr(options, 'autotune'):
+    logging.warning('ram budget of tf.data autotune requires tf >= 2.5')
+    return dataset
+  options.autotune.enabled = True
+  options.autotune.ram_budget = get_ram_budget(auto_tune_config)
+  return dataset.with_options(options)
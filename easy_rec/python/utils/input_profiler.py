@@ -0,0 +1,350 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Per stage timing of the train input pipeline and a bottleneck report.
+
+Enabled by data_config.profile_input, the stages of Input._build are timed:
+  - read: the python generators of the inputs which read in python,
+    e.g. ParquetInput._sample_generator, OdpsInputV3._odps_read, timed
+    around each next() call;
+  - parse: _parse_csv, _parse_table, _parse_rtp, ...;
+  - preprocess: _preprocess, including preprocess/sampler.
+The graph stages are wrapped by tf.timestamp before the inputs and after
+the outputs, and the elapsed seconds are recorded by a py_func, so each
+parallel call is timed separately.
+
+InputProfilerHook measures how long each train step waits for the input:
+the time from session.run to the time get_next returns, and logs a ranked
+report with suggested num_parallel_calls and prefetch_size every
+log_step_count_steps steps.
+"""
+import functools
+import logging
+import math
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+READ_STAGE = 'read'
+PARSE_STAGE = 'parse'
+PREPROCESS_STAGE = 'preprocess'
+SAMPLER_STAGE = 'preprocess/sampler'
+
+# stage => methods of Input subclasses
+STAGE_METHODS = [
+    (READ_STAGE,
+     ['_sample_generator', '_odps_read', '_parquet_read',
+      '_datahub_generator']),
+    (PARSE_STAGE, [
+        '_parse_csv', '_parse_csv_batch', '_parse_table', '_parse_record',
+        '_parse_rtp', '_parse_tfrecord', '_parse_dataframe'
+    ]),
+    (PREPROCESS_STAGE, ['_preprocess']),
+]
+# stages run by the python generators, which are sequential
+SEQUENTIAL_STAGES = [READ_STAGE]
+
+# the input is not the bottleneck if the train steps wait less than this
+# ratio of the time for the input
+_MAX_WAIT_RATIO = 0.05
+
+
+class StageStats(object):
+
+  def __init__(self, count=0, total=0.0, max_secs=0.0):
+    self.count = count
+    self.total = total
+    self.max_secs = max_secs
+
+  def __sub__(self, other):
+    return StageStats(self.count - other.count, self.total - other.total,
+                      self.max_secs)
+
+
+class InputProfiler(object):
+  """Accumulate the seconds of each input stage, thread safe."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = {}
+
+  def record(self, stage, secs):
+    with self._lock:
+      stats = self._stats.setdefault(stage, StageStats())
+      stats.count += 1
+      stats.total += secs
+      stats.max_secs = max(stats.max_secs, secs)
+
+  def snapshot(self):
+    with self._lock:
+      return {
+          k: StageStats(v.count, v.total, v.max_secs)
+          for k, v in self._stats.items()
+      }
+
+  def reset_max(self):
+    with self._lock:
+      for stats in self._stats.values():
+        stats.max_secs = 0.0
+
+  def _record_secs(self, stage, secs):
+    self.record(stage, float(secs))
+    return secs
+
+  def profile_fn(self, stage, fn):
+    """Wrap a tensor in tensor out function, such as a dataset map function."""
+
+    @functools.wraps(fn)
+    def _profiled_fn(*args):
+      start = tf.timestamp()
+      outputs = fn(*_after(args, [start]))
+      elapsed = _after(tf.timestamp, _flatten_tensors(outputs))() - start
+      recorded = tf.py_func(
+          functools.partial(self._record_secs, stage), [elapsed],
+          tf.float64,
+          stateful=True)
+      return _after(outputs, [recorded])
+
+    return _profiled_fn
+
+  def profile_generator(self, stage, generator_fn):
+    """Wrap a generator function, the time of each next() is recorded."""
+
+    @functools.wraps(generator_fn)
+    def _profiled_generator(*args):
+      generator = generator_fn(*args)
+      while True:
+        start = time.time()
+        try:
+          value = next(generator)
+        except StopIteration:
+          return
+        self.record(stage, time.time() - start)
+        yield value
+
+    return _profiled_generator
+
+  def instrument(self, input_obj):
+    """Wrap the stage methods of an Input object, only once."""
+    if getattr(input_obj, '_input_profiler', None) is self:
+      return
+    input_obj._input_profiler = self
+    for stage, method_names in STAGE_METHODS:
+      for method_name in method_names:
+        method = getattr(input_obj, method_name, None)
+        if method is None:
+          continue
+        if stage in SEQUENTIAL_STAGES:
+          wrapped = self.profile_generator(stage, method)
+        else:
+          wrapped = self.profile_fn(stage, method)
+        setattr(input_obj, method_name, wrapped)
+    sampler = getattr(input_obj, '_sampler', None)
+    if sampler is not None:
+      sampler.get = self.profile_fn(SAMPLER_STAGE, sampler.get)
+
+
+def _flatten_tensors(structure):
+  return [
+      x for x in tf.nest.flatten(structure, expand_composites=True)
+      if isinstance(x, tf.Tensor)
+  ]
+
+
+def _after(structure, deps):
+  """Run the tensors in structure after deps, other values are kept.
+
+  If structure is callable, return a function calling it after deps.
+  """
+  if callable(structure):
+
+    def _fn(*args, **kwargs):
+      with tf.control_dependencies(deps):
+        return structure(*args, **kwargs)
+
+    return _fn
+
+  def _identity(x):
+    if isinstance(x, tf.Tensor):
+      with tf.control_dependencies(deps):
+        return tf.identity(x)
+    return x
+
+  return tf.nest.map_structure(_identity, structure, expand_composites=True)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+  """The profiler of the process, created on the first call."""
+  global _profiler
+  with _profiler_lock:
+    if _profiler is None:
+      _profiler = InputProfiler()
+    return _profiler
+
+
+def bottleneck_report(stage_stats,
+                      step_secs,
+                      wait_secs,
+                      num_parallel_calls,
+                      prefetch_size,
+                      max_parallel_calls=None):
+  """Rank the input stages and suggest num_parallel_calls and prefetch_size.
+
+  Args:
+    stage_stats: dict of stage name to StageStats, of the same steps as
+      step_secs
+    step_secs: seconds of each train step
+    wait_secs: seconds each train step waits for the input
+    num_parallel_calls: current data_config.num_parallel_calls
+    prefetch_size: current data_config.prefetch_size
+    max_parallel_calls: upper bound of the suggested num_parallel_calls,
+      default is the number of cpus
+
+  Return:
+    a tuple of (report lines, dict of suggested num_parallel_calls and
+    prefetch_size)
+  """
+  if max_parallel_calls is None:
+    max_parallel_calls = multiprocessing.cpu_count()
+  num_steps = len(step_secs)
+  step_time = float(np.mean(step_secs))
+  wait_time = float(np.mean(wait_secs))
+  # the model computation of each step
+  compute_time = max(step_time - wait_time, 1e-6)
+  wait_ratio = wait_time / step_time if step_time > 0 else 0.0
+  lines = [
+      'input profile of %d steps: step %.2fms, wait for input %.2fms(%.1f%%), '
+      'compute %.2fms' % (num_steps, step_time * 1000, wait_time * 1000,
+                          wait_ratio * 100, compute_time * 1000)
+  ]
+
+  # seconds of each stage per step, divided by the parallelism
+  ranked = []
+  for stage, stats in stage_stats.items():
+    if stats.count <= 0:
+      continue
+    stage_time = stats.total / num_steps
+    parallel = 1 if stage in SEQUENTIAL_STAGES else num_parallel_calls
+    ranked.append((stage_time / parallel, stage, stage_time, stats))
+  ranked.sort(reverse=True)
+  for rank, (effective_time, stage, stage_time, stats) in enumerate(ranked):
+    lines.append(
+        '  %d. %-20s %8.2fms/step(%.2fms/step with parallelism), '
+        '%d calls, %.2fms/call, max %.2fms' %
+        (rank + 1, stage, stage_time * 1000, effective_time * 1000, stats.count,
+         stats.total / stats.count * 1000, stats.max_secs * 1000))
+
+  suggestion = {
+      'num_parallel_calls': num_parallel_calls,
+      'prefetch_size': prefetch_size
+  }
+  if wait_ratio < _MAX_WAIT_RATIO or len(ranked) == 0:
+    lines.append('  the input is not the bottleneck, the train step is')
+    return lines, suggestion
+
+  bottleneck_time, bottleneck, _, _ = ranked[0]
+  if bottleneck_time > compute_time and bottleneck in SEQUENTIAL_STAGES:
+    lines.append(
+        '  the bottleneck is %s, which is sequential in each worker: use '
+        'more workers, or read more files in parallel' % bottleneck)
+  parallel_time = max([
+      stage_time for _, stage, stage_time, _ in ranked
+      if stage not in SEQUENTIAL_STAGES and '/' not in stage
+  ] + [0.0])
+  if parallel_time / num_parallel_calls > compute_time:
+    # enough parallel calls to produce a batch per compute_time
+    suggestion['num_parallel_calls'] = min(
+        max_parallel_calls,
+        max(num_parallel_calls, int(math.ceil(parallel_time / compute_time))))
+  if bottleneck_time <= compute_time:
+    # the input is fast enough on average, the steps wait for slow batches
+    max_batch_time = max([stats.max_secs for _, _, _, stats in ranked])
+    suggestion['prefetch_size'] = max(
+        prefetch_size * 2,
+        int(math.ceil(max_batch_time / compute_time)) + 1)
+  lines.append('  the bottleneck is %s, suggest num_parallel_calls: %d, '
+               'prefetch_size: %d' %
+               (bottleneck, suggestion['num_parallel_calls'],
+                suggestion['prefetch_size']))
+  return lines, suggestion
+
+
+class InputProfilerHook(tf.train.SessionRunHook):
+  """Time the waits of the train steps for the input and log the report.
+
+  Args:
+    input_ready_time: tf.timestamp run after get_next returns
+    report_steps: log the report every report_steps steps
+    num_parallel_calls: data_config.num_parallel_calls
+    prefetch_size: data_config.prefetch_size
+    profiler: InputProfiler, default is get_profiler()
+  """
+
+  def __init__(self,
+               input_ready_time,
+               report_steps,
+               num_parallel_calls,
+               prefetch_size,
+               profiler=None):
+    self._input_ready_time = input_ready_time
+    self._report_steps = max(report_steps, 1)
+    self._num_parallel_calls = num_parallel_calls
+    self._prefetch_size = prefetch_size
+    self._profiler = profiler if profiler is not None else get_profiler()
+    self._step_secs = []
+    self._wait_secs = []
+    self._last_stats = {}
+    self._run_start = None
+    self.last_suggestion = None
+
+  def after_create_session(self, session, coord):
+    self._last_stats = self._profiler.snapshot()
+
+  def before_run(self, run_context):
+    self._run_start = time.time()
+    return tf.train.SessionRunArgs(self._input_ready_time)
+
+  def after_run(self, run_context, run_values):
+    run_end = time.time()
+    self._step_secs.append(run_end - self._run_start)
+    self._wait_secs.append(
+        min(
+            max(run_values.results - self._run_start, 0.0),
+            run_end - self._run_start))
+    if len(self._step_secs) >= self._report_steps:
+      self.report()
+
+  def report(self):
+    if len(self._step_secs) == 0:
+      return
+    stats = self._profiler.snapshot()
+    window_stats = {
+        k: v - self._last_stats.get(k, StageStats()) for k, v in stats.items()
+    }
+    lines, self.last_suggestion = bottleneck_report(window_stats,
+                                                    self._step_secs,
+                                                    self._wait_secs,
+                                                    self._num_parallel_calls,
+                                                    self._prefetch_size)
+    logging.info('\n'.join(lines))
+    self._last_stats = stats
+    self._profiler.reset_max()
+    self._step_secs = []
+    self._wait_secs = []
+
+  def end(self, session):
+    self.report()
+
+
+def input_ready_time(features, labels=None):
+  """tf.timestamp after the features and labels are ready."""
+  return _after(tf.timestamp, _flatten_tensors([features, labels]))()
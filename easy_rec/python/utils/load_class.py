@@ -2,6 +2,7 @@
 # Copyright (c) Alibaba, Inc. and its affiliates.
 """Load_class.py tools for loading classes."""
 
+import importlib
 import inspect
 import logging
 import os
@@ -200,7 +201,40 @@ def register_class(class_map, class_name, cls):
   class_map[class_name] = cls
 
 
-def get_register_class_meta(class_map, have_abstract_class=True):
+_auto_imported = False
+
+
+def import_registered_module(registry, name):
+  """Import the module which defines a registered class.
+
+  The module is found in the generated registry index, if not found,
+  fall back to auto_import all the modules, so that user-defined classes
+  which are not in the index still work.
+
+  Args:
+    registry: registry name, such as EasyRecModel, Input
+    name: class name
+  """
+  global _auto_imported
+  from easy_rec.python.utils.registry_index import REGISTRY_INDEX
+  module = REGISTRY_INDEX.get(registry, {}).get(name, None)
+  if module is not None:
+    importlib.import_module('easy_rec.python.' + module)
+  elif not _auto_imported:
+    logging.info('%s is not in registry index, auto import all modules' % name)
+    auto_import()
+    _auto_imported = True
+
+
+def get_register_class_meta(class_map, have_abstract_class=True, registry=None):
+  """Get metaclass which registers the classes into class_map.
+
+  Args:
+    class_map: dict of class name => class
+    have_abstract_class: kept for compatibility, not used.
+    registry: registry name in the registry index, if set, create_class
+      will import the module of unregistered classes on demand.
+  """
 
   class RegisterABCMeta(ABCMeta):
 
@@ -210,6 +244,8 @@ def get_register_class_meta(class_map, have_abstract_class=True):
 
       @classmethod
       def create_class(cls, name):
+        if name not in class_map and registry is not None:
+          import_registered_module(registry, name)
         if name in class_map:
           return class_map[name]
         else:
@@ -235,6 +271,12 @@ def load_keras_layer(name):
   if name == '' or name is None:
     return None
 
+  from easy_rec.python.utils.registry_index import REGISTRY_INDEX
+  module = REGISTRY_INDEX['KerasLayer'].get(name, None)
+  if module is not None:
+    module = importlib.import_module('easy_rec.python.' + module)
+    return getattr(module, name), True
+
   path = 'easy_rec.python.layers.keras.' + name
   try:
     cls = pydoc.locate(path)
@@ -13,6 +13,7 @@ from tensorflow.python.saved_model.loader_impl import SavedModelLoader
 
 from easy_rec.python.utils import conditional
 from easy_rec.python.utils import constant
+from easy_rec.python.utils import embedding_quantization
 from easy_rec.python.utils import embedding_utils
 from easy_rec.python.utils import proto_util
 
@@ -36,6 +37,7 @@ class MetaGraphEditor:
                meta_graph_def=None,
                norm_name_to_ids=None,
                incr_update_params=None,
+               embedding_quantization=None,
                debug_dir=''):
     self._lookup_op = tf.load_op_library(lookup_lib_path)
     self._debug_dir = debug_dir
@@ -77,6 +79,8 @@ class MetaGraphEditor:
     self._embed_dims = None
     self._embed_sizes = None
     self._embed_combiners = None
+    self._embed_precisions = None
+    self._embedding_quantization = embedding_quantization
     self._redis_url = redis_url
     self._redis_passwd = redis_passwd
     self._redis_timeout = redis_timeout
@@ -357,6 +361,11 @@ class MetaGraphEditor:
         int(self._embed_name_to_ids[x]) for x in self._embed_names
     ]
 
+    self._embed_precisions = [
+        embedding_quantization.get_embedding_precision(
+            self._embedding_quantization, x) for x in self._embed_names
+    ]
+
     self._is_cache_from_redis = [
         proto_util.is_cache_from_redis(x, self._redis_cache_names)
         for x in self._embed_names
@@ -368,6 +377,55 @@ class MetaGraphEditor:
     return lookup_input_indices, lookup_input_values, lookup_input_shapes,\
         lookup_input_weights
 
+  def _get_lookup_combiners_and_dims(self):
+    """Combiners and dimensions of the embeddings in the kv store.
+
+    The packed rows of the quantized embeddings are looked up one id per bag.
+    """
+    combiners, dims = [], []
+    for combiner, dim, precision in zip(self._embed_combiners, self._embed_dims,
+                                        self._embed_precisions):
+      if precision == embedding_quantization.FP32:
+        combiners.append(combiner)
+        dims.append(dim)
+      else:
+        combiners.append('sum')
+        dims.append(embedding_quantization.packed_dim(dim, precision))
+    return combiners, dims
+
+  def _pack_lookup_inputs(self, lookup_input_indices, lookup_input_values,
+                          lookup_input_shapes, lookup_input_weights):
+    """Replace the lookup inputs of the quantized embeddings in place.
+
+    Return:
+      list of the original indices, shapes, weights and the positions of
+      the ids in the unique ids, None for the not quantized embeddings
+    """
+    packed_inputs = [None for _ in lookup_input_values]
+    for i, precision in enumerate(self._embed_precisions):
+      if precision == embedding_quantization.FP32:
+        continue
+      indices, values, shapes, unique_idx = \
+          embedding_quantization.packed_lookup_inputs(lookup_input_values[i])
+      packed_inputs[i] = (lookup_input_indices[i], lookup_input_shapes[i],
+                          lookup_input_weights[i], unique_idx)
+      lookup_input_indices[i] = tf.cast(indices, lookup_input_indices[i].dtype)
+      lookup_input_values[i] = values
+      lookup_input_shapes[i] = tf.cast(shapes, lookup_input_shapes[i].dtype)
+      lookup_input_weights[i] = []
+    return packed_inputs
+
+  def _combine_packed_outputs(self, packed_inputs):
+    """Dequantize and combine the packed rows of the quantized embeddings."""
+    for i, packed_input in enumerate(packed_inputs):
+      if packed_input is None:
+        continue
+      indices, shapes, weights, unique_idx = packed_input
+      self._lookup_outs[i] = embedding_quantization.combine_packed_rows(
+          self._lookup_outs[i], unique_idx, indices, shapes, weights,
+          self._embed_combiners[i], self._embed_precisions[i],
+          self._embed_dims[i])
+
   def add_lookup_op(self, lookup_input_indices, lookup_input_values,
                     lookup_input_shapes, lookup_input_weights):
     logging.info('add custom lookup operation to lookup embeddings from redis')
@@ -375,6 +433,11 @@ class MetaGraphEditor:
     for i in range(len(lookup_input_values)):
       if lookup_input_values[i].dtype == tf.int32:
         lookup_input_values[i] = tf.to_int64(lookup_input_values[i])
+    packed_inputs = self._pack_lookup_inputs(lookup_input_indices,
+                                             lookup_input_values,
+                                             lookup_input_shapes,
+                                             lookup_input_weights)
+    lookup_combiners, lookup_dims = self._get_lookup_combiners_and_dims()
     for i in range(len(self._lookup_outs)):
       i_1 = i + 1
       self._lookup_outs[i] = self._lookup_op.kv_lookup(
@@ -385,11 +448,12 @@ class MetaGraphEditor:
           url=self._redis_url,
           password=self._redis_passwd,
           timeout=self._redis_timeout,
-          combiners=self._embed_combiners[i:i_1],
-          embedding_dims=self._embed_dims[i:i_1],
+          combiners=lookup_combiners[i:i_1],
+          embedding_dims=lookup_dims[i:i_1],
           embedding_names=self._embed_ids[i:i_1],
           cache=self._is_cache_from_redis,
           version=self._meta_graph_version)[0]
+    self._combine_packed_outputs(packed_inputs)
 
     meta_graph_def = tf.train.export_meta_graph()
 
@@ -410,6 +474,11 @@ class MetaGraphEditor:
       for i in range(len(lookup_input_values)):
         if lookup_input_values[i].dtype == tf.int32:
           lookup_input_values[i] = tf.to_int64(lookup_input_values[i])
+      packed_inputs = self._pack_lookup_inputs(lookup_input_indices,
+                                               lookup_input_values,
+                                               lookup_input_shapes,
+                                               lookup_input_weights)
+    lookup_combiners, lookup_dims = self._get_lookup_combiners_and_dims()
     # N = len(lookup_input_indices)
     # self._lookup_outs = [ None for _ in range(N) ]
     # for i in range(N):
@@ -440,12 +509,14 @@ class MetaGraphEditor:
         ak=self._oss_ak,
         sk=self._oss_sk,
         timeout=self._oss_timeout,
-        combiners=self._embed_combiners,
-        embedding_dims=self._embed_dims,
+        combiners=lookup_combiners,
+        embedding_dims=lookup_dims,
         embedding_ids=self._embed_ids,
         embedding_is_kv=self._embed_is_kv,
         shared_name='embedding_lookup_res',
         name='embedding_lookup_fused/lookup')
+    self._lookup_outs = list(self._lookup_outs)
+    self._combine_packed_outputs(packed_inputs)
 
     N = np.max([int(x) for x in self._embed_ids]) + 1
     uniq_embed_ids = [x for x in range(N)]
@@ -453,8 +524,7 @@ class MetaGraphEditor:
     uniq_embed_combiners = ['mean' for x in range(N)]
     uniq_embed_is_kvs = [0 for x in range(N)]
     for embed_id, embed_combiner, embed_is_kv, embed_dim in zip(
-        self._embed_ids, self._embed_combiners, self._embed_is_kv,
-        self._embed_dims):
+        self._embed_ids, lookup_combiners, self._embed_is_kv, lookup_dims):
       uniq_embed_combiners[embed_id] = embed_combiner
       uniq_embed_is_kvs[embed_id] = embed_is_kv
       uniq_embed_dims[embed_id] = embed_dim
@@ -0,0 +1,111 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+# This file is generated by easy_rec/python/tools/gen_registry_index.py,
+# do not edit it manually.
+# Module paths are relative to easy_rec.python.
+
+REGISTRY_INDEX = {
+    'EasyRecModel': {
+        'AutoInt': 'model.autoint',
+        'CMBF': 'model.cmbf',
+        'CoMetricLearningI2I': 'model.collaborative_metric_learning',
+        'DAT': 'model.dat',
+        'DBMTL': 'model.dbmtl',
+        'DCN': 'model.dcn',
+        'DLRM': 'model.dlrm',
+        'DSSM': 'model.dssm',
+        'DSSM_SENet': 'model.dssm_senet',
+        'DeepFM': 'model.deepfm',
+        'DropoutNet': 'model.dropoutnet',
+        'DummyModel': 'model.dummy_model',
+        'ESMM': 'model.esmm',
+        'EasyRecModel': 'model.easy_rec_model',
+        'FM': 'model.fm',
+        'MIND': 'model.mind',
+        'MMoE': 'model.mmoe',
+        'MatchModel': 'model.match_model',
+        'MultiTaskModel': 'model.multi_task_model',
+        'MultiTower': 'model.multi_tower',
+        'MultiTowerBST': 'model.multi_tower_bst',
+        'MultiTowerDIN': 'model.multi_tower_din',
+        'MultiTowerRecall': 'model.multi_tower_recall',
+        'PDN': 'model.pdn',
+        'PLE': 'model.ple',
+        'RankModel': 'model.rank_model',
+        'RocketLaunching': 'model.rocket_launching',
+        'SimpleMultiTask': 'model.simple_multi_task',
+        'Uniter': 'model.uniter',
+        'WideAndDeep': 'model.wide_and_deep',
+    },
+    'Input': {
+        'BatchTFRecordInput': 'input.batch_tfrecord_input',
+        'CSVInput': 'input.csv_input',
+        'CSVInputEx': 'input.csv_input_ex',
+        'CSVInputV2': 'input.csv_input_v2',
+        'CriteoInput': 'input.criteo_input',
+        'DataHubInput': 'input.datahub_input',
+        'DummyInput': 'input.dummy_input',
+        'HiveInput': 'input.hive_input',
+        'HiveParquetInput': 'input.hive_parquet_input',
+        'HiveRTPInput': 'input.hive_rtp_input',
+        'Input': 'input.input',
+        'KafkaInput': 'input.kafka_input',
+        'OdpsInput': 'input.odps_input',
+        'OdpsInputV2': 'input.odps_input_v2',
+        'OdpsInputV3': 'input.odps_input_v3',
+        'OdpsRTPInput': 'input.odps_rtp_input',
+        'OdpsRTPInputV2': 'input.odps_rtp_input_v2',
+        'ParquetInput': 'input.parquet_input',
+        'ParquetInputV2': 'input.parquet_input_v2',
+        'ParquetInputV3': 'input.parquet_input_v3',
+        'RTPInput': 'input.rtp_input',
+        'RTPInputV2': 'input.rtp_input_v2',
+        'TFRecordInput': 'input.tfrecord_input',
+    },
+    'KerasLayer': {
+        'AITMTower': 'layers.keras.multi_task',
+        'Attention': 'layers.keras.attention',
+        'AutoDisEmbedding': 'layers.keras.numerical_embedding',
+        'AuxiliaryLoss': 'layers.keras.auxiliary_loss',
+        'BST': 'layers.keras.bst',
+        'BiLinear': 'layers.keras.fibinet',
+        'CIN': 'layers.keras.interaction',
+        'Cross': 'layers.keras.interaction',
+        'DIN': 'layers.keras.din',
+        'DotInteraction': 'layers.keras.interaction',
+        'EditDistance': 'layers.keras.custom_ops',
+        'EmbeddingLayer': 'layers.keras.embedding',
+        'FM': 'layers.keras.interaction',
+        'FiBiNet': 'layers.keras.fibinet',
+        'Gate': 'layers.keras.blocks',
+        'Highway': 'layers.keras.blocks',
+        'MLP': 'layers.keras.blocks',
+        'MMoE': 'layers.keras.multi_task',
+        'MappedDotProduct': 'layers.keras.custom_ops',
+        'MaskBlock': 'layers.keras.mask_net',
+        'MaskNet': 'layers.keras.mask_net',
+        'MultiHeadAttention': 'layers.keras.multi_head_attention',
+        'NaryDisEmbedding': 'layers.keras.numerical_embedding',
+        'OverlapFeature': 'layers.keras.custom_ops',
+        'PPNet': 'layers.keras.ppnet',
+        'PeriodicEmbedding': 'layers.keras.numerical_embedding',
+        'SENet': 'layers.keras.fibinet',
+        'SeqAugment': 'layers.keras.data_augment',
+        'SeqAugmentOps': 'layers.keras.custom_ops',
+        'TextCNN': 'layers.keras.blocks',
+        'TextEncoder': 'layers.keras.transformer',
+        'TextNormalize': 'layers.keras.custom_ops',
+        'TransformerBlock': 'layers.keras.transformer',
+        'TransformerEncoder': 'layers.keras.transformer',
+    },
+    'PredictorInterface': {
+        'CSVPredictor': 'inference.csv_predictor',
+        'HiveParquetPredictor': 'inference.hive_parquet_predictor',
+        'HivePredictor': 'inference.hive_predictor',
+        'ODPSPredictor': 'inference.odps_predictor',
+        'ParquetPredictor': 'inference.parquet_predictor',
+        'ParquetPredictorV2': 'inference.parquet_predictor_v2',
+        'Predictor': 'inference.predictor',
+        'PredictorInterface': 'inference.predictor',
+    },
+}
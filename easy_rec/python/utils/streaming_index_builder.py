@@ -0,0 +1,209 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Build vector indexes from a stream of vector batches.
+
+The vectors are copied into preallocated float32 chunks as they arrive,
+instead of being accumulated as python lists. The full chunks are added to
+the index and released while reading, so only the last partial chunk of
+each shard is buffered. Indexes which need training(ivf, pq) are trained
+on the first train_sample_size vectors of the stream, which are buffered
+until then, so the peak memory is about train_sample_size vectors plus one
+chunk per shard, independent of the size of the stream.
+"""
+import logging
+
+import numpy as np
+
+
+class ReservoirSampler(object):
+  """Uniform sample of fixed size over a stream of vector batches."""
+
+  def __init__(self, sample_size, ndim, seed=0):
+    self._sample = np.zeros([sample_size, ndim], dtype=np.float32)
+    self._sample_size = sample_size
+    self._num_seen = 0
+    self._rng = np.random.RandomState(seed)
+
+  @property
+  def sample(self):
+    return self._sample[:min(self._num_seen, self._sample_size)]
+
+  @property
+  def num_seen(self):
+    return self._num_seen
+
+  def add(self, vectors):
+    num_fill = min(max(self._sample_size - self._num_seen, 0), len(vectors))
+    if num_fill > 0:
+      self._sample[self._num_seen:self._num_seen + num_fill] = \
+          vectors[:num_fill]
+    if num_fill < len(vectors):
+      # algorithm R, the i-th vector of the stream replaces a random slot
+      # with probability sample_size / (i + 1)
+      stream_pos = self._num_seen + np.arange(num_fill, len(vectors))
+      slots = (self._rng.uniform(size=len(stream_pos)) *
+               (stream_pos + 1)).astype(np.int64)
+      selected = slots < self._sample_size
+      self._sample[slots[selected]] = vectors[num_fill:][selected]
+    self._num_seen += len(vectors)
+
+
+class VectorChunks(object):
+  """Vectors stored in preallocated float32 chunks of chunk_size rows."""
+
+  def __init__(self, ndim, chunk_size):
+    self._ndim = ndim
+    self._chunk_size = chunk_size
+    self._chunks = []
+    self._last_size = chunk_size
+    self._num_vectors = 0
+
+  def __len__(self):
+    return self._num_vectors
+
+  @property
+  def num_full_chunks(self):
+    if self._last_size < self._chunk_size:
+      return len(self._chunks) - 1
+    return len(self._chunks)
+
+  def append(self, vectors):
+    start = 0
+    while start < len(vectors):
+      if self._last_size == self._chunk_size:
+        self._chunks.append(
+            np.empty([self._chunk_size, self._ndim], dtype=np.float32))
+        self._last_size = 0
+      num_copy = min(self._chunk_size - self._last_size, len(vectors) - start)
+      self._chunks[-1][self._last_size:self._last_size + num_copy] = \
+          vectors[start:start + num_copy]
+      self._last_size += num_copy
+      start += num_copy
+    self._num_vectors += len(vectors)
+
+  def pop_chunks(self, full_only=False):
+    """Yield the chunks in order, each chunk is released once yielded.
+
+    Args:
+      full_only: if True, the last chunk is kept if it is not full.
+    """
+    num_pop = self.num_full_chunks if full_only else len(self._chunks)
+    for _ in range(num_pop):
+      chunk = self._chunks.pop(0)
+      if not self._chunks:
+        chunk = chunk[:self._last_size]
+        self._last_size = self._chunk_size
+      self._num_vectors -= len(chunk)
+      yield chunk
+
+
+class StreamingIndexBuilder(object):
+  """Add a stream of vector batches into one or more index shards.
+
+  The index objects follow the faiss index api: is_trained, train(x) and
+  add(x). The i-th vector of the stream goes to shard i % num_shards. All
+  the shards share the quantizer trained on the first train_sample_size
+  vectors of the stream.
+  """
+
+  def __init__(self,
+               index_fn,
+               ndim,
+               num_shards=1,
+               train_sample_size=65536,
+               chunk_size=65536,
+               clone_fn=None,
+               seed=0):
+    """Init StreamingIndexBuilder.
+
+    Args:
+      index_fn: function that creates an empty index.
+      ndim: dimension of the vectors.
+      num_shards: number of index shards.
+      train_sample_size: number of vectors to train the index, the index is
+        trained once train_sample_size vectors are added, or at finish.
+      chunk_size: number of vectors in each chunk.
+      clone_fn: function to copy a trained empty index, such as
+        faiss.clone_index, so that all the shards share the same quantizer;
+        if not set, each shard is trained on the same sample separately.
+      seed: random seed of the sampling.
+    """
+    self._index_fn = index_fn
+    self._ndim = ndim
+    self._num_shards = num_shards
+    self._clone_fn = clone_fn
+    self._num_vectors = 0
+    self._indexes = [index_fn()]
+    self._need_train = not self._indexes[0].is_trained
+    if not self._need_train:
+      self._indexes.extend([index_fn() for _ in range(num_shards - 1)])
+    self._train_sample_size = train_sample_size
+    self._sampler = None
+    if self._need_train:
+      self._sampler = ReservoirSampler(train_sample_size, ndim, seed=seed)
+    self._chunks = [VectorChunks(ndim, chunk_size) for _ in range(num_shards)]
+
+  @property
+  def num_vectors(self):
+    return self._num_vectors
+
+  @property
+  def num_buffered(self):
+    """Number of vectors buffered and not added to the indexes yet."""
+    return sum(len(x) for x in self._chunks)
+
+  def add(self, vectors):
+    """Add a batch of vectors.
+
+    Args:
+      vectors: float array of shape [batch_size, ndim].
+
+    Return:
+      the shard id of each vector.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    assert vectors.ndim == 2 and vectors.shape[1] == self._ndim, \
+        'invalid vectors shape: %s, dimension should be %d' % (
+            str(vectors.shape), self._ndim)
+    shard_ids = (self._num_vectors + np.arange(len(vectors))) % \
+        self._num_shards
+    for shard_id in range(self._num_shards):
+      first = (shard_id - self._num_vectors) % self._num_shards
+      self._chunks[shard_id].append(vectors[first::self._num_shards])
+    self._num_vectors += len(vectors)
+    if self._need_train:
+      self._sampler.add(vectors)
+      if self._sampler.num_seen >= self._train_sample_size:
+        self._train()
+    if not self._need_train:
+      for shard_id in range(self._num_shards):
+        self._add_chunks(shard_id, full_only=True)
+    return shard_ids
+
+  def _add_chunks(self, shard_id, full_only):
+    for chunk in self._chunks[shard_id].pop_chunks(full_only=full_only):
+      self._indexes[shard_id].add(chunk)
+
+  def _train(self):
+    sample = self._sampler.sample
+    logging.info('train index on %d sampled vectors of the first %d vectors' %
+                 (len(sample), self._num_vectors))
+    self._indexes[0].train(sample)
+    for _ in range(self._num_shards - 1):
+      if self._clone_fn is not None:
+        self._indexes.append(self._clone_fn(self._indexes[0]))
+      else:
+        index = self._index_fn()
+        index.train(sample)
+        self._indexes.append(index)
+    self._sampler = None
+    self._need_train = False
+
+  def finish(self):
+    """Add the buffered vectors and return the index shards."""
+    assert self._num_vectors > 0, 'no vectors are added'
+    if self._need_train:
+      self._train()
+    for shard_id in range(self._num_shards):
+      self._add_chunks(shard_id, full_only=False)
+    return self._indexes
@@ -372,6 +372,25 @@ def test_feature_selection(pipeline_config):
   return True
 
 
+def test_permutation_feature_importance(pipeline_config):
+  model_dir = pipeline_config.model_dir
+  pipeline_config_path = os.path.join(model_dir, 'pipeline.config')
+  output_dir = os.path.join(model_dir, 'feature_selection')
+  cmd = 'python -m easy_rec.python.tools.feature_selection --model_type permutation ' \
+        '--config_path %s --saved_model_dir %s --input_path %s --output_dir %s ' \
+        '--num_samples 1000 --num_repeats 2 --batch_size 4096 --num_workers 2' % (
+            pipeline_config_path, os.path.join(model_dir, 'export/final'),
+            pipeline_config.eval_input_path, output_dir)
+  proc = run_cmd(cmd, os.path.join(model_dir, 'log_feature_selection.txt'))
+  proc_wait(proc, timeout=TEST_TIME_OUT)
+  if proc.returncode != 0:
+    logging.error('permutation feature importance %s failed' %
+                  pipeline_config_path)
+    return False
+  return gfile.Exists(
+      os.path.join(output_dir, 'feature_importance_permutation.csv'))
+
+
 def yaml_replace(train_yaml_path,
                  pipline_config_path,
                  test_pipeline_config_path,
@@ -0,0 +1,182 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Share user side computation across the candidate items of one request.
+
+On serving, a ranking request usually consists of one user and many
+candidate items. When user side sharing is enabled in export_config,
+user inputs are fed only once per request(batch_size = 1), embedding
+lookups / sequence poolings of user features are computed on that single
+row, and the outputs are broadcast to the candidate batch.
+"""
+import json
+import logging
+
+import tensorflow as tf
+from tensorflow.python.framework import ops
+
+from easy_rec.python.utils import constant
+
+if tf.__version__ >= '2.0':
+  tf = tf.compat.v1
+
+
+def _feature_name(fc):
+  return fc.feature_name if fc.HasField('feature_name') else fc.input_names[0]
+
+
+def is_enabled(export_config):
+  return export_config is not None and (
+      len(export_config.user_input_names) > 0 or
+      len(export_config.user_feature_groups) > 0)
+
+
+def get_user_side_inputs(export_config, feature_configs, feature_groups):
+  """Get the input names which are fed once per request.
+
+  Args:
+    export_config: ExportConfig instance.
+    feature_configs: list of FeatureConfig.
+    feature_groups: list of FeatureGroupConfig.
+
+  Return:
+    a set of user side input names.
+  """
+  user_inputs = set(export_config.user_input_names)
+  if len(export_config.user_feature_groups) > 0:
+    fc_map = {_feature_name(fc): fc for fc in feature_configs}
+    group_map = {x.group_name: x for x in feature_groups}
+    for group_name in export_config.user_feature_groups:
+      assert group_name in group_map, 'invalid user_feature_groups: %s' % group_name
+      group = group_map[group_name]
+      feature_names = list(group.feature_names)
+      for seq_group in group.sequence_features:
+        for seq_att_map in seq_group.seq_att_map:
+          feature_names.extend(seq_att_map.hist_seq)
+          feature_names.extend(seq_att_map.aux_hist_seq)
+      for feature_name in feature_names:
+        assert feature_name in fc_map, 'feature[%s] is not defined' % feature_name
+        user_inputs.update(fc_map[feature_name].input_names)
+  return user_inputs
+
+
+def get_user_side_features(user_inputs, feature_configs):
+  """Get the features computed only from user side inputs.
+
+  Args:
+    user_inputs: set of user side input names.
+    feature_configs: list of FeatureConfig.
+
+  Return:
+    a list of user side feature names.
+
+  Raise:
+    ValueError: if any feature mixes user side inputs and item side inputs.
+  """
+  user_features = []
+  for fc in feature_configs:
+    input_names = list(fc.input_names)
+    is_user = [x in user_inputs for x in input_names]
+    if all(is_user):
+      user_features.append(_feature_name(fc))
+    elif any(is_user):
+      raise ValueError(
+          'feature[%s] mixes user side inputs and item side inputs: %s, '
+          'which could not be shared across candidate items' %
+          (_feature_name(fc), ','.join(input_names)))
+  return user_features
+
+
+def set_user_side_info(user_inputs, user_features, candidate_batch_size):
+  """Record user side info into the default graph.
+
+  Args:
+    user_inputs: list of user side input names.
+    user_features: list of user side feature names.
+    candidate_batch_size: scalar tensor, the number of candidate items.
+  """
+  ops.add_to_collection(constant.USER_SIDE_INPUTS,
+                        json.dumps(sorted(user_inputs)))
+  ops.add_to_collection(constant.USER_SIDE_FEATURES,
+                        json.dumps(sorted(user_features)))
+  ops.add_to_collection(constant.CANDIDATE_BATCH_SIZE, candidate_batch_size)
+  logging.info('share user side inputs: %s' % ','.join(sorted(user_inputs)))
+
+
+def _load_names(collection_key):
+  col = ops.get_collection(collection_key)
+  if len(col) == 0:
+    return None
+  val = col[0]
+  if isinstance(val, bytes):
+    val = val.decode('utf-8')
+  return set(json.loads(val))
+
+
+def get_user_side_inputs_from_graph():
+  return _load_names(constant.USER_SIDE_INPUTS)
+
+
+def is_user_side_feature(feature_name):
+  user_features = _load_names(constant.USER_SIDE_FEATURES)
+  return user_features is not None and feature_name in user_features
+
+
+def candidate_batch_size():
+  col = ops.get_collection(constant.CANDIDATE_BATCH_SIZE)
+  return col[0] if len(col) > 0 else None
+
+
+def broadcast(tensor, batch_size=None):
+  """Broadcast user side tensor with batch_size 1 to candidate batch_size.
+
+  Args:
+    tensor: Tensor or SparseTensor, the first dim is 1.
+    batch_size: the number of candidate items, if None, will
+      use the one recorded in the default graph.
+
+  Return:
+    Tensor or SparseTensor, the first dim is batch_size.
+  """
+  if batch_size is None:
+    batch_size = candidate_batch_size()
+  if isinstance(tensor, tf.SparseTensor):
+    batch_size = tf.to_int64(batch_size)
+    nnz = tf.shape(tensor.indices)[0]
+    rank = tf.shape(tensor.indices)[1]
+    row_ids = tf.range(batch_size, dtype=tf.int64)
+    row_ids = tf.reshape(tf.tile(row_ids[:, None], [1, nnz]), [-1, 1])
+    col_ids = tf.tile(tensor.indices[:, 1:], [batch_size, 1])
+    indices = tf.concat([row_ids, col_ids], axis=1)
+    indices = tf.reshape(indices, [-1, rank])
+    values = tf.tile(tensor.values, [batch_size])
+    dense_shape = tf.concat([[batch_size], tensor.dense_shape[1:]], axis=0)
+    return tf.SparseTensor(indices, values, dense_shape)
+  multiples = [batch_size] + [1] * (len(tensor.get_shape()) - 1)
+  return tf.tile(tensor, tf.stack(multiples))
+
+
+def maybe_broadcast(feature_name, tensor):
+  """Broadcast tensor if it is computed from user side feature."""
+  if is_user_side_feature(feature_name):
+    return broadcast(tensor)
+  return tensor
+
+
+def maybe_broadcast_features(features, feature_names):
+  """Broadcast raw user side features, used when sharing is not possible.
+
+  Args:
+    features: dict of input features.
+    feature_names: feature names to be used.
+
+  Return:
+    a shallow copy of features, in which user side features are broadcast.
+  """
+  user_features = _load_names(constant.USER_SIDE_FEATURES)
+  if not user_features:
+    return features
+  features = dict(features)
+  for feature_name in feature_names:
+    if feature_name in user_features and feature_name in features:
+      features[feature_name] = broadcast(features[feature_name])
+  return features
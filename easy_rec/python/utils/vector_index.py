@@ -0,0 +1,407 @@
+# -*- encoding:utf-8 -*-
+# Copyright (c) Alibaba, Inc. and its affiliates.
+"""Local vector indexes for knn retrieval.
+
+Faiss is used if it is installed, otherwise a numpy implementation of
+flat and ivfflat indexes is used. The indexes are saved into a directory,
+and could be loaded with mmap, so that multiple processes could share
+the doc vectors without copying them.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+from tensorflow.python.platform import gfile
+
+try:
+  import faiss
+except ImportError:
+  faiss = None
+
+INDEX_TYPES = ['flat', 'ivfflat', 'ivfpq', 'hnsw']
+
+# distance types, the same as graph-learn knn metric
+DISTANCE_L2 = 0
+DISTANCE_INNER_PRODUCT = 1
+
+_META_FILE = 'meta.json'
+
+
+def parse_vectors(vectors, ndim, delimiter=','):
+  """Parse a batch of vector strings in bulk.
+
+  Args:
+    vectors: list or array of vector strings, like '0.1,0.2,0.3'.
+    ndim: dimension of the vectors.
+    delimiter: delimiter of the vector elements.
+
+  Return:
+    float32 numpy array of shape [len(vectors), ndim].
+  """
+  if len(vectors) == 0:
+    return np.zeros([0, ndim], dtype=np.float32)
+  if isinstance(vectors[0], bytes):
+    vectors = [x.decode('utf-8') for x in vectors]
+  values = np.fromstring(
+      delimiter.join(vectors), dtype=np.float32, sep=delimiter)
+  if values.size != len(vectors) * ndim:
+    raise ValueError(
+        'invalid vectors: expect %d vectors of dimension %d, but got %d '
+        'numbers, there may be empty vectors or invalid numbers' %
+        (len(vectors), ndim, values.size))
+  return values.reshape([len(vectors), ndim])
+
+
+def _top_k(scores, k, largest):
+  """Return the indices and scores of the top k of each row."""
+  k = min(k, scores.shape[1])
+  if k == 0:
+    return (np.zeros([scores.shape[0], 0], dtype=np.int64),
+            np.zeros([scores.shape[0], 0], dtype=np.float32))
+  keys = -scores if largest else scores
+  if k < scores.shape[1]:
+    top_ids = np.argpartition(keys, k - 1, axis=1)[:, :k]
+  else:
+    top_ids = np.tile(np.arange(k), [scores.shape[0], 1])
+  top_keys = np.take_along_axis(keys, top_ids, axis=1)
+  order = np.argsort(top_keys, axis=1, kind='stable')
+  top_ids = np.take_along_axis(top_ids, order, axis=1)
+  return top_ids, np.take_along_axis(scores, top_ids, axis=1)
+
+
+class VectorIndex(object):
+  """Base class of the vector indexes.
+
+  search returns the positions of the docs(in the order they are added),
+  and the scores, inner products if distance is DISTANCE_INNER_PRODUCT,
+  else squared l2 distances. The positions are -1 if there are less than
+  k candidates.
+  """
+
+  def __init__(self, ndim, distance=DISTANCE_INNER_PRODUCT):
+    self.ndim = ndim
+    self.distance = distance
+
+  @property
+  def largest(self):
+    return self.distance == DISTANCE_INNER_PRODUCT
+
+  def _scores(self, queries, docs):
+    scores = np.matmul(queries, docs.T)
+    if self.largest:
+      return scores
+    return (np.sum(np.square(queries), axis=1, keepdims=True) - 2 * scores +
+            np.sum(np.square(docs), axis=1)[None, :])
+
+  def train(self, vectors):
+    pass
+
+  def add(self, vectors):
+    raise NotImplementedError
+
+  def search(self, queries, k):
+    raise NotImplementedError
+
+  def save(self, index_dir):
+    raise NotImplementedError
+
+
+class NumpyFlatIndex(VectorIndex):
+  """Exact search by brute force matrix multiplications."""
+
+  def __init__(self, ndim, distance=DISTANCE_INNER_PRODUCT, vectors=None):
+    super(NumpyFlatIndex, self).__init__(ndim, distance)
+    self._vectors = vectors
+
+  def add(self, vectors):
+    if self._vectors is None:
+      self._vectors = vectors
+    else:
+      self._vectors = np.concatenate([self._vectors, vectors], axis=0)
+
+  def search(self, queries, k):
+    scores = self._scores(queries, self._vectors)
+    top_ids, top_scores = _top_k(scores, k, self.largest)
+    return _pad_results(top_ids, top_scores, k, self.largest)
+
+  def save(self, index_dir):
+    np.save(os.path.join(index_dir, 'vectors.npy'), self._vectors)
+
+  @classmethod
+  def load(cls, index_dir, meta, mmap):
+    vectors = np.load(
+        os.path.join(index_dir, 'vectors.npy'), mmap_mode='r' if mmap else None)
+    return cls(meta['ndim'], meta['distance'], vectors=vectors)
+
+
+class NumpyIVFIndex(VectorIndex):
+  """Inverted file index, the docs are clustered by kmeans.
+
+  The vectors are stored sorted by clusters, so that each inverted list
+  is a contiguous slice. Search probes the nprobe nearest clusters of each
+  query, the queries probing the same cluster are scored together.
+  """
+
+  def __init__(self,
+               ndim,
+               distance=DISTANCE_INNER_PRODUCT,
+               nlist=100,
+               nprobe=10,
+               centroids=None,
+               vectors=None,
+               positions=None,
+               list_offsets=None):
+    super(NumpyIVFIndex, self).__init__(ndim, distance)
+    self.nlist = nlist
+    self.nprobe = nprobe
+    self._centroids = centroids
+    self._vectors = vectors
+    self._positions = positions
+    self._list_offsets = list_offsets
+
+  def train(self, vectors, num_iters=10, max_points_per_centroid=256):
+    nlist = min(self.nlist, len(vectors))
+    rng = np.random.RandomState(0)
+    max_points = nlist * max_points_per_centroid
+    if len(vectors) > max_points:
+      vectors = vectors[rng.choice(len(vectors), max_points, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+    for _ in range(num_iters):
+      assign = self._assign(vectors, centroids)
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, assign, vectors)
+      counts = np.bincount(assign, minlength=nlist)
+      non_empty = counts > 0
+      centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    self._centroids = centroids.astype(np.float32)
+    self.nlist = nlist
+
+  def _assign(self, vectors, centroids):
+    # kmeans always uses l2 distance
+    scores = np.matmul(vectors, centroids.T)
+    scores = np.sum(np.square(centroids), axis=1)[None, :] - 2 * scores
+    return np.argmin(scores, axis=1)
+
+  def add(self, vectors):
+    assert self._centroids is not None, 'index must be trained before add'
+    assert self._vectors is None, 'NumpyIVFIndex only supports adding once'
+    assign = self._assign(vectors, self._centroids)
+    positions = np.argsort(assign, kind='stable')
+    self._vectors = vectors[positions]
+    self._positions = positions.astype(np.int64)
+    self._list_offsets = np.searchsorted(assign[positions],
+                                         np.arange(self.nlist + 1))
+
+  def search(self, queries, k):
+    nprobe = min(self.nprobe, self.nlist)
+    centroid_scores = self._scores(queries, self._centroids)
+    probe_lists, _ = _top_k(centroid_scores, nprobe, self.largest)
+    worst = -np.inf if self.largest else np.inf
+    best_ids = np.full([len(queries), k], -1, dtype=np.int64)
+    best_scores = np.full([len(queries), k], worst, dtype=np.float32)
+    for list_id in np.unique(probe_lists):
+      start, end = self._list_offsets[list_id], self._list_offsets[list_id + 1]
+      if start == end:
+        continue
+      query_ids = np.where(np.any(probe_lists == list_id, axis=1))[0]
+      scores = self._scores(queries[query_ids], self._vectors[start:end])
+      top_ids, top_scores = _top_k(scores, k, self.largest)
+      merged_ids = np.concatenate([best_ids[query_ids], top_ids + start],
+                                  axis=1)
+      merged_scores = np.concatenate([best_scores[query_ids], top_scores],
+                                     axis=1)
+      top_ids, top_scores = _top_k(merged_scores, k, self.largest)
+      best_ids[query_ids] = np.take_along_axis(merged_ids, top_ids, axis=1)
+      best_scores[query_ids] = top_scores
+    valid = best_ids >= 0
+    best_ids[valid] = self._positions[best_ids[valid]]
+    return best_ids, best_scores
+
+  def save(self, index_dir):
+    np.save(os.path.join(index_dir, 'centroids.npy'), self._centroids)
+    np.save(os.path.join(index_dir, 'vectors.npy'), self._vectors)
+    np.save(os.path.join(index_dir, 'positions.npy'), self._positions)
+    np.save(os.path.join(index_dir, 'list_offsets.npy'), self._list_offsets)
+
+  @classmethod
+  def load(cls, index_dir, meta, mmap):
+    mmap_mode = 'r' if mmap else None
+    arrays = {}
+    for name in ['centroids', 'vectors', 'positions', 'list_offsets']:
+      arrays[name] = np.load(
+          os.path.join(index_dir, name + '.npy'), mmap_mode=mmap_mode)
+    return cls(
+        meta['ndim'],
+        meta['distance'],
+        nlist=meta['nlist'],
+        nprobe=meta['nprobe'],
+        **arrays)
+
+
+class FaissIndex(VectorIndex):
+
+  def __init__(self, ndim, distance, index):
+    super(FaissIndex, self).__init__(ndim, distance)
+    self._index = index
+
+  @classmethod
+  def create(cls, ndim, distance, index_type, nlist, nprobe, m, hnsw_m,
+             ef_search):
+    metric = faiss.METRIC_INNER_PRODUCT if distance == DISTANCE_INNER_PRODUCT \
+        else faiss.METRIC_L2
+    if index_type == 'flat':
+      index = faiss.IndexFlat(ndim, metric)
+    elif index_type in ['ivfflat', 'ivfpq']:
+      if metric == faiss.METRIC_INNER_PRODUCT:
+        quantizer = faiss.IndexFlatIP(ndim)
+      else:
+        quantizer = faiss.IndexFlatL2(ndim)
+      if index_type == 'ivfflat':
+        index = faiss.IndexIVFFlat(quantizer, ndim, nlist, metric)
+      else:
+        index = faiss.IndexIVFPQ(quantizer, ndim, nlist, m, 8, metric)
+      index.nprobe = nprobe
+      # quantizer must be kept alive with the index
+      index.own_fields = True
+      quantizer.this.disown()
+    elif index_type == 'hnsw':
+      index = faiss.IndexHNSWFlat(ndim, hnsw_m, metric)
+      index.hnsw.efSearch = ef_search
+    else:
+      raise ValueError('unknown index_type: %s, must be one of %s' %
+                       (index_type, ','.join(INDEX_TYPES)))
+    return cls(ndim, distance, index)
+
+  def train(self, vectors):
+    if not self._index.is_trained:
+      self._index.train(vectors)
+
+  def add(self, vectors):
+    self._index.add(vectors)
+
+  def search(self, queries, k):
+    scores, ids = self._index.search(queries, k)
+    return ids.astype(np.int64), scores
+
+  def save(self, index_dir):
+    faiss.write_index(self._index, os.path.join(index_dir, 'faiss.index'))
+
+  @classmethod
+  def load(cls, index_dir, meta, mmap):
+    index_path = os.path.join(index_dir, 'faiss.index')
+    index = None
+    if mmap and hasattr(faiss, 'IO_FLAG_MMAP'):
+      try:
+        index = faiss.read_index(index_path,
+                                 faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+      except RuntimeError:
+        logging.info('%s could not be mmaped, will read it into memory' %
+                     meta['index_type'])
+    if index is None:
+      index = faiss.read_index(index_path)
+    if hasattr(index, 'nprobe'):
+      index.nprobe = meta['nprobe']
+    if meta['index_type'] == 'hnsw':
+      index.hnsw.efSearch = meta['ef_search']
+    return cls(meta['ndim'], meta['distance'], index)
+
+
+def _pad_results(ids, scores, k, largest):
+  if ids.shape[1] >= k:
+    return ids, scores
+  pad = k - ids.shape[1]
+  worst = -np.inf if largest else np.inf
+  return (np.pad(ids, [[0, 0], [0, pad]], constant_values=-1),
+          np.pad(scores, [[0, 0], [0, pad]], constant_values=worst))
+
+
+def create_index(ndim,
+                 index_type='ivfflat',
+                 distance=DISTANCE_INNER_PRODUCT,
+                 nlist=100,
+                 nprobe=10,
+                 m=8,
+                 hnsw_m=32,
+                 ef_search=64,
+                 backend=None):
+  """Create a vector index.
+
+  Args:
+    ndim: dimension of the vectors.
+    index_type: one of flat, ivfflat, ivfpq, hnsw.
+    distance: DISTANCE_L2 or DISTANCE_INNER_PRODUCT.
+    nlist: number of clusters of ivf indexes.
+    nprobe: number of clusters to probe when searching.
+    m: number of sub quantizers of ivfpq.
+    hnsw_m: number of neighbours of each hnsw node.
+    ef_search: size of the hnsw search queue.
+    backend: faiss or numpy, default to faiss if it is installed.
+
+  Return:
+    a VectorIndex.
+  """
+  if backend is None:
+    backend = 'faiss' if faiss is not None else 'numpy'
+  if backend == 'faiss':
+    assert faiss is not None, 'faiss is not installed'
+    index = FaissIndex.create(ndim, distance, index_type, nlist, nprobe, m,
+                              hnsw_m, ef_search)
+  elif index_type == 'flat':
+    index = NumpyFlatIndex(ndim, distance)
+  elif index_type in ['ivfflat', 'ivfpq', 'hnsw']:
+    if index_type != 'ivfflat':
+      logging.warning('%s is not supported without faiss, will use ivfflat' %
+                      index_type)
+    index = NumpyIVFIndex(ndim, distance, nlist=nlist, nprobe=nprobe)
+  else:
+    raise ValueError('unknown index_type: %s, must be one of %s' %
+                     (index_type, ','.join(INDEX_TYPES)))
+  index.meta = {
+      'backend': backend,
+      'index_type': index_type,
+      'ndim': ndim,
+      'distance': distance,
+      'nlist': nlist,
+      'nprobe': nprobe,
+      'ef_search': ef_search
+  }
+  return index
+
+
+def save_index(index, ids, index_dir):
+  """Save the index and the ids of the docs into index_dir."""
+  if not gfile.IsDirectory(index_dir):
+    gfile.MakeDirs(index_dir)
+  index.save(index_dir)
+  np.save(os.path.join(index_dir, 'ids.npy'), ids)
+  meta = dict(index.meta)
+  if isinstance(index, NumpyIVFIndex):
+    # nlist is reduced if there are less docs than nlist
+    meta['nlist'] = index.nlist
+  with gfile.GFile(os.path.join(index_dir, _META_FILE), 'w') as fout:
+    json.dump(meta, fout)
+
+
+def load_index(index_dir, mmap=True):
+  """Load the index and the ids of the docs from index_dir.
+
+  Args:
+    index_dir: directory of the saved index.
+    mmap: if True, the vectors are memory mapped instead of read.
+
+  Return:
+    the index and the ids of the docs.
+  """
+  with gfile.GFile(os.path.join(index_dir, _META_FILE), 'r') as fin:
+    meta = json.load(fin)
+  if meta['backend'] == 'faiss':
+    index = FaissIndex.load(index_dir, meta, mmap)
+  elif meta['index_type'] == 'flat':
+    index = NumpyFlatIndex.load(index_dir, meta, mmap)
+  else:
+    index = NumpyIVFIndex.load(index_dir, meta, mmap)
+  index.meta = meta
+  ids = np.load(
+      os.path.join(index_dir, 'ids.npy'), mmap_mode='r' if mmap else None)
+  return index, ids
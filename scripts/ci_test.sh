@@ -9,6 +9,10 @@ pip install -r requirements.txt
 # update/generate proto
 bash scripts/gen_proto.sh
 
+# build the parse_rtp op, which is not shipped in the ops dirs, so that
+# parse_rtp_test is not skipped
+bash easy_rec/python/ops/build_ops.sh parse_rtp
+
 if [ -n "$PULL_REQUEST_NUM" ]
 then
   # check updates